@@ -14,8 +14,13 @@
   - Martin Barisits, <martin.barisits@cern.ch>, 2014-2015
 '''
 
+import json
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
 import rucio.api.permission
 
+from rucio.common import exception
 from rucio.core import did, naming_convention, meta as meta_core
 from rucio.common.constants import RESERVED_KEYS
 from rucio.common.schema import validate_schema
@@ -39,6 +44,58 @@ def list_dids(scope, filters, type='collection', ignore_case=False, limit=None,
                          limit=limit, offset=offset, long=long)
 
 
+def encode_continuation_token(key):
+    """
+    Encode the key of the last item of a page.
+
+    :param key: The key, a list of strings.
+    :returns: The opaque continuation token.
+    """
+    return urlsafe_b64encode(json.dumps(key))
+
+
+def decode_continuation_token(token, length):
+    """
+    Decode a continuation token.
+
+    :param token: The continuation token.
+    :param length: The number of strings of the key.
+    :returns: The key, a list of strings.
+    """
+    try:
+        key = json.loads(urlsafe_b64decode(str(token)))
+    except (TypeError, ValueError):
+        key = None
+    if not isinstance(key, list) or len(key) != length or not all(isinstance(value, basestring) for value in key):
+        raise exception.InvalidObject('Invalid continuation token %s' % token)
+    return key
+
+
+def list_dids_page(scope, filters, type='collection', ignore_case=False, limit=None, long=False, continuation_token=None):
+    """
+    List one page of dids in a scope, ordered by name.
+
+    :param scope: The scope name.
+    :param filters: Dictionary of attributes by which the results should be filtered.
+    :param type:  The type of the did: all(container, dataset, file), collection(dataset or container), dataset, container
+    :param ignore_case: Ignore case distinctions.
+    :param limit: The maximum number of DIDs returned, by default and at most [did] max_page_size.
+    :param long: Long format option to display more information for each DID.
+    :param continuation_token: The token returned with the previous page, None for the first page.
+    :returns: Tuple (list of dids, continuation token of the next page or None).
+    """
+    validate_schema(name='did_filters', obj=filters)
+    limit = min(limit or did.MAX_PAGE_SIZE, did.MAX_PAGE_SIZE)
+    marker = None
+    if continuation_token is not None:
+        token_scope, marker = decode_continuation_token(continuation_token, 2)
+        if token_scope != scope:
+            raise exception.InvalidObject('Invalid continuation token %s for scope %s' % (continuation_token, scope))
+    dids, marker = did.list_dids_page(scope=scope, filters=filters, type=type, ignore_case=ignore_case,
+                                      limit=limit, long=long, marker=marker)
+    return dids, encode_continuation_token([scope, marker]) if marker is not None else None
+
+
 def add_did(scope, name, type, issuer, account=None, statuses={}, meta={}, rules=[], lifetime=None, dids=[], rse=None):
     """
     Add data did.
@@ -198,6 +255,25 @@ def list_files(scope, name, long):
     return did.list_files(scope=scope, name=name, long=long)
 
 
+def list_files_page(scope, name, long, limit=None, continuation_token=None):
+    """
+    List one page of data identifier file contents, ordered by dataset.
+
+    :param scope: The scope name.
+    :param name: The data identifier name.
+    :param long: A boolean to choose if GUID is returned or not.
+    :param limit: The maximum number of files returned, by default and at most [did] max_page_size.
+    :param continuation_token: The token returned with the previous page, None for the first page.
+    :returns: Tuple (list of files, continuation token of the next page or None).
+    """
+    limit = min(limit or did.MAX_PAGE_SIZE, did.MAX_PAGE_SIZE)
+    marker = None
+    if continuation_token is not None:
+        marker = decode_continuation_token(continuation_token, 4)
+    files, marker = did.list_files_page(scope=scope, name=name, long=long, limit=limit, marker=marker)
+    return files, encode_continuation_token(list(marker)) if marker is not None else None
+
+
 def scope_list(scope, name=None, recursive=False):
     """
     List data identifiers in a scope.
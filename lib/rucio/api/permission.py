@@ -12,7 +12,7 @@
   - Mario Lassnig, <mario.lassnig@cern.ch>, 2012
 '''
 
-from rucio.core import permission
+from rucio.core import permission, permission_cache
 
 
 def has_permission(issuer, action, kwargs):
@@ -25,4 +25,4 @@ def has_permission(issuer, action, kwargs):
     :param kwargs: List of arguments for the action.
     :returns: True if account is allowed to call the API call, otherwise False
     """
-    return permission.has_permission(issuer=issuer, action=action, kwargs=kwargs)
+    return permission_cache.memoize_decision(permission.has_permission, issuer=issuer, action=action, kwargs=kwargs)
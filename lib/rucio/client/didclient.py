@@ -29,13 +29,14 @@ class DIDClient(BaseClient):
 
     DIDS_BASEURL = 'dids'
     ARCHIVES_BASEURL = 'archives'
+    CONTINUATION_TOKEN_HEADER = 'X-Rucio-Continuation-Token'
 
     def __init__(self, rucio_host=None, auth_host=None, account=None, ca_cert=None,
                  auth_type=None, creds=None, timeout=None, user_agent='rucio-clients'):
         super(DIDClient, self).__init__(rucio_host, auth_host, account, ca_cert,
                                         auth_type, creds, timeout, user_agent)
 
-    def list_dids(self, scope, filters, type='collection', long=False):
+    def list_dids(self, scope, filters, type='collection', long=False, page_size=None):
         """
         List all data identifiers in a scope which match a given pattern.
 
@@ -43,8 +44,40 @@ class DIDClient(BaseClient):
         :param filters: A dictionary of key/value pairs like {'name': 'file_name','rse-expression': 'tier0'}.
         :param type: The type of the did: 'all'(container, dataset or file)|'collection'(dataset or container)|'dataset'|'container'|'file'
         :param long: Long format option to display more information for each DID.
+        :param page_size: If set, the dids are requested in pages of this size, ordered by name.
+        """
+        if page_size:
+            return self._list_pages(self.list_dids_page, scope=scope, filters=filters, type=type, long=long, limit=page_size)
+
+        path = '/'.join([self.DIDS_BASEURL, scope, 'dids', 'search'])
+        payload = self._search_payload(filters=filters, type=type, long=long)
+        url = build_url(choice(self.list_hosts), path=path, params=payload)
+
+        r = self._send_request(url, type='GET')
+        if r.status_code == codes.ok:
+            dids = self._load_json_data(r)
+            return dids
+        else:
+            exc_cls, exc_msg = self._get_exception(headers=r.headers, status_code=r.status_code, data=r.content)
+            raise exc_cls(exc_msg)
+
+    def list_dids_page(self, scope, filters, type='collection', long=False, limit=5000, continuation_token=None):
+        """
+        List one page of the data identifiers in a scope which match a given pattern, ordered by name.
+
+        :param scope: The scope name.
+        :param filters: A dictionary of key/value pairs like {'name': 'file_name','rse-expression': 'tier0'}.
+        :param type: The type of the did: 'all'(container, dataset or file)|'collection'(dataset or container)|'dataset'|'container'|'file'
+        :param long: Long format option to display more information for each DID.
+        :param limit: The maximum number of dids, at most the maximum of the server.
+        :param continuation_token: The token returned with the previous page, None for the first page.
+        :returns: Tuple (list of dids, continuation token of the next page or None if it is the last page).
         """
         path = '/'.join([self.DIDS_BASEURL, scope, 'dids', 'search'])
+        payload = self._search_payload(filters=filters, type=type, long=long)
+        return self._get_page(path=path, payload=payload, limit=limit, continuation_token=continuation_token)
+
+    def _search_payload(self, filters, type, long):
         payload = {}
         if long:
             payload['long'] = 1
@@ -55,17 +88,31 @@ class DIDClient(BaseClient):
             else:
                 payload[k] = v
         payload['type'] = type
+        return payload
 
+    def _get_page(self, path, payload, limit, continuation_token):
+        payload = dict(payload)
+        payload['limit'] = limit
+        if continuation_token is not None:
+            payload['continuation_token'] = continuation_token
         url = build_url(choice(self.list_hosts), path=path, params=payload)
 
         r = self._send_request(url, type='GET')
         if r.status_code == codes.ok:
-            dids = self._load_json_data(r)
-            return dids
+            return list(self._load_json_data(r)), r.headers.get(self.CONTINUATION_TOKEN_HEADER)
         else:
             exc_cls, exc_msg = self._get_exception(headers=r.headers, status_code=r.status_code, data=r.content)
             raise exc_cls(exc_msg)
 
+    def _list_pages(self, list_page, **kwargs):
+        continuation_token = None
+        while True:
+            items, continuation_token = list_page(continuation_token=continuation_token, **kwargs)
+            for item in items:
+                yield item
+            if continuation_token is None:
+                break
+
     def add_did(self, scope, name, type, statuses=None, meta=None, rules=None, lifetime=None, dids=None, rse=None):
         """
         Add data identifier for a dataset or container.
@@ -329,14 +376,17 @@ class DIDClient(BaseClient):
         exc_cls, exc_msg = self._get_exception(headers=r.headers, status_code=r.status_code, data=r.content)
         raise exc_cls(exc_msg)
 
-    def list_files(self, scope, name, long=None):
+    def list_files(self, scope, name, long=None, page_size=None):
         """
         List data identifier file contents.
 
         :param scope: The scope name.
         :param name: The data identifier name.
         :param long: A boolean to choose if GUID is returned or not.
+        :param page_size: If set, the files are requested in pages of this size.
         """
+        if page_size:
+            return self._list_pages(self.list_files_page, scope=scope, name=name, long=long, limit=page_size)
 
         payload = {}
         path = '/'.join([self.DIDS_BASEURL, scope, name, 'files'])
@@ -351,6 +401,23 @@ class DIDClient(BaseClient):
             exc_cls, exc_msg = self._get_exception(headers=r.headers, status_code=r.status_code, data=r.content)
             raise exc_cls(exc_msg)
 
+    def list_files_page(self, scope, name, long=None, limit=5000, continuation_token=None):
+        """
+        List one page of data identifier file contents.
+
+        :param scope: The scope name.
+        :param name: The data identifier name.
+        :param long: A boolean to choose if GUID is returned or not.
+        :param limit: The maximum number of files, at most the maximum of the server.
+        :param continuation_token: The token returned with the previous page, None for the first page.
+        :returns: Tuple (list of files, continuation token of the next page or None if it is the last page).
+        """
+        payload = {}
+        path = '/'.join([self.DIDS_BASEURL, scope, name, 'files'])
+        if long:
+            payload['long'] = True
+        return self._get_page(path=path, payload=payload, limit=limit, continuation_token=continuation_token)
+
     def get_did(self, scope, name):
         """
         Retrieve a single data identifier.
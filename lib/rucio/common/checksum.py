@@ -0,0 +1,117 @@
+"""
+ Copyright European Organization for Nuclear Research (CERN)
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ You may not use this file except in compliance with the License.
+ You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+
+ Checksums of local files. All the requested checksums are computed in the same pass over
+ fixed-size buffers; files of at least MMAP_THRESHOLD bytes are read through mmap, so the
+ buffers are not copied.
+"""
+
+import hashlib
+import mmap
+import os
+import zlib
+
+from multiprocessing import Pool, cpu_count
+
+
+BUFFER_SIZE = 1048576  # 1MiB
+MMAP_THRESHOLD = 67108864  # 64MiB
+
+HASHES = {'md5': hashlib.md5,
+          'sha1': hashlib.sha1,
+          'sha256': hashlib.sha256}
+CHECKSUM_ALGORITHMS = ('adler32', ) + tuple(sorted(HASHES))
+
+
+class Checksummer(object):
+    """
+    Incremental computation of several checksums over the same data.
+    """
+
+    def __init__(self, algorithms=('adler32', )):
+        """
+        :param algorithms:  Names of the checksums, in CHECKSUM_ALGORITHMS.
+        """
+        unknown = set(algorithms) - set(CHECKSUM_ALGORITHMS)
+        if unknown:
+            raise ValueError('Unsupported checksum algorithms: %s' % ', '.join(sorted(unknown)))
+        # adler starting value is _not_ 0
+        self.__adler = 1L if 'adler32' in algorithms else None
+        self.__hashes = dict((name, HASHES[name]()) for name in algorithms if name in HASHES)
+
+    def update(self, data):
+        """
+        Add data, a string or a buffer.
+        """
+        if self.__adler is not None:
+            self.__adler = zlib.adler32(data, self.__adler)
+        for hash in self.__hashes.itervalues():
+            hash.update(data)
+
+    def hexdigests(self):
+        """
+        :returns:  Dictionary {algorithm: hexified string}, the adler32 is padded to 8 values.
+        """
+        digests = dict((name, hash.hexdigest()) for name, hash in self.__hashes.iteritems())
+        if self.__adler is not None:
+            # backflip on 32bit
+            digests['adler32'] = '%08x' % (self.__adler & 0xffffffff)
+        return digests
+
+
+def checksum_file(path, algorithms=('adler32', ), buffer_size=BUFFER_SIZE, mmap_threshold=MMAP_THRESHOLD):
+    """
+    Compute the checksums of a file in one pass.
+
+    :param path:            Path of the file.
+    :param algorithms:      Names of the checksums, in CHECKSUM_ALGORITHMS.
+    :param buffer_size:     Size of the buffers.
+    :param mmap_threshold:  Minimal size of the files read through mmap.
+    :returns:               Dictionary {algorithm: hexified string}.
+    """
+    checksummer = Checksummer(algorithms)
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size and size >= mmap_threshold:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for offset in xrange(0, size, buffer_size):
+                    checksummer.update(buffer(mapped, offset, buffer_size))
+            finally:
+                mapped.close()
+        else:
+            for data in iter(lambda: f.read(buffer_size), ''):
+                checksummer.update(data)
+    return checksummer.hexdigests()
+
+
+def _checksum_file(args):
+    path, algorithms = args
+    return path, checksum_file(path, algorithms)
+
+
+def checksum_files(paths, algorithms=('adler32', ), processes=None):
+    """
+    Compute the checksums of several files, in parallel if there is more than one.
+
+    :param paths:       List of paths.
+    :param algorithms:  Names of the checksums, in CHECKSUM_ALGORITHMS.
+    :param processes:   Number of processes, by default the number of CPUs.
+    :returns:           Dictionary {path: {algorithm: hexified string}}.
+    """
+    paths = list(paths)
+    if len(paths) < 2 or processes == 1:
+        return dict((path, checksum_file(path, algorithms)) for path in paths)
+
+    pool = Pool(min(processes or cpu_count(), len(paths)))
+    try:
+        checksums = dict(pool.imap_unordered(_checksum_file, [(path, algorithms) for path in paths]))
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    return checksums
@@ -11,6 +11,7 @@
 from rucio.common import config
 import contextlib
 import datetime
+import glob
 import gzip
 import json
 import logging
@@ -21,6 +22,8 @@ import requests
 import sys
 import tempfile
 
+from multiprocessing.pool import ThreadPool
+
 try:
     import gfal2
     from gfal2 import GError
@@ -106,6 +109,8 @@ def get_requests_session():
 DUMPS_CACHE_DIR = 'cache'
 RESULTS_DIR = 'results'
 CHUNK_SIZE = 4194304  # 4MiB
+DOWNLOAD_PARTS = 4
+MIN_PART_SIZE = 67108864  # 64MiB
 
 
 # There are two Python modules with the name `magic`, luckily both do
@@ -295,6 +300,118 @@ def http_download_to_file(url, file_, session=None):
         file_.write(chunk)
 
 
+def _download_range(url, part_path, start, end, session=None, etag=None):
+    '''
+    Download the bytes `start` to `end` (included) of `url` appending
+    them to `part_path`, starting after the bytes it already contains.
+    '''
+    done = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if start + done > end:
+        return
+
+    headers = {'Range': 'bytes={0}-{1}'.format(start + done, end)}
+    if etag is not None:
+        # The server sends the whole file if it changed since the first attempt
+        headers['If-Range'] = etag
+    if session is None:
+        response = requests.get(url, headers=headers, stream=True)
+    else:
+        response = session.get(url, headers=headers)
+
+    if response.status_code != 206:
+        logging.error(
+            'Retrieving %s (bytes %d-%d) returned %d status code',
+            url,
+            start + done,
+            end,
+            response.status_code,
+        )
+        # The bytes already downloaded may belong to another version of the file
+        if os.path.exists(part_path):
+            os.unlink(part_path)
+        raise HTTPDownloadFailed('Error downloading range of ' + url, response.status_code)
+
+    with open(part_path, 'ab') as part:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            part.write(chunk)
+
+    if os.path.getsize(part_path) != end - start + 1:
+        raise HTTPDownloadFailed('Incomplete range {0}-{1} of {2}'.format(start, end, url))
+
+
+def http_download_resumable(url, path, session=None, parts=DOWNLOAD_PARTS, min_part_size=MIN_PART_SIZE, head=None):
+    '''
+    Download the file in `url` to `path`, with up to `parts` concurrent
+    HTTP range requests of at least `min_part_size` bytes.
+
+    Each range is stored in the file <path>.<start>-<end>.part until all
+    of them are complete, so after a failure the next call only downloads
+    the missing bytes. The ETag of the file is stored in <path>.etag, and
+    the ranges are downloaded again if the file changed in the meantime
+    (or if it has no ETag). If the server does not accept range requests
+    the file is downloaded with http_download_to_file.
+
+    :param head: Response of a HEAD request on `url`, if already done.
+    '''
+    logger = logging.getLogger('dumper.__init__')
+    directory, filename = os.path.split(path)
+
+    if head is None:
+        head = requests.head(url) if session is None else session.head(url)
+    size = int(head.headers.get('content-length', 0))
+    if head.headers.get('accept-ranges') != 'bytes' or size == 0:
+        with temp_file(directory, final_name=filename) as (tfile, _):
+            http_download_to_file(url, tfile, session=session)
+        return
+
+    parts = max(1, min(parts, size // min_part_size))
+    part_size = -(-size // parts)
+    ranges = [(start, min(start + part_size, size) - 1) for start in xrange(0, size, part_size)]
+    part_paths = ['{0}.{1}-{2}.part'.format(path, start, end) for start, end in ranges]
+
+    etag = head.headers.get('etag')
+    etag_path = '{0}.etag'.format(path)
+    saved_etag = None
+    if os.path.exists(etag_path):
+        with open(etag_path) as etag_file:
+            saved_etag = etag_file.read()
+    if etag is None or etag != saved_etag:
+        for part_path in glob.glob('{0}.*-*.part'.format(path)):
+            os.unlink(part_path)
+        if etag is None:
+            if os.path.exists(etag_path):
+                os.unlink(etag_path)
+        else:
+            with open(etag_path, 'w') as etag_file:
+                etag_file.write(etag)
+
+    logger.debug('Downloading %s in %d ranges', url, len(ranges))
+    pool = ThreadPool(len(ranges))
+    try:
+        pool.map(
+            lambda args: _download_range(url, args[0], args[1][0], args[1][1], session=session, etag=etag),
+            zip(part_paths, ranges),
+        )
+    finally:
+        pool.close()
+        pool.join()
+
+    with temp_file(directory, final_name=filename) as (tfile, _):
+        for part_path in part_paths:
+            with open(part_path, 'rb') as part:
+                while True:
+                    chunk = part.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    tfile.write(chunk)
+
+    # Also removes the ranges of previous attempts with another size
+    for part_path in glob.glob('{0}.*-*.part'.format(path)):
+        os.unlink(part_path)
+    if os.path.exists(etag_path):
+        os.unlink(etag_path)
+
+
 def http_download(url, filename):
     '''
     Download the file in `url` storing it in the path given by `filename`.
@@ -10,12 +10,16 @@ from rucio.common import dumper
 from rucio.common.dumper import error, DUMPS_CACHE_DIR
 import data_models
 import datetime
+import dump_cache
 import logging
+import mmap
+import multiprocessing
 import os
 import path_parsing
 import re
 import subprocess
 import tempfile
+import zlib
 
 
 subcommands = ['consistency', 'consistency-manual']
@@ -30,7 +34,20 @@ class Consistency(data_models.DataModel):
     @classmethod
     def dump(cls, subcommand, ddm_endpoint, storage_dump, prev_date_fname=None, next_date_fname=None,
              prev_date=None, next_date=None, sort_rucio_replica_dumps=False, date=None,
-             cache_dir=DUMPS_CACHE_DIR):
+             cache_dir=DUMPS_CACHE_DIR, partitions=None, processes=None, binary_cache=False):
+        '''
+        Yields the LOST and DARK files of an RSE.
+
+        By default the three dumps are sorted and compared in one pass. If
+        `partitions` is given the dumps are instead split into that many
+        partitions by a hash of the directory of each path, and the
+        partitions are compared independently by a pool of `processes`
+        processes (by default one per CPU), without sorting the dumps.
+        If `binary_cache` is True the sorted dumps are kept as binary caches
+        (see rucio.common.dumper.dump_cache) instead of text files, so later
+        checks using the same dumps read them without parsing them again.
+        `binary_cache` is ignored if `partitions` is given.
+        '''
         logger = logging.getLogger('auditor.consistency')
         if subcommand == 'consistency':
             prev_date_fname = data_models.Replica.download(
@@ -76,32 +93,6 @@ class Consistency(data_models.DataModel):
                 relative = relative[1:]
             return '/'.join(relative)
 
-        if sort_rucio_replica_dumps:
-            prev_date_fname_sorted = gnu_sort(
-                parse_and_filter_file(prev_date_fname, parser=parser, cache_dir=cache_dir),
-                delimiter=',',
-                fieldspec='1',
-                cache_dir=cache_dir,
-            )
-
-            next_date_fname_sorted = gnu_sort(
-                parse_and_filter_file(next_date_fname, parser=parser, cache_dir=cache_dir),
-                delimiter=',',
-                fieldspec='1',
-                cache_dir=cache_dir,
-            )
-        else:
-            prev_date_fname_sorted = parse_and_filter_file(
-                prev_date_fname,
-                parser=parser,
-                cache_dir=cache_dir,
-            )
-            next_date_fname_sorted = parse_and_filter_file(
-                next_date_fname,
-                parser=parser,
-                cache_dir=cache_dir,
-            )
-
         standard_name_re = r'(ddmendpoint_{0}_\d{{2}}-\d{{2}}-\d{{4}}_[0-9a-f]{{40}})$'.format(ddm_endpoint)
         standard_name_match = re.search(standard_name_re, storage_dump)
         if standard_name_match is not None:
@@ -128,6 +119,62 @@ class Consistency(data_models.DataModel):
                 sd_prefix,
             )
 
+        if partitions:
+            prev_partitions = partition_file(prev_date_fname, parser=parser, partitions=partitions, cache_dir=cache_dir)
+            next_partitions = partition_file(next_date_fname, parser=parser, partitions=partitions, cache_dir=cache_dir)
+            storage_partitions = partition_file(storage_dump, parser=strip_storage_dump, states=False, partitions=partitions,
+                                                prefix=sd_prefix, cache_dir=cache_dir)
+
+            pool = multiprocessing.Pool(processes)
+            try:
+                for results in pool.imap_unordered(compare_partition, zip(prev_partitions, storage_partitions, next_partitions)):
+                    for apparent_status, path in results:
+                        yield cls(apparent_status, path)
+                pool.close()
+            finally:
+                pool.terminate()
+                pool.join()
+            return
+
+        if binary_cache:
+            prev_cache = build_dump_cache(prev_date_fname, parser=parser, cache_dir=cache_dir)
+            next_cache = build_dump_cache(next_date_fname, parser=parser, cache_dir=cache_dir)
+            storage_cache = build_dump_cache(storage_dump, parser=strip_storage_dump, states=False,
+                                             prefix=sd_prefix, cache_dir=cache_dir)
+
+            with dump_cache.DumpCache(prev_cache) as prevc:
+                with dump_cache.DumpCache(next_cache) as nextc:
+                    with dump_cache.DumpCache(storage_cache) as sdumpc:
+                        for apparent_status, path in _apparent_status(prevc.lines(), sdumpc.lines(), nextc.lines()):
+                            yield cls(apparent_status, path)
+            return
+
+        if sort_rucio_replica_dumps:
+            prev_date_fname_sorted = gnu_sort(
+                parse_and_filter_file(prev_date_fname, parser=parser, cache_dir=cache_dir),
+                delimiter=',',
+                fieldspec='1',
+                cache_dir=cache_dir,
+            )
+
+            next_date_fname_sorted = gnu_sort(
+                parse_and_filter_file(next_date_fname, parser=parser, cache_dir=cache_dir),
+                delimiter=',',
+                fieldspec='1',
+                cache_dir=cache_dir,
+            )
+        else:
+            prev_date_fname_sorted = parse_and_filter_file(
+                prev_date_fname,
+                parser=parser,
+                cache_dir=cache_dir,
+            )
+            next_date_fname_sorted = parse_and_filter_file(
+                next_date_fname,
+                parser=parser,
+                cache_dir=cache_dir,
+            )
+
         storage_dump_fname_sorted = gnu_sort(
             parse_and_filter_file(
                 storage_dump,
@@ -142,15 +189,24 @@ class Consistency(data_models.DataModel):
         with open(prev_date_fname_sorted) as prevf:
             with open(next_date_fname_sorted) as nextf:
                 with open(storage_dump_fname_sorted) as sdump:
-                    for path, where, status in compare3(prevf, sdump, nextf):
-                        prevstatus, nextstatus = status
+                    for apparent_status, path in _apparent_status(prevf, sdump, nextf):
+                        yield cls(apparent_status, path)
 
-                        if where[0] and not where[1] and where[2]:
-                            if prevstatus == 'A' and nextstatus == 'A':
-                                yield cls('LOST', path)
 
-                        if not where[0] and where[1] and not where[2]:
-                            yield cls('DARK', path)
+def _apparent_status(prevf, sdump, nextf):
+    '''
+    Yields tuples (apparent status, path) of the LOST and DARK files found
+    comparing the sorted parsed dumps.
+    '''
+    for path, where, status in compare3(prevf, sdump, nextf):
+        prevstatus, nextstatus = status
+
+        if where[0] and not where[1] and where[2]:
+            if prevstatus == 'A' and nextstatus == 'A':
+                yield ('LOST', path)
+
+        if not where[0] and where[1] and not where[2]:
+            yield ('DARK', path)
 
 
 def _try_to_advance(it, default=None):
@@ -237,6 +293,116 @@ def compare3(it0, it1, it2):
             path2, status2 = split_if_not_none(v2)
 
 
+def _partition_key(line, states=True):
+    '''
+    Directory of the path in a parsed line of a Rucio replica dump
+    ('path,state', if `states` is True) or of a storage dump ('path').
+    '''
+    if states:
+        line = line.rsplit(',', 1)[0]
+    return line.rpartition('/')[0]
+
+
+def partition_file(filepath, parser=lambda s: s, states=True, partitions=64, prefix=None, postfix='partition', cache_dir=DUMPS_CACHE_DIR):
+    '''
+    Parses `filepath` with the `parser` function (as parse_and_filter_file)
+    and splits the result into `partitions` files, by a hash of the
+    directory of each path, so the files of a directory are always in the
+    same partition whatever the dump.
+
+    The output files are named <prefix>_<postfix><partitions>_<n> and are
+    stored in `cache_dir`. If `prefix` is None the name of the input file
+    is used. The files are created with random names and renamed when all
+    are complete.
+
+    :param states: True if the parsed lines are 'path,state' (Rucio replica
+    dumps), False if they are only paths (storage dumps).
+    :returns: List with the paths of the partitions.
+    '''
+    prefix = os.path.basename(filepath) if prefix is None else prefix
+    output_paths = [
+        os.path.join(cache_dir, '{0}_{1}{2}_{3}'.format(prefix, postfix, partitions, n))
+        for n in xrange(partitions)
+    ]
+
+    if all(os.path.exists(path) for path in output_paths):
+        return output_paths
+
+    temp_paths = []
+    outputs = []
+    try:
+        for _ in xrange(partitions):
+            fd, tpath = tempfile.mkstemp(dir=cache_dir)
+            temp_paths.append(tpath)
+            outputs.append(os.fdopen(fd, 'w'))
+
+        input_ = dumper.smart_open(filepath)
+        for line in input_:
+            parsed = parser(line)
+            outputs[zlib.crc32(_partition_key(parsed, states)) % partitions].write(parsed + '\n')
+        input_.close()
+
+        for output in outputs:
+            output.close()
+        for tpath, path in zip(temp_paths, output_paths):
+            os.rename(tpath, path)
+    except:
+        for output in outputs:
+            output.close()
+        for tpath in temp_paths:
+            if os.path.exists(tpath):
+                os.unlink(tpath)
+        raise
+
+    return output_paths
+
+
+def mmap_lines(filepath):
+    '''
+    Generator over the stripped, non empty lines of a file, read through
+    a memory map.
+    '''
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for line in iter(mapped.readline, ''):
+                line = line.strip()
+                if line:
+                    yield line
+        finally:
+            mapped.close()
+
+
+def compare_partition(paths):
+    '''
+    Compares one partition of the older Rucio replica dump, of the storage
+    dump and of the newer Rucio replica dump, with the same rules as
+    Consistency.dump.
+
+    :param paths: Tuple with the paths of the three partitions.
+    :returns: List of tuples (apparent status, path) sorted by path.
+    '''
+    prev_fname, storage_fname, next_fname = paths
+    prev = dict(line.rsplit(',', 1) for line in mmap_lines(prev_fname))
+    next_ = dict(line.rsplit(',', 1) for line in mmap_lines(next_fname))
+
+    results = []
+    storage = set()
+    for path in mmap_lines(storage_fname):
+        storage.add(path)
+        if path not in prev and path not in next_:
+            results.append(('DARK', path))
+
+    for path, status in prev.iteritems():
+        if status == 'A' and next_.get(path) == 'A' and path not in storage:
+            results.append(('LOST', path))
+
+    results.sort(key=lambda result: result[1])
+    return results
+
+
 def parse_and_filter_file(filepath, parser=lambda s: s, filter_=lambda s: s, prefix=None, postfix='parsed', cache_dir=DUMPS_CACHE_DIR):
     '''
     Opens `filepath` as a read-only file, and for each line of the file
@@ -282,6 +448,46 @@ def parse_and_filter_file(filepath, parser=lambda s: s, filter_=lambda s: s, pre
     return output_path
 
 
+def build_dump_cache(filepath, parser=lambda s: s, states=True, prefix=None, postfix='cache', cache_dir=DUMPS_CACHE_DIR):
+    '''
+    Creates the binary cache (see rucio.common.dumper.dump_cache) of the
+    dump in `filepath` if it does not exist yet. The lines are parsed with
+    the `parser` function, as in parse_and_filter_file, and sorted by path.
+    The intermediate text files are removed once the cache is written.
+
+    The cache is named <prefix>_<postfix> and stored in `cache_dir`. If
+    `prefix` is None the name of the input file is used.
+
+    :param states: True if the parsed lines are 'path,state' (Rucio replica
+    dumps), False if they are only paths (storage dumps).
+    :returns: The path of the cache.
+    '''
+    prefix = os.path.basename(filepath) if prefix is None else prefix
+    output_name = '_'.join((prefix, postfix))
+    output_path = os.path.join(cache_dir, output_name)
+
+    if os.path.exists(output_path):
+        return output_path
+
+    parsed_path = parse_and_filter_file(filepath, parser=parser, prefix=output_name, cache_dir=cache_dir)
+    try:
+        if states:
+            sorted_path = gnu_sort(parsed_path, delimiter=',', fieldspec='1,1', cache_dir=cache_dir)
+        else:
+            sorted_path = gnu_sort(parsed_path, cache_dir=cache_dir)
+    finally:
+        os.unlink(parsed_path)
+
+    try:
+        with open(sorted_path) as lines:
+            with dumper.temp_file(cache_dir, final_name=output_name) as (output, _):
+                dump_cache.write_dump_cache(lines, output, states=states, tmp_dir=cache_dir)
+    finally:
+        os.unlink(sorted_path)
+
+    return output_path
+
+
 def gnu_sort(file_path, prefix=None, delimiter=None, fieldspec=None, cache_dir=DUMPS_CACHE_DIR):
     '''
     Sort the file with path `file_path` using the GNU sort command, the
@@ -368,6 +574,26 @@ def populate_args(argparser):
     parser_manual.add_argument('replicas_after')
 
     for p in (parser, parser_manual):
+        p.add_argument(
+            '--partitions',
+            help='Split the dumps into this many partitions and compare them '
+                 'in parallel instead of sorting them.',
+            type=int,
+            default=None,
+        )
+        p.add_argument(
+            '--processes',
+            help='Number of processes comparing the partitions (by default '
+                 'one per CPU).',
+            type=int,
+            default=None,
+        )
+        p.add_argument(
+            '--binary-cache',
+            help='Keep the sorted dumps as binary caches, reused by later '
+                 'checks of the same dumps (ignored with --partitions).',
+            action='store_true'
+        )
         p.add_argument(
             '--sort-rucio-dumps',
             help='Starting 18-08-2015 the Rucio Replica Dumps are sorted by '
@@ -439,6 +665,9 @@ def parse_args(args):
     args_dict['ddm_endpoint'] = args.ddm_endpoint
     args_dict['storage_dump'] = args.storage_dump
     args_dict['sort_rucio_replica_dumps'] = args.sort_rucio_dumps
+    args_dict['partitions'] = args.partitions
+    args_dict['processes'] = args.processes
+    args_dict['binary_cache'] = args.binary_cache
     if args.subcommand == 'consistency':
         args_dict.update(_parse_args_consistency(args))
     else:
@@ -23,9 +23,8 @@ import tabulate
 from rucio.common.dumper import DUMPS_CACHE_DIR
 from rucio.common.dumper import HTTPDownloadFailed
 from rucio.common.dumper import get_requests_session
-from rucio.common.dumper import http_download_to_file
+from rucio.common.dumper import http_download_resumable
 from rucio.common.dumper import smart_open
-from rucio.common.dumper import temp_file
 from rucio.common.dumper import to_datetime
 
 
@@ -188,8 +187,7 @@ class DataModel(object):
                 )
                 raise HTTPDownloadFailed('Downloading {0} dump'.format(cls.__name__), code=response.status_code)
 
-            with temp_file(cache_dir, final_name=filename) as (tfile, _):
-                http_download_to_file(url, tfile, session=requests_session)
+            http_download_resumable(url, path, session=requests_session, head=response)
 
         return path
 
@@ -0,0 +1,205 @@
+# Copyright European Organization for Nuclear Research (CERN)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+
+'''
+Compact binary cache of the paths and states of a dump.
+
+The cache is written once per dump and is read through mmap, so the
+consistency checks do not need to parse and sort the text dump again.
+A cache file contains:
+
+    - A header: magic string, number of records, number of directories,
+      offset of the names and offset of the directory table.
+    - The records sorted by path, all of the same width: directory
+      number, offset and length of the file name and the state (one
+      byte, '\\0' for the storage dumps which have no state).
+    - The file names.
+    - The directory table: offset and length of each directory, followed
+      by the directory names. Each directory is stored only once.
+'''
+
+from rucio.common import dumper
+import mmap
+import os
+import struct
+import tempfile
+
+MAGIC = 'RUCIODC1'
+HEADER = struct.Struct('<8sQQQQ')
+RECORD = struct.Struct('<IQHc')
+DIRECTORY = struct.Struct('<QI')
+NO_STATE = '\0'
+
+
+class DumpCacheError(Exception):
+    pass
+
+
+def write_dump_cache(lines, output, states=True, tmp_dir=None):
+    '''
+    Writes the cache of a sorted dump.
+
+    :param lines: Iterable of parsed lines sorted by path, 'path,state' if
+    `states` is True else 'path'.
+    :param output: Seekable file object open for writing.
+    :param states: False for the storage dumps, whose lines are only paths.
+    :param tmp_dir: Directory of the temporary file holding the names until
+    all the records are written.
+    :returns: The number of records.
+    '''
+    directories = {}
+    names = tempfile.TemporaryFile(dir=tmp_dir)
+    names_size = 0
+    records = 0
+    last_path = None
+
+    output.write(HEADER.pack(MAGIC, 0, 0, 0, 0))
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if states:
+            path, state = line.rsplit(',', 1)
+            state = state[:1] or NO_STATE
+        else:
+            path, state = line, NO_STATE
+        if last_path is not None and path <= last_path:
+            if path == last_path:
+                continue
+            raise DumpCacheError('Dump not sorted by path: "{0}" after "{1}"'.format(path, last_path))
+        last_path = path
+
+        directory, _, name = path.rpartition('/')
+        if directory not in directories:
+            directories[directory] = len(directories)
+        output.write(RECORD.pack(directories[directory], names_size, len(name), state))
+        names.write(name)
+        names_size += len(name)
+        records += 1
+
+    names_offset = output.tell()
+    names.seek(0)
+    while True:
+        chunk = names.read(dumper.CHUNK_SIZE)
+        if not chunk:
+            break
+        output.write(chunk)
+    names.close()
+
+    directories_offset = output.tell()
+    ordered = sorted(directories, key=directories.get)
+    position = directories_offset + DIRECTORY.size * len(ordered)
+    for directory in ordered:
+        output.write(DIRECTORY.pack(position, len(directory)))
+        position += len(directory)
+    for directory in ordered:
+        output.write(directory)
+
+    output.seek(0)
+    output.write(HEADER.pack(MAGIC, records, len(ordered), names_offset, directories_offset))
+    output.seek(0, os.SEEK_END)
+    return records
+
+
+class DumpCache(object):
+    '''
+    Read-only view of a dump cache, mapped in memory.
+
+    Example:
+    >>> with DumpCache(path) as cache:
+    >>>     cache.state('user/someuser/aa/bb/file')
+    >>>     for path, state in cache:
+    >>>         pass
+    '''
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < HEADER.size:
+            self._file.close()
+            raise DumpCacheError('Truncated dump cache {0}'.format(path))
+
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._records, nr_directories, self._names_offset, directories_offset = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise DumpCacheError('{0} is not a dump cache'.format(path))
+
+        self._directories = []
+        for i in xrange(nr_directories):
+            offset, length = DIRECTORY.unpack_from(self._map, directories_offset + i * DIRECTORY.size)
+            self._directories.append(self._map[offset:offset + length])
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._records
+
+    def __getitem__(self, index):
+        '''
+        :returns: Tuple (path, state) of the record `index`, the state is
+        None for the storage dumps.
+        '''
+        if index < 0:
+            index += self._records
+        if not 0 <= index < self._records:
+            raise IndexError(index)
+        directory, offset, length, state = RECORD.unpack_from(self._map, HEADER.size + index * RECORD.size)
+        offset += self._names_offset
+        name = self._map[offset:offset + length]
+        directory = self._directories[directory]
+        path = '/'.join((directory, name)) if directory else name
+        return path, (None if state == NO_STATE else state)
+
+    def __iter__(self):
+        for index in xrange(self._records):
+            yield self[index]
+
+    def find(self, path):
+        '''
+        Binary search of `path` in the records.
+
+        :returns: The index of the record or None if `path` is not in the
+        dump.
+        '''
+        low, high = 0, self._records
+        while low < high:
+            middle = (low + high) // 2
+            if self[middle][0] < path:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._records and self[low][0] == path:
+            return low
+        return None
+
+    def __contains__(self, path):
+        return self.find(path) is not None
+
+    def state(self, path):
+        '''
+        :returns: The state of `path`, or None if `path` is not in the dump
+        or the dump has no states.
+        '''
+        index = self.find(path)
+        return None if index is None else self[index][1]
+
+    def lines(self):
+        '''
+        Generator over the records formatted as the parsed text dumps
+        ('path,state' or 'path'), e.g. for
+        rucio.common.dumper.consistency.compare3.
+        '''
+        for path, state in self:
+            yield path if state is None else ','.join((path, state))
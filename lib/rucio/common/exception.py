@@ -129,6 +129,15 @@ class CounterNotFound(RucioException):
         self._message = "The requested counter does not exist."
 
 
+class CounterUpdateConflict(RucioException):
+    """
+    RucioException
+    """
+    def __init__(self, *args, **kwargs):
+        super(CounterUpdateConflict, self).__init__(args, kwargs)
+        self._message = "The counter updates changed during their aggregation."
+
+
 class DatabaseException(RucioException):
     """
     RucioException
@@ -0,0 +1,133 @@
+"""
+ Copyright European Organization for Nuclear Research (CERN)
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ You may not use this file except in compliance with the License.
+ You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+
+ Streaming serialization of replica listings as JSON lines or metalink 3/4 documents. The replicas
+ of a file are only ordered for the metalink documents, by distance if select=geoip is requested,
+ randomly otherwise. The output is written in chunks of at least BUFFER_SIZE bytes.
+"""
+
+import random
+
+from geoip2.errors import AddressNotFoundError
+
+from rucio.common.replicas_selector import geoIP_order
+from rucio.common.utils import APIEncoder
+
+
+BUFFER_SIZE = 65536  # 64KiB
+
+CONTENT_TYPES = {None: 'application/x-json-stream',
+                 3: 'application/metalink+xml',
+                 4: 'application/metalink4+xml'}
+HEADERS = {None: '',
+           3: '<?xml version="1.0" encoding="UTF-8"?>\n<metalink version="3.0" xmlns="http://www.metalinker.org/">\n<files>\n',
+           4: '<?xml version="1.0" encoding="UTF-8"?>\n<metalink xmlns="urn:ietf:params:xml:ns:metalink">\n'}
+FOOTERS = {None: '',
+           3: '</files>\n</metalink>\n',
+           4: '</metalink>\n'}
+
+ENCODER = APIEncoder()
+
+
+class ReplicaSerializer(object):
+    """
+    Serializer of the files returned by rucio.api.replica.list_replicas.
+    """
+
+    def __init__(self, metalink=None, select=None, limit=None, client_ip=None, glfn=True):
+        """
+        :param metalink:   None for JSON lines, 3 or 4 for the metalink version.
+        :param select:     'geoip' to order the replicas by distance to the client.
+        :param limit:      Maximal number of replicas per file in the metalink documents.
+        :param client_ip:  The IP of the client.
+        :param glfn:       Add the glfn element to the metalink files.
+        """
+        self.metalink = metalink
+        self.select = select
+        self.limit = limit
+        self.client_ip = client_ip
+        self.glfn = glfn
+        self.content_type = CONTENT_TYPES[metalink]
+        self.__locations = {}
+
+    def __location(self, rse):
+        # The url fragment is the same for all the replicas of an RSE
+        if rse not in self.__locations:
+            self.__locations[rse] = '   <url location="%s" priority="' % rse
+        return self.__locations[rse]
+
+    def replicas(self, rfile):
+        """
+        :returns:  List of (pfn, rse) in the order of the metalink documents.
+        """
+        rses = {}
+        for rse, pfns in rfile['rses'].iteritems():
+            for pfn in pfns:
+                rses[pfn] = rse
+        pfns = rses.keys()
+        if self.select == 'geoip':
+            try:
+                pfns = geoIP_order(rses, self.client_ip)
+            except AddressNotFoundError:
+                pass
+        else:
+            random.shuffle(pfns)
+        if self.limit:
+            pfns = pfns[:self.limit]
+        return [(pfn, rses[pfn]) for pfn in pfns]
+
+    def serialize(self, rfile):
+        """
+        :returns:  The serialized file.
+        """
+        if self.metalink is None:
+            return ENCODER.encode(rfile) + '\n'
+
+        name, scope = rfile['name'], rfile['scope']
+        if self.metalink == 3:
+            parts = [' <file name="', name, '">\n']
+            if self.glfn:
+                parts.extend(('  <glfn name="/atlas/rucio/', scope, ':', name, '"></glfn>\n'))
+            parts.append('  <resources>\n')
+            for idx, (pfn, _) in enumerate(self.replicas(rfile)):
+                parts.extend(('   <url type="http" preference="', str(idx), '">', pfn, '</url>\n'))
+            parts.append('  </resources>\n </file>\n')
+        else:
+            parts = [' <file name="', name, '">\n  <identity>', scope, ':', name, '</identity>\n']
+            if rfile['adler32'] is not None:
+                parts.extend(('  <hash type="adler32">', rfile['adler32'], '</hash>\n'))
+            if rfile['md5'] is not None:
+                parts.extend(('  <hash type="md5">', rfile['md5'], '</hash>\n'))
+            parts.extend(('  <size>', str(rfile['bytes']), '</size>\n'))
+            if self.glfn:
+                parts.extend(('  <glfn name="/atlas/rucio/', scope, ':', name, '"></glfn>\n'))
+            for idx, (pfn, rse) in enumerate(self.replicas(rfile), 1):
+                parts.extend((self.__location(rse), str(idx), '">', pfn, '</url>\n'))
+            parts.append(' </file>\n')
+        return ''.join(parts)
+
+    def stream(self, rfiles, buffer_size=BUFFER_SIZE):
+        """
+        Serialize the files with the header and footer of the document.
+
+        :param rfiles:       Iterable of files.
+        :param buffer_size:  Minimal size of the chunks.
+        :returns:            Generator of chunks.
+        """
+        chunks = [HEADERS[self.metalink]]
+        size = len(chunks[0])
+        for rfile in rfiles:
+            chunk = self.serialize(rfile)
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= buffer_size:
+                yield ''.join(chunks)
+                chunks, size = [], 0
+        chunks.append(FOOTERS[self.metalink])
+        chunk = ''.join(chunks)
+        if chunk:
+            yield chunk
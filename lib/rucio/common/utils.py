@@ -19,16 +19,17 @@ import os
 import pwd
 import re
 import subprocess
-import zlib
 
 
 from getpass import getuser
 from itertools import izip_longest
 from logging import getLogger, Formatter
 from logging.handlers import RotatingFileHandler
+from threading import Lock
 from urllib import urlencode, quote
 from uuid import uuid4 as uuid
 
+from rucio.common.checksum import checksum_file
 from rucio.common.config import config_get
 
 try:
@@ -109,22 +110,20 @@ def adler32(file):
 
     :returns: Hexified string, padded to 8 values.
     """
-
-    # adler starting value is _not_ 0
-    adler = 1L
-
     try:
-        openFile = open(file, 'rb')
-        for line in openFile:
-            adler = zlib.adler32(line, adler)
+        return checksum_file(file, ('adler32', ))['adler32']
     except:
         raise Exception('FATAL - could not get checksum of file %s' % file)
 
-    # backflip on 32bit
-    if adler < 0:
-        adler = adler + 2 ** 32
 
-    return str('%08x' % adler)
+def md5(file):
+    """
+    :returns: The hexified md5 of the file.
+    """
+    try:
+        return checksum_file(file, ('md5', ))['md5']
+    except:
+        raise Exception('FATAL - could not get checksum of file %s' % file)
 
 
 def str_to_date(string):
@@ -268,6 +267,94 @@ def chunks(l, n):
         yield l[i:i + n]
 
 
+class LRUCache(object):
+    """
+    Thread-safe mapping keeping the maxsize most recently used entries.
+    """
+
+    PREV, NEXT, KEY, VALUE = 0, 1, 2, 3
+
+    def __init__(self, maxsize=1000):
+        """
+        :param maxsize: Maximum number of entries.
+        """
+        self.maxsize = maxsize
+        self.__lock = Lock()
+        self.__map = {}
+        self.__root = []
+        self.__root[:] = [self.__root, self.__root, None, None]
+
+    def __unlink(self, link):
+        link[self.PREV][self.NEXT] = link[self.NEXT]
+        link[self.NEXT][self.PREV] = link[self.PREV]
+
+    def __append(self, link):
+        last = self.__root[self.PREV]
+        link[self.PREV], link[self.NEXT] = last, self.__root
+        last[self.NEXT] = self.__root[self.PREV] = link
+
+    def get(self, key, default=None):
+        """
+        Return the value of a key and mark it as most recently used.
+
+        :param key:      The key.
+        :param default:  Value returned if the key is not cached.
+        """
+        with self.__lock:
+            link = self.__map.get(key)
+            if link is None:
+                return default
+            self.__unlink(link)
+            self.__append(link)
+            return link[self.VALUE]
+
+    def set(self, key, value):
+        """
+        Add or replace a value, evicting the least recently used entry if the cache is full.
+
+        :param key:    The key.
+        :param value:  The value.
+        """
+        with self.__lock:
+            link = self.__map.get(key)
+            if link is not None:
+                self.__unlink(link)
+                link[self.VALUE] = value
+            else:
+                link = [None, None, key, value]
+                self.__map[key] = link
+            self.__append(link)
+            while len(self.__map) > self.maxsize:
+                oldest = self.__root[self.NEXT]
+                self.__unlink(oldest)
+                del self.__map[oldest[self.KEY]]
+
+    def delete(self, key):
+        """
+        Remove a key if it is cached.
+
+        :param key:  The key.
+        """
+        with self.__lock:
+            link = self.__map.pop(key, None)
+            if link is not None:
+                self.__unlink(link)
+
+    def clear(self):
+        """
+        Remove all entries.
+        """
+        with self.__lock:
+            self.__map.clear()
+            self.__root[:] = [self.__root, self.__root, None, None]
+
+    def __contains__(self, key):
+        return key in self.__map
+
+    def __len__(self):
+        return len(self.__map)
+
+
 def my_key_generator(namespace, fn, **kw):
     """
     Customyzed key generator for dogpile
@@ -22,6 +22,7 @@ from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import exc
 
 import rucio.core.account_counter
+import rucio.core.permission_cache
 
 from rucio.common import exception
 from rucio.db.sqla import models
@@ -89,6 +90,7 @@ def del_account(account, session=None):
     :param account: the account name.
     :param session: the database session in use.
     """
+    rucio.core.permission_cache.invalidate(account, session=session)
     query = session.query(models.Account).filter_by(account=account).filter_by(status=AccountStatus.ACTIVE)
     try:
         account = query.one()
@@ -121,6 +123,7 @@ def set_account_status(account, status, session=None):
     :param status: The status for the account.
     :param session: the database session in use.
     """
+    rucio.core.permission_cache.invalidate(account, session=session)
     query = session.query(models.Account).filter_by(account=account)
     try:
         account = query.one()
@@ -241,6 +244,7 @@ def add_account_attribute(account, key, value, session=None):
     except exc.NoResultFound:
         raise exception.AccountNotFound("Account ID '{0}' does not exist".format(account))
 
+    rucio.core.permission_cache.invalidate(account, session=session)
     new_attr = models.AccountAttrAssociation(account=account, key=key, value=value)
     try:
         new_attr.save(session=session)
@@ -266,4 +270,5 @@ def del_account_attribute(account, key, session=None):
     aid = session.query(models.AccountAttrAssociation).filter_by(key=key, account=account).first()
     if aid is None:
         raise exception.AccountNotFound('Attribute ({0}) does not exist for the account {0}!'.format(key, account))
+    rucio.core.permission_cache.invalidate(account, session=session)
     aid.delete(session=session)
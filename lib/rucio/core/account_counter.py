@@ -10,17 +10,25 @@
 # - Mario Lassnig, <mario.lassnig@cern.ch>, 2013-2014
 # - Martin Barisits, <martin.barisits@cern.ch>, 2014
 
+from datetime import datetime
+
+from sqlalchemy import and_, func, or_
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.sql.expression import bindparam, text
 
 import rucio.core.account
 import rucio.core.rse
 
+from rucio.common.exception import CounterUpdateConflict
+from rucio.common.utils import chunks
+from rucio.core.counter_accumulator import ACCUMULATE_COUNTERS, get_accumulator
 from rucio.db.sqla import models
 from rucio.db.sqla.session import read_session, transactional_session
 
 MAX_COUNTERS = 10
 
+ACCUMULATOR = get_accumulator(model=models.UpdatedAccountCounter, columns=('rse_id', 'account'))
+
 
 @transactional_session
 def add_counter(rse_id, account, session=None):
@@ -73,7 +81,10 @@ def increase(rse_id, account, files, bytes, session=None):
     :param session: The database session in use.
     """
 
-    models.UpdatedAccountCounter(account=account, rse_id=rse_id, files=files, bytes=bytes).save(session=session)
+    if ACCUMULATE_COUNTERS:
+        ACCUMULATOR.add(key=(rse_id, account), files=files, bytes=bytes, session=session)
+    else:
+        models.UpdatedAccountCounter(account=account, rse_id=rse_id, files=files, bytes=bytes).save(session=session)
 
 
 @transactional_session
@@ -158,7 +169,10 @@ def update_account_counter(account, rse_id, session=None):
     :param session:  Database session in use.
     """
 
-    updated_account_counters = session.query(models.UpdatedAccountCounter).filter_by(account=account, rse_id=rse_id).all()
+    updated_account_counters = session.query(models.UpdatedAccountCounter.id,
+                                             models.UpdatedAccountCounter.files,
+                                             models.UpdatedAccountCounter.bytes).\
+        filter_by(account=account, rse_id=rse_id).all()
 
     try:
         account_counter = session.query(models.AccountUsage).filter_by(account=account, rse_id=rse_id).one()
@@ -170,5 +184,60 @@ def update_account_counter(account, rse_id, session=None):
                             files=sum([updated_account_counter.files for updated_account_counter in updated_account_counters]),
                             bytes=sum([updated_account_counter.bytes for updated_account_counter in updated_account_counters])).save(session=session)
 
-    for update in updated_account_counters:
-        update.delete(flush=False, session=session)
+    for ids in chunks([updated_account_counter.id for updated_account_counter in updated_account_counters], 100):
+        session.query(models.UpdatedAccountCounter).filter(models.UpdatedAccountCounter.id.in_(ids)).\
+            delete(synchronize_session=False)
+
+
+@transactional_session
+def __aggregate_account_counters(counters, session=None):
+    """
+    Sum up the updated_account_counters of some accounts and RSEs in the database and delete them in bulk.
+
+    :param counters:               List of tuples (account, rse_id) to update.
+    :param session:                Database session in use.
+    :raises CounterUpdateConflict: If updates were added between the sum and the delete.
+    """
+    # The ids are random, so the aggregated rows are bounded by their creation date instead
+    # and the delete must remove as many rows as were summed up
+    now = datetime.utcnow()
+    condition = and_(or_(*[and_(models.UpdatedAccountCounter.account == account,
+                                models.UpdatedAccountCounter.rse_id == rse_id) for account, rse_id in counters]),
+                     models.UpdatedAccountCounter.created_at <= now)
+    deltas = session.query(models.UpdatedAccountCounter.account,
+                           models.UpdatedAccountCounter.rse_id,
+                           func.count(models.UpdatedAccountCounter.id),
+                           func.sum(models.UpdatedAccountCounter.files),
+                           func.sum(models.UpdatedAccountCounter.bytes)).\
+        filter(condition).\
+        group_by(models.UpdatedAccountCounter.account, models.UpdatedAccountCounter.rse_id).all()
+
+    rowcount = session.query(models.UpdatedAccountCounter).filter(condition).delete(synchronize_session=False)
+    if rowcount != sum([count for account, rse_id, count, files, bytes in deltas]):
+        raise CounterUpdateConflict()
+
+    deltas = dict(((account, rse_id), (files, bytes)) for account, rse_id, count, files, bytes in deltas)
+    if not deltas:
+        return
+    query = session.query(models.AccountUsage).filter(or_(*[and_(models.AccountUsage.account == account,
+                                                                 models.AccountUsage.rse_id == rse_id) for account, rse_id in deltas]))
+    for account_counter in query:
+        files, bytes = deltas.pop((account_counter.account, account_counter.rse_id))
+        account_counter.bytes += bytes
+        account_counter.files += files
+    for (account, rse_id), (files, bytes) in deltas.iteritems():
+        models.AccountUsage(rse_id=rse_id, account=account, files=files, bytes=bytes).save(session=session, flush=False)
+
+
+def update_account_counters(counters):
+    """
+    Update the account_counters of a batch of accounts and RSEs in one transaction,
+    falling back to update_account_counter if updates were added concurrently.
+
+    :param counters:  List of tuples (account, rse_id) to update.
+    """
+    try:
+        __aggregate_account_counters(counters=counters)
+    except CounterUpdateConflict:
+        for account, rse_id in counters:
+            update_account_counter(account=account, rse_id=rse_id)
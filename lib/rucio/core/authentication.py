@@ -18,11 +18,14 @@ Core authentication
 import datetime
 import hashlib
 
+from ConfigParser import NoOptionError, NoSectionError
+
 # Create cache region used for token validation
 from dogpile.cache import make_region
 from dogpile.cache.api import NO_VALUE
 
-from rucio.common.utils import generate_uuid
+from rucio.common.config import config_get
+from rucio.common.utils import generate_uuid, LRUCache
 from rucio.core.account import account_exists
 from rucio.db.sqla import models
 from rucio.db.sqla.constants import IdentityType
@@ -43,6 +46,19 @@ TOKENREGION = make_region(
     expiration_time=3600
 )
 
+try:
+    TOKEN_CACHE_SIZE = int(config_get('authentication', 'token_cache_size'))
+except (NoOptionError, NoSectionError):
+    TOKEN_CACHE_SIZE = 10000
+
+try:
+    INVALID_TOKEN_TTL = int(config_get('authentication', 'invalid_token_ttl'))
+except (NoOptionError, NoSectionError):
+    INVALID_TOKEN_TTL = 30
+
+# Process-local tier in front of TOKENREGION: token -> (value or None if invalid, expiry of the entry)
+TOKEN_CACHE = LRUCache(maxsize=TOKEN_CACHE_SIZE)
+
 
 @read_session
 def exist_identity_account(identity, type, account, session=None):
@@ -181,15 +197,30 @@ def validate_auth_token(token):
 
     # Be gentle with bash variables, there can be whitespace
     token = token.strip()
+    now = datetime.datetime.utcnow()
+
+    # Check if token can be found in the process-local cache, valid tokens are kept until their lifetime
+    cached = TOKEN_CACHE.get(token)
+    if cached is not None:
+        value, expires_at = cached
+        if expires_at > now:
+            return value
+        TOKEN_CACHE.delete(token)
 
     # Check if token ca be found in cache region
     value = TOKENREGION.get(token)
     if value is NO_VALUE:  # no cached entry found
         value = query_token(token)
         value and TOKENREGION.set(token, value)
-    elif value.get('lifetime', datetime.datetime(1970, 1, 1)) < datetime.datetime.utcnow():  # check if expired
+    elif value.get('lifetime', datetime.datetime(1970, 1, 1)) < now:  # check if expired
         TOKENREGION.delete(token)
-        return
+        value = None
+
+    if value:
+        TOKEN_CACHE.set(token, (value, value.get('lifetime', now)))
+    elif INVALID_TOKEN_TTL > 0:
+        # Invalid tokens are remembered for a short time, so that retries do not all reach the database
+        TOKEN_CACHE.set(token, (None, now + datetime.timedelta(seconds=INVALID_TOKEN_TTL)))
     return value
 
 
@@ -0,0 +1,167 @@
+'''
+  Copyright European Organization for Nuclear Research (CERN)
+  Licensed under the Apache License, Version 2.0 (the "License");
+  You may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+
+  Process-local accumulation of the RSE and account counter updates.
+
+  With `[abacus] accumulate_counters` enabled, rucio.core.rse_counter.increase and
+  rucio.core.account_counter.increase do not insert one updated counter row per call. The deltas
+  are kept on the session, merged per key into the process-wide accumulator when the session
+  commits (and dropped when it rolls back), and written as one updated counter row per key every
+  `accumulate_interval` seconds. Deltas which are not written yet are lost if the process is killed.
+'''
+
+import atexit
+import logging
+import threading
+import time
+import traceback
+
+from ConfigParser import NoOptionError, NoSectionError
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from rucio.common.config import config_get
+from rucio.db.sqla.session import transactional_session
+
+
+try:
+    ACCUMULATE_COUNTERS = config_get('abacus', 'accumulate_counters').lower() in ('true', '1', 'yes')
+except (NoOptionError, NoSectionError):
+    ACCUMULATE_COUNTERS = False
+
+try:
+    ACCUMULATE_INTERVAL = int(config_get('abacus', 'accumulate_interval'))
+except (NoOptionError, NoSectionError):
+    ACCUMULATE_INTERVAL = 10
+
+SESSION_KEY = 'rucio.counter_deltas'
+
+
+class CounterAccumulator(object):
+    """
+    Deltas of one updated counter table, merged per key.
+    """
+
+    def __init__(self, model, columns, interval=ACCUMULATE_INTERVAL):
+        """
+        :param model:     The updated counter model, e.g. models.UpdatedRSECounter.
+        :param columns:   Names of the key columns, e.g. ('rse_id', ).
+        :param interval:  Seconds between two writes of the deltas.
+        """
+        self.model = model
+        self.columns = columns
+        self.interval = interval
+        self.__deltas = {}
+        self.__lock = threading.Lock()
+        self.__flusher = None
+
+    def add(self, key, files, bytes, session):
+        """
+        Add a delta in the transaction of the session.
+
+        :param key:      Tuple of the values of the key columns.
+        :param files:    The number of added files.
+        :param bytes:    The number of added bytes.
+        :param session:  The database session in use.
+        """
+        session.info.setdefault(SESSION_KEY, []).append((self, key, files, bytes))
+
+    def merge(self, key, files, bytes):
+        """
+        Merge a committed delta.
+        """
+        with self.__lock:
+            total_files, total_bytes = self.__deltas.get(key, (0, 0))
+            self.__deltas[key] = (total_files + files, total_bytes + bytes)
+            if self.__flusher is None:
+                self.__flusher = threading.Thread(target=self.__run)
+                self.__flusher.daemon = True
+                self.__flusher.start()
+
+    def pending(self):
+        """
+        :returns:  Dictionary {key: (files, bytes)} of the deltas not written yet.
+        """
+        with self.__lock:
+            return dict(self.__deltas)
+
+    def flush(self):
+        """
+        Write one updated counter row per key.
+
+        :returns:  The number of written rows.
+        """
+        with self.__lock:
+            deltas, self.__deltas = self.__deltas, {}
+        deltas = dict((key, delta) for key, delta in deltas.iteritems() if delta != (0, 0))
+        if not deltas:
+            return 0
+        try:
+            self.__insert(deltas)
+        except:
+            with self.__lock:
+                for key, (files, bytes) in deltas.iteritems():
+                    total_files, total_bytes = self.__deltas.get(key, (0, 0))
+                    self.__deltas[key] = (total_files + files, total_bytes + bytes)
+            raise
+        return len(deltas)
+
+    @transactional_session
+    def __insert(self, deltas, session=None):
+        rows = []
+        for key, (files, bytes) in deltas.iteritems():
+            row = dict(zip(self.columns, key))
+            row.update({'files': files, 'bytes': bytes})
+            rows.append(row)
+        session.bulk_insert_mappings(self.model, rows)
+
+    def __run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logging.error(traceback.format_exc())
+
+
+ACCUMULATORS = []
+
+
+def get_accumulator(model, columns):
+    """
+    Create an accumulator which is flushed at exit.
+
+    :param model:    The updated counter model.
+    :param columns:  Names of the key columns.
+    :returns:        The CounterAccumulator.
+    """
+    accumulator = CounterAccumulator(model=model, columns=columns)
+    ACCUMULATORS.append(accumulator)
+    return accumulator
+
+
+def flush_accumulators():
+    """
+    Write the deltas of all accumulators.
+    """
+    for accumulator in ACCUMULATORS:
+        accumulator.flush()
+
+
+@event.listens_for(Session, 'after_commit')
+def _merge_deltas(session):
+    for accumulator, key, files, bytes in session.info.pop(SESSION_KEY, []):
+        accumulator.merge(key, files, bytes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_deltas(session):
+    session.info.pop(SESSION_KEY, None)
+
+
+atexit.register(flush_accumulators)
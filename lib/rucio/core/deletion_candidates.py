@@ -0,0 +1,265 @@
+'''
+  Copyright European Organization for Nuclear Research (CERN)
+  Licensed under the Apache License, Version 2.0 (the "License");
+  You may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+
+  Process-local index of the replicas the reaper can delete.
+
+  For every RSE (and reaper partition) the deletion candidates are kept in a heap ordered by
+  tombstone. The heap is filled by scanning the tombstone index in windows of `candidates_window`
+  replicas, topped up on every call with the obsolete replicas and, once the scan is complete,
+  with the replicas whose tombstone expired since the previous call. The BEING_DELETED replicas
+  are obsolete, so they come back once `delay_seconds` expired. Candidates which could not be
+  marked BEING_DELETED are requeued by the caller. The index is fully reloaded every
+  `candidates_ttl` seconds.
+
+  Candidates are checked again by primary key right before they are handed out, so the cost of
+  a call is proportional to the number of replicas returned and not to the size of the RSE.
+'''
+
+import heapq
+import time
+
+from ConfigParser import NoOptionError, NoSectionError
+from datetime import datetime
+from threading import Lock
+
+from sqlalchemy import and_, or_
+
+from rucio.common.config import config_get
+from rucio.common.utils import chunks
+from rucio.core.replica import get_unlocked_replicas_query
+from rucio.db.sqla import models
+from rucio.db.sqla.constants import ReplicaState, OBSOLETE
+from rucio.db.sqla.session import read_session
+
+
+try:
+    CANDIDATES_TTL = int(config_get('reaper', 'candidates_ttl'))
+except (NoOptionError, NoSectionError):
+    CANDIDATES_TTL = 3600
+
+try:
+    CANDIDATES_WINDOW = int(config_get('reaper', 'candidates_window'))
+except (NoOptionError, NoSectionError):
+    CANDIDATES_WINDOW = 100000
+
+COLUMNS = (models.RSEFileAssociation.tombstone,
+           models.RSEFileAssociation.scope,
+           models.RSEFileAssociation.name,
+           models.RSEFileAssociation.path,
+           models.RSEFileAssociation.bytes,
+           models.RSEFileAssociation.state)
+
+
+class DeletionCandidates(object):
+    """
+    Heap of the deletion candidates of one RSE partition, ordered by tombstone.
+    """
+
+    def __init__(self, rse_id, worker_number=None, total_workers=None, delay_seconds=0, ttl=CANDIDATES_TTL, window=CANDIDATES_WINDOW):
+        """
+        Create an empty index. It is loaded on first use.
+
+        :param rse_id:         The RSE id.
+        :param worker_number:  The worker number, to select a partition of the replicas.
+        :param total_workers:  The total number of workers.
+        :param delay_seconds:  Delay before BEING_DELETED replicas are selected again.
+        :param ttl:            Seconds after which the index is fully reloaded from the database.
+        :param window:         Number of replicas loaded per scan of the tombstone index.
+        """
+        self.rse_id = rse_id
+        self.worker_number = worker_number
+        self.total_workers = total_workers
+        self.delay_seconds = delay_seconds
+        self.ttl = ttl
+        self.window = window
+        self.__lock = Lock()
+        self.__loaded_at = None
+        self.__reset()
+
+    def __reset(self):
+        self.__heap = []              # (tombstone, scope, name, path, bytes, state)
+        self.__keys = set()           # (scope, name) of the replicas in the heap
+        self.__scanned_until = None   # (tombstone, scope, name) of the last scanned replica
+        self.__complete = False       # True if the scan reached the end of the tombstone index
+        self.__topped_up_at = None    # Time of the end of the last scan or top up
+
+    def __query(self, session):
+        return get_unlocked_replicas_query(rse_id=self.rse_id, columns=COLUMNS,
+                                           worker_number=self.worker_number, total_workers=self.total_workers,
+                                           delay_seconds=self.delay_seconds, session=session)
+
+    def __push(self, rows):
+        for row in rows:
+            if (row[1], row[2]) not in self.__keys:
+                self.__keys.add((row[1], row[2]))
+                heapq.heappush(self.__heap, tuple(row))
+
+    def __scan(self, session):
+        """
+        Load the next window of candidates from the tombstone index.
+        """
+        now = datetime.utcnow()
+        query = self.__query(session)
+        if self.__scanned_until is not None:
+            tombstone, scope, name = self.__scanned_until
+            query = query.filter(or_(models.RSEFileAssociation.tombstone > tombstone,
+                                     and_(models.RSEFileAssociation.tombstone == tombstone,
+                                          or_(models.RSEFileAssociation.scope > scope,
+                                              and_(models.RSEFileAssociation.scope == scope, models.RSEFileAssociation.name > name)))))
+        rows = query.order_by(models.RSEFileAssociation.tombstone, models.RSEFileAssociation.scope, models.RSEFileAssociation.name).limit(self.window).all()
+        self.__push(rows)
+        if len(rows) < self.window:
+            self.__complete = True
+            self.__topped_up_at = now
+        else:
+            self.__scanned_until = tuple(rows[-1][:3])
+
+    def __top_up(self, session):
+        """
+        Add the candidates which were made obsolete and, once the scan is complete, those whose
+        tombstone expired since the last scan or top up. The replicas marked BEING_DELETED get an
+        OBSOLETE tombstone, so those whose deletion failed are added again once the delay expired.
+        """
+        now = datetime.utcnow()
+        condition = models.RSEFileAssociation.tombstone == OBSOLETE
+        if self.__complete:
+            condition = or_(condition, models.RSEFileAssociation.tombstone >= self.__topped_up_at)
+        self.__push(self.__query(session).filter(condition).all())
+        if self.__complete:
+            self.__topped_up_at = now
+
+    def __validate(self, candidates, session):
+        """
+        Get the current values of the candidates which can still be deleted.
+
+        :param candidates:  List of heap entries.
+        :param session:     The database session in use.
+        :returns:           Dictionary {(scope, name): row}.
+        """
+        valid = {}
+        for chunk in chunks(candidates, 100):
+            query = self.__query(session).\
+                filter(models.RSEFileAssociation.rse_id == self.rse_id).\
+                filter(or_(*[and_(models.RSEFileAssociation.scope == candidate[1],
+                                  models.RSEFileAssociation.name == candidate[2]) for candidate in chunk]))
+            for row in query:
+                valid[(row[1], row[2])] = tuple(row)
+        return valid
+
+    def requeue(self, replicas):
+        """
+        Give back candidates which were not deleted, e.g. because they could not be marked
+        BEING_DELETED. They are checked again before they are handed out.
+
+        :param replicas:  List of replica dictionaries, as returned by get().
+        """
+        with self.__lock:
+            self.__push([(replica['tombstone'], replica['scope'], replica['name'], replica['path'], replica['bytes'], replica['state'])
+                         for replica in replicas])
+
+    def invalidate(self):
+        """
+        Force a full reload on the next call.
+        """
+        self.__loaded_at = None
+
+    @read_session
+    def get(self, limit, bytes=None, session=None):
+        """
+        Pop the next deletion candidates. The replicas are selected in the same order and with
+        the same limits as rucio.core.replica.list_unlocked_replicas.
+
+        :param limit:    Maximum number of replicas, not counting the UNAVAILABLE ones.
+        :param bytes:    The amount of needed bytes, not limiting the OBSOLETE replicas.
+        :param session:  The database session in use.
+        :returns:        A list of replica dictionaries.
+        """
+        with self.__lock:
+            if self.__loaded_at is None or time.time() - self.__loaded_at > self.ttl:
+                self.__reset()
+                self.__scan(session=session)
+                self.__loaded_at = time.time()
+            else:
+                self.__top_up(session=session)
+
+            needed_space = bytes
+            total_bytes, total_files = 0, 0
+            rows = []
+            stop = False
+            while not stop and total_files < limit:
+                if len(self.__heap) < limit - total_files and not self.__complete:
+                    self.__scan(session=session)
+                if not self.__heap:
+                    break
+
+                batch = [heapq.heappop(self.__heap) for i in xrange(min(limit - total_files, len(self.__heap)))]
+                for candidate in batch:
+                    self.__keys.discard((candidate[1], candidate[2]))
+                valid = self.__validate(batch, session=session)
+
+                for i, candidate in enumerate(batch):
+                    row = valid.get((candidate[1], candidate[2]))
+                    if row is None:
+                        continue
+                    tombstone, scope, name, path, bytes, state = row
+                    if state != ReplicaState.UNAVAILABLE:
+                        if (tombstone != OBSOLETE and needed_space is not None and total_bytes + bytes > needed_space) or total_files + 1 > limit:
+                            # Keep the remaining candidates for the next call
+                            self.__push([valid[(entry[1], entry[2])] for entry in batch[i:] if (entry[1], entry[2]) in valid])
+                            stop = True
+                            break
+                        total_bytes += bytes
+                        total_files += 1
+
+                    rows.append({'scope': scope, 'name': name, 'path': path,
+                                 'bytes': bytes, 'tombstone': tombstone,
+                                 'state': state})
+            return rows
+
+
+INDEXES = {}
+INDEXES_LOCK = Lock()
+
+
+def _get_index(rse_id, worker_number=None, total_workers=None, delay_seconds=0):
+    key = (rse_id, worker_number, total_workers, delay_seconds)
+    with INDEXES_LOCK:
+        if key not in INDEXES:
+            INDEXES[key] = DeletionCandidates(rse_id=rse_id, worker_number=worker_number, total_workers=total_workers, delay_seconds=delay_seconds)
+        return INDEXES[key]
+
+
+@read_session
+def list_deletion_candidates(rse_id, limit, bytes=None, worker_number=None, total_workers=None, delay_seconds=0, session=None):
+    """
+    List the next replicas to delete on an RSE from the process-wide deletion candidate index.
+
+    :param rse_id:         The RSE id.
+    :param limit:          Maximum number of replicas, not counting the UNAVAILABLE ones.
+    :param bytes:          The amount of needed bytes.
+    :param worker_number:  The worker number, to select a partition of the replicas.
+    :param total_workers:  The total number of workers.
+    :param delay_seconds:  Delay before BEING_DELETED replicas are selected again.
+    :param session:        The database session in use.
+    :returns:              A list of replica dictionaries.
+    """
+    index = _get_index(rse_id=rse_id, worker_number=worker_number, total_workers=total_workers, delay_seconds=delay_seconds)
+    return index.get(limit=limit, bytes=bytes, session=session)
+
+
+def requeue_deletion_candidates(rse_id, replicas, worker_number=None, total_workers=None, delay_seconds=0):
+    """
+    Give back to the process-wide deletion candidate index the replicas which were not deleted.
+
+    :param rse_id:         The RSE id.
+    :param replicas:       List of replica dictionaries, as returned by list_deletion_candidates.
+    :param worker_number:  The worker number, to select a partition of the replicas.
+    :param total_workers:  The total number of workers.
+    :param delay_seconds:  Delay before BEING_DELETED replicas are selected again.
+    """
+    index = _get_index(rse_id=rse_id, worker_number=worker_number, total_workers=total_workers, delay_seconds=delay_seconds)
+    index.requeue(replicas)
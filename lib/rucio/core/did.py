@@ -22,15 +22,16 @@ import logging
 import random
 import sys
 
+from ConfigParser import NoOptionError, NoSectionError
 from datetime import datetime, timedelta
-from hashlib import md5
+from itertools import islice
 from re import match
 
 from sqlalchemy import and_, or_, exists
 from sqlalchemy.exc import DatabaseError, IntegrityError, CompileError
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.sql import not_, func
-from sqlalchemy.sql.expression import bindparam, text, Insert, select, true
+from sqlalchemy.sql.expression import bindparam, Insert, select, true
 
 import rucio.core.rule
 import rucio.core.replica  # import add_replicas
@@ -47,12 +48,23 @@ from rucio.db.sqla import models
 from rucio.db.sqla.constants import DIDType, DIDReEvaluation, DIDAvailability, RuleState
 from rucio.db.sqla.enum import EnumSymbol
 from rucio.db.sqla.session import read_session, transactional_session, stream_session
+from rucio.db.sqla.util import get_partition_filter
 
 
 logging.basicConfig(stream=sys.stdout,
                     level=getattr(logging, config_get('common', 'loglevel').upper()),
                     format='%(asctime)s\t%(process)d\t%(levelname)s\t%(message)s')
 
+try:
+    FETCH_SIZE = int(config_get('did', 'fetch_size'))
+except (NoOptionError, NoSectionError):
+    FETCH_SIZE = 5000
+
+try:
+    MAX_PAGE_SIZE = int(config_get('did', 'max_page_size'))
+except (NoOptionError, NoSectionError):
+    MAX_PAGE_SIZE = 10000
+
 
 @read_session
 def list_expired_dids(worker_number=None, total_workers=None, limit=None, session=None):
@@ -75,27 +87,7 @@ def list_expired_dids(worker_number=None, total_workers=None, limit=None, sessio
         with_hint(models.DataIdentifier, "index(DIDS DIDS_EXPIRED_AT_IDX)", 'oracle')
 
     if worker_number and total_workers and total_workers - 1 > 0:
-        if session.bind.dialect.name == 'oracle':
-            bindparams = [bindparam('worker_number', worker_number - 1), bindparam('total_workers', total_workers - 1)]
-            query = query.filter(text('ORA_HASH(name, :total_workers) = :worker_number', bindparams=bindparams))
-        elif session.bind.dialect.name == 'mysql':
-            query = query.filter('mod(md5(name), %s) = %s' % (total_workers - 1, worker_number - 1))
-        elif session.bind.dialect.name == 'postgresql':
-            query = query.filter('mod(abs((\'x\'||md5(name))::bit(32)::int), %s) = %s' % (total_workers - 1, worker_number - 1))
-        elif session.bind.dialect.name == 'sqlite':
-            row_count = 0
-            dids = list()
-            for scope, name, did_type, created_at, purge_replicas in query.yield_per(10):
-                if int(md5(name).hexdigest(), 16) % total_workers == worker_number - 1:
-                    dids.append({'scope': scope,
-                                 'name': name,
-                                 'did_type': did_type,
-                                 'created_at': created_at,
-                                 'purge_replicas': purge_replicas})
-                    row_count += 1
-                if limit and row_count >= limit:
-                    return dids
-            return dids
+        query = query.filter(get_partition_filter(models.DataIdentifier.bucket, worker_number - 1, total_workers))
 
     if limit:
         query = query.limit(limit)
@@ -760,13 +752,7 @@ def list_new_dids(did_type, thread=None, total_threads=None, chunk_size=1000, se
             query = query.filter_by(did_type=did_type)
 
     if total_threads and (total_threads - 1) > 0:
-        if session.bind.dialect.name == 'oracle':
-            bindparams = [bindparam('thread_number', thread), bindparam('total_threads', total_threads - 1)]
-            query = query.filter(text('ORA_HASH(name, :total_threads) = :thread_number', bindparams=bindparams))
-        elif session.bind.dialect.name == 'mysql':
-            query = query.filter('mod(md5(name), %s) = %s' % (total_threads - 1, thread))
-        elif session.bind.dialect.name == 'postgresql':
-            query = query.filter('mod(abs((\'x\'||md5(name))::bit(32)::int), %s) = %s' % (total_threads - 1, thread))
+        query = query.filter(get_partition_filter(models.DataIdentifier.bucket, thread, total_threads))
 
     row_count = 0
     for chunk in query.yield_per(10):
@@ -906,7 +892,7 @@ def list_child_datasets(scope, name, session=None):
                                                                               models.DataIdentifierAssociation.name == name,
                                                                               models.DataIdentifierAssociation.child_type != DIDType.FILE)
     query = query.with_hint(models.DataIdentifierAssociation, "INDEX(CONTENTS CONTENTS_PK)", 'oracle')
-    for child_scope, child_name, child_type in query.yield_per(5):
+    for child_scope, child_name, child_type in query.yield_per(FETCH_SIZE):
         if child_type == DIDType.CONTAINER:
             result.extend(list_child_datasets(scope=child_scope, name=child_name, session=session))
         else:
@@ -915,14 +901,42 @@ def list_child_datasets(scope, name, session=None):
 
 
 @stream_session
-def list_files(scope, name, long=False, session=None):
+def list_files(scope, name, long=False, marker=None, session=None):
     """
     List data identifier file contents.
 
     :param scope:      The scope name.
     :param name:       The data identifier name.
     :param long:       A boolean to choose if more metadata are returned or not.
+    :param marker:     Only list the files after this key, as returned by list_files_page.
+    :param session:    The database session in use.
+    """
+    for _, file in _list_files(scope=scope, name=name, long=long, marker=marker, session=session):
+        yield file
+
+
+@read_session
+def list_files_page(scope, name, long=False, limit=FETCH_SIZE, marker=None, session=None):
+    """
+    List one page of data identifier file contents.
+
+    :param scope:      The scope name.
+    :param name:       The data identifier name.
+    :param long:       A boolean to choose if more metadata are returned or not.
+    :param limit:      The maximum number of files returned.
+    :param marker:     Only list the files after this key, None for the first page.
     :param session:    The database session in use.
+    :returns:          Tuple (list of files, key of the last file or None if it is the last page).
+    """
+    page = list(islice(_list_files(scope=scope, name=name, long=long, marker=marker, session=session), limit + 1))
+    if len(page) <= limit:
+        return [file for _, file in page], None
+    return [file for _, file in page[:limit]], page[limit - 1][0]
+
+
+def _list_files(scope, name, long, marker, session):
+    """
+    Generator of (key, file) in the order of the keys (dataset scope, dataset name, file scope, file name).
     """
     try:
         did = session.query(models.DataIdentifier.scope, models.DataIdentifier.name,
@@ -933,78 +947,73 @@ def list_files(scope, name, long=False, session=None):
             filter_by(scope=scope, name=name).\
             with_hint(models.DataIdentifier, "INDEX(DIDS DIDS_PK)", 'oracle').\
             one()
+    except NoResultFound:
+        raise exception.DataIdentifierNotFound("Data identifier '%(scope)s:%(name)s' not found" % locals())
 
-        if did[7] == DIDType.FILE:
+    if did[7] == DIDType.FILE:
+        if marker is None:
+            file = {'scope': did[0], 'name': did[1], 'bytes': did[2],
+                    'adler32': did[3], 'guid': did[4] and did[4].upper(),
+                    'events': did[5]}
             if long:
-                yield {'scope': did[0], 'name': did[1], 'bytes': did[2],
-                       'adler32': did[3], 'guid': did[4] and did[4].upper(),
-                       'events': did[5], 'lumiblocknr': did[6]}
-            else:
-                yield {'scope': did[0], 'name': did[1], 'bytes': did[2],
-                       'adler32': did[3], 'guid': did[4] and did[4].upper(),
-                       'events': did[5]}
-        else:
-            cnt_query = session.\
-                query(models.DataIdentifierAssociation.child_scope,
-                      models.DataIdentifierAssociation.child_name,
-                      models.DataIdentifierAssociation.child_type).\
-                with_hint(models.DataIdentifierAssociation,
-                          "INDEX(CONTENTS CONTENTS_PK)", 'oracle')
+                file['lumiblocknr'] = did[6]
+            yield (scope, name, scope, name), file
+        return
 
-            if long:
-                dst_cnt_query = session.\
-                    query(models.DataIdentifierAssociation.child_scope,
-                          models.DataIdentifierAssociation.child_name,
-                          models.DataIdentifierAssociation.child_type,
-                          models.DataIdentifierAssociation.bytes,
-                          models.DataIdentifierAssociation.adler32,
-                          models.DataIdentifierAssociation.guid,
-                          models.DataIdentifierAssociation.events,
-                          models.DataIdentifier.lumiblocknr).\
-                    with_hint(models.DataIdentifierAssociation,
-                              "INDEX_RS_ASC(DIDS DIDS_PK) INDEX_RS_ASC(CONTENTS CONTENTS_PK) NO_INDEX_FFS(CONTENTS CONTENTS_PK)",
-                              "oracle").\
-                    filter(and_(models.DataIdentifier.scope == models.DataIdentifierAssociation.child_scope,
-                                models.DataIdentifier.name == models.DataIdentifierAssociation.child_name))
-            else:
-                dst_cnt_query = session.\
-                    query(models.DataIdentifierAssociation.child_scope,
-                          models.DataIdentifierAssociation.child_name,
-                          models.DataIdentifierAssociation.child_type,
-                          models.DataIdentifierAssociation.bytes,
-                          models.DataIdentifierAssociation.adler32,
-                          models.DataIdentifierAssociation.guid,
-                          models.DataIdentifierAssociation.events,
-                          bindparam("lumiblocknr", None)).\
-                    with_hint(models.DataIdentifierAssociation,
-                              "INDEX(CONTENTS CONTENTS_PK)", 'oracle')
-
-            dids = [(scope, name, did[7]), ]
-            while dids:
-                s, n, t = dids.pop()
-                if t == DIDType.DATASET:
-                    query = dst_cnt_query.\
-                        filter(and_(models.DataIdentifierAssociation.scope == s,
-                                    models.DataIdentifierAssociation.name == n))
-
-                    for child_scope, child_name, child_type, bytes, adler32, guid, events, lumiblocknr in query.yield_per(500):
-                        if long:
-                            yield {'scope': child_scope, 'name': child_name,
-                                   'bytes': bytes, 'adler32': adler32,
-                                   'guid': guid and guid.upper(),
-                                   'events': events,
-                                   'lumiblocknr': lumiblocknr}
-                        else:
-                            yield {'scope': child_scope, 'name': child_name,
-                                   'bytes': bytes, 'adler32': adler32,
-                                   'guid': guid and guid.upper(),
-                                   'events': events}
-                else:
-                    for child_scope, child_name, child_type in cnt_query.filter_by(scope=s, name=n).yield_per(500):
-                        dids.append((child_scope, child_name, child_type))
+    if long:
+        query = session.\
+            query(models.DataIdentifierAssociation.child_scope,
+                  models.DataIdentifierAssociation.child_name,
+                  models.DataIdentifierAssociation.bytes,
+                  models.DataIdentifierAssociation.adler32,
+                  models.DataIdentifierAssociation.guid,
+                  models.DataIdentifierAssociation.events,
+                  models.DataIdentifier.lumiblocknr).\
+            with_hint(models.DataIdentifierAssociation,
+                      "INDEX_RS_ASC(DIDS DIDS_PK) INDEX_RS_ASC(CONTENTS CONTENTS_PK) NO_INDEX_FFS(CONTENTS CONTENTS_PK)",
+                      "oracle").\
+            filter(and_(models.DataIdentifier.scope == models.DataIdentifierAssociation.child_scope,
+                        models.DataIdentifier.name == models.DataIdentifierAssociation.child_name))
+    else:
+        query = session.\
+            query(models.DataIdentifierAssociation.child_scope,
+                  models.DataIdentifierAssociation.child_name,
+                  models.DataIdentifierAssociation.bytes,
+                  models.DataIdentifierAssociation.adler32,
+                  models.DataIdentifierAssociation.guid,
+                  models.DataIdentifierAssociation.events,
+                  bindparam("lumiblocknr", None)).\
+            with_hint(models.DataIdentifierAssociation,
+                      "INDEX(CONTENTS CONTENTS_PK)", 'oracle')
+    query = query.order_by(models.DataIdentifierAssociation.child_scope,
+                           models.DataIdentifierAssociation.child_name)
 
-    except NoResultFound:
-        raise exception.DataIdentifierNotFound("Data identifier '%(scope)s:%(name)s' not found" % locals())
+    # The keys of the datasets are compared here, the keys of the files by the database
+    if did[7] == DIDType.DATASET:
+        datasets = [(scope, name)]
+    else:
+        datasets = sorted(set((dataset['scope'], dataset['name']) for dataset in list_child_datasets(scope=scope, name=name, session=session)))
+
+    for dataset_scope, dataset_name in datasets:
+        dataset_query = query.filter(and_(models.DataIdentifierAssociation.scope == dataset_scope,
+                                          models.DataIdentifierAssociation.name == dataset_name))
+        if marker is not None:
+            if (dataset_scope, dataset_name) < tuple(marker[:2]):
+                continue
+            if (dataset_scope, dataset_name) == tuple(marker[:2]):
+                dataset_query = dataset_query.\
+                    filter(or_(models.DataIdentifierAssociation.child_scope > marker[2],
+                               and_(models.DataIdentifierAssociation.child_scope == marker[2],
+                                    models.DataIdentifierAssociation.child_name > marker[3])))
+
+        for child_scope, child_name, bytes, adler32, guid, events, lumiblocknr in dataset_query.yield_per(FETCH_SIZE):
+            file = {'scope': child_scope, 'name': child_name,
+                    'bytes': bytes, 'adler32': adler32,
+                    'guid': guid and guid.upper(),
+                    'events': events}
+            if long:
+                file['lumiblocknr'] = lumiblocknr
+            yield (dataset_scope, dataset_name, child_scope, child_name), file
 
 
 @stream_session
@@ -1294,8 +1303,8 @@ def set_status(scope, name, session=None, **kwargs):
 
 @stream_session
 def list_dids(scope, filters, type='collection', ignore_case=False, limit=None,
-              offset=None, long=False, session=None):
-    """0
+              offset=None, long=False, marker=None, session=None):
+    """
     Search data identifiers
 
     :param scope: the scope name.
@@ -1305,6 +1314,7 @@ def list_dids(scope, filters, type='collection', ignore_case=False, limit=None,
     :param limit: limit number.
     :param offset: offset number.
     :param long: Long format option to display more information for each DID.
+    :param marker: Only list the data identifiers with a name after this one.
     :param session: The database session in use.
     """
     types = ['all', 'collection', 'container', 'dataset', 'file']
@@ -1370,21 +1380,55 @@ def list_dids(scope, filters, type='collection', ignore_case=False, limit=None,
             query = query.\
                 with_hint(models.DataIdentifier, "INDEX(DIDS DIDS_PK)", 'oracle')
 
+    if marker is not None:
+        query = query.filter(models.DataIdentifier.name > marker)
+
+    # The pages are only consistent in the order of the primary key
+    if limit or offset or marker is not None:
+        query = query.order_by(models.DataIdentifier.name)
+
     if limit:
         query = query.limit(limit)
 
+    if offset:
+        query = query.offset(offset)
+
     if long:
-        for scope, name, did_type, bytes, length in query.yield_per(5):
+        for scope, name, did_type, bytes, length in query.yield_per(FETCH_SIZE):
             yield {'scope': scope,
                    'name': name,
                    'did_type': str(did_type),
                    'bytes': bytes,
                    'length': length}
     else:
-        for scope, name, did_type, bytes, length in query.yield_per(5):
+        for scope, name, did_type, bytes, length in query.yield_per(FETCH_SIZE):
             yield name
 
 
+@read_session
+def list_dids_page(scope, filters, type='collection', ignore_case=False, limit=FETCH_SIZE,
+                   long=False, marker=None, session=None):
+    """
+    Search one page of data identifiers, ordered by name.
+
+    :param scope: the scope name.
+    :param filters: dictionary of attributes by which the results should be filtered.
+    :param type: the type of the did: all(container, dataset, file), collection(dataset or container), dataset, container, file.
+    :param ignore_case: ignore case distinctions.
+    :param limit: The maximum number of data identifiers returned.
+    :param long: Long format option to display more information for each DID.
+    :param marker: Only list the data identifiers with a name after this one, None for the first page.
+    :param session: The database session in use.
+    :returns: Tuple (list of dids, name of the last did or None if it is the last page).
+    """
+    dids = list(list_dids(scope=scope, filters=filters, type=type, ignore_case=ignore_case,
+                          limit=limit + 1, long=long, marker=marker, session=session))
+    if len(dids) <= limit:
+        return dids, None
+    dids = dids[:limit]
+    return dids, dids[-1]['name'] if long else dids[-1]
+
+
 @read_session
 def get_did_atime(scope, name, session=None):
     """
@@ -67,13 +67,10 @@ def _sanity_check(executable, hostname, hash_executable=None, session=None):
 
 
 @transactional_session
-def live(executable, hostname, pid, thread, older_than=600, hash_executable=None, session=None):
+def live_members(executable, hostname, pid, thread, older_than=600, hash_executable=None, session=None):
     """
-    Register a heartbeat for a process/thread on a given node.
-    The executable name is used for the calculation of thread assignments.
-    Removal of stale heartbeats is done as a scheduled database job.
-
-    TODO: Returns an assignment dictionary for the given executable.
+    Register a heartbeat for a process/thread on a given node and list the live
+    processes/threads of the executable.
 
     :param executable: Executable name as a string, e.g., conveyor-submitter.
     :param hostname: Hostname as a string, e.g., rucio-daemon-prod-01.cern.ch.
@@ -82,7 +79,7 @@ def live(executable, hostname, pid, thread, older_than=600, hash_executable=None
     :param older_than: Ignore specified heartbeats older than specified nr of seconds.
     :param hash_executable: Hash of the executable.
 
-    :returns heartbeats: Dictionary {assign_thread, nr_threads}
+    :returns members: Sorted list of tuples (hostname, pid, thread_id)
     """
     if not hash_executable:
         hash_executable = hashlib.sha256(executable).hexdigest()
@@ -102,7 +99,6 @@ def live(executable, hostname, pid, thread, older_than=600, hash_executable=None
                    thread_id=thread.ident,
                    thread_name=thread.name).save(session=session)
 
-    # assign thread identifier
     query = session.query(Heartbeats.hostname,
                           Heartbeats.pid,
                           Heartbeats.thread_id)\
@@ -115,7 +111,30 @@ def live(executable, hostname, pid, thread, older_than=600, hash_executable=None
                    .order_by(Heartbeats.hostname,
                              Heartbeats.pid,
                              Heartbeats.thread_id)
-    result = query.all()
+    return [tuple(member) for member in query.all()]
+
+
+@transactional_session
+def live(executable, hostname, pid, thread, older_than=600, hash_executable=None, session=None):
+    """
+    Register a heartbeat for a process/thread on a given node.
+    The executable name is used for the calculation of thread assignments.
+    Removal of stale heartbeats is done as a scheduled database job.
+
+    Daemons which run many threads should prefer rucio.core.membership.live,
+    which caches the members between refreshes.
+
+    :param executable: Executable name as a string, e.g., conveyor-submitter.
+    :param hostname: Hostname as a string, e.g., rucio-daemon-prod-01.cern.ch.
+    :param pid: UNIX Process ID as a number, e.g., 1234.
+    :param thread: Python Thread Object.
+    :param older_than: Ignore specified heartbeats older than specified nr of seconds.
+    :param hash_executable: Hash of the executable.
+
+    :returns heartbeats: Dictionary {assign_thread, nr_threads}
+    """
+    result = live_members(executable=executable, hostname=hostname, pid=pid, thread=thread,
+                          older_than=older_than, hash_executable=hash_executable, session=session)
 
     # there is no universally applicable rownumber in SQLAlchemy
     # so we have to do it in Python
@@ -24,6 +24,7 @@ import rucio.core.rule
 import rucio.core.did
 
 from rucio.common.config import config_get
+from rucio.common.utils import chunks
 from rucio.core.lifetime_exception import define_eol
 from rucio.core.rse import get_rse_name, get_rse_id
 from rucio.db.sqla import models
@@ -239,6 +240,49 @@ def get_files_and_replica_locks_of_dataset(scope, name, nowait=False, restrict_r
     return locks
 
 
+@transactional_session
+def get_files_and_replica_locks_of_datasets(datasets, nowait=False, restrict_rses=None, chunk_size=50, session=None):
+    """
+    Get all the files of several datasets and, if existing, all locks of the files, querying chunk_size datasets at a time.
+
+    :param datasets:       List of dictionaries {'scope', 'name'} of the datasets.
+    :param nowait:         Nowait parameter for the FOR UPDATE statement
+    :param restrict_rses:  Possible RSE_ids to filter on.
+    :param chunk_size:     Number of datasets resolved per query.
+    :param session:        The db session.
+    :return:               Dictionary with keys: (scope, name)
+                           and as value: [LockObject]
+    """
+    lock_clause = [models.DataIdentifierAssociation.child_scope == models.ReplicaLock.scope,
+                   models.DataIdentifierAssociation.child_name == models.ReplicaLock.name]
+    if restrict_rses:
+        lock_clause.append(or_(*[models.ReplicaLock.rse_id == rse_id for rse_id in restrict_rses]))
+
+    locks = {}
+    owner = {}  # A file attached to several datasets only adds its locks once
+
+    for chunk in chunks(datasets, chunk_size):
+        query = session.query(models.DataIdentifierAssociation.scope,
+                              models.DataIdentifierAssociation.name,
+                              models.DataIdentifierAssociation.child_scope,
+                              models.DataIdentifierAssociation.child_name,
+                              models.ReplicaLock).\
+            with_hint(models.DataIdentifierAssociation, "INDEX_RS_ASC(CONTENTS CONTENTS_PK) NO_INDEX_FFS(CONTENTS CONTENTS_PK)", 'oracle').\
+            outerjoin(models.ReplicaLock, and_(*lock_clause)).\
+            filter(or_(*[and_(models.DataIdentifierAssociation.scope == dataset['scope'],
+                              models.DataIdentifierAssociation.name == dataset['name']) for dataset in chunk])).\
+            with_for_update(nowait=nowait, of=models.ReplicaLock.state)
+
+        for scope, name, child_scope, child_name, lock in query:
+            if (child_scope, child_name) not in owner:
+                owner[(child_scope, child_name)] = (scope, name)
+                locks[(child_scope, child_name)] = []
+            if lock is not None and owner[(child_scope, child_name)] == (scope, name):
+                locks[(child_scope, child_name)].append(lock)
+
+    return locks
+
+
 @transactional_session
 def successful_transfer(scope, name, rse_id, nowait, session=None):
     """
@@ -251,58 +295,97 @@ def successful_transfer(scope, name, rse_id, nowait, session=None):
     :param session:  DB Session.
     """
 
-    locks = session.query(models.ReplicaLock).with_for_update(nowait=nowait).filter_by(scope=scope, name=name, rse_id=rse_id)
-    for lock in locks:
-        if lock.state == LockState.OK:
-            continue
-        logging.debug('Marking lock %s:%s for rule %s on rse %s as OK' % (lock.scope, lock.name, str(lock.rule_id), str(lock.rse_id)))
-        # Update the rule counters
-        rule = session.query(models.ReplicationRule).with_for_update(nowait=nowait).filter_by(id=lock.rule_id).one()
-        logging.debug('Updating rule counters for rule %s [%d/%d/%d]' % (str(rule.id), rule.locks_ok_cnt, rule.locks_replicating_cnt, rule.locks_stuck_cnt))
+    successful_transfers(files=[{'scope': scope, 'name': name, 'rse_id': rse_id}], nowait=nowait, session=session)
 
-        if lock.state == LockState.REPLICATING:
-            rule.locks_replicating_cnt -= 1
-        elif lock.state == LockState.STUCK:
-            rule.locks_stuck_cnt -= 1
-        rule.locks_ok_cnt += 1
-        lock.state = LockState.OK
-        logging.debug('Finished updating rule counters for rule %s [%d/%d/%d]' % (str(rule.id), rule.locks_ok_cnt, rule.locks_replicating_cnt, rule.locks_stuck_cnt))
 
-        # Insert UpdatedCollectionReplica
-        if rule.did_type == DIDType.DATASET:
-            models.UpdatedCollectionReplica(scope=rule.scope,
-                                            name=rule.name,
-                                            did_type=rule.did_type,
-                                            rse_id=rse_id).save(flush=False, session=session)
-        elif rule.did_type == DIDType.CONTAINER:
-            # Resolve to all child datasets
-            for dataset in rucio.core.did.list_child_datasets(scope=rule.scope, name=rule.name, session=session):
-                models.UpdatedCollectionReplica(scope=dataset['scope'],
-                                                name=dataset['name'],
-                                                did_type=dataset['type'],
-                                                rse_id=rse_id).save(flush=False, session=session)
+@transactional_session
+def successful_transfers(files, nowait, chunk_size=100, session=None):
+    """
+    Update the state of all replica locks because of several successful transfers.
 
-        # Update the rule state
-        if rule.state == RuleState.SUSPENDED:
-            pass
-        elif rule.locks_stuck_cnt > 0:
-            pass
-        elif rule.locks_replicating_cnt == 0 and rule.state == RuleState.REPLICATING:
-            rule.state = RuleState.OK
-            # Try to update the DatasetLocks
-            if rule.grouping != RuleGrouping.NONE:
-                ds_locks = session.query(models.DatasetLock).with_for_update(nowait=nowait).filter_by(rule_id=rule.id)
-                for ds_lock in ds_locks:
-                    ds_lock.state = LockState.OK
-                session.flush()
-                rucio.core.rule.generate_message_for_dataset_ok_callback(rule=rule, session=session)
-            if rule.notification == RuleNotification.YES:
-                rucio.core.rule.generate_email_for_rule_ok_notification(rule=rule, session=session)
-            # Try to release potential parent rules
-            rucio.core.rule.release_parent_rule(child_rule_id=rule.id, session=session)
+    The locks are updated with one statement per chunk of files, and every affected rule
+    has its counters updated and its state evaluated once for all of its locks.
 
-        # Insert rule history
-        rucio.core.rule.insert_rule_history(rule=rule, recent=True, longterm=False, session=session)
+    :param files:       List of dictionaries {'scope', 'name', 'rse_id'}.
+    :param nowait:      Nowait parameter for the for_update queries.
+    :param chunk_size:  Number of files or rules per query.
+    :param session:     DB Session.
+    """
+
+    # {rule_id: {'replicating': #locks, 'stuck': #locks, 'ok': #locks, 'rse_ids': set()}}
+    rule_counters = {}
+    for chunk in chunks(files, chunk_size):
+        condition = and_(or_(*[and_(models.ReplicaLock.scope == file['scope'],
+                                    models.ReplicaLock.name == file['name'],
+                                    models.ReplicaLock.rse_id == file['rse_id']) for file in chunk]),
+                         models.ReplicaLock.state != LockState.OK)
+        locks = session.query(models.ReplicaLock.scope,
+                              models.ReplicaLock.name,
+                              models.ReplicaLock.rse_id,
+                              models.ReplicaLock.rule_id,
+                              models.ReplicaLock.state).with_for_update(nowait=nowait).filter(condition).all()
+        if not locks:
+            continue
+        for scope, name, rse_id, rule_id, state in locks:
+            logging.debug('Marking lock %s:%s for rule %s on rse %s as OK' % (scope, name, str(rule_id), str(rse_id)))
+            counter = rule_counters.setdefault(rule_id, {'replicating': 0, 'stuck': 0, 'ok': 0, 'rse_ids': set()})
+            if state == LockState.REPLICATING:
+                counter['replicating'] += 1
+            elif state == LockState.STUCK:
+                counter['stuck'] += 1
+            counter['ok'] += 1
+            counter['rse_ids'].add(rse_id)
+        session.query(models.ReplicaLock).filter(condition).update({'state': LockState.OK}, synchronize_session=False)
+
+    # Rules are locked in id order, so that concurrent finishers do not deadlock
+    for rule_ids in chunks(sorted(rule_counters), chunk_size):
+        rules = session.query(models.ReplicationRule).with_for_update(nowait=nowait).filter(models.ReplicationRule.id.in_(rule_ids)).order_by(models.ReplicationRule.id).all()
+        for rule in rules:
+            counter = rule_counters[rule.id]
+            # Update the rule counters
+            logging.debug('Updating rule counters for rule %s [%d/%d/%d]' % (str(rule.id), rule.locks_ok_cnt, rule.locks_replicating_cnt, rule.locks_stuck_cnt))
+            rule.locks_replicating_cnt -= counter['replicating']
+            rule.locks_stuck_cnt -= counter['stuck']
+            rule.locks_ok_cnt += counter['ok']
+            logging.debug('Finished updating rule counters for rule %s [%d/%d/%d]' % (str(rule.id), rule.locks_ok_cnt, rule.locks_replicating_cnt, rule.locks_stuck_cnt))
+
+            # Insert UpdatedCollectionReplica
+            if rule.did_type == DIDType.DATASET:
+                for rse_id in counter['rse_ids']:
+                    models.UpdatedCollectionReplica(scope=rule.scope,
+                                                    name=rule.name,
+                                                    did_type=rule.did_type,
+                                                    rse_id=rse_id).save(flush=False, session=session)
+            elif rule.did_type == DIDType.CONTAINER:
+                # Resolve to all child datasets
+                for dataset in rucio.core.did.list_child_datasets(scope=rule.scope, name=rule.name, session=session):
+                    for rse_id in counter['rse_ids']:
+                        models.UpdatedCollectionReplica(scope=dataset['scope'],
+                                                        name=dataset['name'],
+                                                        did_type=dataset['type'],
+                                                        rse_id=rse_id).save(flush=False, session=session)
+
+            # Update the rule state
+            if rule.state == RuleState.SUSPENDED:
+                pass
+            elif rule.locks_stuck_cnt > 0:
+                pass
+            elif rule.locks_replicating_cnt == 0 and rule.state == RuleState.REPLICATING:
+                rule.state = RuleState.OK
+                # Try to update the DatasetLocks
+                if rule.grouping != RuleGrouping.NONE:
+                    # Lock the rows first, the UPDATE itself cannot be issued with nowait
+                    session.query(models.DatasetLock).filter_by(rule_id=rule.id).with_for_update(nowait=nowait).all()
+                    session.query(models.DatasetLock).filter_by(rule_id=rule.id).update({'state': LockState.OK}, synchronize_session='evaluate')
+                    session.flush()
+                    rucio.core.rule.generate_message_for_dataset_ok_callback(rule=rule, session=session)
+                if rule.notification == RuleNotification.YES:
+                    rucio.core.rule.generate_email_for_rule_ok_notification(rule=rule, session=session)
+                # Try to release potential parent rules
+                rucio.core.rule.release_parent_rule(child_rule_id=rule.id, session=session)
+
+            # Insert rule history
+            rucio.core.rule.insert_rule_history(rule=rule, recent=True, longterm=False, session=session)
         session.flush()
 
 
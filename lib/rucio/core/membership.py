@@ -0,0 +1,225 @@
+'''
+  Copyright European Organization for Nuclear Research (CERN)
+  Licensed under the Apache License, Version 2.0 (the "License");
+  You may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+
+  Process-local membership of the daemon threads, built on the heartbeats.
+
+  Every thread refreshes its heartbeat and the list of live members of its executable at most
+  every `refresh_interval` seconds, the assignment is served from memory in between. The members
+  are placed on a consistent-hash ring with `virtual_nodes` points each and every partition bucket
+  (rucio.db.sqla.constants.PARTITION_BUCKETS) belongs to the member owning the next point on the
+  ring. When a member joins or leaves, only the buckets next to its points move.
+'''
+
+import bisect
+import hashlib
+import time
+
+from ConfigParser import NoOptionError, NoSectionError
+from threading import Lock
+
+from rucio.common.config import config_get
+from rucio.core import heartbeat
+from rucio.db.sqla.constants import PARTITION_BUCKETS
+
+
+try:
+    REFRESH_INTERVAL = int(config_get('heartbeat', 'refresh_interval'))
+except (NoOptionError, NoSectionError):
+    REFRESH_INTERVAL = 60
+
+try:
+    VIRTUAL_NODES = int(config_get('heartbeat', 'virtual_nodes'))
+except (NoOptionError, NoSectionError):
+    VIRTUAL_NODES = 64
+
+RING_SIZE = 2 ** 32
+
+
+def _ring_position(key):
+    return int(hashlib.md5(key).hexdigest()[:8], 16)
+
+
+class HashRing(object):
+    """
+    Consistent-hash ring of members over the partition buckets.
+    """
+
+    def __init__(self, members, virtual_nodes=VIRTUAL_NODES):
+        """
+        :param members:        List of member tuples, e.g. (hostname, pid, thread_id).
+        :param virtual_nodes:  Number of points of each member on the ring.
+        """
+        self.members = sorted(members)
+        points = sorted((_ring_position('%s#%d' % (':'.join(str(field) for field in member), i)), member)
+                        for member in self.members for i in xrange(virtual_nodes))
+        self.__positions = [position for position, _ in points]
+        self.__owners = [member for _, member in points]
+
+    def owner(self, bucket):
+        """
+        Get the member owning a bucket.
+
+        :param bucket:  The partition bucket.
+        :returns:       The member tuple or None if the ring is empty.
+        """
+        if not self.__positions:
+            return None
+        index = bisect.bisect_left(self.__positions, bucket * RING_SIZE // PARTITION_BUCKETS)
+        return self.__owners[index % len(self.__positions)]
+
+    def buckets(self, member):
+        """
+        Get the buckets owned by a member.
+
+        :param member:  The member tuple.
+        :returns:       Sorted list of partition buckets.
+        """
+        return [bucket for bucket in xrange(PARTITION_BUCKETS) if self.owner(bucket) == member]
+
+
+class Membership(object):
+    """
+    Cached membership and bucket assignment of one daemon thread.
+    """
+
+    def __init__(self, executable, hostname, pid, thread, older_than=600, hash_executable=None,
+                 refresh_interval=REFRESH_INTERVAL, virtual_nodes=VIRTUAL_NODES):
+        """
+        :param executable:        Executable name as a string, e.g., conveyor-submitter.
+        :param hostname:          Hostname as a string, e.g., rucio-daemon-prod-01.cern.ch.
+        :param pid:               UNIX Process ID as a number, e.g., 1234.
+        :param thread:            Python Thread Object.
+        :param older_than:        Ignore heartbeats older than specified nr of seconds.
+        :param hash_executable:   Hash of the executable.
+        :param refresh_interval:  Seconds between two refreshes of the heartbeat and the members.
+        :param virtual_nodes:     Number of points of each member on the ring.
+        """
+        self.executable = executable
+        self.hostname = hostname
+        self.pid = pid
+        self.thread = thread
+        self.older_than = older_than
+        self.hash_executable = hash_executable
+        # The own heartbeat must be refreshed before the others consider it dead
+        self.refresh_interval = min(refresh_interval, older_than // 2)
+        self.virtual_nodes = virtual_nodes
+        self.member = (hostname, pid, thread.ident)
+        self.__members = None
+        self.__assignment = None
+        self.__refreshed_at = None
+
+    def refresh(self, force=False):
+        """
+        Refresh the heartbeat and the members if the refresh interval expired.
+
+        :param force:  Refresh even if the refresh interval did not expire.
+        :returns:      The assignment dictionary, see assignment().
+        """
+        if force or self.__refreshed_at is None or time.time() - self.__refreshed_at >= self.refresh_interval:
+            members = heartbeat.live_members(executable=self.executable, hostname=self.hostname, pid=self.pid, thread=self.thread,
+                                             older_than=self.older_than, hash_executable=self.hash_executable)
+            self.__refreshed_at = time.time()
+            if members != self.__members:
+                ring = HashRing(members, virtual_nodes=self.virtual_nodes)
+                self.__members = members
+                self.__assignment = {'assign_thread': members.index(self.member) if self.member in members else 0,
+                                     'nr_threads': len(members),
+                                     'buckets': ring.buckets(self.member)}
+        return self.assignment()
+
+    def assignment(self):
+        """
+        Get the last assignment without accessing the database.
+
+        :returns:  Dictionary {assign_thread, nr_threads, buckets} or None before the first refresh.
+        """
+        if self.__assignment is None:
+            return None
+        return dict(self.__assignment)
+
+
+MEMBERSHIPS = {}
+MEMBERSHIPS_LOCK = Lock()
+
+
+def _key(executable, hostname, pid, thread):
+    return (executable, hostname, pid, thread.ident)
+
+
+def live(executable, hostname, pid, thread, older_than=600, hash_executable=None, force=False):
+    """
+    Cached replacement of rucio.core.heartbeat.live. The database is only accessed once
+    per refresh interval of the thread.
+
+    :param executable:       Executable name as a string, e.g., conveyor-submitter.
+    :param hostname:         Hostname as a string, e.g., rucio-daemon-prod-01.cern.ch.
+    :param pid:              UNIX Process ID as a number, e.g., 1234.
+    :param thread:           Python Thread Object.
+    :param older_than:       Ignore heartbeats older than specified nr of seconds.
+    :param hash_executable:  Hash of the executable.
+    :param force:            Refresh even if the refresh interval did not expire.
+    :returns:                Dictionary {assign_thread, nr_threads, buckets}.
+    """
+    key = _key(executable, hostname, pid, thread)
+    with MEMBERSHIPS_LOCK:
+        if key not in MEMBERSHIPS:
+            MEMBERSHIPS[key] = Membership(executable=executable, hostname=hostname, pid=pid, thread=thread,
+                                          older_than=older_than, hash_executable=hash_executable)
+        membership = MEMBERSHIPS[key]
+    return membership.refresh(force=force)
+
+
+def join(executable, hostname, pid, thread, older_than=600, hash_executable=None, wait=time.sleep, delay=1):
+    """
+    Make an initial heartbeat, wait for the members starting at the same time and refresh the
+    members, so that the threads starting together do not claim the same buckets.
+
+    :param executable:       Executable name as a string, e.g., conveyor-submitter.
+    :param hostname:         Hostname as a string, e.g., rucio-daemon-prod-01.cern.ch.
+    :param pid:              UNIX Process ID as a number, e.g., 1234.
+    :param thread:           Python Thread Object.
+    :param older_than:       Ignore heartbeats older than specified nr of seconds.
+    :param hash_executable:  Hash of the executable.
+    :param wait:             Function waiting a number of seconds, e.g., the wait of the graceful stop event.
+    :param delay:            Seconds to wait for the other members.
+    :returns:                Dictionary {assign_thread, nr_threads, buckets}.
+    """
+    live(executable=executable, hostname=hostname, pid=pid, thread=thread, older_than=older_than, hash_executable=hash_executable)
+    wait(delay)
+    # The cached members only contain the threads which had already started
+    return live(executable=executable, hostname=hostname, pid=pid, thread=thread, older_than=older_than, hash_executable=hash_executable, force=True)
+
+
+def get_assignment(executable, hostname, pid, thread):
+    """
+    Get the last assignment of a thread without accessing the database.
+
+    :param executable:  Executable name as a string, e.g., conveyor-submitter.
+    :param hostname:    Hostname as a string, e.g., rucio-daemon-prod-01.cern.ch.
+    :param pid:         UNIX Process ID as a number, e.g., 1234.
+    :param thread:      Python Thread Object.
+    :returns:           Dictionary {assign_thread, nr_threads, buckets} or None if the thread is not a member.
+    """
+    membership = MEMBERSHIPS.get(_key(executable, hostname, pid, thread))
+    if membership is None:
+        return None
+    return membership.assignment()
+
+
+def die(executable, hostname, pid, thread, hash_executable=None):
+    """
+    Leave the membership and remove the heartbeat of the thread.
+
+    :param executable:       Executable name as a string, e.g., conveyor-submitter.
+    :param hostname:         Hostname as a string, e.g., rucio-daemon-prod-01.cern.ch.
+    :param pid:              UNIX Process ID as a number, e.g., 1234.
+    :param thread:           Python Thread Object.
+    :param hash_executable:  Hash of the executable.
+    """
+    with MEMBERSHIPS_LOCK:
+        MEMBERSHIPS.pop(_key(executable, hostname, pid, thread), None)
+    heartbeat.die(executable=executable, hostname=hostname, pid=pid, thread=thread, hash_executable=hash_executable)
@@ -14,11 +14,12 @@ import json
 import re
 
 from sqlalchemy.exc import DatabaseError, IntegrityError
-from sqlalchemy.sql.expression import bindparam, text
 
 from rucio.common.exception import InvalidObject, RucioException
+from rucio.common.utils import chunks
 from rucio.db.sqla.models import Message, MessageHistory
 from rucio.db.sqla.session import transactional_session
+from rucio.db.sqla.util import get_partition_filter
 
 
 @transactional_session
@@ -44,7 +45,7 @@ def add_message(event_type, payload, session=None):
 
 
 @transactional_session
-def retrieve_messages(bulk=1000, thread=None, total_threads=None, event_type=None, session=None):
+def retrieve_messages(bulk=1000, thread=None, total_threads=None, event_type=None, exclude=None, session=None):
     """
     Retrieve up to $bulk messages.
 
@@ -52,6 +53,7 @@ def retrieve_messages(bulk=1000, thread=None, total_threads=None, event_type=Non
     :param thread: Identifier of the caller thread as an integer.
     :param total_threads: Maximum number of threads as an integer.
     :param event_type: Return only specified event_type. If None, returns everything except email.
+    :param exclude: Message IDs to skip, as a list of strings.
     :param session: The database session to use.
 
     :returns messages: List of dictionaries {id, created_at, event_type, payload}
@@ -60,19 +62,16 @@ def retrieve_messages(bulk=1000, thread=None, total_threads=None, event_type=Non
     try:
         subquery = session.query(Message.id)
         if total_threads and (total_threads - 1) > 0:
-            if session.bind.dialect.name == 'oracle':
-                bindparams = [bindparam('thread_number', thread), bindparam('total_threads', total_threads - 1)]
-                subquery = subquery.filter(text('ORA_HASH(id, :total_threads) = :thread_number', bindparams=bindparams))
-            elif session.bind.dialect.name == 'mysql':
-                subquery = subquery.filter('mod(md5(id), %s) = %s' % (total_threads - 1, thread))
-            elif session.bind.dialect.name == 'postgresql':
-                subquery = subquery.filter('mod(abs((\'x\'||md5(id))::bit(32)::int), %s) = %s' % (total_threads - 1, thread))
+            subquery = subquery.filter(get_partition_filter(Message.bucket, thread, total_threads))
 
         if event_type:
             subquery = subquery.filter_by(event_type=event_type)
         else:
             subquery = subquery.filter(Message.event_type != 'email')
 
+        for ids in chunks(list(exclude or []), 1000):
+            subquery = subquery.filter(~Message.id.in_(ids))
+
         subquery = subquery.order_by(Message.created_at).limit(bulk)
 
         query = session.query(Message.id,
@@ -102,15 +101,20 @@ def delete_messages(ids, session=None):
     """
 
     try:
-        for id in ids:
-            m = session.query(Message).filter_by(id=id).one()
-            m_prime = MessageHistory(id=m['id'],
-                                     created_at=m['created_at'],
-                                     updated_at=m['updated_at'],
-                                     payload=m['payload'],
-                                     event_type=m['event_type'])
-            m_prime.save(session=session)
-            session.query(Message).filter_by(id=id).delete(synchronize_session=False)
+        for chunk in chunks(ids, 100):
+            messages = session.query(Message.id,
+                                     Message.created_at,
+                                     Message.updated_at,
+                                     Message.payload,
+                                     Message.event_type).\
+                filter(Message.id.in_(chunk)).all()
+            if messages:
+                session.bulk_insert_mappings(MessageHistory, [{'id': id,
+                                                               'created_at': created_at,
+                                                               'updated_at': updated_at,
+                                                               'payload': payload,
+                                                               'event_type': event_type} for id, created_at, updated_at, payload, event_type in messages])
+            session.query(Message).filter(Message.id.in_(chunk)).delete(synchronize_session=False)
     except IntegrityError, e:
         raise RucioException(e.args)
 
@@ -16,8 +16,7 @@
 # - Joaquin Bogado, <joaquin.bogado@cern.ch>, 2015
 
 import rucio.core.authentication
-import rucio.core.scope
-from rucio.core.account import list_account_attributes, has_account_attribute
+from rucio.core.permission_cache import has_account_attribute, is_scope_owner, list_account_attributes
 from rucio.core.rse import list_rse_attributes
 from rucio.core.rse_expression_parser import parse_expression
 from rucio.core.rule import get_rule
@@ -34,70 +33,7 @@ def has_permission(issuer, action, kwargs):
     :param kwargs: List of arguments for the action.
     :returns: True if account is allowed, otherwise False
     """
-    perm = {'add_account': perm_add_account,
-            'del_account': perm_del_account,
-            'set_account_status': perm_set_account_status,
-            'add_rule': perm_add_rule,
-            'add_subscription': perm_add_subscription,
-            'add_scope': perm_add_scope,
-            'add_rse': perm_add_rse,
-            'update_rse': perm_update_rse,
-            'add_protocol': perm_add_protocol,
-            'del_protocol': perm_del_protocol,
-            'update_protocol': perm_update_protocol,
-            'declare_bad_file_replicas': perm_declare_bad_file_replicas,
-            'declare_suspicious_file_replicas': perm_declare_suspicious_file_replicas,
-            'add_replicas': perm_add_replicas,
-            'delete_replicas': perm_delete_replicas,
-            'skip_availability_check': perm_skip_availability_check,
-            'update_replicas_states': perm_update_replicas_states,
-            'add_rse_attribute': perm_add_rse_attribute,
-            'del_rse_attribute': perm_del_rse_attribute,
-            'del_rse': perm_del_rse,
-            'del_rule': perm_del_rule,
-            'update_rule': perm_update_rule,
-            'approve_rule': perm_approve_rule,
-            'update_subscription': perm_update_subscription,
-            'reduce_rule': perm_reduce_rule,
-            'get_auth_token_user_pass': perm_get_auth_token_user_pass,
-            'get_auth_token_gss': perm_get_auth_token_gss,
-            'get_auth_token_x509': perm_get_auth_token_x509,
-            'add_account_identity': perm_add_account_identity,
-            'add_did': perm_add_did,
-            'add_dids': perm_add_dids,
-            'attach_dids': perm_attach_dids,
-            'detach_dids': perm_detach_dids,
-            'attach_dids_to_dids': perm_attach_dids_to_dids,
-            'create_did_sample': perm_create_did_sample,
-            'set_metadata': perm_set_metadata,
-            'set_status': perm_set_status,
-            'queue_requests': perm_queue_requests,
-            'set_rse_usage': perm_set_rse_usage,
-            'set_rse_limits': perm_set_rse_limits,
-            'query_request': perm_query_request,
-            'get_request_by_did': perm_get_request_by_did,
-            'cancel_request': perm_cancel_request,
-            'get_next': perm_get_next,
-            'set_account_limit': perm_set_account_limit,
-            'delete_account_limit': perm_delete_account_limit,
-            'config_sections': perm_config,
-            'config_add_section': perm_config,
-            'config_has_section': perm_config,
-            'config_options': perm_config,
-            'config_has_option': perm_config,
-            'config_get': perm_config,
-            'config_items': perm_config,
-            'config_set': perm_config,
-            'config_remove_section': perm_config,
-            'config_remove_option': perm_config,
-            'get_account_usage': perm_get_account_usage,
-            'add_attribute': perm_add_account_attribute,
-            'del_attribute': perm_del_account_attribute,
-            'list_heartbeats': perm_list_heartbeats,
-            'resurrect': perm_resurrect,
-            'update_lifetime_exceptions': perm_update_lifetime_exceptions}
-
-    return perm.get(action, perm_default)(issuer=issuer, kwargs=kwargs)
+    return PERMISSIONS.get(action, perm_default)(issuer=issuer, kwargs=kwargs)
 
 
 def perm_default(issuer, kwargs):
@@ -329,7 +265,7 @@ def perm_add_did(issuer, kwargs):
 
     return issuer == 'root'\
         or has_account_attribute(account=issuer, key='admin')\
-        or rucio.core.scope.is_scope_owner(scope=kwargs['scope'], account=issuer)\
+        or is_scope_owner(scope=kwargs['scope'], account=issuer)\
         or kwargs['scope'] == u'mock'
 
 
@@ -361,7 +297,7 @@ def perm_attach_dids(issuer, kwargs):
     """
     return issuer == 'root'\
         or has_account_attribute(account=issuer, key='admin')\
-        or rucio.core.scope.is_scope_owner(scope=kwargs['scope'], account=issuer)\
+        or is_scope_owner(scope=kwargs['scope'], account=issuer)\
         or kwargs['scope'] == 'mock'
 
 
@@ -380,7 +316,7 @@ def perm_attach_dids_to_dids(issuer, kwargs):
         scopes = [did['scope'] for did in attachments]
         scopes = list(set(scopes))
         for scope in scopes:
-            if not rucio.core.scope.is_scope_owner(scope, issuer):
+            if not is_scope_owner(scope, issuer):
                 return False
         return True
 
@@ -395,7 +331,7 @@ def perm_create_did_sample(issuer, kwargs):
     """
     return issuer == 'root'\
         or has_account_attribute(account=issuer, key='admin')\
-        or rucio.core.scope.is_scope_owner(scope=kwargs['scope'], account=issuer)\
+        or is_scope_owner(scope=kwargs['scope'], account=issuer)\
         or kwargs['scope'] == 'mock'
 
 
@@ -573,7 +509,7 @@ def perm_set_metadata(issuer, kwargs):
     :param kwargs: List of arguments for the action.
     :returns: True if account is allowed, otherwise False
     """
-    return issuer == 'root' or has_account_attribute(account=issuer, key='admin') or rucio.core.scope.is_scope_owner(scope=kwargs['scope'], account=issuer)
+    return issuer == 'root' or has_account_attribute(account=issuer, key='admin') or is_scope_owner(scope=kwargs['scope'], account=issuer)
 
 
 def perm_set_status(issuer, kwargs):
@@ -588,7 +524,7 @@ def perm_set_status(issuer, kwargs):
         if issuer != 'root' and not has_account_attribute(account=issuer, key='admin'):
             return False
 
-    return issuer == 'root' or has_account_attribute(account=issuer, key='admin') or rucio.core.scope.is_scope_owner(scope=kwargs['scope'], account=issuer)
+    return issuer == 'root' or has_account_attribute(account=issuer, key='admin') or is_scope_owner(scope=kwargs['scope'], account=issuer)
 
 
 def perm_add_protocol(issuer, kwargs):
@@ -916,3 +852,68 @@ def perm_update_lifetime_exceptions(issuer, kwargs):
     :returns: True if account is allowed to call the API call, otherwise False
     """
     return issuer == 'root' or has_account_attribute(account=issuer, key='admin')
+
+
+# The permission function of each action, built once
+PERMISSIONS = {'add_account': perm_add_account,
+               'del_account': perm_del_account,
+               'set_account_status': perm_set_account_status,
+               'add_rule': perm_add_rule,
+               'add_subscription': perm_add_subscription,
+               'add_scope': perm_add_scope,
+               'add_rse': perm_add_rse,
+               'update_rse': perm_update_rse,
+               'add_protocol': perm_add_protocol,
+               'del_protocol': perm_del_protocol,
+               'update_protocol': perm_update_protocol,
+               'declare_bad_file_replicas': perm_declare_bad_file_replicas,
+               'declare_suspicious_file_replicas': perm_declare_suspicious_file_replicas,
+               'add_replicas': perm_add_replicas,
+               'delete_replicas': perm_delete_replicas,
+               'skip_availability_check': perm_skip_availability_check,
+               'update_replicas_states': perm_update_replicas_states,
+               'add_rse_attribute': perm_add_rse_attribute,
+               'del_rse_attribute': perm_del_rse_attribute,
+               'del_rse': perm_del_rse,
+               'del_rule': perm_del_rule,
+               'update_rule': perm_update_rule,
+               'approve_rule': perm_approve_rule,
+               'update_subscription': perm_update_subscription,
+               'reduce_rule': perm_reduce_rule,
+               'get_auth_token_user_pass': perm_get_auth_token_user_pass,
+               'get_auth_token_gss': perm_get_auth_token_gss,
+               'get_auth_token_x509': perm_get_auth_token_x509,
+               'add_account_identity': perm_add_account_identity,
+               'add_did': perm_add_did,
+               'add_dids': perm_add_dids,
+               'attach_dids': perm_attach_dids,
+               'detach_dids': perm_detach_dids,
+               'attach_dids_to_dids': perm_attach_dids_to_dids,
+               'create_did_sample': perm_create_did_sample,
+               'set_metadata': perm_set_metadata,
+               'set_status': perm_set_status,
+               'queue_requests': perm_queue_requests,
+               'set_rse_usage': perm_set_rse_usage,
+               'set_rse_limits': perm_set_rse_limits,
+               'query_request': perm_query_request,
+               'get_request_by_did': perm_get_request_by_did,
+               'cancel_request': perm_cancel_request,
+               'get_next': perm_get_next,
+               'set_account_limit': perm_set_account_limit,
+               'delete_account_limit': perm_delete_account_limit,
+               'config_sections': perm_config,
+               'config_add_section': perm_config,
+               'config_has_section': perm_config,
+               'config_options': perm_config,
+               'config_has_option': perm_config,
+               'config_get': perm_config,
+               'config_items': perm_config,
+               'config_set': perm_config,
+               'config_remove_section': perm_config,
+               'config_remove_option': perm_config,
+               'get_account_usage': perm_get_account_usage,
+               'add_attribute': perm_add_account_attribute,
+               'del_attribute': perm_del_account_attribute,
+               'list_heartbeats': perm_list_heartbeats,
+               'resurrect': perm_resurrect,
+               'update_lifetime_exceptions': perm_update_lifetime_exceptions}
@@ -0,0 +1,174 @@
+'''
+  Copyright European Organization for Nuclear Research (CERN)
+  Licensed under the Apache License, Version 2.0 (the "License");
+  You may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+
+  Process-local cache of the account attributes and scope ownership read by the permission checks.
+
+  The status, attributes and scopes of an account are read together and kept for `[permission]
+  cache_ttl` seconds (0 disables the cache). The changes made through rucio.core.account and
+  rucio.core.scope invalidate the entry of the account in the current process, immediately and
+  again when the transaction ends; the other processes see them after at most the TTL.
+
+  Between rucio.web.rest.common.rucio_loadhook and rucio_unloadhook, the decisions of
+  rucio.api.permission.has_permission are also memoised for the duration of the REST request.
+'''
+
+import json
+import threading
+import time
+
+from ConfigParser import NoOptionError, NoSectionError
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from rucio.common.config import config_get
+from rucio.common.exception import AccountNotFound
+from rucio.common.utils import LRUCache
+from rucio.db.sqla import models
+from rucio.db.sqla.constants import AccountStatus
+from rucio.db.sqla.session import read_session
+
+
+try:
+    CACHE_TTL = int(config_get('permission', 'cache_ttl'))
+except (NoOptionError, NoSectionError):
+    CACHE_TTL = 30
+
+try:
+    CACHE_SIZE = int(config_get('permission', 'cache_size'))
+except (NoOptionError, NoSectionError):
+    CACHE_SIZE = 10000
+
+SESSION_KEY = 'rucio.permission_cache'
+
+ACCOUNTS = LRUCache(maxsize=CACHE_SIZE)
+GENERATIONS = {}
+GENERATIONS_LOCK = threading.Lock()
+REQUEST = threading.local()
+
+
+@read_session
+def _load_account(account, session=None):
+    status = session.query(models.Account.status).filter_by(account=account).first()
+    attributes = session.query(models.AccountAttrAssociation.key, models.AccountAttrAssociation.value).filter_by(account=account)
+    scopes = session.query(models.Scope.scope).filter_by(account=account)
+    return {'active': status is not None and status[0] == AccountStatus.ACTIVE,
+            'attributes': [{'key': key, 'value': value} for key, value in attributes],
+            'scopes': set(scope for scope, in scopes)}
+
+
+def _get_account(account):
+    if CACHE_TTL <= 0:
+        return _load_account(account)
+    cached = ACCOUNTS.get(account)
+    if cached is not None and cached[0] > time.time():
+        return cached[1]
+    # An invalidation during the load must not be overwritten by the loaded entry
+    generation = GENERATIONS.get(account, 0)
+    entry = _load_account(account)
+    with GENERATIONS_LOCK:
+        if GENERATIONS.get(account, 0) == generation:
+            ACCOUNTS.set(account, (time.time() + CACHE_TTL, entry))
+    return entry
+
+
+def invalidate(account=None, session=None):
+    """
+    Drop the cached entry of an account.
+
+    :param account:  The account name, all the accounts if None.
+    :param session:  The database session of the change, the entry is dropped again when it ends.
+    """
+    with GENERATIONS_LOCK:
+        if account is None:
+            for key in GENERATIONS:
+                GENERATIONS[key] += 1
+            ACCOUNTS.clear()
+        else:
+            GENERATIONS[account] = GENERATIONS.get(account, 0) + 1
+            ACCOUNTS.delete(account)
+    if session is not None:
+        session.info.setdefault(SESSION_KEY, set()).add(account)
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _invalidate_accounts(session):
+    for account in session.info.pop(SESSION_KEY, ()):
+        invalidate(account)
+
+
+def has_account_attribute(account, key):
+    """
+    Cached rucio.core.account.has_account_attribute.
+
+    :param account:  The account name.
+    :param key:      The key of the attribute.
+    :returns:        True or False.
+    """
+    return any(attribute['key'] == key for attribute in _get_account(account)['attributes'])
+
+
+def list_account_attributes(account):
+    """
+    Cached rucio.core.account.list_account_attributes.
+
+    :param account:  The account name.
+    :returns:        A list of all key, value pairs for this account.
+    """
+    entry = _get_account(account)
+    if not entry['active']:
+        raise AccountNotFound("Account ID '{0}' does not exist".format(account))
+    return [dict(attribute) for attribute in entry['attributes']]
+
+
+def is_scope_owner(scope, account):
+    """
+    Cached rucio.core.scope.is_scope_owner.
+
+    :param scope:    The scope.
+    :param account:  The account name.
+    :returns:        True or False.
+    """
+    return scope in _get_account(account)['scopes']
+
+
+def begin_request():
+    """
+    Start memoising the permission decisions of the current thread.
+    """
+    REQUEST.decisions = {}
+    REQUEST.started_at = time.time()
+
+
+def end_request():
+    """
+    Stop memoising the permission decisions of the current thread.
+    """
+    REQUEST.decisions = None
+
+
+def memoize_decision(function, issuer, action, kwargs):
+    """
+    Call a permission function once per request for the same arguments.
+
+    :param function:  The permission function, e.g. rucio.core.permission.has_permission.
+    :param issuer:    Account identifier which issues the command.
+    :param action:    The action (API call) called by the account.
+    :param kwargs:    List of arguments for the action.
+    :returns:         The decision of the function.
+    """
+    decisions = getattr(REQUEST, 'decisions', None)
+    if decisions is None or time.time() - REQUEST.started_at > CACHE_TTL:
+        return function(issuer=issuer, action=action, kwargs=kwargs)
+    try:
+        key = (issuer, action, json.dumps(kwargs, sort_keys=True, default=str))
+    except (TypeError, ValueError):
+        return function(issuer=issuer, action=action, kwargs=kwargs)
+    if key not in decisions:
+        decisions[key] = function(issuer=issuer, action=action, kwargs=kwargs)
+    return decisions[key]
@@ -19,6 +19,7 @@
 from collections import defaultdict
 from curses.ascii import isprint
 from datetime import datetime, timedelta
+from itertools import islice
 from json import dumps
 from re import match
 from traceback import format_exc
@@ -37,10 +38,14 @@ from rucio.core.rse_counter import decrease, increase
 from rucio.core.rse_expression_parser import parse_expression
 from rucio.db.sqla import models
 from rucio.db.sqla.constants import DIDType, ReplicaState, OBSOLETE, DIDAvailability, BadFilesStatus
+from rucio.db.sqla.util import get_partition_filter
 from rucio.db.sqla.session import (read_session, stream_session, transactional_session,
                                    DEFAULT_SCHEMA_NAME)
 from rucio.rse import rsemanager as rsemgr
 
+# Number of replicas whose PFNs are built together by _list_replicas
+PFN_CHUNK_SIZE = 1000
+
 
 @read_session
 def get_bad_replicas_summary(rse_expression=None, from_date=None, to_date=None, session=None):
@@ -715,91 +720,116 @@ def _list_replicas_for_files(file_clause, state_clause, files, rse_clause, sessi
         #    raise exception.DataIdentifierNotFound("Files not found %s", str(files))
 
 
+def _lfns2pfns(protocol, lfns):
+    """
+    Build the PFNs of a protocol in bulk, or one by one if the bulk call fails.
+
+    :returns: list of PFNs in the order of lfns, None for the failed ones.
+    """
+    try:
+        return protocol.lfns2pfns_bulk(lfns)
+    except:
+        pfns = []
+        for scope, name, path in lfns:
+            try:
+                pfns.append(protocol.lfns2pfns(lfns={'scope': scope,
+                                                     'name': name,
+                                                     'path': path}).values()[0])
+            except:
+                # temporary protection
+                print format_exc()
+                pfns.append(None)
+        return pfns
+
+
 def _list_replicas(dataset_clause, file_clause, state_clause, show_pfns, schemes, files, rse_clause, session):
 
     files = [dataset_clause and _list_replicas_for_datasets(dataset_clause, state_clause, rse_clause, session),
              file_clause and _list_replicas_for_files(file_clause, state_clause, files, rse_clause, session)]
 
-    file, tmp_protocols, rse_info, pfns_cache = {}, {}, {}, {}
+    file, tmp_protocols, rse_info = {}, {}, {}
     for replicas in filter(None, files):
-        for scope, name, bytes, md5, adler32, path, state, rse, rse_type, volatile in replicas:
-
-            pfns = []
-            if show_pfns and rse:
-
-                if rse not in rse_info:
-                    rse_info[rse] = rsemgr.get_rse_info(rse, session=session)
-
-                if rse not in tmp_protocols:
-
-                    rse_schemes = schemes or []
-                    if not rse_schemes:
-                        try:
-                            rse_schemes = [rsemgr.select_protocol(rse_settings=rse_info[rse],
-                                                                  operation='read')['scheme']]
-                        except:
-                            print format_exc()
-
-                    protocols = []
-                    for s in rse_schemes:
-                        try:
-                            protocols.append(rsemgr.create_protocol(rse_settings=rse_info[rse],
-                                                                    operation='read',
-                                                                    scheme=s))
-                        except exception.RSEProtocolNotSupported:
-                            pass  # no need to be verbose
-                        except:
-                            print format_exc()
-                    tmp_protocols[rse] = protocols
-
-                # get pfns
-                for protocol in tmp_protocols[rse]:
-                    if 'determinism_type' in protocol.attributes:  # PFN is cachable
-                        try:
-                            path = pfns_cache['%s:%s:%s' % (protocol.attributes['determinism_type'], scope, name)]
-                        except KeyError:  # No cache entry scope:name found for this protocol
-                            path = protocol._get_path(scope, name)
-                            pfns_cache['%s:%s:%s' % (protocol.attributes['determinism_type'], scope, name)] = path
-
-                    try:
-                        pfn = protocol.lfns2pfns(lfns={'scope': scope,
-                                                       'name': name,
-                                                       'path': path}).\
-                            values()[0]
-                        pfns.append(pfn)
-                    except:
-                        # temporary protection
-                        print format_exc()
-
-                    if protocol.attributes['scheme'] == 'srm':
-                        try:
-                            file['space_token'] = protocol.attributes['extended_attributes']['space_token']
-                        except KeyError:
-                            file['space_token'] = None
-
-            if 'scope' in file and 'name' in file:
-                if file['scope'] == scope and file['name'] == name:
-                    file['rses'][rse] += pfns
-                    file['states'][rse] = str(state)
-                    for pfn in pfns:
-                        file['pfns'][pfn] = {'rse': rse,
-                                             'type': str(rse_type),
-                                             'volatile': volatile}
-                else:
-                    yield file
-                    file = {}
-
-            if not ('scope' in file and 'name' in file):
-                file = {'scope': scope, 'name': name, 'bytes': bytes,
-                        'md5': md5, 'adler32': adler32,
-                        'pfns': {}, 'rses': defaultdict(list),
-                        'states': {rse: str(state)}}
-                if rse:
-                    file['rses'][rse] = pfns
-                    for pfn in pfns:
-                        file['pfns'][pfn] = {'rse': rse,
-                                             'type': str(rse_type),
-                                             'volatile': volatile}
+        replicas = iter(replicas)
+        while True:
+            rows = list(islice(replicas, PFN_CHUNK_SIZE))
+            if not rows:
+                break
+
+            # get pfns, in one pass per protocol over the replicas of the chunk
+            rows_pfns = [[] for _ in rows]
+            if show_pfns:
+                rows_per_rse = defaultdict(list)
+                for index, row in enumerate(rows):
+                    if row[7]:
+                        rows_per_rse[row[7]].append(index)
+
+                for rse, indexes in rows_per_rse.iteritems():
+                    if rse not in rse_info:
+                        rse_info[rse] = rsemgr.get_rse_info(rse, session=session)
+
+                    if rse not in tmp_protocols:
+
+                        rse_schemes = schemes or []
+                        if not rse_schemes:
+                            try:
+                                rse_schemes = [rsemgr.select_protocol(rse_settings=rse_info[rse],
+                                                                      operation='read')['scheme']]
+                            except:
+                                print format_exc()
+
+                        protocols = []
+                        for s in rse_schemes:
+                            try:
+                                protocols.append(rsemgr.create_protocol(rse_settings=rse_info[rse],
+                                                                        operation='read',
+                                                                        scheme=s))
+                            except exception.RSEProtocolNotSupported:
+                                pass  # no need to be verbose
+                            except:
+                                print format_exc()
+                        tmp_protocols[rse] = protocols
+
+                    for protocol in tmp_protocols[rse]:
+                        # The path of the replica is only used if the PFN is not cachable
+                        cachable = 'determinism_type' in protocol.attributes
+                        lfns = [(rows[index][0], rows[index][1], None if cachable else rows[index][5]) for index in indexes]
+                        for index, pfn in zip(indexes, _lfns2pfns(protocol, lfns)):
+                            if pfn is not None:
+                                rows_pfns[index].append(pfn)
+
+            for (scope, name, bytes, md5, adler32, path, state, rse, rse_type, volatile), pfns in zip(rows, rows_pfns):
+
+                if show_pfns and rse:
+                    for protocol in tmp_protocols[rse]:
+                        if protocol.attributes['scheme'] == 'srm':
+                            try:
+                                file['space_token'] = protocol.attributes['extended_attributes']['space_token']
+                            except KeyError:
+                                file['space_token'] = None
+
+                if 'scope' in file and 'name' in file:
+                    if file['scope'] == scope and file['name'] == name:
+                        file['rses'][rse] += pfns
+                        file['states'][rse] = str(state)
+                        for pfn in pfns:
+                            file['pfns'][pfn] = {'rse': rse,
+                                                 'type': str(rse_type),
+                                                 'volatile': volatile}
+                    else:
+                        yield file
+                        file = {}
+
+                if not ('scope' in file and 'name' in file):
+                    file = {'scope': scope, 'name': name, 'bytes': bytes,
+                            'md5': md5, 'adler32': adler32,
+                            'pfns': {}, 'rses': defaultdict(list),
+                            'states': {rse: str(state)}}
+                    if rse:
+                        file['rses'][rse] = pfns
+                        for pfn in pfns:
+                            file['pfns'][pfn] = {'rse': rse,
+                                                 'type': str(rse_type),
+                                                 'volatile': volatile}
 
     if 'scope' in file and 'name' in file:
         yield file
@@ -1209,30 +1239,29 @@ def get_replica(rse, scope, name, rse_id=None, session=None):
     return result
 
 
-@read_session
-def list_unlocked_replicas(rse, limit, bytes=None, rse_id=None, worker_number=None, total_workers=None, delay_seconds=0, session=None):
+def get_unlocked_replicas_query(rse_id, columns, worker_number=None, total_workers=None, delay_seconds=0, session=None):
     """
-    List RSE File replicas with no locks.
+    Build the query of the RSE File replicas which can be deleted: with an expired tombstone,
+    no locks and not used as source of a request.
 
-    :param rse: the rse name.
-    :param bytes: the amount of needed bytes.
+    :param rse_id: The id of the RSE.
+    :param columns: The columns to select.
+    :param worker_number: The worker number, to select a partition of the replicas.
+    :param total_workers: The total number of workers.
+    :param delay_seconds: Delay before BEING_DELETED replicas are selected again.
     :param session: The database session in use.
 
-    :returns: a list of dictionary replica.
+    :returns: The (unordered) query.
     """
-    if not rse_id:
-        rse_id = get_rse_id(rse=rse, session=session)
-
     # filter(models.RSEFileAssociation.state != ReplicaState.BEING_DELETED).\
     none_value = None  # Hack to get pep8 happy...
-    query = session.query(models.RSEFileAssociation.scope, models.RSEFileAssociation.name, models.RSEFileAssociation.path, models.RSEFileAssociation.bytes, models.RSEFileAssociation.tombstone, models.RSEFileAssociation.state).\
+    query = session.query(*columns).\
         with_hint(models.RSEFileAssociation, "INDEX_RS_ASC(replicas REPLICAS_TOMBSTONE_IDX)  NO_INDEX_FFS(replicas REPLICAS_TOMBSTONE_IDX)", 'oracle').\
         filter(models.RSEFileAssociation.tombstone < datetime.utcnow()).\
         filter(models.RSEFileAssociation.lock_cnt == 0).\
         filter(case([(models.RSEFileAssociation.tombstone != none_value, models.RSEFileAssociation.rse_id), ]) == rse_id).\
         filter(or_(models.RSEFileAssociation.state.in_((ReplicaState.AVAILABLE, ReplicaState.UNAVAILABLE, ReplicaState.BAD)),
-                   and_(models.RSEFileAssociation.state == ReplicaState.BEING_DELETED, models.RSEFileAssociation.updated_at < datetime.utcnow() - timedelta(seconds=delay_seconds)))).\
-        order_by(models.RSEFileAssociation.tombstone)
+                   and_(models.RSEFileAssociation.state == ReplicaState.BEING_DELETED, models.RSEFileAssociation.updated_at < datetime.utcnow() - timedelta(seconds=delay_seconds))))
 
     # do no delete files used as sources
     stmt = exists(select([1]).prefix_with("/*+ INDEX(requests REQUESTS_SCOPE_NAME_RSE_IDX) */", dialect='oracle')).\
@@ -1241,13 +1270,29 @@ def list_unlocked_replicas(rse, limit, bytes=None, rse_id=None, worker_number=No
     query = query.filter(not_(stmt))
 
     if worker_number and total_workers and total_workers - 1 > 0:
-        if session.bind.dialect.name == 'oracle':
-            bindparams = [bindparam('worker_number', worker_number - 1), bindparam('total_workers', total_workers - 1)]
-            query = query.filter(text('ORA_HASH(name, :total_workers) = :worker_number', bindparams=bindparams))
-        elif session.bind.dialect.name == 'mysql':
-            query = query.filter('mod(md5(name), %s) = %s' % (total_workers - 1, worker_number - 1))
-        elif session.bind.dialect.name == 'postgresql':
-            query = query.filter('mod(abs((\'x\'||md5(name))::bit(32)::int), %s) = %s' % (total_workers - 1, worker_number - 1))
+        query = query.filter(get_partition_filter(models.RSEFileAssociation.bucket, worker_number - 1, total_workers))
+    return query
+
+
+@read_session
+def list_unlocked_replicas(rse, limit, bytes=None, rse_id=None, worker_number=None, total_workers=None, delay_seconds=0, session=None):
+    """
+    List RSE File replicas with no locks.
+
+    :param rse: the rse name.
+    :param bytes: the amount of needed bytes.
+    :param session: The database session in use.
+
+    :returns: a list of dictionary replica.
+    """
+    if not rse_id:
+        rse_id = get_rse_id(rse=rse, session=session)
+
+    query = get_unlocked_replicas_query(rse_id=rse_id,
+                                        columns=(models.RSEFileAssociation.scope, models.RSEFileAssociation.name, models.RSEFileAssociation.path,
+                                                 models.RSEFileAssociation.bytes, models.RSEFileAssociation.tombstone, models.RSEFileAssociation.state),
+                                        worker_number=worker_number, total_workers=total_workers, delay_seconds=delay_seconds, session=session).\
+        order_by(models.RSEFileAssociation.tombstone)
 
     needed_space = bytes
     total_bytes, total_files = 0, 0
@@ -1291,6 +1336,9 @@ def update_replicas_states(replicas, nowait=False, session=None):
     """
     Update File replica information and state.
 
+    The locks of the replicas becoming AVAILABLE are finished in bulk, and those of
+    them without a new path are updated with one statement per chunk of replicas.
+
     :param replicas: The list of replicas.
     :param nowait:   Nowait parameter for the for_update queries.
     :param session:  The database session in use.
@@ -1302,17 +1350,30 @@ def update_replicas_states(replicas, nowait=False, session=None):
                 rse_ids[replica['rse']] = get_rse_id(rse=replica['rse'], session=session)
             replica['rse_id'] = rse_ids[replica['rse']]
 
-        query = session.query(models.RSEFileAssociation).filter_by(rse_id=replica['rse_id'], scope=replica['scope'], name=replica['name'])
-        try:
-            if nowait:
-                query.with_for_update(nowait=True).one()
-        except NoResultFound:
-            # remember scope, name and rse_id
-            raise exception.ReplicaNotFound("No row found for scope: %s name: %s rse_id: %s" % (replica['scope'], replica['name'], replica['rse_id']))
-
         if isinstance(replica['state'], str) or isinstance(replica['state'], unicode):
             replica['state'] = ReplicaState.from_string(replica['state'])
 
+    if nowait:
+        for chunk in chunks(replicas, 100):
+            found = set(session.query(models.RSEFileAssociation.scope,
+                                      models.RSEFileAssociation.name,
+                                      models.RSEFileAssociation.rse_id).
+                        filter(or_(*[and_(models.RSEFileAssociation.scope == replica['scope'],
+                                          models.RSEFileAssociation.name == replica['name'],
+                                          models.RSEFileAssociation.rse_id == replica['rse_id']) for replica in chunk])).
+                        with_for_update(nowait=True).all())
+            for replica in chunk:
+                if (replica['scope'], replica['name'], replica['rse_id']) not in found:
+                    # remember scope, name and rse_id
+                    raise exception.ReplicaNotFound("No row found for scope: %s name: %s rse_id: %s" % (replica['scope'], replica['name'], replica['rse_id']))
+
+    available = [replica for replica in replicas if replica['state'] == ReplicaState.AVAILABLE]
+    if available:
+        rucio.core.lock.successful_transfers(files=available, nowait=nowait, session=session)
+
+    for replica in replicas:
+        query = session.query(models.RSEFileAssociation).filter_by(rse_id=replica['rse_id'], scope=replica['scope'], name=replica['name'])
+
         values = {'state': replica['state']}
         if replica['state'] == ReplicaState.BEING_DELETED:
             query = query.filter_by(lock_cnt=0)
@@ -1323,7 +1384,8 @@ def update_replicas_states(replicas, nowait=False, session=None):
             query = query.filter(not_(stmt))
             values['tombstone'] = OBSOLETE
         elif replica['state'] == ReplicaState.AVAILABLE:
-            rucio.core.lock.successful_transfer(scope=replica['scope'], name=replica['name'], rse_id=replica['rse_id'], nowait=nowait, session=session)
+            if not replica.get('path'):
+                continue
         elif replica['state'] == ReplicaState.UNAVAILABLE:
             rucio.core.lock.failed_transfer(scope=replica['scope'], name=replica['name'], rse_id=replica['rse_id'],
                                             error_message=replica.get('error_message', None),
@@ -1338,6 +1400,16 @@ def update_replicas_states(replicas, nowait=False, session=None):
             if 'rse' not in replica:
                 replica['rse'] = get_rse_name(rse_id=replica['rse_id'], session=session)
             raise exception.UnsupportedOperation('State %(state)s for replica %(scope)s:%(name)s on %(rse)s cannot be updated' % replica)
+
+    keys = set([(replica['scope'], replica['name'], replica['rse_id']) for replica in available if not replica.get('path')])
+    for chunk in chunks(list(keys), 100):
+        rowcount = session.query(models.RSEFileAssociation).\
+            filter(or_(*[and_(models.RSEFileAssociation.scope == scope,
+                              models.RSEFileAssociation.name == name,
+                              models.RSEFileAssociation.rse_id == rse_id) for scope, name, rse_id in chunk])).\
+            update({'state': ReplicaState.AVAILABLE}, synchronize_session=False)
+        if rowcount != len(chunk):
+            raise exception.UnsupportedOperation('State %s for %s of %s replicas cannot be updated' % (ReplicaState.AVAILABLE, len(chunk) - rowcount, len(chunk)))
     return True
 
 
@@ -1389,6 +1461,74 @@ def touch_replica(replica, session=None):
     return True
 
 
+@transactional_session
+def touch_replicas(replicas, session=None):
+    """
+    Update the accessed_at timestamps of the given file replicas/dids in bulk but don't wait if a row is locked.
+
+    :param replicas: a list of dictionaries with the information of the affected replicas.
+    :param session: The database session in use.
+
+    :returns: True, if successful, False if a row is locked, in which case nothing is updated.
+    """
+    if not replicas:
+        return True
+
+    rse_ids, files = {}, {}
+    for replica in replicas:
+        if 'rse_id' not in replica:
+            if replica['rse'] not in rse_ids:
+                rse_ids[replica['rse']] = get_rse_id(rse=replica['rse'], session=session)
+            replica['rse_id'] = rse_ids[replica['rse']]
+        replica['accessed_at'] = replica.get('accessed_at') or datetime.utcnow()
+        key = (replica['scope'], replica['name'])
+        files[key] = max(files.get(key, replica['accessed_at']), replica['accessed_at'])
+
+    try:
+        for chunk in chunks(replicas, 100):
+            session.query(models.RSEFileAssociation.rse_id).\
+                filter(or_(*[and_(models.RSEFileAssociation.rse_id == replica['rse_id'],
+                                  models.RSEFileAssociation.scope == replica['scope'],
+                                  models.RSEFileAssociation.name == replica['name']) for replica in chunk])).\
+                with_hint(models.RSEFileAssociation, "index(REPLICAS REPLICAS_PK)", 'oracle').\
+                with_for_update(nowait=True).all()
+
+        for chunk in chunks(files.keys(), 100):
+            session.query(models.DataIdentifier.did_type).\
+                filter(or_(*[and_(models.DataIdentifier.scope == scope,
+                                  models.DataIdentifier.name == name) for scope, name in chunk])).\
+                filter(models.DataIdentifier.did_type == DIDType.FILE).\
+                with_hint(models.DataIdentifier, "INDEX(DIDS DIDS_PK)", 'oracle').\
+                with_for_update(nowait=True).all()
+    except DatabaseError:
+        return False
+
+    none_value = None
+    replicas_table, dids_table = models.RSEFileAssociation.__table__, models.DataIdentifier.__table__
+    accessed_at = bindparam('b_accessed_at', type_=replicas_table.c.accessed_at.type)
+    stmt = replicas_table.update().\
+        where(and_(replicas_table.c.rse_id == bindparam('b_rse_id'),
+                   replicas_table.c.scope == bindparam('b_scope'),
+                   replicas_table.c.name == bindparam('b_name'))).\
+        with_hint("index(REPLICAS REPLICAS_PK)", dialect_name='oracle').\
+        values(accessed_at=accessed_at,
+               tombstone=case([(and_(replicas_table.c.tombstone != none_value,
+                                     replicas_table.c.tombstone != OBSOLETE),
+                                accessed_at)],
+                              else_=replicas_table.c.tombstone))
+    session.execute(stmt, [{'b_rse_id': replica['rse_id'], 'b_scope': replica['scope'], 'b_name': replica['name'],
+                            'b_accessed_at': replica['accessed_at']} for replica in replicas])
+
+    stmt = dids_table.update().\
+        where(and_(dids_table.c.scope == bindparam('b_scope'),
+                   dids_table.c.name == bindparam('b_name'),
+                   dids_table.c.did_type == DIDType.FILE)).\
+        with_hint("INDEX(DIDS DIDS_PK)", dialect_name='oracle').\
+        values(accessed_at=bindparam('b_accessed_at', type_=dids_table.c.accessed_at.type))
+    session.execute(stmt, [{'b_scope': scope, 'b_name': name, 'b_accessed_at': atime} for (scope, name), atime in files.items()])
+    return True
+
+
 @transactional_session
 def update_replica_state(rse, scope, name, state, session=None):
     """
@@ -1613,6 +1753,104 @@ def get_source_replicas_for_dataset(scope, name, source_rses=None, session=None)
     return replicas
 
 
+@transactional_session
+def get_and_lock_file_replicas_for_datasets(datasets, nowait=False, restrict_rses=None, chunk_size=50, session=None):
+    """
+    Get file replicas for all files of several datasets, querying chunk_size datasets at a time.
+
+    :param datasets:       List of dictionaries {'scope', 'name'} of the datasets.
+    :param nowait:         Nowait parameter for the FOR UPDATE statement
+    :param restrict_rses:  Possible RSE_ids to filter on.
+    :param chunk_size:     Number of datasets resolved per query.
+    :param session:        The db session in use.
+    :returns:              ({(ds_scope, ds_name): files in dataset}, replicas in datasets)
+    """
+    replica_clause = [models.DataIdentifierAssociation.child_scope == models.RSEFileAssociation.scope,
+                      models.DataIdentifierAssociation.child_name == models.RSEFileAssociation.name,
+                      models.RSEFileAssociation.state != ReplicaState.BEING_DELETED]
+    if restrict_rses is not None and 0 < len(restrict_rses) < 10:
+        replica_clause.append(or_(*[models.RSEFileAssociation.rse_id == rse_id for rse_id in restrict_rses]))
+
+    files = {}
+    replicas = {}
+    owner = {}  # A file attached to several datasets only adds its replicas once
+
+    for dataset in datasets:
+        files[(dataset['scope'], dataset['name'])] = {}
+
+    for chunk in chunks(datasets, chunk_size):
+        query = session.query(models.DataIdentifierAssociation.scope,
+                              models.DataIdentifierAssociation.name,
+                              models.DataIdentifierAssociation.child_scope,
+                              models.DataIdentifierAssociation.child_name,
+                              models.DataIdentifierAssociation.bytes,
+                              models.DataIdentifierAssociation.md5,
+                              models.DataIdentifierAssociation.adler32,
+                              models.RSEFileAssociation)\
+            .with_hint(models.DataIdentifierAssociation, "INDEX_RS_ASC(CONTENTS CONTENTS_PK) NO_INDEX_FFS(CONTENTS CONTENTS_PK)", 'oracle')\
+            .outerjoin(models.RSEFileAssociation, and_(*replica_clause))\
+            .filter(or_(*[and_(models.DataIdentifierAssociation.scope == dataset['scope'],
+                               models.DataIdentifierAssociation.name == dataset['name']) for dataset in chunk]))\
+            .with_for_update(nowait=nowait, of=models.RSEFileAssociation.lock_cnt)
+
+        for scope, name, child_scope, child_name, bytes, md5, adler32, replica in query:
+            dataset_files = files[(scope, name)]
+            if (child_scope, child_name) not in dataset_files:
+                dataset_files[(child_scope, child_name)] = {'scope': child_scope,
+                                                            'name': child_name,
+                                                            'bytes': bytes,
+                                                            'md5': md5,
+                                                            'adler32': adler32}
+            if (child_scope, child_name) not in owner:
+                owner[(child_scope, child_name)] = (scope, name)
+                replicas[(child_scope, child_name)] = []
+            if replica is not None and owner[(child_scope, child_name)] == (scope, name):
+                replicas[(child_scope, child_name)].append(replica)
+
+    return (dict((dataset, dataset_files.values()) for dataset, dataset_files in files.items()), replicas)
+
+
+@transactional_session
+def get_source_replicas_for_datasets(datasets, source_rses=None, chunk_size=50, session=None):
+    """
+    Get source replicas for all files of several datasets, querying chunk_size datasets at a time.
+
+    :param datasets:       List of dictionaries {'scope', 'name'} of the datasets.
+    :param source_rses:    Possible source RSE_ids to filter on.
+    :param chunk_size:     Number of datasets resolved per query.
+    :param session:        The db session in use.
+    :returns:              Dictionary (scope, name) of the files with the list of source rse_ids
+    """
+    replica_clause = [models.DataIdentifierAssociation.child_scope == models.RSEFileAssociation.scope,
+                      models.DataIdentifierAssociation.child_name == models.RSEFileAssociation.name,
+                      models.RSEFileAssociation.state == ReplicaState.AVAILABLE]
+    if source_rses and len(source_rses) < 10:
+        replica_clause.append(or_(*[models.RSEFileAssociation.rse_id == rse_id for rse_id in source_rses]))
+
+    replicas = {}
+    owner = {}
+
+    for chunk in chunks(datasets, chunk_size):
+        query = session.query(models.DataIdentifierAssociation.scope,
+                              models.DataIdentifierAssociation.name,
+                              models.DataIdentifierAssociation.child_scope,
+                              models.DataIdentifierAssociation.child_name,
+                              models.RSEFileAssociation.rse_id)\
+            .with_hint(models.DataIdentifierAssociation, "INDEX_RS_ASC(CONTENTS CONTENTS_PK) NO_INDEX_FFS(CONTENTS CONTENTS_PK)", 'oracle')\
+            .outerjoin(models.RSEFileAssociation, and_(*replica_clause))\
+            .filter(or_(*[and_(models.DataIdentifierAssociation.scope == dataset['scope'],
+                               models.DataIdentifierAssociation.name == dataset['name']) for dataset in chunk]))
+
+        for scope, name, child_scope, child_name, rse_id in query:
+            if (child_scope, child_name) not in owner:
+                owner[(child_scope, child_name)] = (scope, name)
+                replicas[(child_scope, child_name)] = []
+            if rse_id and owner[(child_scope, child_name)] == (scope, name):
+                replicas[(child_scope, child_name)].append(rse_id)
+
+    return replicas
+
+
 @transactional_session
 def update_replicas_paths(replicas, session=None):
     """
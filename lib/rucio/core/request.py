@@ -26,7 +26,7 @@ from dogpile.cache.api import NoValue
 from sqlalchemy import and_, or_, func
 from sqlalchemy.orm import aliased
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.sql.expression import asc, bindparam, text, false, true
+from sqlalchemy.sql.expression import asc, false, true
 
 from rucio.common.config import config_get
 from rucio.common.exception import RequestNotFound, RucioException, UnsupportedOperation
@@ -37,6 +37,7 @@ from rucio.core.rse import get_rse_id, get_rse_name, get_rse_transfer_limits
 from rucio.db.sqla import models
 from rucio.db.sqla.constants import RequestState, RequestType, FTSState, ReplicaState, LockState
 from rucio.db.sqla.session import read_session, transactional_session
+from rucio.db.sqla.util import get_partition_filter
 from rucio.transfertool import fts3
 
 
@@ -576,9 +577,6 @@ def get_next(request_type, state, limit=100, older_than=None, rse=None, activity
 
     record_counter('core.request.get_next.%s-%s' % (request_type, state))
 
-    if total_processes > 1 and total_processes == total_threads:
-        raise RucioException("Total process %s is the same with total threads %s, will create potential same hash" % (total_processes, total_threads))
-
     # lists of one element are not allowed by SQLA, so just duplicate the item
     if type(request_type) is not list:
         request_type = [request_type, request_type]
@@ -611,23 +609,8 @@ def get_next(request_type, state, limit=100, older_than=None, rse=None, activity
         elif activity:
             query = query.filter(models.Request.activity == activity)
 
-        if (total_processes - 1) > 0:
-            if session.bind.dialect.name == 'oracle':
-                bindparams = [bindparam('process_number', process), bindparam('total_processes', total_processes - 1)]
-                query = query.filter(text('ORA_HASH(rule_id, :total_processes) = :process_number', bindparams=bindparams))
-            elif session.bind.dialect.name == 'mysql':
-                query = query.filter('mod(md5(rule_id), %s) = %s' % (total_processes - 1, process))
-            elif session.bind.dialect.name == 'postgresql':
-                query = query.filter('mod(abs((\'x\'||md5(rule_id))::bit(32)::int), %s) = %s' % (total_processes - 1, process))
-
-        if (total_threads - 1) > 0:
-            if session.bind.dialect.name == 'oracle':
-                bindparams = [bindparam('thread_number', thread), bindparam('total_threads', total_threads - 1)]
-                query = query.filter(text('ORA_HASH(rule_id, :total_threads) = :thread_number', bindparams=bindparams))
-            elif session.bind.dialect.name == 'mysql':
-                query = query.filter('mod(md5(rule_id), %s) = %s' % (total_threads - 1, thread))
-            elif session.bind.dialect.name == 'postgresql':
-                query = query.filter('mod(abs((\'x\'||md5(rule_id))::bit(32)::int), %s) = %s' % (total_threads - 1, thread))
+        if total_processes * total_threads > 1:
+            query = query.filter(get_partition_filter(models.Request.bucket, process * total_threads + thread, total_processes * total_threads))
 
         if share:
             query = query.limit(activity_shares[share])
@@ -668,9 +651,6 @@ def get_next_transfers(request_type, state, limit=100, older_than=None, rse=None
 
     record_counter('core.request.get_next_transfers.%s-%s' % (request_type, state))
 
-    if total_processes > 1 and total_processes == total_threads:
-        raise RucioException("Total process %s is the same with total threads %s, will create potential same hash" % (total_processes, total_threads))
-
     # lists of one element are not allowed by SQLA, so just duplicate the item
     if type(request_type) is not list:
         request_type = [request_type, request_type]
@@ -704,23 +684,8 @@ def get_next_transfers(request_type, state, limit=100, older_than=None, rse=None
         elif activity:
             query = query.filter(models.Request.activity == activity)
 
-        if (total_processes - 1) > 0:
-            if session.bind.dialect.name == 'oracle':
-                bindparams = [bindparam('process_number', process), bindparam('total_processes', total_processes - 1)]
-                query = query.filter(text('ORA_HASH(rule_id, :total_processes) = :process_number', bindparams=bindparams))
-            elif session.bind.dialect.name == 'mysql':
-                query = query.filter('mod(md5(rule_id), %s) = %s' % (total_processes - 1, process))
-            elif session.bind.dialect.name == 'postgresql':
-                query = query.filter('mod(abs((\'x\'||md5(rule_id))::bit(32)::int), %s) = %s' % (total_processes - 1, process))
-
-        if (total_threads - 1) > 0:
-            if session.bind.dialect.name == 'oracle':
-                bindparams = [bindparam('thread_number', thread), bindparam('total_threads', total_threads - 1)]
-                query = query.filter(text('ORA_HASH(rule_id, :total_threads) = :thread_number', bindparams=bindparams))
-            elif session.bind.dialect.name == 'mysql':
-                query = query.filter('mod(md5(rule_id), %s) = %s' % (total_threads - 1, thread))
-            elif session.bind.dialect.name == 'postgresql':
-                query = query.filter('mod(abs((\'x\'||md5(rule_id))::bit(32)::int), %s) = %s' % (total_threads - 1, thread))
+        if total_processes * total_threads > 1:
+            query = query.filter(get_partition_filter(models.Request.bucket, process * total_threads + thread, total_processes * total_threads))
 
         if share:
             query = query.limit(activity_shares[share])
@@ -1347,9 +1312,6 @@ def list_transfer_requests_and_source_replicas(process=None, total_processes=Non
     :param session: Database session to use.
     :returns: List.
     """
-    if total_processes > 1 and total_processes == total_threads:
-        raise RucioException("Total process %s is the same with total threads %s, will create potential same hash" % (total_processes, total_threads))
-
     sub_requests = session.query(models.Request.id,
                                  models.Request.rule_id,
                                  models.Request.scope,
@@ -1372,23 +1334,8 @@ def list_transfer_requests_and_source_replicas(process=None, total_processes=Non
     if activity:
         sub_requests = sub_requests.filter(models.Request.activity == activity)
 
-    if (total_processes - 1) > 0:
-        if session.bind.dialect.name == 'oracle':
-            bindparams = [bindparam('process_number', process), bindparam('total_processes', total_processes - 1)]
-            sub_requests = sub_requests.filter(text('ORA_HASH(rule_id, :total_processes) = :process_number', bindparams=bindparams))
-        elif session.bind.dialect.name == 'mysql':
-            sub_requests = sub_requests.filter('mod(md5(rule_id), %s) = %s' % (total_processes - 1, process))
-        elif session.bind.dialect.name == 'postgresql':
-            sub_requests = sub_requests.filter('mod(abs((\'x\'||md5(rule_id))::bit(32)::int), %s) = %s' % (total_processes - 1, process))
-
-    if (total_threads - 1) > 0:
-        if session.bind.dialect.name == 'oracle':
-            bindparams = [bindparam('thread_number', thread), bindparam('total_threads', total_threads - 1)]
-            sub_requests = sub_requests.filter(text('ORA_HASH(rule_id, :total_threads) = :thread_number', bindparams=bindparams))
-        elif session.bind.dialect.name == 'mysql':
-            sub_requests = sub_requests.filter('mod(md5(rule_id), %s) = %s' % (total_threads - 1, thread))
-        elif session.bind.dialect.name == 'postgresql':
-            sub_requests = sub_requests.filter('mod(abs((\'x\'||md5(rule_id))::bit(32)::int), %s) = %s' % (total_threads - 1, thread))
+    if total_processes * total_threads > 1:
+        sub_requests = sub_requests.filter(get_partition_filter(models.Request.bucket, process * total_threads + thread, total_processes * total_threads))
 
     if limit:
         sub_requests = sub_requests.limit(limit)
@@ -1480,23 +1427,8 @@ def list_stagein_requests_and_source_replicas(process=None, total_processes=None
     if activity:
         sub_requests = sub_requests.filter(models.Request.activity == activity)
 
-    if (total_processes - 1) > 0:
-        if session.bind.dialect.name == 'oracle':
-            bindparams = [bindparam('process_number', process), bindparam('total_processes', total_processes - 1)]
-            sub_requests = sub_requests.filter(text('ORA_HASH(rule_id, :total_processes) = :process_number', bindparams=bindparams))
-        elif session.bind.dialect.name == 'mysql':
-            sub_requests = sub_requests.filter('mod(md5(rule_id), %s) = %s' % (total_processes - 1, process))
-        elif session.bind.dialect.name == 'postgresql':
-            sub_requests = sub_requests.filter('mod(abs((\'x\'||md5(rule_id))::bit(32)::int), %s) = %s' % (total_processes - 1, process))
-
-    if (total_threads - 1) > 0:
-        if session.bind.dialect.name == 'oracle':
-            bindparams = [bindparam('thread_number', thread), bindparam('total_threads', total_threads - 1)]
-            sub_requests = sub_requests.filter(text('ORA_HASH(rule_id, :total_threads) = :thread_number', bindparams=bindparams))
-        elif session.bind.dialect.name == 'mysql':
-            sub_requests = sub_requests.filter('mod(md5(rule_id), %s) = %s' % (total_threads - 1, thread))
-        elif session.bind.dialect.name == 'postgresql':
-            sub_requests = sub_requests.filter('mod(abs((\'x\'||md5(rule_id))::bit(32)::int), %s) = %s' % (total_threads - 1, thread))
+    if total_processes * total_threads > 1:
+        sub_requests = sub_requests.filter(get_partition_filter(models.Request.bucket, process * total_threads + thread, total_processes * total_threads))
 
     if limit:
         sub_requests = sub_requests.limit(limit)
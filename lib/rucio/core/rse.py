@@ -28,6 +28,7 @@ from sqlalchemy.sql.expression import or_
 
 import rucio.core.account_counter
 
+from rucio.core import rse_expression_index
 from rucio.core.rse_counter import add_counter
 
 from rucio.common import exception, utils
@@ -63,6 +64,9 @@ def add_rse(rse, deterministic=True, volatile=False, city=None, region_code=None
     except DatabaseError, e:
         raise exception.RucioException(e.args)
 
+    rse_expression_index.INDEX.invalidate()
+    rse_expression_index.on_commit(session, rse_expression_index.INDEX.invalidate)
+
     # Add rse name as a RSE-Tag
     add_rse_attribute(rse=rse, key=rse, value=True, session=session)
 
@@ -132,6 +136,8 @@ def del_rse(rse, session=None):
         raise exception.RSENotFound('RSE \'%s\' cannot be found' % rse)
     old_rse.delete(session=session)
     del_rse_attribute(rse=rse, key=rse, session=session)
+    rse_expression_index.INDEX.invalidate()
+    rse_expression_index.on_commit(session, rse_expression_index.INDEX.invalidate)
 
 
 @read_session
@@ -286,6 +292,7 @@ def add_rse_attribute(rse, key, value, session=None):
         new_rse_attr.save(session=session)
     except IntegrityError:
         raise exception.Duplicate("RSE attribute '%(key)s-%(value)s\' for RSE '%(rse)s' already exists!" % locals())
+    rse_expression_index.on_commit(session, rse_expression_index.INDEX.add_attribute, rse_id=rse_id, key=key, value=value)
     return True
 
 
@@ -304,6 +311,7 @@ def del_rse_attribute(rse, key, session=None):
     query = session.query(models.RSEAttrAssociation).filter_by(rse_id=rse_id).filter(models.RSEAttrAssociation.key == key)
     rse_attr = query.one()
     rse_attr.delete(session=session)
+    rse_expression_index.on_commit(session, rse_expression_index.INDEX.del_attribute, rse_id=rse_id, key=key)
     return True
 
 
@@ -943,3 +951,5 @@ def update_rse(rse, parameters, session=None):
         query = session.query(models.RSEAttrAssociation).filter_by(rse_id=rse_id).filter(models.RSEAttrAssociation.key == rse)
         rse_attr = query.one()
         rse_attr.delete(session=session)
+        rse_expression_index.on_commit(session, rse_expression_index.INDEX.del_attribute, rse_id=rse_id, key=rse)
+    rse_expression_index.on_commit(session, rse_expression_index.INDEX.update_rse, rse_id=rse_id, parameters=param)
@@ -10,13 +10,20 @@
 # - Mario Lassnig, <mario.lassnig@cern.ch>, 2013-2014
 # - Martin Barisits, <martin.barisits@cern.ch>, 2014
 
+from datetime import datetime
+
+from sqlalchemy import func
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.sql.expression import bindparam, text
 
-from rucio.common.exception import CounterNotFound
+from rucio.common.exception import CounterNotFound, CounterUpdateConflict
+from rucio.common.utils import chunks
+from rucio.core.counter_accumulator import ACCUMULATE_COUNTERS, get_accumulator
 from rucio.db.sqla import models
 from rucio.db.sqla.session import read_session, transactional_session
 
+ACCUMULATOR = get_accumulator(model=models.UpdatedRSECounter, columns=('rse_id', ))
+
 
 @transactional_session
 def add_counter(rse_id, session=None):
@@ -40,8 +47,11 @@ def increase(rse_id, files, bytes, session=None):
     :param bytes:   The number of added bytes.
     :param session: The database session in use.
     """
-    models.UpdatedRSECounter(rse_id=rse_id, files=files, bytes=bytes).\
-        save(session=session)
+    if ACCUMULATE_COUNTERS:
+        ACCUMULATOR.add(key=(rse_id, ), files=files, bytes=bytes, session=session)
+    else:
+        models.UpdatedRSECounter(rse_id=rse_id, files=files, bytes=bytes).\
+            save(session=session)
 
 
 @transactional_session
@@ -128,7 +138,9 @@ def update_rse_counter(rse_id, session=None):
     :param session:  Database session in use.
     """
 
-    updated_rse_counters = session.query(models.UpdatedRSECounter).\
+    updated_rse_counters = session.query(models.UpdatedRSECounter.id,
+                                         models.UpdatedRSECounter.files,
+                                         models.UpdatedRSECounter.bytes).\
         filter_by(rse_id=rse_id).all()
 
     try:
@@ -138,5 +150,56 @@ def update_rse_counter(rse_id, session=None):
     except NoResultFound:
         pass
 
-    for update in updated_rse_counters:
-        update.delete(flush=False, session=session)
+    for ids in chunks([updated_rse_counter.id for updated_rse_counter in updated_rse_counters], 100):
+        session.query(models.UpdatedRSECounter).filter(models.UpdatedRSECounter.id.in_(ids)).\
+            delete(synchronize_session=False)
+
+
+@transactional_session
+def __aggregate_rse_counters(rse_ids, session=None):
+    """
+    Sum up the updated_rse_counters of some RSEs in the database and delete them in bulk.
+
+    :param rse_ids:                The rse_ids to update.
+    :param session:                Database session in use.
+    :raises CounterUpdateConflict: If updates were added between the sum and the delete.
+    """
+    # The ids are random, so the aggregated rows are bounded by their creation date instead
+    # and the delete must remove as many rows as were summed up
+    now = datetime.utcnow()
+    deltas = session.query(models.UpdatedRSECounter.rse_id,
+                           func.count(models.UpdatedRSECounter.id),
+                           func.sum(models.UpdatedRSECounter.files),
+                           func.sum(models.UpdatedRSECounter.bytes)).\
+        filter(models.UpdatedRSECounter.rse_id.in_(rse_ids)).\
+        filter(models.UpdatedRSECounter.created_at <= now).\
+        group_by(models.UpdatedRSECounter.rse_id).all()
+
+    rowcount = session.query(models.UpdatedRSECounter).\
+        filter(models.UpdatedRSECounter.rse_id.in_(rse_ids)).\
+        filter(models.UpdatedRSECounter.created_at <= now).\
+        delete(synchronize_session=False)
+    if rowcount != sum([count for rse_id, count, files, bytes in deltas]):
+        raise CounterUpdateConflict()
+
+    deltas = dict((rse_id, (files, bytes)) for rse_id, count, files, bytes in deltas)
+    if not deltas:
+        return
+    for rse_counter in session.query(models.RSEUsage).filter(models.RSEUsage.rse_id.in_(deltas.keys()), models.RSEUsage.source == 'rucio'):
+        files, bytes = deltas[rse_counter.rse_id]
+        rse_counter.used += bytes
+        rse_counter.files += files
+
+
+def update_rse_counters(rse_ids):
+    """
+    Update the rse_counters of a batch of RSEs in one transaction, falling back
+    to update_rse_counter if updates were added concurrently.
+
+    :param rse_ids:  The rse_ids to update.
+    """
+    try:
+        __aggregate_rse_counters(rse_ids=rse_ids)
+    except CounterUpdateConflict:
+        for rse_id in rse_ids:
+            update_rse_counter(rse_id=rse_id)
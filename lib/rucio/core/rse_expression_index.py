@@ -0,0 +1,330 @@
+'''
+  Copyright European Organization for Nuclear Research (CERN)
+  Licensed under the Apache License, Version 2.0 (the "License");
+  You may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+
+  Process-local inverted index of RSE attributes used by the RSE expression parser.
+
+  Every non-deleted RSE is given a bit position; every (attribute key, value) and
+  (RSE column, value) pair maps to an integer bitmask of the RSEs carrying it. Evaluating
+  an RSE expression is then pure set algebra over these bitmasks.
+
+  The index is loaded with two queries, kept up to date incrementally by the
+  functions in rucio.core.rse and fully reloaded every `index_ttl` seconds to pick up
+  changes made by other processes. The incremental changes are only applied when the
+  transaction which made them commits; a rollback invalidates the index instead.
+'''
+
+import time
+
+from ConfigParser import NoOptionError, NoSectionError
+from threading import RLock
+
+from sqlalchemy import Boolean, event
+from sqlalchemy.orm import Session
+
+from rucio.common.config import config_get
+from rucio.db.sqla import models
+from rucio.db.sqla.enum import EnumSymbol
+from rucio.db.sqla.session import read_session
+
+
+try:
+    INDEX_TTL = int(config_get('rse-expressions', 'index_ttl'))
+except (NoOptionError, NoSectionError):
+    INDEX_TTL = 600
+
+SESSION_KEY = 'rucio.rse_expression_index'
+
+RSE_COLUMNS = frozenset([column.name for column in models.RSE.__table__.columns])
+AVAILABILITY_MAPPING = {'availability_read': 4, 'availability_write': 2, 'availability_delete': 1}
+
+
+def _encode(value):
+    """
+    Encode a value the same way the database compares it (see rucio.db.sqla.types.BooleanString).
+
+    :param value:  The value to encode.
+    :returns:      The string representation.
+    """
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, EnumSymbol):
+        return value.description.upper()
+    return str(value)
+
+
+def _encode_column(column, value):
+    """
+    Encode an expression value for the comparison against an RSE column.
+
+    :param column:  The RSE column name.
+    :param value:   The value as given in the expression.
+    :returns:       The string representation.
+    """
+    if column == 'rse_type' and not isinstance(value, EnumSymbol):
+        return str(value).upper()
+    if isinstance(getattr(models.RSE, column).type, Boolean):
+        if isinstance(value, bool):
+            return _encode(value)
+        return '1' if str(value).lower() in ('1', 'true') else '0'
+    return _encode(value)
+
+
+def _is_true(value):
+    """
+    Interpret an expression value as boolean.
+
+    :param value:  The value as given in the expression.
+    :returns:      True or False.
+    """
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() not in ('0', 'false', '')
+
+
+class RSEAttributeIndex(object):
+    """
+    Inverted index of RSE attributes and columns to bitmasks of RSEs.
+    """
+
+    def __init__(self, ttl=INDEX_TTL):
+        """
+        Create an empty index. It is loaded on first use.
+
+        :param ttl:  Seconds after which the index is fully reloaded from the database.
+        """
+        self.ttl = ttl
+        self.__lock = RLock()
+        self.__loaded_at = None
+        self.__reset()
+
+    def __reset(self):
+        self.__bits = {}          # rse_id -> bit position
+        self.__rses = []          # bit position -> rse dictionary
+        self.__columns = {}       # (column, encoded value) -> bitmask
+        self.__postings = {}      # (key, encoded value) -> bitmask
+        self.__attributes = {}    # rse_id -> {key: value}
+        self.__all = 0
+
+    @staticmethod
+    def __add_to(postings, entry, bit):
+        postings[entry] = postings.get(entry, 0) | (1 << bit)
+
+    @staticmethod
+    def __remove_from(postings, entry, bit):
+        mask = postings.get(entry, 0) & ~(1 << bit)
+        if mask:
+            postings[entry] = mask
+        else:
+            postings.pop(entry, None)
+
+    def __index_rse(self, rse):
+        bit = self.__bits.get(rse['id'])
+        if bit is None:
+            bit = len(self.__rses)
+            self.__bits[rse['id']] = bit
+            self.__rses.append(rse)
+            self.__attributes[rse['id']] = {}
+        else:
+            old = self.__rses[bit]
+            for column in RSE_COLUMNS:
+                self.__remove_from(self.__columns, (column, _encode(old[column])), bit)
+            self.__rses[bit] = rse
+        for column in RSE_COLUMNS:
+            self.__add_to(self.__columns, (column, _encode(rse[column])), bit)
+        self.__all |= 1 << bit
+
+    def __index_attribute(self, rse_id, key, value):
+        bit = self.__bits[rse_id]
+        attributes = self.__attributes[rse_id]
+        if key in attributes:
+            self.__remove_from(self.__postings, (key, _encode(attributes[key])), bit)
+        attributes[key] = value
+        self.__add_to(self.__postings, (key, _encode(value)), bit)
+
+    @read_session
+    def load(self, session=None):
+        """
+        Fully (re)load the index from the database.
+
+        :param session:  The database session in use.
+        """
+        rses = []
+        for row in session.query(models.RSE).filter_by(deleted=False).order_by(models.RSE.rse):
+            rses.append(dict((column, getattr(row, column)) for column in RSE_COLUMNS))
+        attributes = session.query(models.RSEAttrAssociation.rse_id,
+                                   models.RSEAttrAssociation.key,
+                                   models.RSEAttrAssociation.value).all()
+        with self.__lock:
+            self.__reset()
+            for rse in rses:
+                self.__index_rse(rse)
+            for rse_id, key, value in attributes:
+                if rse_id in self.__bits:
+                    self.__index_attribute(rse_id, key, value)
+            self.__loaded_at = time.time()
+
+    @read_session
+    def refresh(self, session=None):
+        """
+        Load the index if it was never loaded, was invalidated or is older than the ttl.
+
+        :param session:  The database session in use.
+        """
+        loaded_at = self.__loaded_at
+        if loaded_at is None or time.time() - loaded_at > self.ttl:
+            self.load(session=session)
+
+    def invalidate(self):
+        """
+        Force a full reload on the next refresh.
+        """
+        self.__loaded_at = None
+
+    def add_attribute(self, rse_id, key, value):
+        """
+        Incrementally add or update an RSE attribute.
+
+        :param rse_id:  The RSE id.
+        :param key:     The attribute key.
+        :param value:   The attribute value.
+        """
+        with self.__lock:
+            if self.__loaded_at is None:
+                return
+            if rse_id not in self.__bits:
+                self.invalidate()
+                return
+            self.__index_attribute(rse_id, key, value)
+
+    def del_attribute(self, rse_id, key):
+        """
+        Incrementally remove an RSE attribute.
+
+        :param rse_id:  The RSE id.
+        :param key:     The attribute key.
+        """
+        with self.__lock:
+            if self.__loaded_at is None or rse_id not in self.__bits:
+                return
+            attributes = self.__attributes[rse_id]
+            if key in attributes:
+                self.__remove_from(self.__postings, (key, _encode(attributes.pop(key))), self.__bits[rse_id])
+
+    def update_rse(self, rse_id, parameters):
+        """
+        Incrementally update RSE columns.
+
+        :param rse_id:      The RSE id.
+        :param parameters:  Dictionary of the changed RSE columns.
+        """
+        with self.__lock:
+            if self.__loaded_at is None:
+                return
+            if rse_id not in self.__bits:
+                self.invalidate()
+                return
+            rse = dict(self.__rses[self.__bits[rse_id]])
+            rse.update((key, value) for key, value in parameters.items() if key in RSE_COLUMNS)
+            self.__index_rse(rse)
+
+    def equal(self, key, value):
+        """
+        Bitmask of the RSEs where the key equals the value, with the semantics of rucio.core.rse.list_rses.
+
+        :param key:    RSE column or attribute key.
+        :param value:  The value to compare with.
+        :returns:      Bitmask of RSEs.
+        """
+        with self.__lock:
+            if key in RSE_COLUMNS:
+                return self.__columns.get((key, _encode_column(key, value)), 0)
+            if key in AVAILABILITY_MAPPING:
+                flag = AVAILABILITY_MAPPING[key]
+                mask = 0
+                for bit, rse in enumerate(self.__rses):
+                    if bool((rse['availability'] or 0) & flag) == _is_true(value):
+                        mask |= 1 << bit
+                return mask
+            return self.__postings.get((key, _encode(value)), 0)
+
+    def compare(self, key, value, operator):
+        """
+        Bitmask of the RSEs where the numerical attribute value compares to the value.
+
+        :param key:       Attribute key.
+        :param value:     The value to compare with.
+        :param operator:  Binary function applied to (attribute value, value).
+        :returns:         Bitmask of RSEs.
+        """
+        mask = 0
+        with self.__lock:
+            for rse_id, attributes in self.__attributes.items():
+                if key not in attributes:
+                    continue
+                try:
+                    if operator(float(attributes[key]), float(value)):
+                        mask |= 1 << self.__bits[rse_id]
+                except (TypeError, ValueError):
+                    continue
+        return mask
+
+    def get_rses(self, mask):
+        """
+        Return the RSE dictionaries of a bitmask.
+
+        :param mask:  Bitmask of RSEs.
+        :returns:     List of RSE dictionaries.
+        """
+        result = []
+        with self.__lock:
+            mask &= self.__all
+            bit = 0
+            while mask:
+                if mask & 1:
+                    result.append(dict(self.__rses[bit]))
+                mask >>= 1
+                bit += 1
+        return result
+
+
+INDEX = RSEAttributeIndex()
+
+
+@read_session
+def get_index(session=None):
+    """
+    Return the process-wide RSE attribute index, (re)loaded if needed.
+
+    :param session:  The database session in use.
+    :returns:        RSEAttributeIndex
+    """
+    INDEX.refresh(session=session)
+    return INDEX
+
+
+def on_commit(session, change, **kwargs):
+    """
+    Apply a change of the index when the transaction of the session commits.
+
+    :param session:  The database session of the change.
+    :param change:   The method of the index, e.g. INDEX.add_attribute.
+    :param kwargs:   The arguments of the method.
+    """
+    session.info.setdefault(SESSION_KEY, []).append((change, kwargs))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    for change, kwargs in session.info.pop(SESSION_KEY, []):
+        change(**kwargs)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_changes(session):
+    # The index may have been loaded from the session before the rollback
+    if session.info.pop(SESSION_KEY, None):
+        INDEX.invalidate()
@@ -13,16 +13,13 @@
 '''
 
 import abc
+import operator
 import re
 import string
 
-from dogpile.cache import make_region
-from dogpile.cache.api import NoValue
-from hashlib import sha256
-
 from rucio.common import schema
 from rucio.common.exception import InvalidRSEExpression, RSEBlacklisted
-from rucio.core.rse import list_rses, get_rses_with_attribute, get_rse_attribute
+from rucio.core.rse_expression_index import get_index
 from rucio.db.sqla.session import transactional_session
 
 
@@ -36,10 +33,9 @@ COMPLEMENT = r'(\\%s)' % (PRIMITIVE)
 
 PATTERN = r'^%s(%s|%s|%s)*' % (PRIMITIVE, UNION, INTERSECTION, COMPLEMENT)
 
-
-REGION = make_region().configure('dogpile.cache.memcached',
-                                 expiration_time=3600,
-                                 arguments={'url': "127.0.0.1:11211", 'distributed_lock': True})
+# Compiled expression trees, keyed by expression
+COMPILED_EXPRESSIONS = {}
+MAX_COMPILED_EXPRESSIONS = 10000
 
 
 @transactional_session
@@ -53,34 +49,8 @@ def parse_expression(expression, filter=None, session=None):
     :returns:             A list of rse dictionaries.
     :raises:              InvalidRSEExpression, RSENotFound, RSEBlacklisted
     """
-    result = REGION.get(sha256(expression).hexdigest())
-    if type(result) is NoValue:
-        # Evaluate the correctness of the parentheses
-        parantheses_open_count = 0
-        parantheses_close_count = 0
-        for char in expression:
-            if (char == '('):
-                parantheses_open_count += 1
-            elif (char == ')'):
-                parantheses_close_count += 1
-            if (parantheses_close_count > parantheses_open_count):
-                raise InvalidRSEExpression('Problem with parantheses.')
-        if (parantheses_open_count != parantheses_close_count):
-            raise InvalidRSEExpression('Problem with parantheses.')
-
-        # Check the expression pattern
-        match = re.match(PATTERN, expression)
-        if match is None:
-            raise InvalidRSEExpression('Expression does not comply to RSE Expression syntax')
-        else:
-            if match.group() != expression:
-                raise InvalidRSEExpression('Expression does not comply to RSE Expression syntax')
-        result_tuple = __resolve_term_expression(expression)[0].resolve_elements(session=session)
-        # result_tuple = ([rse_ids], {rse_id: {rse_info}})
-        result = []
-        for rse in list(result_tuple[0]):
-            result.append(result_tuple[1][rse])
-        REGION.set(sha256(expression).hexdigest(), result)
+    index = get_index(session=session)
+    result = index.get_rses(compile_expression(expression).resolve_mask(index))
 
     if not result:
         raise InvalidRSEExpression('RSE Expression resulted in an empty set.')
@@ -101,6 +71,46 @@ def parse_expression(expression, filter=None, session=None):
     return final_result
 
 
+def compile_expression(expression):
+    """
+    Validate a RSE expression and return its (cached) expression tree.
+
+    :param expression:    RSE expression, e.g: 'CERN|BNL'.
+    :returns:             BaseExpressionElement
+    :raises:              InvalidRSEExpression
+    """
+    compiled = COMPILED_EXPRESSIONS.get(expression)
+    if compiled is not None:
+        return compiled
+
+    # Evaluate the correctness of the parentheses
+    parantheses_open_count = 0
+    parantheses_close_count = 0
+    for char in expression:
+        if (char == '('):
+            parantheses_open_count += 1
+        elif (char == ')'):
+            parantheses_close_count += 1
+        if (parantheses_close_count > parantheses_open_count):
+            raise InvalidRSEExpression('Problem with parantheses.')
+    if (parantheses_open_count != parantheses_close_count):
+        raise InvalidRSEExpression('Problem with parantheses.')
+
+    # Check the expression pattern
+    match = re.match(PATTERN, expression)
+    if match is None:
+        raise InvalidRSEExpression('Expression does not comply to RSE Expression syntax')
+    else:
+        if match.group() != expression:
+            raise InvalidRSEExpression('Expression does not comply to RSE Expression syntax')
+
+    compiled = __resolve_term_expression(expression)[0]
+    if len(COMPILED_EXPRESSIONS) >= MAX_COMPILED_EXPRESSIONS:
+        COMPILED_EXPRESSIONS.clear()
+    COMPILED_EXPRESSIONS[expression] = compiled
+    return compiled
+
+
 def __resolve_term_expression(expression):
     """
     Resolves a Term Expression and returns an object of type BaseExpressionElement
@@ -201,13 +211,13 @@ class BaseExpressionElement:
     __metaclass__ = abc.ABCMeta
 
     @abc.abstractmethod
-    def resolve_elements(self, session):
+    def resolve_mask(self, index):
         """
-        Resolve the ExpressionElement and return a set of RSE ids
+        Resolve the ExpressionElement and return the bitmask of matching RSEs
 
-        :param session:  Database session in use
-        :returns:        (Set of RSE ids, Dictionary of RSE dicts)
-        :rtype:          (Set of Strings, Dictionary of RSE dicts organized by rse_id)
+        :param index:    RSEAttributeIndex to resolve against
+        :returns:        Bitmask of RSEs
+        :rtype:          Integer
         """
         pass
 
@@ -227,17 +237,11 @@ class RSEAttributeEqualCheck(BaseExpressionElement):
         self.key = key
         self.value = value
 
-    def resolve_elements(self, session):
+    def resolve_mask(self, index):
         """
-        Inherited from :py:func:`BaseExpressionElement.resolve_elements`
+        Inherited from :py:func:`BaseExpressionElement.resolve_mask`
         """
-        output = list_rses({self.key: self.value}, session=session)
-        if not output:
-            return (set(), {})
-        rse_dict = {}
-        for rse in output:
-            rse_dict[rse['id']] = rse
-        return (set([rse['id'] for rse in output]), rse_dict)
+        return index.equal(self.key, self.value)
 
 
 class RSEAttributeSmallerCheck(BaseExpressionElement):
@@ -255,24 +259,11 @@ class RSEAttributeSmallerCheck(BaseExpressionElement):
         self.key = key
         self.value = value
 
-    def resolve_elements(self, session):
+    def resolve_mask(self, index):
         """
-        Inherited from :py:func:`BaseExpressionElement.resolve_elements`
+        Inherited from :py:func:`BaseExpressionElement.resolve_mask`
         """
-        rse_list = get_rses_with_attribute(key=self.key, session=session)
-        if not rse_list:
-            return (set(), {})
-
-        output = []
-        rse_dict = {}
-        for rse in rse_list:
-            try:
-                if float(get_rse_attribute(key=self.key, rse_id=rse['id'], session=session)[0]) < float(self.value):
-                    rse_dict[rse['id']] = rse
-                    output.append(rse['id'])
-            except ValueError:
-                continue
-        return (set(output), rse_dict)
+        return index.compare(self.key, self.value, operator.lt)
 
 
 class RSEAttributeLargerCheck(BaseExpressionElement):
@@ -290,24 +281,11 @@ class RSEAttributeLargerCheck(BaseExpressionElement):
         self.key = key
         self.value = value
 
-    def resolve_elements(self, session):
+    def resolve_mask(self, index):
         """
-        Inherited from :py:func:`BaseExpressionElement.resolve_elements`
+        Inherited from :py:func:`BaseExpressionElement.resolve_mask`
         """
-        rse_list = get_rses_with_attribute(key=self.key, session=session)
-        if not rse_list:
-            return (set(), {})
-
-        output = []
-        rse_dict = {}
-        for rse in rse_list:
-            try:
-                if float(get_rse_attribute(key=self.key, rse_id=rse['id'], session=session)[0]) > float(self.value):
-                    rse_dict[rse['id']] = rse
-                    output.append(rse['id'])
-            except ValueError:
-                continue
-        return (set(output), rse_dict)
+        return index.compare(self.key, self.value, operator.gt)
 
 
 class BaseRSEOperator(BaseExpressionElement):
@@ -357,13 +335,11 @@ class ComplementOperator(BaseRSEOperator):
         """
         self.right_term = right_term
 
-    def resolve_elements(self, session):
+    def resolve_mask(self, index):
         """
-        Inherited from :py:func:`BaseExpressionElement.resolve_elements`
+        Inherited from :py:func:`BaseExpressionElement.resolve_mask`
         """
-        left_term_tuple = self.left_term.resolve_elements(session=session)
-        right_term_tuple = self.right_term.resolve_elements(session=session)
-        return (left_term_tuple[0] - right_term_tuple[0], dict(left_term_tuple[1].items() + right_term_tuple[1].items()))
+        return self.left_term.resolve_mask(index) & ~self.right_term.resolve_mask(index)
 
 
 class UnionOperator(BaseRSEOperator):
@@ -391,13 +367,11 @@ class UnionOperator(BaseRSEOperator):
         """
         self.right_term = right_term
 
-    def resolve_elements(self, session):
+    def resolve_mask(self, index):
         """
-        Inherited from :py:func:`BaseExpressionElement.resolve_elements`
+        Inherited from :py:func:`BaseExpressionElement.resolve_mask`
         """
-        left_term_tuple = self.left_term.resolve_elements(session=session)
-        right_term_tuple = self.right_term.resolve_elements(session=session)
-        return (left_term_tuple[0] | right_term_tuple[0], dict(left_term_tuple[1].items() + right_term_tuple[1].items()))
+        return self.left_term.resolve_mask(index) | self.right_term.resolve_mask(index)
 
 
 class IntersectOperator(BaseRSEOperator):
@@ -425,10 +399,8 @@ class IntersectOperator(BaseRSEOperator):
         """
         self.right_term = right_term
 
-    def resolve_elements(self, session):
+    def resolve_mask(self, index):
         """
-        Inherited from :py:func:`BaseExpressionElement.resolve_elements`
+        Inherited from :py:func:`BaseExpressionElement.resolve_mask`
         """
-        left_term_tuple = self.left_term.resolve_elements(session=session)
-        right_term_tuple = self.right_term.resolve_elements(session=session)
-        return (left_term_tuple[0] & right_term_tuple[0], dict(left_term_tuple[1].items() + right_term_tuple[1].items()))
+        return self.left_term.resolve_mask(index) & self.right_term.resolve_mask(index)
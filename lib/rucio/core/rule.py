@@ -14,13 +14,14 @@
 import logging
 import sys
 
-from ConfigParser import NoOptionError
+from ConfigParser import NoOptionError, NoSectionError
 from copy import deepcopy
 from datetime import datetime, timedelta
 from re import match
 from string import Template
 
 from sqlalchemy.exc import IntegrityError, StatementError
+from sqlalchemy.orm import make_transient_to_detached, object_mapper
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.sql import func
 from sqlalchemy.sql.expression import and_, or_, bindparam, text, true, null
@@ -38,7 +39,7 @@ from rucio.common.exception import (InvalidRSEExpression, InvalidReplicationRule
                                     InvalidObject, RSEBlacklisted, RuleReplaceFailed, RequestNotFound,
                                     ManualRuleApprovalBlocked, UnsupportedOperation)
 from rucio.common.schema import validate_schema
-from rucio.common.utils import str_to_date, sizefmt
+from rucio.common.utils import chunks, str_to_date, sizefmt
 from rucio.core import account_counter, rse_counter
 from rucio.core.account import get_account
 from rucio.core.lifetime_exception import define_eol
@@ -54,11 +55,17 @@ from rucio.db.sqla.constants import (LockState, ReplicaState, RuleState, RuleGro
                                      DIDAvailability, DIDReEvaluation, DIDType,
                                      RequestType, RuleNotification, OBSOLETE, RSEType)
 from rucio.db.sqla.session import read_session, transactional_session, stream_session
+from rucio.db.sqla.util import get_buckets_filter, get_partition_filter
 
 logging.basicConfig(stream=sys.stdout,
                     level=getattr(logging, config_get('common', 'loglevel').upper()),
                     format='%(asctime)s\t%(process)d\t%(levelname)s\t%(message)s')
 
+try:
+    BULK_RESOLUTION_CHUNK_SIZE = int(config_get('rules', 'bulk_resolution_chunk_size'))
+except (NoOptionError, NoSectionError):
+    BULK_RESOLUTION_CHUNK_SIZE = 50
+
 
 @transactional_session
 def add_rule(dids, account, copies, rse_expression, grouping, weight, lifetime, locked, subscription_id,
@@ -1121,16 +1128,18 @@ def update_rule(rule_id, options, session=None):
                 validate_schema('activity', options['activity'])
                 rule.activity = options['activity']
                 # Cancel transfers and re-submit them:
+                transfers_to_create = []
                 for lock in session.query(models.ReplicaLock).filter_by(rule_id=rule.id, state=LockState.REPLICATING).all():
                     cancel_request_did(scope=lock.scope, name=lock.name, dest_rse_id=lock.rse_id, session=session)
                     md5, bytes, adler32 = session.query(models.RSEFileAssociation.md5, models.RSEFileAssociation.bytes, models.RSEFileAssociation.adler32).filter(models.RSEFileAssociation.scope == lock.scope,
                                                                                                                                                                   models.RSEFileAssociation.name == lock.name,
                                                                                                                                                                   models.RSEFileAssociation.rse_id == lock.rse_id).one()
-                    session.flush()
-                    queue_requests(requests=[create_transfer_dict(dest_rse_id=lock.rse_id,
-                                                                  request_type=RequestType.TRANSFER,
-                                                                  scope=lock.scope, name=lock.name, rule=rule, lock=lock, bytes=bytes, md5=md5, adler32=adler32,
-                                                                  ds_scope=rule.scope, ds_name=rule.name, lifetime=None, activity=rule.activity, session=session)], session=session)
+                    transfers_to_create.append(create_transfer_dict(dest_rse_id=lock.rse_id,
+                                                                    request_type=RequestType.TRANSFER,
+                                                                    scope=lock.scope, name=lock.name, rule=rule, lock=lock, bytes=bytes, md5=md5, adler32=adler32,
+                                                                    ds_scope=rule.scope, ds_name=rule.name, lifetime=None, activity=rule.activity, session=session))
+                session.flush()
+                queue_requests(requests=transfers_to_create, session=session)
 
             elif key == 'account':
                 # Check if the account exists
@@ -1339,7 +1348,7 @@ def re_evaluate_did(scope, name, rule_evaluation_action, session=None):
 
 
 @read_session
-def get_updated_dids(total_workers, worker_number, limit=100, blacklisted_dids=[], session=None):
+def get_updated_dids(total_workers, worker_number, limit=100, blacklisted_dids=[], buckets=None, session=None):
     """
     Get updated dids.
 
@@ -1347,6 +1356,7 @@ def get_updated_dids(total_workers, worker_number, limit=100, blacklisted_dids=[
     :param worker_number:      id of the executing worker.
     :param limit:              Maximum number of dids to return.
     :param blacklisted_dids:   Blacklisted dids to filter.
+    :param buckets:            Partition buckets of the worker, replacing total_workers and worker_number.
     :param session:            Database session in use.
     """
     query = session.query(models.UpdatedDID.id,
@@ -1354,15 +1364,10 @@ def get_updated_dids(total_workers, worker_number, limit=100, blacklisted_dids=[
                           models.UpdatedDID.name,
                           models.UpdatedDID.rule_evaluation_action)
 
-    if total_workers > 0:
-        if session.bind.dialect.name == 'oracle':
-            bindparams = [bindparam('worker_number', worker_number),
-                          bindparam('total_workers', total_workers)]
-            query = query.filter(text('ORA_HASH(name, :total_workers) = :worker_number', bindparams=bindparams))
-        elif session.bind.dialect.name == 'mysql':
-            query = query.filter('mod(md5(name), %s) = %s' % (total_workers + 1, worker_number))
-        elif session.bind.dialect.name == 'postgresql':
-            query = query.filter('mod(abs((\'x\'||md5(name))::bit(32)::int), %s) = %s' % (total_workers + 1, worker_number))
+    if buckets is not None:
+        query = query.filter(get_buckets_filter(models.UpdatedDID.bucket, buckets))
+    elif total_workers > 0:
+        query = query.filter(get_partition_filter(models.UpdatedDID.bucket, worker_number, total_workers + 1))
 
     if limit:
         fetched_dids = query.order_by(models.UpdatedDID.created_at).limit(limit).all()
@@ -1372,6 +1377,7 @@ def get_updated_dids(total_workers, worker_number, limit=100, blacklisted_dids=[
                                     worker_number=worker_number,
                                     limit=None,
                                     blacklisted_dids=blacklisted_dids,
+                                    buckets=buckets,
                                     session=session)
         else:
             return filtered_dids
@@ -1793,10 +1799,12 @@ def generate_email_for_rule_ok_notification(rule, session=None):
                                                  'scope': rule.scope,
                                                  'name': rule.name,
                                                  'did_type': rule.did_type})
+                # Hermes aggregates the notifications with the same digest and recipients into one email
                 add_message(event_type='email',
                             payload={'body': text,
                                      'to': [email],
-                                     'subject': '[RUCIO] Replication rule %s has been succesfully transferred' % (str(rule.id))},
+                                     'subject': '[RUCIO] Replication rule %s has been succesfully transferred' % (str(rule.id)),
+                                     'digest': '[RUCIO] Replication rules have been succesfully transferred'},
                             session=session)
         except (IOError, NoOptionError):
             pass
@@ -2140,21 +2148,12 @@ def __find_stuck_locks_and_repair_them(datasetfiles, locks, replicas, source_rep
                                                                      rule=rule,
                                                                      source_rses=source_rses,
                                                                      session=session)
-    # Add the replicas
-    session.add_all([item for sublist in replicas_to_create.values() for item in sublist])
-    session.flush()
-
-    # Add the locks
-    session.add_all([item for sublist in locks_to_create.values() for item in sublist])
-    session.flush()
-
-    # Increase rse_counters
-    for rse_id in replicas_to_create.keys():
-        rse_counter.increase(rse_id=rse_id, files=len(replicas_to_create[rse_id]), bytes=sum([replica.bytes for replica in replicas_to_create[rse_id]]), session=session)
-
-    # Increase account_counters
-    for rse_id in locks_to_create.keys():
-        account_counter.increase(rse_id=rse_id, account=rule.account, files=len(locks_to_create[rse_id]), bytes=sum([lock.bytes for lock in locks_to_create[rse_id]]), session=session)
+    # Add the replicas, locks and transfers
+    __persist_locks_replicas_transfers(rule=rule,
+                                       replicas_to_create=replicas_to_create,
+                                       locks_to_create=locks_to_create,
+                                       transfers_to_create=transfers_to_create,
+                                       session=session)
 
     # Decrease account_counters
     for rse_id in locks_to_delete:
@@ -2163,9 +2162,6 @@ def __find_stuck_locks_and_repair_them(datasetfiles, locks, replicas, source_rep
     # Delete the locks:
     for lock in [item for sublist in locks_to_delete.values() for item in sublist]:
         session.delete(lock)
-
-    # Add the transfers
-    queue_requests(requests=transfers_to_create, session=session)
     session.flush()
     logging.debug("Finished finding and repairing stuck locks for rule %s [%d/%d/%d]" % (str(rule.id), rule.locks_ok_cnt, rule.locks_replicating_cnt, rule.locks_stuck_cnt))
 
@@ -2508,17 +2504,11 @@ def __resolve_did_to_locks_and_replicas(did, nowait=False, restrict_rses=None, s
 
     elif did.did_type == DIDType.CONTAINER:
 
-        for dataset in rucio.core.did.list_child_datasets(scope=did.scope, name=did.name, session=session):
-            files, tmp_replicas = rucio.core.replica.get_and_lock_file_replicas_for_dataset(scope=dataset['scope'], name=dataset['name'], nowait=nowait, restrict_rses=restrict_rses, session=session)
-            if source_rses:
-                tmp_source_replicas = rucio.core.replica.get_source_replicas_for_dataset(scope=dataset['scope'], name=dataset['name'], source_rses=source_rses, session=session)
-                source_replicas = dict(source_replicas.items() + tmp_source_replicas.items())
-            tmp_locks = rucio.core.lock.get_files_and_replica_locks_of_dataset(scope=dataset['scope'], name=dataset['name'], nowait=nowait, restrict_rses=restrict_rses, session=session)
-            datasetfiles.append({'scope': dataset['scope'],
-                                 'name': dataset['name'],
-                                 'files': files})
-            replicas = dict(replicas.items() + tmp_replicas.items())
-            locks = dict(locks.items() + tmp_locks.items())
+        datasetfiles, locks, replicas, source_replicas = __resolve_datasets_to_locks_and_replicas(datasets=rucio.core.did.list_child_datasets(scope=did.scope, name=did.name, session=session),
+                                                                                                  nowait=nowait,
+                                                                                                  restrict_rses=restrict_rses,
+                                                                                                  source_rses=source_rses,
+                                                                                                  session=session)
 
     else:
         raise InvalidReplicationRule('The did \"%s:%s\" has been deleted.' % (did.scope, did.name))
@@ -2624,7 +2614,14 @@ def __resolve_dids_to_locks_and_replicas(dids, nowait=False, restrict_rses=[], s
                         source_replicas[(scope, name)].append(rse_id)
     else:
         # The evaluate_dids will be containers and/or datasets
-        for did in dids:
+        datasets = [{'scope': did.child_scope, 'name': did.child_name} for did in dids if did.child_type == DIDType.DATASET]
+        if datasets:
+            datasetfiles, locks, replicas, source_replicas = __resolve_datasets_to_locks_and_replicas(datasets=datasets,
+                                                                                                      nowait=nowait,
+                                                                                                      restrict_rses=restrict_rses,
+                                                                                                      source_rses=source_rses,
+                                                                                                      session=session)
+        for did in [did for did in dids if did.child_type != DIDType.DATASET]:
             real_did = session.query(models.DataIdentifier).filter(models.DataIdentifier.scope == did.child_scope, models.DataIdentifier.name == did.child_name).one()
             tmp_datasetfiles, tmp_locks, tmp_replicas, tmp_source_replicas = __resolve_did_to_locks_and_replicas(did=real_did,
                                                                                                                  nowait=nowait,
@@ -2638,6 +2635,53 @@ def __resolve_dids_to_locks_and_replicas(dids, nowait=False, restrict_rses=[], s
     return datasetfiles, locks, replicas, source_replicas
 
 
+@transactional_session
+def __resolve_datasets_to_locks_and_replicas(datasets, nowait=False, restrict_rses=None, source_rses=None, session=None):
+    """
+    Resolves a list of datasets to their files and reads the locks and replicas of all these files.
+    The datasets are resolved BULK_RESOLUTION_CHUNK_SIZE at a time; a chunk size of 0 resolves them one by one.
+
+    :param datasets:       List of dictionaries {'scope', 'name'} of the datasets.
+    :param nowait:         Nowait parameter for the FOR UPDATE statement.
+    :param restrict_rses:  Possible rses of the rule, so only these replica/locks should be considered.
+    :param source_rses:    Source rses for this rule. These replicas are not row-locked.
+    :param session:        Session of the db.
+    :returns:              (datasetfiles, locks, replicas, source_replicas)
+    """
+
+    datasetfiles = []
+    locks = {}
+    replicas = {}
+    source_replicas = {}
+
+    if BULK_RESOLUTION_CHUNK_SIZE > 0:
+        files, replicas = rucio.core.replica.get_and_lock_file_replicas_for_datasets(datasets=datasets, nowait=nowait, restrict_rses=restrict_rses,
+                                                                                     chunk_size=BULK_RESOLUTION_CHUNK_SIZE, session=session)
+        if source_rses:
+            source_replicas = rucio.core.replica.get_source_replicas_for_datasets(datasets=datasets, source_rses=source_rses,
+                                                                                  chunk_size=BULK_RESOLUTION_CHUNK_SIZE, session=session)
+        locks = rucio.core.lock.get_files_and_replica_locks_of_datasets(datasets=datasets, nowait=nowait, restrict_rses=restrict_rses,
+                                                                        chunk_size=BULK_RESOLUTION_CHUNK_SIZE, session=session)
+        for dataset in datasets:
+            datasetfiles.append({'scope': dataset['scope'],
+                                 'name': dataset['name'],
+                                 'files': files[(dataset['scope'], dataset['name'])]})
+        return datasetfiles, locks, replicas, source_replicas
+
+    for dataset in datasets:
+        files, tmp_replicas = rucio.core.replica.get_and_lock_file_replicas_for_dataset(scope=dataset['scope'], name=dataset['name'], nowait=nowait, restrict_rses=restrict_rses, session=session)
+        if source_rses:
+            tmp_source_replicas = rucio.core.replica.get_source_replicas_for_dataset(scope=dataset['scope'], name=dataset['name'], source_rses=source_rses, session=session)
+            source_replicas = dict(source_replicas.items() + tmp_source_replicas.items())
+        tmp_locks = rucio.core.lock.get_files_and_replica_locks_of_dataset(scope=dataset['scope'], name=dataset['name'], nowait=nowait, restrict_rses=restrict_rses, session=session)
+        datasetfiles.append({'scope': dataset['scope'],
+                             'name': dataset['name'],
+                             'files': files})
+        replicas = dict(replicas.items() + tmp_replicas.items())
+        locks = dict(locks.items() + tmp_locks.items())
+    return datasetfiles, locks, replicas, source_replicas
+
+
 @transactional_session
 def __create_locks_replicas_transfers(datasetfiles, locks, replicas, source_replicas, rseselector, rule, preferred_rse_ids=[], source_rses=[], session=None):
     """
@@ -2667,13 +2711,33 @@ def __create_locks_replicas_transfers(datasetfiles, locks, replicas, source_repl
                                                                                    preferred_rse_ids=preferred_rse_ids,
                                                                                    source_rses=source_rses,
                                                                                    session=session)
+    # Add the replicas, locks and transfers
+    logging.debug("Rule %s  [%d/%d/%d] queued %d transfers" % (str(rule.id), rule.locks_ok_cnt, rule.locks_replicating_cnt, rule.locks_stuck_cnt, len(transfers_to_create)))
+    __persist_locks_replicas_transfers(rule=rule,
+                                       replicas_to_create=replicas_to_create,
+                                       locks_to_create=locks_to_create,
+                                       transfers_to_create=transfers_to_create,
+                                       session=session)
+    logging.debug("Finished creating locks and replicas for rule %s [%d/%d/%d]" % (str(rule.id), rule.locks_ok_cnt, rule.locks_replicating_cnt, rule.locks_stuck_cnt))
+
+
+@transactional_session
+def __persist_locks_replicas_transfers(rule, replicas_to_create, locks_to_create, transfers_to_create, session=None):
+    """
+    Persist the replicas, locks and transfers created by the rule grouping in bulk.
+
+    :param rule:                 The rule.
+    :param replicas_to_create:   Dictionary rse_id -> list of new SQLAlchemy replica objects.
+    :param locks_to_create:      Dictionary rse_id -> list of new SQLAlchemy lock objects.
+    :param transfers_to_create:  List of transfer dictionaries.
+    :param session:              Session of the db.
+    """
+
     # Add the replicas
-    session.add_all([item for sublist in replicas_to_create.values() for item in sublist])
-    session.flush()
+    __bulk_insert_objects(objects=[item for sublist in replicas_to_create.values() for item in sublist], session=session)
 
     # Add the locks
-    session.add_all([item for sublist in locks_to_create.values() for item in sublist])
-    session.flush()
+    __bulk_insert_objects(objects=[item for sublist in locks_to_create.values() for item in sublist], session=session)
 
     # Increase rse_counters
     for rse_id in replicas_to_create.keys():
@@ -2684,10 +2748,64 @@ def __create_locks_replicas_transfers(datasetfiles, locks, replicas, source_repl
         account_counter.increase(rse_id=rse_id, account=rule.account, files=len(locks_to_create[rse_id]), bytes=sum([lock.bytes for lock in locks_to_create[rse_id]]), session=session)
 
     # Add the transfers
-    logging.debug("Rule %s  [%d/%d/%d] queued %d transfers" % (str(rule.id), rule.locks_ok_cnt, rule.locks_replicating_cnt, rule.locks_stuck_cnt, len(transfers_to_create)))
     queue_requests(requests=transfers_to_create, session=session)
     session.flush()
-    logging.debug("Finished creating locks and replicas for rule %s [%d/%d/%d]" % (str(rule.id), rule.locks_ok_cnt, rule.locks_replicating_cnt, rule.locks_stuck_cnt))
+
+
+class _RowContext(object):
+    """
+    The part of the execution context used by the Python column defaults of one row.
+    """
+
+    def __init__(self, parameters):
+        self.current_parameters = parameters
+
+
+@transactional_session
+def __bulk_insert_objects(objects, session=None):
+    """
+    Insert new SQLAlchemy objects of one model in executemany batches instead of per-object ORM flushes.
+    Afterwards the objects are attached to the session as persistent, so later changes are flushed as updates.
+
+    :param objects:  List of transient SQLAlchemy objects of the same model.
+    :param session:  Session of the db.
+    """
+
+    if not objects:
+        return
+
+    now = datetime.utcnow()
+    mapper = object_mapper(objects[0])
+    mappings = []
+    for obj in objects:
+        mapping, callables = {}, []
+        for attribute in mapper.column_attrs:
+            column = attribute.columns[0]
+            value = getattr(obj, attribute.key)
+            if value is None and column.default is not None:
+                if not column.default.is_callable:
+                    value = column.default.arg
+                elif column.name in ('created_at', 'updated_at'):
+                    value = now
+                else:
+                    callables.append((attribute.key, column))
+                    continue
+            if value is None and column.server_default is not None:
+                continue
+            mapping[attribute.key] = value
+        # The other callable defaults, e.g. the partition buckets, are computed from the row
+        for key, column in callables:
+            mapping[key] = column.default.arg(_RowContext(mapping))
+        for key, value in mapping.iteritems():
+            setattr(obj, key, value)
+        mappings.append(mapping)
+
+    for mappings_chunk in chunks(mappings, 1000):
+        session.bulk_insert_mappings(mapper, mappings_chunk)
+
+    for obj in objects:
+        make_transient_to_detached(obj)
+        session.add(obj)
 
 
 @transactional_session
@@ -17,6 +17,7 @@ from sqlalchemy.exc import IntegrityError
 from traceback import format_exc
 
 from rucio.common.exception import AccountNotFound, Duplicate, RucioException
+from rucio.core.permission_cache import invalidate
 from rucio.db.sqla import models
 from rucio.db.sqla.constants import AccountStatus, ScopeStatus
 from rucio.db.sqla.session import read_session, transactional_session
@@ -35,6 +36,7 @@ def add_scope(scope, account, session=None):
     if result is None:
         raise AccountNotFound('Account ID \'%s\' does not exist' % account)
 
+    invalidate(account, session=session)
     new_scope = models.Scope(scope=scope, account=account, status=ScopeStatus.OPEN)
     try:
         new_scope.save(session=session)
@@ -18,7 +18,8 @@ import time
 import traceback
 
 from rucio.common.config import config_get
-from rucio.core.account_counter import get_updated_account_counters, update_account_counter
+from rucio.common.utils import chunks
+from rucio.core.account_counter import get_updated_account_counters, update_account_counters
 
 graceful_stop = threading.Event()
 
@@ -49,12 +50,12 @@ def account_update(once=False, process=0, total_processes=1, thread=0, threads_p
                 logging.info('account_update[%s/%s] did not get any work' % (process * threads_per_process + thread, total_processes * threads_per_process - 1))
                 time.sleep(10)
             else:
-                for account_rse_id in account_rse_ids:
+                for counters in chunks([(account, rse_id) for account, rse_id in account_rse_ids], 100):
                     if graceful_stop.is_set():
                         break
                     start_time = time.time()
-                    update_account_counter(account=account_rse_id[0], rse_id=account_rse_id[1])
-                    logging.debug('account_update[%s/%s]: update of account-rse counter "%s-%s" took %f' % (process * threads_per_process + thread, total_processes * threads_per_process - 1, account_rse_id[0], account_rse_id[1], time.time() - start_time))
+                    update_account_counters(counters=counters)
+                    logging.debug('account_update[%s/%s]: update of %d account-rse counters took %f' % (process * threads_per_process + thread, total_processes * threads_per_process - 1, len(counters), time.time() - start_time))
         except Exception:
             logging.error(traceback.format_exc())
 
@@ -18,7 +18,8 @@ import time
 import traceback
 
 from rucio.common.config import config_get
-from rucio.core.rse_counter import get_updated_rse_counters, update_rse_counter
+from rucio.common.utils import chunks
+from rucio.core.rse_counter import get_updated_rse_counters, update_rse_counters
 
 graceful_stop = threading.Event()
 
@@ -49,12 +50,12 @@ def rse_update(once=False, process=0, total_processes=1, thread=0, threads_per_p
                 logging.info('rse_update[%s/%s] did not get any work' % (process * threads_per_process + thread, total_processes * threads_per_process - 1))
                 time.sleep(10)
             else:
-                for rse_id in rse_ids:
+                for chunk in chunks(rse_ids, 100):
                     if graceful_stop.is_set():
                         break
                     start_time = time.time()
-                    update_rse_counter(rse_id=rse_id)
-                    logging.debug('rse_update[%s/%s]: update of rse "%s" took %f' % (process * threads_per_process + thread, total_processes * threads_per_process - 1, rse_id, time.time() - start_time))
+                    update_rse_counters(rse_ids=chunk)
+                    logging.debug('rse_update[%s/%s]: update of %d rses took %f' % (process * threads_per_process + thread, total_processes * threads_per_process - 1, len(chunk), time.time() - start_time))
         except Exception:
             logging.error(traceback.format_exc())
         if once:
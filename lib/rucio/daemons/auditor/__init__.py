@@ -7,10 +7,12 @@
 # Authors:
 # - Fernando Lopez, <felopez@cern.ch>, 2015
 
+import ConfigParser
 import Queue
 import glob
 import logging
 import os.path
+import shutil
 import select
 import sys
 
@@ -39,6 +41,24 @@ def consistency(rse, delta, configuration, cache_dir, results_dir):
         logger.warn('Consistency check for "%s" (dump dated %s) already done, skipping check', rse, rsedate.strftime('%Y%m%d'))  # pylint: disable=no-member
         return
 
+    try:
+        partitions = int(config.config_get('auditor', 'partitions'))
+    except (ConfigParser.NoOptionError, ConfigParser.NoSectionError):
+        partitions = None
+
+    try:
+        processes = int(config.config_get('auditor', 'processes'))
+    except (ConfigParser.NoOptionError, ConfigParser.NoSectionError):
+        processes = None
+
+    try:
+        binary_cache = config.config_get_bool('auditor', 'binary_cache')
+    except (ConfigParser.NoOptionError, ConfigParser.NoSectionError):
+        binary_cache = False
+
+    if partitions and binary_cache:
+        logger.warn('Consistency check for "%s" uses %d partitions, the binary cache is not used', rse, partitions)
+
     rrdump_prev = ReplicaFromHDFS.download(rse, rsedate - delta, cache_dir=cache_dir)
     rrdump_next = ReplicaFromHDFS.download(rse, rsedate + delta, cache_dir=cache_dir)
     results = Consistency.dump(
@@ -49,6 +69,9 @@ def consistency(rse, delta, configuration, cache_dir, results_dir):
         rrdump_next,
         date=rsedate,
         cache_dir=cache_dir,
+        partitions=partitions,
+        processes=processes,
+        binary_cache=binary_cache,
     )
     mkdir(results_dir)
     with temp_file(results_dir, results_path) as (output, _):
@@ -104,7 +127,12 @@ def check(queue, retry, terminate, logpipe, cache_dir, results_dir, keep_dumps,
             remove.extend(glob.glob(os.path.join(cache_dir, 'ddmendpoint_{0}_*'.format(rse))))
             logger.debug('Removing: %s', remove)
             for fil in remove:
-                os.remove(fil)
+                # Partial downloads (and the ETag they belong to) are kept for the next attempt
+                if os.path.isdir(fil):
+                    if success:
+                        shutil.rmtree(fil)
+                elif success or not fil.endswith(('.part', '.etag')):
+                    os.remove(fil)
 
         if not success and attemps > 0:
             retry.put((rse, attemps - 1))
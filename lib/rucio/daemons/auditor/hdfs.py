@@ -1,3 +1,5 @@
+from multiprocessing.pool import ThreadPool
+from rucio.common.dumper import DOWNLOAD_PARTS
 from rucio.common.dumper import DUMPS_CACHE_DIR
 from rucio.common.dumper import temp_file
 from rucio.common.dumper.data_models import Replica
@@ -25,16 +27,41 @@ def _hdfs_get(src_url, dst_path):
         ))
 
 
+def _hdfs_ls(src_url):
+    '''
+    Returns the sorted list of the files matching `src_url`.
+    '''
+    cmd = ['hadoop', 'fs', '-ls', src_url]
+    ls = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    stdout, stderr = ls.communicate()
+    if ls.returncode != 0:
+        raise IOError('_hdfs_ls(): "{0}": {1}. Return code {2}'.format(
+            ' '.join(cmd),
+            stderr,
+            ls.returncode,
+        ))
+    return sorted(line.split()[-1] for line in stdout.splitlines() if line.startswith('-'))
+
+
 class ReplicaFromHDFS(Replica):
     BASE_URL = '/user/rucio01/reports/{0}/replicas_per_rse/{1}.bz2/*'
 
     @classmethod
-    def download(cls, rse, date, cache_dir=DUMPS_CACHE_DIR, buffer_size=65536):
+    def download(cls, rse, date, cache_dir=DUMPS_CACHE_DIR, buffer_size=65536, processes=DOWNLOAD_PARTS):
+        '''
+        Downloads the parts of the dump with up to `processes` concurrent
+        transfers and merges them in order. The parts are kept in
+        <path>.parts until the merge, so a failed download only transfers
+        the missing parts when it is retried.
+        '''
         logger = logging.getLogger('auditor.hdfs')
 
         if not os.path.isdir(cache_dir):
             os.mkdir(cache_dir)
-        tmp_dir = tempfile.mkdtemp(dir=cache_dir)
 
         url = cls.BASE_URL.format(date.strftime('%Y-%m-%d'), rse)
         filename = '{0}_{1}_{2}_{3}'.format(
@@ -50,21 +77,40 @@ class ReplicaFromHDFS(Replica):
             logger.debug('Taking Rucio Replica Dump %s for %s from cache', path, rse)
             return path
 
-        try:
-            logging.debug('Trying to download: %s for %s', url, rse)
+        parts_dir = path + '.parts'
+        if not os.path.isdir(parts_dir):
+            os.mkdir(parts_dir)
 
-            _hdfs_get(cls.BASE_URL.format(date.strftime('%Y-%m-%d'), rse), tmp_dir)
-            files = (os.path.join(tmp_dir, file_) for file_ in sorted(os.listdir(tmp_dir)))
+        def get_part(src_url):
+            # Each part is fetched in its own directory, a part is complete once it is moved to `parts_dir`
+            part_path = os.path.join(parts_dir, os.path.basename(src_url))
+            if os.path.exists(part_path):
+                return
+            tmp_dir = tempfile.mkdtemp(dir=cache_dir)
+            try:
+                _hdfs_get(src_url, tmp_dir)
+                os.rename(os.path.join(tmp_dir, os.path.basename(src_url)), part_path)
+            finally:
+                shutil.rmtree(tmp_dir)
 
-            with temp_file(cache_dir, filename) as (full_dump, _):
-                for chunk_file in files:
-                    with open(chunk_file, 'rb') as partial_dump:
-                        while True:
-                            data_chunk = partial_dump.read(buffer_size)
-                            if not data_chunk:
-                                break
-                            full_dump.write(data_chunk)
+        logging.debug('Trying to download: %s for %s', url, rse)
+        parts = _hdfs_ls(url)
+        pool = ThreadPool(max(1, min(processes, len(parts))))
+        try:
+            pool.map(get_part, parts)
         finally:
-            shutil.rmtree(tmp_dir)
+            pool.close()
+            pool.join()
+
+        files = (os.path.join(parts_dir, os.path.basename(part)) for part in parts)
+        with temp_file(cache_dir, filename) as (full_dump, _):
+            for chunk_file in files:
+                with open(chunk_file, 'rb') as partial_dump:
+                    while True:
+                        data_chunk = partial_dump.read(buffer_size)
+                        if not data_chunk:
+                            break
+                        full_dump.write(data_chunk)
+        shutil.rmtree(parts_dir)
 
         return path
@@ -1,6 +1,7 @@
 from rucio.common.config import __CONFIGFILES as __RUCIOCONFIGFILES
 from rucio.common.dumper import DUMPS_CACHE_DIR
 from rucio.common.dumper import http_download_to_file, srm_download_to_file, ddmendpoint_url, temp_file
+from rucio.common.dumper import get_requests_session, http_download_resumable
 import ConfigParser
 import HTMLParser
 import datetime
@@ -227,8 +228,11 @@ def download_rse_dump(rse, configuration, date='latest', destdir=DUMPS_CACHE_DIR
 
     if not os.path.exists(path):
         logger.debug('Trying to download: "%s"', url)
-        with temp_file(destdir, final_name=filename) as (f, _):
-            download(url, f)
+        if protocol(url) == 'http':
+            http_download_resumable(url, path, session=get_requests_session())
+        else:
+            with temp_file(destdir, final_name=filename) as (f, _):
+                download(url, f)
 
     return (path, date)
 
@@ -81,6 +81,7 @@ def update_request_state(response, session=None):
     :param response: The transfertool response dictionary, retrieved via request.query_request().
     :param session: The database session to use.
     :returns commit_or_rollback: Boolean.
+    :raises: Any error other than UnsupportedOperation, the session must then be rolled back.
     """
 
     try:
@@ -140,20 +141,23 @@ def update_request_state(response, session=None):
         return False
     except:
         logging.critical(traceback.format_exc())
+        raise
 
 
-def touch_transfer(external_host, transfer_id):
+@transactional_session
+def touch_transfer(external_host, transfer_id, session=None):
     """
     Used by poller and consumer to update the internal state of requests,
     after the response by the external transfertool.
 
     :param request_host: Name of the external host.
     :param transfer_id: external transfer job id as a string.
+    :param session: The database session to use.
     :returns commit_or_rollback: Boolean.
     """
 
     try:
-        request_core.touch_transfer(external_host, transfer_id)
+        request_core.touch_transfer(external_host, transfer_id, session=session)
     except UnsupportedOperation as error:
         logging.warning("Transfer %s on %s doesn't exist - Error: %s" % (transfer_id, external_host, str(error).replace('\n', '')))
         return False
@@ -604,48 +608,108 @@ def add_monitor_message(request, response, session=None):
                 session=session)
 
 
-def poll_transfers(external_host, xfers, process=0, thread=0, timeout=None):
+def query_transfers(external_host, xfers, process=0, thread=0, timeout=None):
+    """
+    Query the states of a chunk of transfers from the external transfertool.
+
+    :param external_host: Name of the external host.
+    :param xfers: List of external transfer job ids.
+    :param process: Process number, for logging.
+    :param thread: Thread number, for logging.
+    :param timeout: Timeout of the query in seconds.
+    :returns: Dictionary {transfer_id: response}, or None if the query failed.
+    """
     try:
-        try:
-            tss = time.time()
-            logging.info('%i:%i - polling %i transfers against %s with timeout %s' % (process, thread, len(xfers), external_host, timeout))
-            resps = request_core.bulk_query_transfers(external_host, xfers, 'fts3', timeout)
-            record_timer('daemons.conveyor.poller.bulk_query_transfers', (time.time() - tss) * 1000 / len(xfers))
-        except RequestException as error:
-            logging.error("Failed to contact FTS server: %s" % (str(error)))
-            return
-        except:
-            logging.error("Failed to query FTS info: %s" % (traceback.format_exc()))
-            return
+        tss = time.time()
+        logging.info('%i:%i - polling %i transfers against %s with timeout %s' % (process, thread, len(xfers), external_host, timeout))
+        resps = request_core.bulk_query_transfers(external_host, xfers, 'fts3', timeout)
+        record_timer('daemons.conveyor.poller.bulk_query_transfers', (time.time() - tss) * 1000 / len(xfers))
+        return resps
+    except RequestException as error:
+        logging.error("Failed to contact FTS server: %s" % (str(error)))
+    except:
+        logging.error("Failed to query FTS info: %s" % (traceback.format_exc()))
 
-        logging.debug('%i:%i - updating %s requests status' % (process, thread, len(xfers)))
-        for transfer_id in resps:
-            try:
-                transf_resp = resps[transfer_id]
-                # transf_resp is None: Lost.
-                #             is Exception: Failed to get fts job status.
-                #             is {}: No terminated jobs.
-                #             is {request_id: {file_status}}: terminated jobs.
-                if transf_resp is None:
-                    set_transfer_state(external_host, transfer_id, RequestState.LOST)
-                    record_counter('daemons.conveyor.poller.transfer_lost')
-                elif isinstance(transf_resp, Exception):
-                    logging.warning("Failed to poll FTS(%s) job (%s): %s" % (external_host, transfer_id, transf_resp))
-                    record_counter('daemons.conveyor.poller.query_transfer_exception')
-                else:
-                    for request_id in transf_resp:
-                        ret = update_request_state(transf_resp[request_id])
-                        # if True, really update request content; if False, only touch request
-                        record_counter('daemons.conveyor.poller.update_request_state.%s' % ret)
-
-                # should touch transfers.
-                # Otherwise if one bulk transfer includes many requests and one is not terminated, the transfer will be poll again.
-                touch_transfer(external_host, transfer_id)
-            except (DatabaseException, DatabaseError) as error:
-                if isinstance(error.args[0], tuple) and (match('.*ORA-00054.*', error.args[0][0]) or match('.*ORA-00060.*', error.args[0][0]) or ('ERROR 1205 (HY000)' in error.args[0][0])):
-                    logging.warn("Lock detected when handling request %s - skipping" % request_id)
-                else:
+
+@transactional_session
+def update_transfer_state(external_host, transfer_id, transf_resp, session=None):
+    """
+    Update the requests of one transfer with the response of the external transfertool.
+
+    :param external_host: Name of the external host.
+    :param transfer_id: External transfer job id.
+    :param transf_resp: None if the transfer is lost, an Exception if its state could not be retrieved,
+                        {} if it is not terminated or {request_id: response} if it is terminated.
+    :param session: The database session to use.
+    """
+    if transf_resp is None:
+        set_transfer_state(external_host, transfer_id, RequestState.LOST, session=session)
+        record_counter('daemons.conveyor.poller.transfer_lost')
+    elif isinstance(transf_resp, Exception):
+        logging.warning("Failed to poll FTS(%s) job (%s): %s" % (external_host, transfer_id, transf_resp))
+        record_counter('daemons.conveyor.poller.query_transfer_exception')
+    else:
+        for request_id in transf_resp:
+            ret = update_request_state(transf_resp[request_id], session=session)
+            # if True, really update request content; if False, only touch request
+            record_counter('daemons.conveyor.poller.update_request_state.%s' % ret)
+
+    # should touch transfers.
+    # Otherwise if one bulk transfer includes many requests and one is not terminated, the transfer will be poll again.
+    touch_transfer(external_host, transfer_id, session=session)
+
+
+def __is_lock_error(error):
+    return isinstance(error.args[0], tuple) and (match('.*ORA-00054.*', error.args[0][0]) or match('.*ORA-00060.*', error.args[0][0]) or ('ERROR 1205 (HY000)' in error.args[0][0]))
+
+
+def update_transfers_states(transfers, process=0, thread=0):
+    """
+    Update the requests of a batch of transfers in a single transaction. If the transaction
+    fails, the transfers are retried one transaction each, so that a locked request only
+    skips its own transfer.
+
+    :param transfers: List of (external_host, {transfer_id: response}) tuples, as returned by query_transfers.
+    :param process: Process number, for logging.
+    :param thread: Thread number, for logging.
+    """
+    nr_transfers = sum([len(resps) for external_host, resps in transfers])
+    logging.debug('%i:%i - updating %s transfers status' % (process, thread, nr_transfers))
+    tss = time.time()
+    try:
+        __update_transfers_states(transfers)
+    except Exception as error:
+        if isinstance(error, (DatabaseException, DatabaseError)) and __is_lock_error(error):
+            logging.warn("Lock detected when updating %s transfers in bulk - retrying one by one" % nr_transfers)
+        else:
+            logging.error(traceback.format_exc())
+        for external_host, resps in transfers:
+            for transfer_id in resps:
+                try:
+                    update_transfer_state(external_host, transfer_id, resps[transfer_id])
+                except (DatabaseException, DatabaseError) as error:
+                    if __is_lock_error(error):
+                        logging.warn("Lock detected when handling transfer %s - skipping" % transfer_id)
+                    else:
+                        logging.error(traceback.format_exc())
+                except:
                     logging.error(traceback.format_exc())
-        logging.debug('%i:%i - finished updating %s requests status' % (process, thread, len(xfers)))
+    record_timer('daemons.conveyor.poller.update_transfers_states', (time.time() - tss) * 1000 / (nr_transfers or 1))
+    logging.debug('%i:%i - finished updating %s transfers status' % (process, thread, nr_transfers))
+
+
+@transactional_session
+def __update_transfers_states(transfers, session=None):
+    for external_host, resps in transfers:
+        for transfer_id in resps:
+            update_transfer_state(external_host, transfer_id, resps[transfer_id], session=session)
+
+
+def poll_transfers(external_host, xfers, process=0, thread=0, timeout=None):
+    try:
+        resps = query_transfers(external_host, xfers, process=process, thread=thread, timeout=timeout)
+        if resps is None:
+            return
+        update_transfers_states([(external_host, resps)], process=process, thread=thread)
     except:
         logging.error(traceback.format_exc())
@@ -19,6 +19,7 @@ import datetime
 import json
 import logging
 import os
+import Queue
 import socket
 import sys
 import threading
@@ -27,7 +28,6 @@ import traceback
 
 from collections import defaultdict
 from ConfigParser import NoOptionError
-from threadpool import ThreadPool, makeRequests
 
 from rucio.common.config import config_get
 from rucio.common.utils import chunks
@@ -47,11 +47,69 @@ graceful_stop = threading.Event()
 datetime.datetime.strptime('', '')
 
 
+def query_worker(queries, responses, process=0, thread=0, timeout=None):
+    """
+    Query the external hosts for the chunks of transfers taken from the queries queue
+    and put the responses into the responses queue. Stops on a None chunk.
+
+    :param queries:    Queue of (external_host, [transfer_id]) tuples.
+    :param responses:  Queue of (external_host, {transfer_id: response}) tuples.
+    """
+    while True:
+        task = queries.get()
+        try:
+            if task is None:
+                return
+            external_host, xfers = task
+            resps = common.query_transfers(external_host, xfers, process=process, thread=thread, timeout=timeout)
+            if resps:
+                responses.put((external_host, resps))
+        except:
+            logging.critical("%i:%i - %s" % (process, thread, traceback.format_exc()))
+        finally:
+            queries.task_done()
+
+
+def state_writer(responses, update_bulk=1000, process=0, thread=0):
+    """
+    Drain the responses queue and update the request states in batches of up to
+    update_bulk transfers per transaction. Stops on a None response.
+
+    :param responses:    Queue of (external_host, {transfer_id: response}) tuples.
+    :param update_bulk:  Maximum number of transfers per transaction.
+    """
+    stop = False
+    while not stop:
+        batch = [responses.get()]
+        nr_transfers = len(batch[0][1]) if batch[0] else 0
+        while nr_transfers < update_bulk:
+            try:
+                item = responses.get_nowait()
+            except Queue.Empty:
+                break
+            batch.append(item)
+            nr_transfers += len(item[1]) if item else 0
+        try:
+            stop = None in batch
+            transfers = [response for response in batch if response is not None]
+            if transfers:
+                common.update_transfers_states(transfers, process=process, thread=thread)
+        except:
+            logging.critical("%i:%i - %s" % (process, thread, traceback.format_exc()))
+        finally:
+            for item in batch:
+                responses.task_done()
+
+
 def poller(once=False,
            process=0, total_processes=1, thread=0, total_threads=1, activities=None, sleep_time=60,
-           fts_bulk=100, db_bulk=1000, older_than=60, activity_shares=None):
+           fts_bulk=100, db_bulk=1000, older_than=60, activity_shares=None, update_bulk=1000):
     """
     Main loop to check the status of a transfer primitive with a transfertool.
+
+    The FTS queries are run by total_threads query workers, so the queries to all external hosts
+    overlap. Their responses are written to the database by a separate state writer in batches of
+    up to update_bulk transfers, while the remaining queries are still in flight.
     """
 
     try:
@@ -76,7 +134,13 @@ def poller(once=False,
                                                                                 db_bulk))
 
     activity_next_exe_time = defaultdict(time.time)
-    threadPool = ThreadPool(total_threads)
+    queries = Queue.Queue()
+    responses = Queue.Queue()
+    workers = [threading.Thread(target=query_worker, args=(queries, responses),
+                                kwargs={'process': process, 'thread': hb['assign_thread'], 'timeout': timeout}) for i in xrange(total_threads)]
+    writer = threading.Thread(target=state_writer, args=(responses, ),
+                              kwargs={'update_bulk': update_bulk, 'process': process, 'thread': hb['assign_thread']})
+    [t.start() for t in workers + [writer]]
     sleeping = False
 
     while not graceful_stop.is_set():
@@ -117,13 +181,14 @@ def poller(once=False,
                         xfers_ids[transf['external_host']] = []
                     xfers_ids[transf['external_host']].append(transf['external_id'])
 
-                for external_host in xfers_ids:
-                    for xfers in chunks(xfers_ids[external_host], fts_bulk):
-                        # poll transfers
-                        # xfer_requests = makeRequests(common.poll_transfers, args_list=[((external_host, xfers, process, thread), {})])
-                        xfer_requests = makeRequests(common.poll_transfers, args_list=[((), {'external_host': external_host, 'xfers': xfers, 'process': process, 'thread': hb['assign_thread'], 'timeout': timeout})])
-                        [threadPool.putRequest(xfer_req) for xfer_req in xfer_requests]
-                threadPool.wait()
+                # interleave the chunks of the external hosts, so that all of them are queried at the same time
+                host_chunks = [list(chunks(xfers_ids[external_host], fts_bulk)) for external_host in xfers_ids]
+                for i in xrange(max([len(host_chunk) for host_chunk in host_chunks] or [0])):
+                    for external_host, host_chunk in zip(xfers_ids, host_chunks):
+                        if i < len(host_chunk):
+                            queries.put((external_host, host_chunk[i]))
+                queries.join()
+                responses.join()
 
                 if len(transfs) < db_bulk / 2:
                     logging.info("%i:%i - only %s transfers for activity %s, which is less than half of the bulk %s, will sleep %s seconds" % (process, hb['assign_thread'], len(transfs), activity, db_bulk, sleep_time))
@@ -137,7 +202,10 @@ def poller(once=False,
 
     logging.info('%i:%i - graceful stop requests' % (process, hb['assign_thread']))
 
-    threadPool.dismissWorkers(total_threads, do_join=True)
+    [queries.put(None) for t in workers]
+    [t.join() for t in workers]
+    responses.put(None)
+    writer.join()
     heartbeat.die(executable, hostname, pid, hb_thread)
 
     logging.info('%i:%i - graceful stop done' % (process, hb['assign_thread']))
@@ -153,7 +221,7 @@ def stop(signum=None, frame=None):
 
 def run(once=False,
         process=0, total_processes=1, total_threads=1, sleep_time=60, activities=None,
-        fts_bulk=100, db_bulk=1000, older_than=60, activity_shares=None):
+        fts_bulk=100, db_bulk=1000, older_than=60, activity_shares=None, update_bulk=1000):
     """
     Starts up the conveyer threads.
     """
@@ -179,7 +247,8 @@ def run(once=False,
 
     if once:
         logging.info('executing one poller iteration only')
-        poller(once=once, fts_bulk=fts_bulk, db_bulk=db_bulk, older_than=older_than, activities=activities, activity_shares=activity_shares)
+        poller(once=once, fts_bulk=fts_bulk, db_bulk=db_bulk, older_than=older_than, activities=activities, activity_shares=activity_shares,
+               update_bulk=update_bulk)
 
     else:
 
@@ -194,7 +263,8 @@ def run(once=False,
                                                            'db_bulk': db_bulk,
                                                            'sleep_time': sleep_time,
                                                            'activities': activities,
-                                                           'activity_shares': activity_shares})]
+                                                           'activity_shares': activity_shares,
+                                                           'update_bulk': update_bulk})]
 
         [t.start() for t in threads]
 
@@ -29,11 +29,13 @@ import json
 import stomp
 
 from rucio.common.config import config_get, config_get_int
+from rucio.common.exception import UnsupportedOperation
 from rucio.core import heartbeat
 from rucio.core.monitor import record_counter
 from rucio.core.request import set_transfer_update_time
 from rucio.daemons.conveyor import common
 from rucio.db.sqla.constants import RequestState, FTSCompleteState
+from rucio.db.sqla.session import transactional_session
 
 
 logging.getLogger("stomp").setLevel(logging.CRITICAL)
@@ -46,12 +48,27 @@ graceful_stop = threading.Event()
 
 
 class Receiver(object):
+    """
+    Consumes the FTS3 completion messages of one broker connection.
+
+    The messages are buffered and applied in bulk, once bulk messages are buffered or the
+    oldest one is older than bulk_wait milliseconds. A message is acknowledged only after
+    its update was committed, so messages of a failed or interrupted batch are redelivered.
+    """
 
-    def __init__(self, broker, id, total_threads, full_mode=False):
+    def __init__(self, broker, id, total_threads, full_mode=False, conn=None, subscription_id=None, bulk=100, bulk_wait=500):
         self.__broker = broker
         self.__id = id
         self.__total_threads = total_threads
         self.__full_mode = full_mode
+        self.__conn = conn
+        self.__subscription_id = subscription_id
+        self.__bulk = bulk
+        self.__bulk_wait = bulk_wait / 1000.0
+        self.__lock = threading.Lock()
+        self.__ids = []
+        self.__responses = []
+        self.__buffered_at = None
 
     def on_error(self, headers, message):
         record_counter('daemons.conveyor.receiver.error')
@@ -60,6 +77,102 @@ class Receiver(object):
     def on_message(self, headers, message):
         record_counter('daemons.conveyor.receiver.message_all')
 
+        id = headers.get('message-id')
+        try:
+            response = self.__get_response(headers, message)
+        except:
+            logging.critical(traceback.format_exc())
+            response = None
+
+        if response is None:
+            self.__ack([id])
+            return
+
+        with self.__lock:
+            if not self.__ids:
+                self.__buffered_at = time.time()
+            self.__ids.append(id)
+            self.__responses.append(response)
+        self.flush()
+
+    def flush(self, force=False):
+        """
+        Apply the buffered messages if the batch is full, too old or if forced.
+
+        :param force: Apply the buffered messages in any case.
+        """
+        with self.__lock:
+            if not self.__ids:
+                return
+            if not force and len(self.__ids) < self.__bulk and time.time() - self.__buffered_at < self.__bulk_wait:
+                return
+            ids, responses = self.__ids, self.__responses
+            self.__ids, self.__responses, self.__buffered_at = [], [], None
+
+        record_counter('daemons.conveyor.receiver.bulk', len(ids))
+        self.__ack(self.__apply(ids, responses))
+
+    def __ack(self, ids):
+        if self.__conn is None:
+            return
+        for id in ids:
+            try:
+                self.__conn.ack(id, self.__subscription_id)
+            except:
+                logging.warning('[%s] Failed to acknowledge message %s: %s' % (self.__broker, id, traceback.format_exc()))
+
+    def __apply(self, ids, responses):
+        """
+        Apply a batch of responses in a single transaction, or one by one if the transaction fails.
+
+        :param ids: Message ids of the responses.
+        :param responses: Responses built from the messages.
+        :returns: The message ids whose update was committed.
+        """
+        # several messages of the same request (e.g. redeliveries) are coalesced, the last one wins
+        ids_by_key, response_by_key = {}, {}
+        for id, response in zip(ids, responses):
+            key = response['request_id'] if self.__full_mode else (response['external_host'], response['transfer_id'])
+            ids_by_key.setdefault(key, []).append(id)
+            response_by_key[key] = response
+        # apply in key order, so that concurrent batches lock the rows in the same order
+        keys = sorted(response_by_key)
+        try:
+            self.__update(map(response_by_key.get, keys))
+            return ids
+        except:
+            logging.warning('[%s] Failed to apply %s messages in bulk, retrying one by one: %s' % (self.__broker, len(ids), traceback.format_exc()))
+
+        committed = []
+        for key in keys:
+            try:
+                self.__update([response_by_key[key]])
+                committed.extend(ids_by_key[key])
+            except:
+                logging.critical(traceback.format_exc())
+        return committed
+
+    @transactional_session
+    def __update(self, responses, session=None):
+        if self.__full_mode:
+            for response in responses:
+                ret = common.update_request_state(response, session=session)
+                record_counter('daemons.conveyor.receiver.update_request_state.%s' % ret)
+        else:
+            for response in responses:
+                try:
+                    logging.debug("Update request %s update time" % response['request_id'])
+                    set_transfer_update_time(response['external_host'], response['transfer_id'], datetime.datetime.utcnow() - datetime.timedelta(hours=24), session=session)
+                    record_counter('daemons.conveyor.receiver.set_transfer_update_time')
+                except UnsupportedOperation, e:
+                    logging.debug("Failed to update transfer's update time: %s" % str(e))
+
+    def __get_response(self, headers, message):
+        """
+        Build the transfertool response of a message.
+
+        :returns: The response, or None if the message does not need to be applied.
+        """
         if 'vo' not in headers or headers['vo'] != 'atlas':
             return
 
@@ -131,31 +244,18 @@ class Receiver(object):
                 elif str(msg['t_final_transfer_state']) == str(FTSCompleteState.ERROR):
                     response['new_state'] = RequestState.FAILED
 
-                try:
-                    if response['new_state']:
-                        logging.info('RECEIVED DID %s:%s FROM %s TO %s REQUEST %s TRANSFER_ID %s STATE %s' % (response['scope'],
-                                                                                                              response['name'],
-                                                                                                              response['src_rse'],
-                                                                                                              response['dst_rse'],
-                                                                                                              response['request_id'],
-                                                                                                              response['transfer_id'],
-                                                                                                              response['new_state']))
-
-                        if self.__full_mode:
-                            ret = common.update_request_state(response)
-                            record_counter('daemons.conveyor.receiver.update_request_state.%s' % ret)
-                        else:
-                            try:
-                                logging.debug("Update request %s update time" % response['request_id'])
-                                set_transfer_update_time(response['external_host'], response['transfer_id'], datetime.datetime.utcnow() - datetime.timedelta(hours=24))
-                                record_counter('daemons.conveyor.receiver.set_transfer_update_time')
-                            except Exception, e:
-                                logging.debug("Failed to update transfer's update time: %s" % str(e))
-                except:
-                    logging.critical(traceback.format_exc())
+                if response['new_state']:
+                    logging.info('RECEIVED DID %s:%s FROM %s TO %s REQUEST %s TRANSFER_ID %s STATE %s' % (response['scope'],
+                                                                                                          response['name'],
+                                                                                                          response['src_rse'],
+                                                                                                          response['dst_rse'],
+                                                                                                          response['request_id'],
+                                                                                                          response['transfer_id'],
+                                                                                                          response['new_state']))
+                    return response
 
 
-def receiver(id, total_threads=1, full_mode=False):
+def receiver(id, total_threads=1, full_mode=False, bulk=100, bulk_wait=500):
     """
     Main loop to consume messages from the FTS3 producer.
     """
@@ -198,6 +298,7 @@ def receiver(id, total_threads=1, full_mode=False):
 
     logging.info('receiver started')
 
+    listeners = {}
     while not graceful_stop.is_set():
 
         heartbeat.live(executable, hostname, pid, hb_thread)
@@ -208,17 +309,34 @@ def receiver(id, total_threads=1, full_mode=False):
                 logging.info('connecting to %s' % conn.transport._Transport__host_and_ports[0][0])
                 record_counter('daemons.messaging.fts3.reconnect.%s' % conn.transport._Transport__host_and_ports[0][0].split('.')[0])
 
-                conn.set_listener('rucio-messaging-fts3', Receiver(broker=conn.transport._Transport__host_and_ports[0], id=id, total_threads=total_threads, full_mode=full_mode))
+                # unacknowledged messages of the previous connection are redelivered by the broker
+                listeners[conn] = Receiver(broker=conn.transport._Transport__host_and_ports[0], id=id, total_threads=total_threads, full_mode=full_mode,
+                                           conn=conn, subscription_id='rucio-messaging-fts3', bulk=bulk, bulk_wait=bulk_wait)
+                conn.set_listener('rucio-messaging-fts3', listeners[conn])
                 conn.start()
                 conn.connect()
                 conn.subscribe(destination=config_get('messaging-fts3', 'destination'),
                                id='rucio-messaging-fts3',
-                               ack='auto')
+                               ack='client-individual')
 
-        time.sleep(1)
+        # flush the batches of brokers which are not sending enough messages to fill them
+        next_heartbeat = time.time() + 1
+        while time.time() < next_heartbeat and not graceful_stop.is_set():
+            for listener in listeners.values():
+                try:
+                    listener.flush()
+                except:
+                    logging.critical(traceback.format_exc())
+            time.sleep(min(bulk_wait, 1000) / 1000.0)
 
     logging.info('receiver graceful stop requested')
 
+    for listener in listeners.values():
+        try:
+            listener.flush(force=True)
+        except:
+            logging.critical(traceback.format_exc())
+
     for conn in conns:
         try:
             conn.disconnect()
@@ -238,7 +356,7 @@ def stop(signum=None, frame=None):
     graceful_stop.set()
 
 
-def run(once=False, total_threads=1, full_mode=False):
+def run(once=False, total_threads=1, full_mode=False, bulk=100, bulk_wait=500):
     """
     Starts up the receiver thread
     """
@@ -246,7 +364,9 @@ def run(once=False, total_threads=1, full_mode=False):
     logging.info('starting receiver thread')
     threads = [threading.Thread(target=receiver, kwargs={'id': i,
                                                          'full_mode': full_mode,
-                                                         'total_threads': total_threads}) for i in xrange(0, total_threads)]
+                                                         'total_threads': total_threads,
+                                                         'bulk': bulk,
+                                                         'bulk_wait': bulk_wait}) for i in xrange(0, total_threads)]
 
     [t.start() for t in threads]
 
@@ -17,6 +17,7 @@ Conveyor transfer submitter is a daemon to manage non-tape file transfers.
 
 import logging
 import os
+import Queue
 import socket
 import sys
 import threading
@@ -25,7 +26,6 @@ import traceback
 
 from collections import defaultdict
 from ConfigParser import NoOptionError
-from threadpool import ThreadPool, makeRequests
 
 from rucio.common.config import config_get
 from rucio.core import heartbeat
@@ -40,17 +40,53 @@ logging.basicConfig(stream=sys.stdout,
 graceful_stop = threading.Event()
 
 
+def submit_jobs(grouped_jobs, max_inflight, **kwargs):
+    """
+    Submit grouped jobs to their transfertools. The jobs of the different external hosts
+    are submitted concurrently, with at most max_inflight jobs in flight per external host.
+
+    :param grouped_jobs:  Dictionary {external_host: [job]}.
+    :param max_inflight:  Maximum number of concurrent submissions per external host.
+    :param kwargs:        Extra arguments for submit_transfer.
+    """
+
+    def worker(external_host, jobs):
+        while True:
+            try:
+                job = jobs.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                submit_transfer(external_host=external_host, job=job, **kwargs)
+            except:
+                logging.critical('Failed to submit job to %s: %s' % (external_host, traceback.format_exc()))
+
+    workers = []
+    for external_host in grouped_jobs:
+        jobs = Queue.Queue()
+        for job in grouped_jobs[external_host]:
+            jobs.put(job)
+        for i in xrange(min(max_inflight, len(grouped_jobs[external_host]))):
+            workers.append(threading.Thread(target=worker, args=(external_host, jobs)))
+    [t.start() for t in workers]
+    [t.join() for t in workers]
+
+
 def submitter(once=False, rses=[], mock=False,
               process=0, total_processes=1, total_threads=1,
               bulk=100, group_bulk=1, group_policy='rule', fts_source_strategy='auto',
-              activities=None, sleep_time=600, max_sources=4, retry_other_fts=False):
+              activities=None, sleep_time=600, max_sources=4, retry_other_fts=False, max_inflight=None):
     """
     Main loop to submit a new transfer primitive to a transfertool.
     """
 
-    logging.info('Transfer submitter starting - process (%i/%i) threads (%i)' % (process,
-                                                                                 total_processes,
-                                                                                 total_threads))
+    if max_inflight is None:
+        max_inflight = total_threads
+
+    logging.info('Transfer submitter starting - process (%i/%i) threads (%i) max inflight per host (%i)' % (process,
+                                                                                                            total_processes,
+                                                                                                            total_threads,
+                                                                                                            max_inflight))
 
     try:
         scheme = config_get('conveyor', 'scheme')
@@ -100,7 +136,6 @@ def submitter(once=False, rses=[], mock=False,
                                                                                                 hb['assign_thread'], hb['nr_threads'],
                                                                                                 timeout))
 
-    threadPool = ThreadPool(total_threads)
     activity_next_exe_time = defaultdict(time.time)
     sleeping = False
 
@@ -149,14 +184,8 @@ def submitter(once=False, rses=[], mock=False,
                 record_timer('daemons.conveyor.transfer_submitter.bulk_group_transfer', (time.time() - ts) * 1000 / (len(transfers) if len(transfers) else 1))
 
                 logging.info("%s:%s Starting to submit transfers for %s" % (process, hb['assign_thread'], activity))
-                for external_host in grouped_jobs:
-                    for job in grouped_jobs[external_host]:
-                        # submit transfers
-                        # job_requests = makeRequests(submit_transfer, args_list=[((external_host, job, 'transfer_submitter', process, thread), {})])
-                        job_requests = makeRequests(submit_transfer, args_list=[((), {'external_host': external_host, 'job': job, 'submitter': 'transfer_submitter', 'process': process,
-                                                                                      'thread': hb['assign_thread'], 'cachedir': cachedir, 'timeout': timeout})])
-                        [threadPool.putRequest(job_req) for job_req in job_requests]
-                threadPool.wait()
+                submit_jobs(grouped_jobs, max_inflight, submitter='transfer_submitter', process=process,
+                            thread=hb['assign_thread'], cachedir=cachedir, timeout=timeout)
 
                 if len(transfers) < group_bulk:
                     logging.info('%i:%i - only %s transfers for %s which is less than group bulk %s, sleep %s seconds' % (process, hb['assign_thread'], len(transfers), activity, group_bulk, sleep_time))
@@ -170,7 +199,6 @@ def submitter(once=False, rses=[], mock=False,
 
     logging.info('%s:%s graceful stop requested' % (process, hb['assign_thread']))
 
-    threadPool.dismissWorkers(total_threads, do_join=True)
     heartbeat.die(executable, hostname, pid, hb_thread)
 
     logging.info('%s:%s graceful stop done' % (process, hb['assign_thread']))
@@ -188,7 +216,7 @@ def stop(signum=None, frame=None):
 def run(once=False,
         process=0, total_processes=1, total_threads=1, group_bulk=1, group_policy='rule',
         mock=False, rses=[], include_rses=None, exclude_rses=None, bulk=100, fts_source_strategy='auto',
-        activities=None, sleep_time=600, max_sources=4, retry_other_fts=False):
+        activities=None, sleep_time=600, max_sources=4, retry_other_fts=False, max_inflight=None):
     """
     Starts up the conveyer threads.
     """
@@ -219,7 +247,8 @@ def run(once=False,
                                                           'sleep_time': sleep_time,
                                                           'max_sources': max_sources,
                                                           'fts_source_strategy': fts_source_strategy,
-                                                          'retry_other_fts': retry_other_fts})]
+                                                          'retry_other_fts': retry_other_fts,
+                                                          'max_inflight': max_inflight})]
 
     [t.start() for t in threads]
 
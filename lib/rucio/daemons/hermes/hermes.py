@@ -17,7 +17,6 @@
 import json
 import logging
 import os
-import random
 import smtplib
 import socket
 import ssl
@@ -27,7 +26,7 @@ import time
 import traceback
 
 from email.mime.text import MIMEText
-from sqlalchemy.orm.exc import NoResultFound
+from Queue import Queue, Empty
 
 import dns.resolver
 import stomp
@@ -48,7 +47,94 @@ logging.basicConfig(stream=sys.stdout,
 graceful_stop = threading.Event()
 
 
-def deliver_emails(once=False, send_email=True, thread=0, bulk=1000, delay=10):
+def build_emails(messages, email_from):
+    '''
+    Build the emails of a batch of messages. Messages with the same digest and recipients
+    are aggregated into one email.
+
+    :param messages:    List of message dictionaries {id, payload}.
+    :param email_from:  The sender address.
+    :returns:           List of tuples (message ids, recipients, MIMEText).
+    '''
+    emails, digests = [], {}
+    for t in messages:
+        if t['payload'].get('digest'):
+            digests.setdefault((t['payload']['digest'], tuple(sorted(t['payload']['to']))), []).append(t)
+        else:
+            emails.append(([t['id']], t['payload']['to'], t['payload']['subject'], t['payload']['body']))
+
+    for (digest, to), group in digests.iteritems():
+        if len(group) == 1:
+            emails.append(([group[0]['id']], list(to), group[0]['payload']['subject'], group[0]['payload']['body']))
+        else:
+            emails.append(([t['id'] for t in group], list(to),
+                           '%s (%i notifications)' % (digest, len(group)),
+                           ('\n\n' + '-' * 72 + '\n\n').join(t['payload']['body'] for t in group)))
+
+    result = []
+    for ids, to, subject, body in emails:
+        msg = MIMEText(body.encode('utf-8'))
+        msg['From'] = email_from
+        msg['To'] = ', '.join(to)
+        msg['Subject'] = subject.encode('utf-8')
+        result.append((ids, to, msg))
+    return result
+
+
+def send_emails(emails, workers=4, send_email=True):
+    '''
+    Send emails on a pool of workers, each keeping its SMTP connection open for the whole batch.
+
+    :param emails:      List of tuples (message ids, recipients, MIMEText).
+    :param workers:     Maximum number of concurrent SMTP connections.
+    :param send_email:  Only drop the emails if False.
+    :returns:           List of the ids of the messages which are done, i.e. sent or rejected by the server.
+    '''
+    queue = Queue()
+    for email in emails:
+        queue.put(email)
+    done = []
+
+    def worker():
+        smtp = None
+        while True:
+            try:
+                ids, to, msg = queue.get_nowait()
+            except Empty:
+                break
+            if not send_email:
+                done.extend(ids)
+                continue
+            try:
+                if smtp is None:
+                    smtp = smtplib.SMTP()
+                    smtp.connect()
+                smtp.sendmail(msg['From'], to, msg.as_string())
+                done.extend(ids)
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, socket.error), e:
+                # Keep the messages for the next cycle and reconnect for the next email
+                logging.warning('[email] connection failed, retrying later: %s' % str(e))
+                record_counter('daemons.hermes.email.reconnect')
+                smtp = None
+            except smtplib.SMTPException, e:
+                logging.warning('[email] cannot send to %s: %s' % (to, str(e)))
+                record_counter('daemons.hermes.email.rejected')
+                done.extend(ids)
+        if smtp is not None:
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, socket.error):
+                pass
+
+    threads = [threading.Thread(target=worker) for _ in xrange(max(1, min(workers, len(emails))))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return done
+
+
+def deliver_emails(once=False, send_email=True, thread=0, bulk=1000, delay=10, email_workers=4):
     '''
     Main loop to deliver emails via SMTP.
     '''
@@ -82,28 +168,13 @@ def deliver_emails(once=False, send_email=True, thread=0, bulk=1000, delay=10):
                                 event_type='email')
 
         if tmp != []:
-            to_delete = []
-            for t in tmp:
-                logging.debug('[email] %i:%i - submitting: %s' % (hb['assign_thread'],
-                                                                  hb['nr_threads'],
-                                                                  str(t)))
-
-                msg = MIMEText(t['payload']['body'].encode('utf-8'))
-
-                msg['From'] = email_from
-                msg['To'] = ', '.join(t['payload']['to'])
-                msg['Subject'] = t['payload']['subject'].encode('utf-8')
+            emails = build_emails(tmp, email_from)
+            logging.debug('[email] %i:%i - submitting %i emails for %i messages' % (hb['assign_thread'],
+                                                                                    hb['nr_threads'],
+                                                                                    len(emails),
+                                                                                    len(tmp)))
 
-                if send_email:
-                    s = smtplib.SMTP()
-                    s.connect()
-                    s.sendmail(msg['From'], t['payload']['to'], msg.as_string())
-                    s.quit()
-
-                to_delete.append(t['id'])
-                logging.debug('[email] %i:%i - submitting done: %s' % (hb['assign_thread'],
-                                                                       hb['nr_threads'],
-                                                                       str(t['id'])))
+            to_delete = send_emails(emails, workers=email_workers, send_email=send_email)
 
             delete_messages(to_delete)
             logging.info('[email] %i:%i - submitted %i messages' % (hb['assign_thread'],
@@ -126,7 +197,239 @@ def deliver_emails(once=False, send_email=True, thread=0, bulk=1000, delay=10):
     logging.debug('[email] %i:%i - graceful stop done' % (hb['assign_thread'], hb['nr_threads']))
 
 
-def deliver_messages(once=False, brokers_resolved=None, thread=0, bulk=1000, delay=10, broker_timeout=3, broker_retry=3):
+def log_message(hb, t):
+    '''
+    Log the delivery of a message.
+    '''
+    if str(t['event_type']).lower().startswith('transfer') or str(t['event_type']).lower().startswith('stagein'):
+        logging.debug('[broker] %i:%i - event_type: %s, scope: %s, name: %s, rse: %s, request-id: %s, transfer-id: %s, created_at: %s' % (hb['assign_thread'],
+                                                                                                                                          hb['nr_threads'],
+                                                                                                                                          str(t['event_type']).lower(),
+                                                                                                                                          t['payload'].get('scope', None),
+                                                                                                                                          t['payload'].get('name', None),
+                                                                                                                                          t['payload'].get('dst-rse', None),
+                                                                                                                                          t['payload'].get('request-id', None),
+                                                                                                                                          t['payload'].get('transfer-id', None),
+                                                                                                                                          str(t['created_at'])))
+    elif str(t['event_type']).lower().startswith('dataset'):
+        logging.debug('[broker] %i:%i - event_type: %s, scope: %s, name: %s, rse: %s, rule-id: %s, created_at: %s)' % (hb['assign_thread'],
+                                                                                                                       hb['nr_threads'],
+                                                                                                                       str(t['event_type']).lower(),
+                                                                                                                       t['payload']['scope'],
+                                                                                                                       t['payload']['name'],
+                                                                                                                       t['payload']['rse'],
+                                                                                                                       t['payload']['rule_id'],
+                                                                                                                       str(t['created_at'])))
+    elif str(t['event_type']).lower().startswith('deletion'):
+        if 'url' not in t['payload']:
+            t['payload']['url'] = 'unknown'
+        logging.debug('[broker] %i:%i - event_type: %s, scope: %s, name: %s, rse: %s, url: %s, created_at: %s)' % (hb['assign_thread'],
+                                                                                                                   hb['nr_threads'],
+                                                                                                                   str(t['event_type']).lower(),
+                                                                                                                   t['payload']['scope'],
+                                                                                                                   t['payload']['name'],
+                                                                                                                   t['payload']['rse'],
+                                                                                                                   t['payload']['url'],
+                                                                                                                   str(t['created_at'])))
+
+    else:
+        logging.debug('[broker] %i:%i - other message: %s' % (hb['assign_thread'],
+                                                              hb['nr_threads'],
+                                                              t))
+
+
+class ReceiptListener(object):
+    '''
+    Hands the receipts of a broker connection to the delivery pipeline.
+    '''
+
+    def __init__(self, broker, pipeline):
+        self.__broker = broker
+        self.__pipeline = pipeline
+
+    def on_receipt(self, headers, body):
+        self.__pipeline.acknowledge(headers.get('receipt-id'))
+
+    def on_error(self, headers, body):
+        logging.warning('[broker] error from %s: %s' % (self.__broker, body))
+
+
+class DeliveryPipeline(object):
+    '''
+    Overlaps the retrieval, the delivery and the deletion of messages.
+
+    Retrieved messages are queued in an outbox which is drained concurrently by one sender thread
+    per broker. Every message is sent with a receipt header and is only deleted, in batches by a
+    separate thread, once the broker acknowledged it. Messages without receipt after
+    receipt_timeout seconds are released to be retrieved and sent again.
+    '''
+
+    def __init__(self, conns, destination, bulk=1000, receipt_timeout=60, delete_bulk=1000):
+        '''
+        :param conns:            List of connection dictionaries {conn, broker, use, retry}.
+        :param destination:      The destination of the messages on the brokers.
+        :param bulk:             Number of messages per retrieval.
+        :param receipt_timeout:  Seconds after which a message without receipt is sent again.
+        :param delete_bulk:      Maximum number of messages per deletion.
+        '''
+        self.conns = conns
+        self.destination = destination
+        self.bulk = bulk
+        self.receipt_timeout = receipt_timeout
+        self.delete_bulk = delete_bulk
+        self.hb = {'assign_thread': 0, 'nr_threads': 0}
+        self.deleted = 0
+        self.__outbox = Queue()
+        self.__delivered = Queue()
+        self.__lock = threading.Lock()
+        self.__in_flight = {}    # id: time of the send, None while in the outbox
+        self.__deleting = set()  # ids acknowledged by a broker, not yet deleted
+        self.__stop_sending = threading.Event()
+        self.__stop_deleting = threading.Event()
+        self.__threads = []
+
+    def start(self):
+        '''
+        Register the receipt listeners and start the sender and deleter threads.
+        '''
+        for conn in self.conns:
+            conn['conn'].set_listener('rucio-hermes', ReceiptListener(broker=conn['broker'], pipeline=self))
+            self.__threads.append(threading.Thread(target=self.__send, kwargs={'conn': conn}))
+        self.__deleter = threading.Thread(target=self.__delete)
+        for thread in self.__threads + [self.__deleter]:
+            thread.daemon = True
+            thread.start()
+
+    def fill(self, thread, total_threads):
+        '''
+        Retrieve the next messages while the current ones are sent.
+
+        :param thread:         Identifier of the caller thread as an integer.
+        :param total_threads:  Maximum number of threads as an integer.
+        :returns:              Number of retrieved messages, or None if the outbox still holds a full bulk.
+        '''
+        if self.__outbox.qsize() >= self.bulk:
+            return None
+
+        now = time.time()
+        with self.__lock:
+            for id, sent_at in self.__in_flight.items():
+                if sent_at is not None and now - sent_at > self.receipt_timeout:
+                    del self.__in_flight[id]
+                    record_counter('daemons.hermes.receipt_timeout')
+            busy = set(self.__in_flight) | self.__deleting
+
+        # Messages stay in the table until they are deleted, skip the ones already in the pipeline
+        messages = retrieve_messages(bulk=self.bulk, thread=thread, total_threads=total_threads, exclude=busy)
+        with self.__lock:
+            for t in messages:
+                self.__in_flight[t['id']] = None
+        for t in messages:
+            self.__outbox.put(t)
+        return len(messages)
+
+    def acknowledge(self, id):
+        '''
+        Mark a message as delivered, to be deleted.
+
+        :param id:  The message id.
+        '''
+        with self.__lock:
+            if id not in self.__in_flight:
+                return
+            del self.__in_flight[id]
+            self.__deleting.add(id)
+        self.__delivered.put(id)
+
+    def pending(self):
+        '''
+        :returns:  Number of messages not yet deleted.
+        '''
+        with self.__lock:
+            return len(self.__in_flight) + len(self.__deleting)
+
+    def __send(self, conn):
+        while not self.__stop_sending.is_set():
+            if not conn['use']:
+                self.__stop_sending.wait(0.1)
+                continue
+            try:
+                t = self.__outbox.get(timeout=0.1)
+            except Empty:
+                continue
+
+            try:
+                body = json.dumps({'event_type': str(t['event_type']).lower(),
+                                   'payload': t['payload'],
+                                   'created_at': str(t['created_at'])})
+            except ValueError:
+                logging.warn('Cannot serialize payload to JSON: %s' % str(t['payload']))
+                self.acknowledge(t['id'])
+                continue
+
+            with self.__lock:
+                if t['id'] not in self.__in_flight:
+                    continue
+                self.__in_flight[t['id']] = time.time()
+            try:
+                conn['conn'].send(body=body, destination=self.destination, headers={'persistent': 'true', 'receipt': t['id']})
+            except Exception, e:
+                logging.warn('Could not deliver message to %s: %s' % (conn['broker'], str(e)))
+                # Leave the message to the other brokers until this one is connected again
+                conn['use'] = False
+                with self.__lock:
+                    if t['id'] in self.__in_flight:
+                        self.__in_flight[t['id']] = None
+                self.__outbox.put(t)
+                continue
+            log_message(self.hb, t)
+
+    def __delete(self):
+        while not (self.__stop_deleting.is_set() and self.__delivered.empty()):
+            ids = []
+            try:
+                ids.append(self.__delivered.get(timeout=1))
+                while len(ids) < self.delete_bulk:
+                    ids.append(self.__delivered.get_nowait())
+            except Empty:
+                pass
+            if not ids:
+                continue
+
+            try:
+                delete_messages(ids)
+            except:
+                logging.error(traceback.format_exc())
+                for id in ids:
+                    self.__delivered.put(id)
+                self.__stop_deleting.wait(1)
+                continue
+            with self.__lock:
+                self.__deleting.difference_update(ids)
+            self.deleted += len(ids)
+
+    def stop(self, timeout=None):
+        '''
+        Stop the pipeline after the delivered messages are deleted.
+
+        :param timeout:  Seconds to wait for the queued and in-flight messages, None to not wait.
+        '''
+        if timeout:
+            end = time.time() + timeout
+            with self.__lock:
+                waiting = len(self.__in_flight)
+            while waiting and time.time() < end and any(conn['use'] for conn in self.conns):
+                time.sleep(0.1)
+                with self.__lock:
+                    waiting = len(self.__in_flight)
+        self.__stop_sending.set()
+        for thread in self.__threads:
+            thread.join()
+        self.__stop_deleting.set()
+        self.__deleter.join()
+
+
+def deliver_messages(once=False, brokers_resolved=None, thread=0, bulk=1000, delay=10, broker_timeout=3, broker_retry=3, receipt_timeout=60):
     '''
     Main loop to deliver messages to a broker.
     '''
@@ -146,6 +449,7 @@ def deliver_messages(once=False, brokers_resolved=None, thread=0, bulk=1000, del
                                                ssl_version=ssl.PROTOCOL_TLSv1,
                                                keepalive=True,
                                                timeout=broker_timeout),
+                      'broker': broker,
                       'use': False,
                       'retry': 0})  # reconnect safeguard counter
     destination = config_get('messaging-hermes', 'destination')
@@ -157,27 +461,32 @@ def deliver_messages(once=False, brokers_resolved=None, thread=0, bulk=1000, del
     # Make an initial heartbeat so that all daemons have the correct worker number on the next try
     sanity_check(executable=executable, hostname=hostname, pid=pid, thread=hb_thread)
 
+    pipeline = DeliveryPipeline(conns=conns, destination=destination, bulk=bulk, receipt_timeout=receipt_timeout)
+    pipeline.start()
+
     graceful_stop.wait(1)
 
     while not graceful_stop.is_set():
+        retrieved = 0
         try:
             t_start = time.time()
 
             hb = live(executable=executable, hostname=hostname, pid=pid, thread=hb_thread)
+            pipeline.hb = hb
 
             for conn in conns:
 
                 if not conn['conn'].is_connected():
                     logging.info('[broker] %i:%i - connecting to %s' % (hb['assign_thread'],
                                                                         hb['nr_threads'],
-                                                                        conn['conn'].transport._Transport__host_and_ports[0][0]))
-                    record_counter('daemons.hermes.reconnect.%s' % conn['conn'].transport._Transport__host_and_ports[0][0].split('.')[0])
+                                                                        conn['broker']))
+                    record_counter('daemons.hermes.reconnect.%s' % conn['broker'].split('.')[0])
 
                     try:
                         if conn['retry'] >= broker_retry:
                             logging.warning('[broker] %i:%i - connection retrials exceeded, skipping this round: %s' % (hb['assign_thread'],
                                                                                                                         hb['nr_threads'],
-                                                                                                                        conn['conn'].transport._Transport__host_and_ports[0][0]))
+                                                                                                                        conn['broker']))
                             conn['retry'] = 0
                             conn['use'] = False
                             continue
@@ -185,105 +494,57 @@ def deliver_messages(once=False, brokers_resolved=None, thread=0, bulk=1000, del
                             conn['conn'].start()
                             conn['conn'].connect()
                             conn['use'] = True
-                    except stomp.exception.ConnectFailedException as e:
+                    except stomp.exception.ConnectFailedException:
                         logging.warning('[broker] %i:%i - connection timeout, retrying: %s' % (hb['assign_thread'],
                                                                                                hb['nr_threads'],
-                                                                                               conn['conn'].transport._Transport__host_and_ports[0][0]))
+                                                                                               conn['broker']))
                         conn['retry'] += 1
                         conn['use'] = False
+                else:
+                    conn['use'] = True
 
             usable_conns = [conn for conn in conns if conn['use']]
             logging.debug('[broker] %i:%i - using: %s' % (hb['assign_thread'],
                                                           hb['nr_threads'],
-                                                          [uc['conn'].transport._Transport__host_and_ports[0][0] for uc in usable_conns]))
-
-            tmp = retrieve_messages(bulk=bulk,
-                                    thread=hb['assign_thread'],
-                                    total_threads=hb['nr_threads'])
+                                                          [uc['broker'] for uc in usable_conns]))
 
-            if tmp != []:
-                logging.debug('[broker] %i:%i - retrieved %i messages' % (hb['assign_thread'],
-                                                                          hb['nr_threads'],
-                                                                          len(tmp)))
-                to_delete = []
-                for t in tmp:
-
-                    try:
-                        random.sample(usable_conns, 1)[0]['conn'].send(body=json.dumps({'event_type': str(t['event_type']).lower(),
-                                                                                        'payload': t['payload'],
-                                                                                        'created_at': str(t['created_at'])}),
-                                                                       destination=destination,
-                                                                       headers={'persistent': 'true'})
-                        to_delete.append(t['id'])
-                    except ValueError:
-                        logging.warn('Cannot serialize payload to JSON: %s' % str(t['payload']))
-                        to_delete.append(t['id'])
-                        continue
-                    except Exception, e:
-                        logging.warn('Could not deliver message: %s' % str(e))
-                        continue
-
-                    if str(t['event_type']).lower().startswith('transfer') or str(t['event_type']).lower().startswith('stagein'):
-                        logging.debug('[broker] %i:%i - event_type: %s, scope: %s, name: %s, rse: %s, request-id: %s, transfer-id: %s, created_at: %s' % (hb['assign_thread'],
-                                                                                                                                                          hb['nr_threads'],
-                                                                                                                                                          str(t['event_type']).lower(),
-                                                                                                                                                          t['payload'].get('scope', None),
-                                                                                                                                                          t['payload'].get('name', None),
-                                                                                                                                                          t['payload'].get('dst-rse', None),
-                                                                                                                                                          t['payload'].get('request-id', None),
-                                                                                                                                                          t['payload'].get('transfer-id', None),
-                                                                                                                                                          str(t['created_at'])))
-                    elif str(t['event_type']).lower().startswith('dataset'):
-                        logging.debug('[broker] %i:%i - event_type: %s, scope: %s, name: %s, rse: %s, rule-id: %s, created_at: %s)' % (hb['assign_thread'],
-                                                                                                                                       hb['nr_threads'],
-                                                                                                                                       str(t['event_type']).lower(),
-                                                                                                                                       t['payload']['scope'],
-                                                                                                                                       t['payload']['name'],
-                                                                                                                                       t['payload']['rse'],
-                                                                                                                                       t['payload']['rule_id'],
-                                                                                                                                       str(t['created_at'])))
-                    elif str(t['event_type']).lower().startswith('deletion'):
-                        if 'url' not in t['payload']:
-                            t['payload']['url'] = 'unknown'
-                        logging.debug('[broker] %i:%i - event_type: %s, scope: %s, name: %s, rse: %s, url: %s, created_at: %s)' % (hb['assign_thread'],
-                                                                                                                                   hb['nr_threads'],
-                                                                                                                                   str(t['event_type']).lower(),
-                                                                                                                                   t['payload']['scope'],
-                                                                                                                                   t['payload']['name'],
-                                                                                                                                   t['payload']['rse'],
-                                                                                                                                   t['payload']['url'],
-                                                                                                                                   str(t['created_at'])))
-
-                    else:
-                        logging.debug('[broker] %i:%i - other message: %s' % (hb['assign_thread'],
+            if usable_conns:
+                deleted = pipeline.deleted
+                retrieved = pipeline.fill(thread=hb['assign_thread'], total_threads=hb['nr_threads'])
+                if retrieved:
+                    logging.debug('[broker] %i:%i - retrieved %i messages' % (hb['assign_thread'],
                                                                               hb['nr_threads'],
-                                                                              t))
+                                                                              retrieved))
+                logging.info('[broker] %i:%i - submitted %i messages, %i pending' % (hb['assign_thread'],
+                                                                                     hb['nr_threads'],
+                                                                                     pipeline.deleted - deleted,
+                                                                                     pipeline.pending()))
 
-                delete_messages(to_delete)
-                logging.info('[broker] %i:%i - submitted %i messages' % (hb['assign_thread'],
-                                                                         hb['nr_threads'],
-                                                                         len(to_delete)))
-
-                if once:
-                    break
-
-        except NoResultFound:
-            # silence this error: https://its.cern.ch/jira/browse/RUCIO-1699
-            pass
         except:
             logging.critical(traceback.format_exc())
 
+        if once:
+            break
+
+        if retrieved is None:
+            # The outbox is still full, retrieve again as soon as it drains
+            graceful_stop.wait(0.5)
+            continue
+
         t_delay = delay - (time.time() - t_start)
         t_delay = t_delay if t_delay > 0 else 0
-        if t_delay:
+        if t_delay and not retrieved:
             logging.debug('[broker] %i:%i - sleeping %s seconds' % (hb['assign_thread'], hb['nr_threads'], t_delay))
-        time.sleep(t_delay)
+            time.sleep(t_delay)
 
     logging.debug('[broker] %i:%i - graceful stop requested' % (hb['assign_thread'], hb['nr_threads']))
 
+    # In a single iteration wait for the receipts of all retrieved messages
+    pipeline.stop(timeout=receipt_timeout if once else broker_timeout)
+
     for conn in conns:
         try:
-            conn.disconnect()
+            conn['conn'].disconnect()
         except:
             pass
 
@@ -302,7 +563,7 @@ def stop(signum=None, frame=None):
     graceful_stop.set()
 
 
-def run(once=False, send_email=True, threads=1, bulk=1000, delay=10, broker_timeout=3, broker_retry=3):
+def run(once=False, send_email=True, threads=1, bulk=1000, delay=10, broker_timeout=3, broker_retry=3, receipt_timeout=60, email_workers=4):
     '''
     Starts up the hermes threads.
     '''
@@ -331,8 +592,8 @@ def run(once=False, send_email=True, threads=1, bulk=1000, delay=10, broker_time
 
     if once:
         logging.info('executing one hermes iteration only')
-        deliver_messages(once=once, brokers_resolved=brokers_resolved, bulk=bulk, delay=delay, broker_timeout=broker_timeout, broker_retry=broker_retry)
-        deliver_emails(once=once, send_email=send_email, bulk=bulk, delay=delay)
+        deliver_messages(once=once, brokers_resolved=brokers_resolved, bulk=bulk, delay=delay, broker_timeout=broker_timeout, broker_retry=broker_retry, receipt_timeout=receipt_timeout)
+        deliver_emails(once=once, send_email=send_email, bulk=bulk, delay=delay, email_workers=email_workers)
 
     else:
         logging.info('starting hermes threads')
@@ -341,12 +602,14 @@ def run(once=False, send_email=True, threads=1, bulk=1000, delay=10, broker_time
                                                                          'bulk': bulk,
                                                                          'delay': delay,
                                                                          'broker_timeout': broker_timeout,
-                                                                         'broker_retry': broker_retry}) for i in xrange(0, threads)]
+                                                                         'broker_retry': broker_retry,
+                                                                         'receipt_timeout': receipt_timeout}) for i in xrange(0, threads)]
 
         for i in xrange(0, threads):
             thread_list.append(threading.Thread(target=deliver_emails, kwargs={'thread': i,
                                                                                'bulk': bulk,
-                                                                               'delay': delay}))
+                                                                               'delay': delay,
+                                                                               'email_workers': email_workers}))
 
         [t.start() for t in thread_list]
 
@@ -30,7 +30,8 @@ from sqlalchemy.orm.exc import FlushError
 
 from rucio.common.config import config_get
 from rucio.common.exception import DatabaseException, DataIdentifierNotFound, ReplicationRuleCreationTemporaryFailed
-from rucio.core.heartbeat import live, die, sanity_check
+from rucio.core.heartbeat import sanity_check
+from rucio.core.membership import live, die, join
 from rucio.core.rule import re_evaluate_did, get_updated_dids, delete_updated_did, delete_duplicate_updated_dids
 from rucio.core.monitor import record_counter
 
@@ -53,8 +54,7 @@ def re_evaluator(once=False):
     paused_dids = {}  # {(scope, name): datetime}
 
     # Make an initial heartbeat so that all judge-evaluators have the correct worker number on the next try
-    live(executable='rucio-judge-evaluator', hostname=hostname, pid=pid, thread=current_thread, older_than=60 * 30)
-    graceful_stop.wait(1)
+    join(executable='rucio-judge-evaluator', hostname=hostname, pid=pid, thread=current_thread, older_than=60 * 30, wait=graceful_stop.wait)
 
     while not graceful_stop.is_set():
         try:
@@ -70,7 +70,8 @@ def re_evaluator(once=False):
             dids = get_updated_dids(total_workers=heartbeat['nr_threads'] - 1,
                                     worker_number=heartbeat['assign_thread'],
                                     limit=100,
-                                    blacklisted_dids=[key for key in paused_dids])
+                                    blacklisted_dids=[key for key in paused_dids],
+                                    buckets=heartbeat['buckets'])
             logging.debug('re_evaluator[%s/%s] index query time %f fetch size is %d' % (heartbeat['assign_thread'], heartbeat['nr_threads'] - 1, time.time() - start, len(dids)))
 
             # If the list is empty, sent the worker to sleep
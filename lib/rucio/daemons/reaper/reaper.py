@@ -20,6 +20,7 @@ import hashlib
 import logging
 import math
 import os
+import Queue
 import random
 import socket
 import sys
@@ -27,6 +28,8 @@ import threading
 import time
 import traceback
 
+from ConfigParser import NoOptionError, NoSectionError
+
 from rucio.db.sqla.constants import ReplicaState
 from rucio.common.config import config_get
 from rucio.common.exception import (SourceNotFound, ServiceUnavailable, RSEAccessDenied,
@@ -37,9 +40,9 @@ from rucio.common.utils import chunks
 from rucio.core import monitor
 from rucio.core import rse as rse_core
 from rucio.core.heartbeat import live, die, sanity_check
+from rucio.core.deletion_candidates import list_deletion_candidates, requeue_deletion_candidates
 from rucio.core.message import add_message
-from rucio.core.replica import (list_unlocked_replicas, update_replicas_states,
-                                delete_replicas)
+from rucio.core.replica import update_replicas_states, delete_replicas
 from rucio.core.rse import get_rse_attribute, sort_rses
 from rucio.core.rse_expression_parser import parse_expression
 from rucio.rse import rsemanager as rsemgr
@@ -53,6 +56,287 @@ logging.basicConfig(stream=sys.stdout,
 
 GRACEFUL_STOP = threading.Event()
 
+try:
+    SLOW_DELETION_THRESHOLD = float(config_get('reaper', 'slow_deletion_threshold'))
+except (NoOptionError, NoSectionError):
+    SLOW_DELETION_THRESHOLD = 10.0
+
+try:
+    MAX_DELETION_BACKOFF = float(config_get('reaper', 'max_deletion_backoff'))
+except (NoOptionError, NoSectionError):
+    MAX_DELETION_BACKOFF = 60.0
+
+
+class RSEDeletionState(object):
+    """
+    The pooled protocols and the in-flight window of the deletions on one RSE.
+    """
+
+    def __init__(self, rse_info, max_inflight):
+        self.rse_info = rse_info
+        self.window = max_inflight
+        self.backoff = 0
+        self.inflight = 0
+        self.protocols = Queue.Queue()
+
+
+class DeletionExecutor(object):
+    """
+    Deletes replicas with up to max_inflight concurrent deletions per RSE.
+
+    The worker threads, the catalog thread and the pools of connected protocol instances
+    live as long as the executor, so one executor is reused by a reaper thread for all its
+    RSEs and cycles. When a deletion is slower than slow_threshold seconds or the storage
+    is temporarily unavailable, the number of deletions in flight on the RSE is halved and
+    new deletions are delayed by an exponential backoff; every fast deletion lets the window
+    grow again by one. The deleted replicas are removed from the catalog in batches.
+    """
+
+    def __init__(self, scheme=None, max_inflight=10, chunk_size=100,
+                 slow_threshold=SLOW_DELETION_THRESHOLD, max_backoff=MAX_DELETION_BACKOFF, prefix='Reaper'):
+        """
+        Start the deletion and catalog threads.
+
+        :param scheme:          Force the deletion protocol, e.g., mock.
+        :param max_inflight:    Maximum number of concurrent deletions.
+        :param chunk_size:      Number of replicas removed from the catalog at once.
+        :param slow_threshold:  Seconds above which a deletion is considered slow.
+        :param max_backoff:     Maximum delay in seconds before a new deletion.
+        :param prefix:          Prefix of the log messages.
+        """
+        self.scheme = scheme
+        self.max_inflight = max(1, max_inflight)
+        self.chunk_size = chunk_size
+        self.slow_threshold = slow_threshold
+        self.max_backoff = max_backoff
+        self.prefix = prefix
+        self.deleted = 0
+        self.__states = {}
+        self.__condition = threading.Condition()
+        self.__replicas = Queue.Queue()
+        self.__done = Queue.Queue()
+        self.__workers = [threading.Thread(target=self.__delete_worker) for i in xrange(self.max_inflight)]
+        self.__catalog = threading.Thread(target=self.__catalog_worker)
+        for thread in self.__workers + [self.__catalog]:
+            thread.daemon = True
+            thread.start()
+
+    def state(self, rse_info):
+        """
+        The deletion state of an RSE. It is reset, and its idle protocols closed, when the RSE settings change.
+
+        :param rse_info:  The RSE settings, as returned by rsemanager.get_rse_info.
+        :returns:         The RSEDeletionState.
+        """
+        state = self.__states.get(rse_info['rse'])
+        if state is None or state.rse_info != rse_info:
+            if state is not None:
+                self.__close_protocols(state)
+            state = RSEDeletionState(rse_info, self.max_inflight)
+            self.__states[rse_info['rse']] = state
+        return state
+
+    def submit(self, rse_info, replicas, catalog_only=False):
+        """
+        Queue replicas for deletion.
+
+        :param rse_info:      The RSE settings, as returned by rsemanager.get_rse_info.
+        :param replicas:      List of replica dictionaries with scope, name, bytes, state and pfn.
+        :param catalog_only:  If True, only remove the replicas from the catalog.
+        """
+        state = self.state(rse_info)
+        for replica in replicas:
+            self.__replicas.put((state, replica, catalog_only))
+
+    def wait(self):
+        """
+        Wait for the queued deletions and their catalog updates.
+
+        :returns:  The number of replicas removed from the catalog since the last wait.
+        """
+        self.__replicas.join()
+        self.__done.put(None)
+        self.__done.join()
+        deleted, self.deleted = self.deleted, 0
+        return deleted
+
+    def close(self):
+        """
+        Wait for the queued deletions, stop the threads and close the pooled protocols.
+
+        :returns:  The number of replicas removed from the catalog since the last wait.
+        """
+        deleted = self.wait()
+        for thread in self.__workers:
+            self.__replicas.put(None)
+        for thread in self.__workers:
+            thread.join()
+        self.__done.put(False)
+        self.__catalog.join()
+        for state in self.__states.values():
+            self.__close_protocols(state)
+        return deleted
+
+    def __close_protocols(self, state):
+        while True:
+            try:
+                state.protocols.get_nowait().close()
+            except Queue.Empty:
+                break
+            except Exception:
+                logging.warning('%s: Failed to close protocol on %s: %s', self.prefix, state.rse_info['rse'], traceback.format_exc())
+
+    def __get_protocol(self, state):
+        try:
+            return state.protocols.get_nowait()
+        except Queue.Empty:
+            prot = rsemgr.create_protocol(state.rse_info, 'delete', scheme=self.scheme)
+            prot.connect()
+            return prot
+
+    def __discard_protocol(self, prot):
+        try:
+            prot.close()
+        except Exception:
+            pass
+
+    def __acquire(self, state):
+        with self.__condition:
+            while state.inflight >= state.window:
+                self.__condition.wait()
+            state.inflight += 1
+            backoff = state.backoff
+        if backoff:
+            time.sleep(backoff)
+
+    def __release(self, state):
+        with self.__condition:
+            state.inflight -= 1
+            self.__condition.notify_all()
+
+    def __adapt(self, state, slow):
+        with self.__condition:
+            if slow:
+                state.window = max(1, state.window / 2)
+                state.backoff = min(self.max_backoff, max(1, state.backoff * 2))
+                logging.warning('%s: Storage %s is slow, %s deletions in flight, backoff %s seconds', self.prefix, state.rse_info['rse'], state.window, state.backoff)
+            else:
+                state.window = min(self.max_inflight, state.window + 1)
+                state.backoff = 0
+            self.__condition.notify_all()
+
+    def __failed(self, rse, replica, reason):
+        add_message('deletion-failed', {'scope': replica['scope'],
+                                        'name': replica['name'],
+                                        'rse': rse,
+                                        'file-size': replica['bytes'],
+                                        'bytes': replica['bytes'],
+                                        'url': replica['pfn'],
+                                        'reason': reason})
+
+    def __delete(self, state, replica, catalog_only):
+        rse = state.rse_info['rse']
+        prot = None
+        try:
+            logging.info('%s: Deletion ATTEMPT of %s:%s as %s on %s', self.prefix, replica['scope'], replica['name'], replica['pfn'], rse)
+            start = time.time()
+            if catalog_only:
+                logging.warning('%s: Deletion STAGING of %s:%s as %s on %s, will only delete the catalog and not do physical deletion',
+                                self.prefix, replica['scope'], replica['name'], replica['pfn'], rse)
+            elif replica['pfn']:
+                prot = self.__get_protocol(state)
+                prot.delete(replica['pfn'])
+                monitor.record_timer('daemons.reaper.delete.%s.%s' % (prot.attributes['scheme'], rse), (time.time() - start) * 1000)
+            else:
+                logging.warning('%s: Deletion UNAVAILABLE of %s:%s as %s on %s', self.prefix, replica['scope'], replica['name'], replica['pfn'], rse)
+            duration = time.time() - start
+
+            self.__done.put((rse, {'scope': replica['scope'], 'name': replica['name']}))
+            add_message('deletion-done', {'scope': replica['scope'],
+                                          'name': replica['name'],
+                                          'rse': rse,
+                                          'file-size': replica['bytes'],
+                                          'bytes': replica['bytes'],
+                                          'url': replica['pfn'],
+                                          'duration': duration})
+            logging.info('%s: Deletion SUCCESS of %s:%s as %s on %s in %s seconds', self.prefix, replica['scope'], replica['name'], replica['pfn'], rse, duration)
+            if prot:
+                self.__adapt(state, slow=duration > self.slow_threshold)
+        except SourceNotFound:
+            err_msg = '%s: Deletion NOTFOUND of %s:%s as %s on %s' % (self.prefix, replica['scope'], replica['name'], replica['pfn'], rse)
+            logging.warning(err_msg)
+            self.__done.put((rse, {'scope': replica['scope'], 'name': replica['name']}))
+            if replica['state'] == ReplicaState.AVAILABLE:
+                self.__failed(rse, replica, str(err_msg))
+        except (ServiceUnavailable, RSEAccessDenied, ResourceTemporaryUnavailable) as error:
+            logging.warning('%s: Deletion NOACCESS of %s:%s as %s on %s: %s', self.prefix, replica['scope'], replica['name'], replica['pfn'], rse, str(error))
+            self.__failed(rse, replica, str(error))
+            if prot:
+                self.__discard_protocol(prot)
+                prot = None
+            self.__adapt(state, slow=True)
+        except Exception as error:
+            logging.critical('%s: Deletion CRITICAL of %s:%s as %s on %s: %s', self.prefix, replica['scope'], replica['name'], replica['pfn'], rse, str(traceback.format_exc()))
+            self.__failed(rse, replica, str(error))
+            if prot:
+                self.__discard_protocol(prot)
+                prot = None
+        if prot:
+            state.protocols.put(prot)
+
+    def __delete_worker(self):
+        while True:
+            task = self.__replicas.get()
+            try:
+                if task is None:
+                    break
+                state, replica, catalog_only = task
+                self.__acquire(state)
+                try:
+                    self.__delete(state, replica, catalog_only)
+                except Exception:
+                    logging.critical(traceback.format_exc())
+                finally:
+                    self.__release(state)
+            finally:
+                self.__replicas.task_done()
+
+    def __catalog_worker(self):
+        # None flushes the current batch, False also stops the thread
+        while True:
+            files, items = {}, []
+            item = self.__done.get()
+            items.append(item)
+            while item:
+                rse, replica = item
+                files.setdefault(rse, []).append(replica)
+                if len(items) >= self.chunk_size:
+                    break
+                try:
+                    item = self.__done.get(timeout=1)
+                    items.append(item)
+                except Queue.Empty:
+                    break
+            for rse, replicas in files.items():
+                self.__delete_replicas(rse, replicas)
+            for item in items:
+                self.__done.task_done()
+            if item is False:
+                break
+
+    def __delete_replicas(self, rse, files):
+        try:
+            start = time.time()
+            with monitor.record_timer_block('reaper.delete_replicas'):
+                delete_replicas(rse=rse, files=files)
+            logging.debug('%s: delete_replicas successes %s %s %s', self.prefix, rse, len(files), time.time() - start)
+            monitor.record_counter(counters='reaper.deletion.done', delta=len(files))
+            self.deleted += len(files)
+        except DatabaseException as error:
+            logging.warning('%s: DatabaseException %s', self.prefix, str(error))
+        except Exception:
+            logging.critical(traceback.format_exc())
+
 
 def __check_rse_usage(rse, rse_id):
     """
@@ -110,7 +394,7 @@ def __check_rse_usage(rse, rse_id):
 
 
 def reaper(rses, worker_number=1, child_number=1, total_children=1, chunk_size=100,
-           once=False, greedy=False, scheme=None, delay_seconds=0):
+           once=False, greedy=False, scheme=None, delay_seconds=0, max_inflight=10):
     """
     Main loop to select and delete files.
 
@@ -123,6 +407,8 @@ def reaper(rses, worker_number=1, child_number=1, total_children=1, chunk_size=1
     :param greedy: If True, delete right away replicas with tombstone.
     :param scheme: Force the reaper to use a particular protocol, e.g., mock.
     :param exclude_rses: RSE expression to exclude RSEs from the Reaper.
+    :param delay_seconds: Delay to retry failed deletion.
+    :param max_inflight: Maximum number of concurrent deletions per RSE.
     """
     logging.info('Starting Reaper: Worker %(worker_number)s, '
                  'child %(child_number)s will work on RSEs: ' % locals() + ', '.join([rse['rse'] for rse in rses]))
@@ -136,6 +422,9 @@ def reaper(rses, worker_number=1, child_number=1, total_children=1, chunk_size=1
     hash_executable = hashlib.sha256(sys.argv[0] + ''.join(rse_names)).hexdigest()
     sanity_check(executable=None, hostname=hostname)
 
+    # The executor, with its threads and pooled protocols, is reused across the RSEs and cycles
+    executor = DeletionExecutor(scheme=scheme, max_inflight=max_inflight, chunk_size=chunk_size,
+                                prefix='Reaper %s-%s' % (worker_number, child_number))
     nothing_to_do = {}
     while not GRACEFUL_STOP.is_set():
         try:
@@ -186,14 +475,14 @@ def reaper(rses, worker_number=1, child_number=1, total_children=1, chunk_size=1
                                 needed_free_space_per_child = needed_free_space / float(total_children)
 
                     start = time.time()
-                    with monitor.record_timer_block('reaper.list_unlocked_replicas'):
-                        replicas = list_unlocked_replicas(rse=rse['rse'], rse_id=rse['id'],
-                                                          bytes=needed_free_space_per_child,
-                                                          limit=max_being_deleted_files,
-                                                          worker_number=child_number,
-                                                          total_workers=total_children,
-                                                          delay_seconds=delay_seconds)
-                    logging.debug('Reaper %s-%s: list_unlocked_replicas on %s for %s bytes in %s seconds: %s replicas', worker_number, child_number, rse['rse'], needed_free_space_per_child, time.time() - start, len(replicas))
+                    with monitor.record_timer_block('reaper.list_deletion_candidates'):
+                        replicas = list_deletion_candidates(rse_id=rse['id'],
+                                                            bytes=needed_free_space_per_child,
+                                                            limit=max_being_deleted_files,
+                                                            worker_number=child_number,
+                                                            total_workers=total_children,
+                                                            delay_seconds=delay_seconds)
+                    logging.debug('Reaper %s-%s: list_deletion_candidates on %s for %s bytes in %s seconds: %s replicas', worker_number, child_number, rse['rse'], needed_free_space_per_child, time.time() - start, len(replicas))
 
                     if not replicas:
                         nothing_to_do[rse['id']] = datetime.datetime.now() + datetime.timedelta(minutes=30)
@@ -202,115 +491,42 @@ def reaper(rses, worker_number=1, child_number=1, total_children=1, chunk_size=1
                                      nothing_to_do[rse['id']])
                         continue
 
-                    prot = rsemgr.create_protocol(rse_info, 'delete', scheme=scheme)
-                    for files in chunks(replicas, chunk_size):
-                        logging.debug('Reaper %s-%s: Running on : %s', worker_number, child_number, str(files))
-                        try:
-                            update_replicas_states(replicas=[dict(replica.items() + [('state', ReplicaState.BEING_DELETED), ('rse_id', rse['id'])]) for replica in files], nowait=True)
-                            for replica in files:
-                                try:
-                                    replica['pfn'] = str(rsemgr.lfns2pfns(rse_settings=rse_info,
-                                                                          lfns=[{'scope': replica['scope'], 'name': replica['name'], 'path': replica['path']}],
-                                                                          operation='delete', scheme=scheme).values()[0])
-                                except (ReplicaUnAvailable, ReplicaNotFound) as error:
-                                    err_msg = 'Failed to get pfn UNAVAILABLE replica %s:%s on %s with error %s' % (replica['scope'], replica['name'], rse['rse'], str(error))
-                                    logging.warning('Reaper %s-%s: %s', worker_number, child_number, err_msg)
-                                    replica['pfn'] = None
-
-                                add_message('deletion-planned', {'scope': replica['scope'],
-                                                                 'name': replica['name'],
-                                                                 'file-size': replica['bytes'],
-                                                                 'bytes': replica['bytes'],
-                                                                 'url': replica['pfn'],
-                                                                 'rse': rse_info['rse']})
-
-                            monitor.record_counter(counters='reaper.deletion.being_deleted', delta=len(files))
-
+                    catalog_only = rse['staging_area'] or rse['rse'].endswith("STAGING")
+                    try:
+                        for files in chunks(replicas, chunk_size):
+                            logging.debug('Reaper %s-%s: Running on : %s', worker_number, child_number, str(files))
                             try:
-                                deleted_files = []
-                                prot.connect()
+                                update_replicas_states(replicas=[dict(replica.items() + [('state', ReplicaState.BEING_DELETED), ('rse_id', rse['id'])]) for replica in files], nowait=True)
                                 for replica in files:
                                     try:
-                                        logging.info('Reaper %s-%s: Deletion ATTEMPT of %s:%s as %s on %s', worker_number, child_number, replica['scope'], replica['name'], replica['pfn'], rse['rse'])
-                                        start = time.time()
-                                        if rse['staging_area'] or rse['rse'].endswith("STAGING"):
-                                            logging.warning('Reaper %s-%s: Deletion STAGING of %s:%s as %s on %s, will only delete the catalog and not do physical deletion',
-                                                            worker_number, child_number, replica['scope'], replica['name'], replica['pfn'], rse['rse'])
-                                        else:
-                                            if replica['pfn']:
-                                                prot.delete(replica['pfn'])
-                                            else:
-                                                logging.warning('Reaper %s-%s: Deletion UNAVAILABLE of %s:%s as %s on %s', worker_number, child_number, replica['scope'], replica['name'], replica['pfn'], rse['rse'])
-                                        monitor.record_timer('daemons.reaper.delete.%s.%s' % (prot.attributes['scheme'], rse['rse']), (time.time() - start) * 1000)
-                                        duration = time.time() - start
-
-                                        deleted_files.append({'scope': replica['scope'], 'name': replica['name']})
-
-                                        add_message('deletion-done', {'scope': replica['scope'],
-                                                                      'name': replica['name'],
-                                                                      'rse': rse_info['rse'],
-                                                                      'file-size': replica['bytes'],
-                                                                      'bytes': replica['bytes'],
-                                                                      'url': replica['pfn'],
-                                                                      'duration': duration})
-                                        logging.info('Reaper %s-%s: Deletion SUCCESS of %s:%s as %s on %s in %s seconds', worker_number, child_number, replica['scope'], replica['name'], replica['pfn'], rse['rse'], duration)
-                                    except SourceNotFound:
-                                        err_msg = 'Reaper %s-%s: Deletion NOTFOUND of %s:%s as %s on %s' % (worker_number, child_number, replica['scope'], replica['name'], replica['pfn'], rse['rse'])
-                                        logging.warning(err_msg)
-                                        deleted_files.append({'scope': replica['scope'], 'name': replica['name']})
-                                        if replica['state'] == ReplicaState.AVAILABLE:
-                                            add_message('deletion-failed', {'scope': replica['scope'],
-                                                                            'name': replica['name'],
-                                                                            'rse': rse_info['rse'],
-                                                                            'file-size': replica['bytes'],
-                                                                            'bytes': replica['bytes'],
-                                                                            'url': replica['pfn'],
-                                                                            'reason': str(err_msg)})
-                                    except (ServiceUnavailable, RSEAccessDenied, ResourceTemporaryUnavailable) as error:
-                                        logging.warning('Reaper %s-%s: Deletion NOACCESS of %s:%s as %s on %s: %s', worker_number, child_number, replica['scope'], replica['name'], replica['pfn'], rse['rse'], str(error))
-                                        add_message('deletion-failed', {'scope': replica['scope'],
-                                                                        'name': replica['name'],
-                                                                        'rse': rse_info['rse'],
-                                                                        'file-size': replica['bytes'],
-                                                                        'bytes': replica['bytes'],
-                                                                        'url': replica['pfn'],
-                                                                        'reason': str(error)})
-                                    except Exception as error:
-                                        logging.critical('Reaper %s-%s: Deletion CRITICAL of %s:%s as %s on %s: %s', worker_number, child_number, replica['scope'], replica['name'], replica['pfn'], rse['rse'], str(traceback.format_exc()))
-                                        add_message('deletion-failed', {'scope': replica['scope'],
-                                                                        'name': replica['name'],
-                                                                        'rse': rse_info['rse'],
-                                                                        'file-size': replica['bytes'],
-                                                                        'bytes': replica['bytes'],
-                                                                        'url': replica['pfn'],
-                                                                        'reason': str(error)})
-                                    except:
-                                        logging.critical('Reaper %s-%s: Deletion CRITICAL of %s:%s as %s on %s: %s', worker_number, child_number, replica['scope'], replica['name'], replica['pfn'], rse['rse'], str(traceback.format_exc()))
-                            except (ServiceUnavailable, RSEAccessDenied, ResourceTemporaryUnavailable) as error:
-                                for replica in files:
-                                    logging.warning('Reaper %s-%s: Deletion NOACCESS of %s:%s as %s on %s: %s', worker_number, child_number, replica['scope'], replica['name'], replica['pfn'], rse['rse'], str(error))
-                                    add_message('deletion-failed', {'scope': replica['scope'],
-                                                                    'name': replica['name'],
-                                                                    'rse': rse_info['rse'],
-                                                                    'file-size': replica['bytes'],
-                                                                    'bytes': replica['bytes'],
-                                                                    'url': replica['pfn'],
-                                                                    'reason': str(error)})
-                                    break
-                            finally:
-                                prot.close()
-                            start = time.time()
-                            with monitor.record_timer_block('reaper.delete_replicas'):
-                                delete_replicas(rse=rse['rse'], files=deleted_files)
-                            logging.debug('Reaper %s-%s: delete_replicas successes %s %s %s', worker_number, child_number, rse['rse'], len(deleted_files), time.time() - start)
-                            monitor.record_counter(counters='reaper.deletion.done', delta=len(deleted_files))
-
-                        except DatabaseException as error:
-                            logging.warning('Reaper %s-%s: DatabaseException %s', worker_number, child_number, str(error))
-                        except UnsupportedOperation as error:
-                            logging.warning('Reaper %s-%s: UnsupportedOperation %s', worker_number, child_number, str(error))
-                        except:
-                            logging.critical(traceback.format_exc())
+                                        replica['pfn'] = str(rsemgr.lfns2pfns(rse_settings=rse_info,
+                                                                              lfns=[{'scope': replica['scope'], 'name': replica['name'], 'path': replica['path']}],
+                                                                              operation='delete', scheme=scheme).values()[0])
+                                    except (ReplicaUnAvailable, ReplicaNotFound) as error:
+                                        err_msg = 'Failed to get pfn UNAVAILABLE replica %s:%s on %s with error %s' % (replica['scope'], replica['name'], rse['rse'], str(error))
+                                        logging.warning('Reaper %s-%s: %s', worker_number, child_number, err_msg)
+                                        replica['pfn'] = None
+
+                                    add_message('deletion-planned', {'scope': replica['scope'],
+                                                                     'name': replica['name'],
+                                                                     'file-size': replica['bytes'],
+                                                                     'bytes': replica['bytes'],
+                                                                     'url': replica['pfn'],
+                                                                     'rse': rse_info['rse']})
+
+                                monitor.record_counter(counters='reaper.deletion.being_deleted', delta=len(files))
+                                executor.submit(rse_info, files, catalog_only=catalog_only)
+
+                            except (DatabaseException, UnsupportedOperation) as error:
+                                logging.warning('Reaper %s-%s: %s %s', worker_number, child_number, type(error).__name__, str(error))
+                                # The replicas were not marked BEING_DELETED, they are tried again on the next cycle
+                                requeue_deletion_candidates(rse_id=rse['id'], replicas=files, worker_number=child_number,
+                                                            total_workers=total_children, delay_seconds=delay_seconds)
+                            except:
+                                logging.critical(traceback.format_exc())
+                    finally:
+                        deleted = executor.wait()
+                        logging.info('Reaper %s-%s: %s replicas deleted on %s', worker_number, child_number, deleted, rse['rse'])
 
                 except RSENotFound as error:
                     logging.warning('Reaper %s-%s: RSE not found %s', worker_number, child_number, str(error))
@@ -328,6 +544,7 @@ def reaper(rses, worker_number=1, child_number=1, total_children=1, chunk_size=1
         except:
             logging.critical(traceback.format_exc())
 
+    executor.close()
     die(executable=executable, hostname=hostname, pid=pid, thread=thread, hash_executable=hash_executable)
     logging.info('Graceful stop requested')
     logging.info('Graceful stop done')
@@ -341,7 +558,7 @@ def stop(signum=None, frame=None):
     GRACEFUL_STOP.set()
 
 
-def run(total_workers=1, chunk_size=100, threads_per_worker=None, once=False, greedy=False, rses=[], scheme=None, exclude_rses=None, include_rses=None, delay_seconds=0):
+def run(total_workers=1, chunk_size=100, threads_per_worker=None, once=False, greedy=False, rses=[], scheme=None, exclude_rses=None, include_rses=None, delay_seconds=0, max_inflight=10):
     """
     Starts up the reaper threads.
 
@@ -354,6 +571,8 @@ def run(total_workers=1, chunk_size=100, threads_per_worker=None, once=False, gr
     :param scheme: Force the reaper to use a particular protocol/scheme, e.g., mock.
     :param exclude_rses: RSE expression to exclude RSEs from the Reaper.
     :param include_rses: RSE expression to include RSEs.
+    :param delay_seconds: Delay to retry failed deletion.
+    :param max_inflight: Maximum number of concurrent deletions per RSE.
     """
     logging.info('main: starting processes')
 
@@ -390,6 +609,7 @@ def run(total_workers=1, chunk_size=100, threads_per_worker=None, once=False, gr
                       'greedy': greedy,
                       'rses': rses_list,
                       'delay_seconds': delay_seconds,
+                      'max_inflight': max_inflight,
                       'scheme': scheme}
             threads.append(threading.Thread(target=reaper, kwargs=kwargs, name='Worker: %s, child: %s' % (worker, child + 1)))
     [t.start() for t in threads]
@@ -14,6 +14,7 @@
 This daemon consumes tracer messages from ActiveMQ and updates the atime for replicas.
 """
 
+from ConfigParser import NoOptionError, NoSectionError
 from datetime import datetime
 from dns import resolver
 import logging
@@ -21,7 +22,7 @@ from os import getpid
 from socket import gethostname
 from ssl import PROTOCOL_TLSv1
 from sys import stdout
-from threading import Event, Thread, current_thread
+from threading import Event, Lock, Thread, current_thread
 from time import sleep, time
 from traceback import format_exc
 from Queue import Queue
@@ -30,11 +31,12 @@ from json import loads as jloads, dumps as jdumps
 from stomp import Connection
 
 from rucio.common.config import config_get, config_get_bool, config_get_int
+from rucio.common.utils import LRUCache
 from rucio.core.monitor import record_counter, record_timer
 from rucio.core.did import touch_dids, list_parent_dids
 from rucio.core.heartbeat import live, die, sanity_check
 from rucio.core.lock import touch_dataset_locks
-from rucio.core.replica import touch_replica, touch_collection_replicas
+from rucio.core.replica import touch_replica, touch_replicas, touch_collection_replicas
 from rucio.db.sqla.constants import DIDType
 
 logging.getLogger("stomp").setLevel(logging.CRITICAL)
@@ -47,7 +49,17 @@ graceful_stop = Event()
 
 
 class AMQConsumer(object):
-    def __init__(self, broker, conn, queue, chunksize, subscription_id, excluded_usrdns, dataset_queue):
+    """
+    Consumes the tracer reports of one broker connection.
+
+    The accesses are coalesced per (scope, name, rse) and per (dataset, rse), keeping the
+    latest access time, and flushed every atime_window seconds or once max_replicas
+    replicas are buffered. The replicas are then touched with one bulk update per RSE,
+    falling back to one update per replica if rows are locked. A report is acknowledged
+    only after the flush of its accesses.
+    """
+
+    def __init__(self, broker, conn, queue, chunksize, subscription_id, excluded_usrdns, dataset_queue, parent_cache=None, atime_window=60, max_replicas=10000):
         self.__broker = broker
         self.__conn = conn
         self.__queue = queue
@@ -60,6 +72,15 @@ class AMQConsumer(object):
         # exclude specific usrdns like GangaRBT
         self.__excluded_usrdns = excluded_usrdns
         self.__dataset_queue = dataset_queue
+        self.__parent_cache = parent_cache if parent_cache is not None else LRUCache(maxsize=100000)
+        self.__atime_window = atime_window
+        self.__max_replicas = max_replicas
+        self.__lock = Lock()
+        self.__pending_ids = []
+        self.__replicas = {}
+        self.__datasets = {}
+        self.__accesses = 0
+        self.__buffered_at = None
 
     def on_error(self, headers, message):
         record_counter('daemons.tracer.kronos.error')
@@ -101,18 +122,60 @@ class AMQConsumer(object):
 
         if len(self.__ids) >= self.__chunksize:
             self.__update_atime()
-            for id in self.__ids:
-                self.__conn.ack(id, self.__subscription_id)
-
             self.__reports = []
             self.__ids = []
+            self.flush()
+
+    def flush(self, force=False):
+        """
+        Touch the buffered replicas and datasets if the window expired, the buffer is full or if forced.
+
+        :param force: Flush the buffered accesses in any case.
+        """
+        with self.__lock:
+            if not self.__pending_ids:
+                return
+            if not force and len(self.__replicas) < self.__max_replicas and time() - self.__buffered_at < self.__atime_window:
+                return
+            ids, replicas, datasets, accesses = self.__pending_ids, self.__replicas, self.__datasets, self.__accesses
+            self.__pending_ids, self.__replicas, self.__datasets, self.__accesses, self.__buffered_at = [], {}, {}, 0, None
+
+        record_counter('daemons.tracer.kronos.coalesced', accesses - len(replicas))
+        for dataset in datasets.values():
+            self.__dataset_queue.put(dataset)
+        self.__touch_replicas(replicas.values())
+        for id in ids:
+            try:
+                self.__conn.ack(id, self.__subscription_id)
+            except:
+                logging.warning('(kronos_file) failed to acknowledge message %s: %s' % (id, format_exc()))
+
+    def __get_parent_datasets(self, scope, name):
+        """
+        Get the parent datasets of a file, from the cache if possible.
+        """
+        parents = self.__parent_cache.get((scope, name))
+        if parents is None:
+            parents = []
+            for did in list_parent_dids(scope, name):
+                if did['type'] != DIDType.DATASET:
+                    continue
+                # do not update _dis datasets
+                if did['scope'] == 'panda' and '_dis' in did['name']:
+                    continue
+                parents.append({'scope': did['scope'], 'name': did['name'], 'type': did['type']})
+            self.__parent_cache.set((scope, name), parents)
+            record_counter('daemons.tracer.kronos.parent_cache.miss')
+        else:
+            record_counter('daemons.tracer.kronos.parent_cache.hit')
+        return parents
 
     def __update_atime(self):
         """
-        Bulk update atime.
+        Coalesce the accesses of the reports into the buffer.
         """
         replicas = []
-        rses = []
+        datasets = []
         for report in self.__reports:
             try:
                 # check if scope in report. if not skip this one.
@@ -165,44 +228,71 @@ class AMQConsumer(object):
                         report['filename'] = report['name']
 
                 rses = report['remoteSite'].strip().split(',')
+                accessed_at = datetime.utcfromtimestamp(report['traceTimeentryUnix'])
                 for rse in rses:
-                    replicas.append({'name': report['filename'], 'scope': report['scope'], 'rse': rse, 'accessed_at': datetime.utcfromtimestamp(report['traceTimeentryUnix']),
+                    replicas.append({'name': report['filename'], 'scope': report['scope'], 'rse': rse, 'accessed_at': accessed_at,
                                      'traceTimeentryUnix': report['traceTimeentryUnix'], 'eventVersion': report['eventVersion']})
             except (KeyError, AttributeError):
                 logging.error(format_exc())
                 record_counter('daemons.tracer.kronos.report_error')
                 continue
 
-            for did in list_parent_dids(report['scope'], report['filename']):
-                if did['type'] != DIDType.DATASET:
-                    continue
-                # do not update _dis datasets
-                if did['scope'] == 'panda' and '_dis' in did['name']:
-                    continue
+            for did in self.__get_parent_datasets(report['scope'], report['filename']):
                 for rse in rses:
-                    self.__dataset_queue.put({'scope': did['scope'], 'name': did['name'], 'did_type': did['type'], 'rse': rse, 'accessed_at': datetime.utcfromtimestamp(report['traceTimeentryUnix'])})
-
-        logging.debug(replicas)
+                    datasets.append({'scope': did['scope'], 'name': did['name'], 'did_type': did['type'], 'rse': rse, 'accessed_at': accessed_at})
 
-        try:
-            ts = time()
+        with self.__lock:
+            if not self.__pending_ids:
+                self.__buffered_at = time()
+            self.__pending_ids.extend(self.__ids)
+            self.__accesses += len(replicas)
             for replica in replicas:
-                # if touch replica hits a locked row put the trace back into queue for later retry
-                if not touch_replica(replica):
-                    resubmit = {'filename': replica['name'], 'scope': replica['scope'], 'remoteSite': replica['rse'], 'traceTimeentryUnix': replica['traceTimeentryUnix'],
-                                'eventType': 'get', 'usrdn': 'someuser', 'clientState': 'DONE', 'eventVersion': replica['eventVersion']}
-                    self.__conn.send(body=jdumps(resubmit), destination=self.__queue, headers={'appversion': 'rucio', 'resubmitted': '1'})
-                    record_counter('daemons.tracer.kronos.sent_resubmitted')
-                    logging.warning('(kronos_file) hit locked row, resubmitted to queue')
-            record_timer('daemons.tracer.kronos.update_atime', (time() - ts) * 1000)
-        except:
-            logging.error(format_exc())
-            record_counter('daemons.tracer.kronos.update_error')
+                key = (replica['scope'], replica['name'], replica['rse'])
+                if key not in self.__replicas or self.__replicas[key]['accessed_at'] < replica['accessed_at']:
+                    self.__replicas[key] = replica
+            for dataset in datasets:
+                key = (dataset['scope'], dataset['name'], dataset['rse'])
+                if key not in self.__datasets or self.__datasets[key]['accessed_at'] < dataset['accessed_at']:
+                    self.__datasets[key] = dataset
+
+    def __resubmit(self, replica):
+        """
+        Put the trace of a replica back into the queue for later retry.
+        """
+        resubmit = {'filename': replica['name'], 'scope': replica['scope'], 'remoteSite': replica['rse'], 'traceTimeentryUnix': replica['traceTimeentryUnix'],
+                    'eventType': 'get', 'usrdn': 'someuser', 'clientState': 'DONE', 'eventVersion': replica['eventVersion']}
+        self.__conn.send(body=jdumps(resubmit), destination=self.__queue, headers={'appversion': 'rucio', 'resubmitted': '1'})
+        record_counter('daemons.tracer.kronos.sent_resubmitted')
+        logging.warning('(kronos_file) hit locked row, resubmitted to queue')
+
+    def __touch_replicas(self, replicas):
+        """
+        Touch the replicas with one bulk update per RSE.
+        """
+        ts = time()
+        rses = {}
+        for replica in replicas:
+            rses.setdefault(replica['rse'], []).append(replica)
+
+        for rse, rse_replicas in rses.items():
+            try:
+                if touch_replicas(rse_replicas):
+                    continue
+                record_counter('daemons.tracer.kronos.bulk_locked')
+                # if the bulk update hits a locked row, touch the replicas one by one
+                # and put the traces of the locked ones back into queue for later retry
+                for replica in rse_replicas:
+                    if not touch_replica(replica):
+                        self.__resubmit(replica)
+            except:
+                logging.error(format_exc())
+                record_counter('daemons.tracer.kronos.update_error')
+        record_timer('daemons.tracer.kronos.update_atime', (time() - ts) * 1000)
 
-        logging.info('(kronos_file) updated %d replicas' % len(replicas))
+        logging.info('(kronos_file) updated %d replicas on %d rses' % (len(replicas), len(rses)))
 
 
-def kronos_file(once=False, thread=0, brokers_resolved=None, dataset_queue=None):
+def kronos_file(once=False, thread=0, brokers_resolved=None, dataset_queue=None, parent_cache=None):
     """
     Main loop to consume tracer reports.
     """
@@ -229,6 +319,16 @@ def kronos_file(once=False, thread=0, brokers_resolved=None, dataset_queue=None)
 
     excluded_usrdns = set(config_get('tracer-kronos', 'excluded_usrdns').split(','))
 
+    try:
+        atime_window = config_get_int('tracer-kronos', 'atime_window')
+    except (NoOptionError, NoSectionError):
+        atime_window = 60
+
+    try:
+        max_replicas = config_get_int('tracer-kronos', 'atime_max_replicas')
+    except (NoOptionError, NoSectionError):
+        max_replicas = 10000
+
     conns = []
     for broker in brokers_resolved:
         if not use_ssl:
@@ -245,6 +345,7 @@ def kronos_file(once=False, thread=0, brokers_resolved=None, dataset_queue=None)
 
     logging.info('(kronos_file) tracer consumer started')
 
+    listeners = {}
     sanity_check(executable='kronos-file', hostname=hostname)
     while not graceful_stop.is_set():
         live(executable='kronos-file', hostname=hostname, pid=pid, thread=thread)
@@ -252,23 +353,40 @@ def kronos_file(once=False, thread=0, brokers_resolved=None, dataset_queue=None)
             if not conn.is_connected():
                 logging.info('(kronos_file) connecting to %s' % conn.transport._Transport__host_and_ports[0][0])
                 record_counter('daemons.tracer.kronos.reconnect.%s' % conn.transport._Transport__host_and_ports[0][0].split('.')[0])
-                conn.set_listener('rucio-tracer-kronos', AMQConsumer(broker=conn.transport._Transport__host_and_ports[0],
-                                                                     conn=conn,
-                                                                     queue=config_get('tracer-kronos', 'queue'),
-                                                                     chunksize=chunksize,
-                                                                     subscription_id=subscription_id,
-                                                                     excluded_usrdns=excluded_usrdns,
-                                                                     dataset_queue=dataset_queue))
+                listeners[conn] = AMQConsumer(broker=conn.transport._Transport__host_and_ports[0],
+                                              conn=conn,
+                                              queue=config_get('tracer-kronos', 'queue'),
+                                              chunksize=chunksize,
+                                              subscription_id=subscription_id,
+                                              excluded_usrdns=excluded_usrdns,
+                                              dataset_queue=dataset_queue,
+                                              parent_cache=parent_cache,
+                                              atime_window=atime_window,
+                                              max_replicas=max_replicas)
+                conn.set_listener('rucio-tracer-kronos', listeners[conn])
                 conn.start()
                 if not use_ssl:
                     conn.connect(username, password)
                 else:
                     conn.connect()
                 conn.subscribe(destination=config_get('tracer-kronos', 'queue'), ack='client-individual', id=subscription_id, headers={'activemq.prefetchSize': prefetch_size})
+
+        # flush the accesses of brokers which are not sending enough reports to fill the buffer
+        for listener in listeners.values():
+            try:
+                listener.flush()
+            except:
+                logging.error(format_exc())
         sleep(1)
 
     logging.info('(kronos_file) graceful stop requested')
 
+    for listener in listeners.values():
+        try:
+            listener.flush(force=True)
+        except:
+            logging.error(format_exc())
+
     for conn in conns:
         try:
             conn.disconnect()
@@ -391,13 +509,18 @@ def run(once=False, threads=1):
     logging.debug('brokers resolved to %s', brokers_resolved)
 
     dataset_queue = Queue()
+    try:
+        parent_cache = LRUCache(maxsize=config_get_int('tracer-kronos', 'parent_cache_size'))
+    except (NoOptionError, NoSectionError):
+        parent_cache = LRUCache(maxsize=100000)
     logging.info('starting tracer consumer threads')
 
     thread_list = []
     for i in xrange(0, threads):
         thread_list.append(Thread(target=kronos_file, kwargs={'thread': i,
                                                               'brokers_resolved': brokers_resolved,
-                                                              'dataset_queue': dataset_queue}))
+                                                              'dataset_queue': dataset_queue,
+                                                              'parent_cache': parent_cache}))
         thread_list.append(Thread(target=kronos_dataset, kwargs={'thread': i,
                                                                  'dataset_queue': dataset_queue}))
 
@@ -191,3 +191,4 @@ class SubscriptionState(DeclEnum):
 # Individual constants
 
 OBSOLETE = datetime(year=1970, month=1, day=1)  # Tombstone value to mark obsolete replicas.
+PARTITION_BUCKETS = 1024  # Number of buckets the hash-sharded work queues are partitioned into.
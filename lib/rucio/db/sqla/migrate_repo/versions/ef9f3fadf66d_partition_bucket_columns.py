@@ -0,0 +1,83 @@
+# Copyright European Organization for Nuclear Research (CERN)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+
+"""partition bucket columns
+
+Revision ID: ef9f3fadf66d
+Revises: e59300c8b179
+Create Date: 2017-06-12 10:21:43.164327
+
+"""
+
+from alembic.op import add_column, create_index, drop_column, drop_index, execute, get_bind
+from alembic import context
+import sqlalchemy as sa
+
+from rucio.common.utils import chunks
+from rucio.db.sqla.constants import PARTITION_BUCKETS
+from rucio.db.sqla.models import partition_bucket
+
+# revision identifiers, used by Alembic.
+revision = 'ef9f3fadf66d'
+down_revision = 'e59300c8b179'
+
+# table, column the bucket is computed from, index
+TABLES = (('replicas', 'name', 'REPLICAS_BUCKET_IDX'),
+          ('dids', 'name', 'DIDS_BUCKET_IDX'),
+          ('updated_dids', 'name', 'UPDATED_DIDS_BUCKET_IDX'),
+          ('messages', 'id', 'MESSAGES_BUCKET_IDX'),
+          ('requests', 'rule_id', 'REQUESTS_BUCKET_IDX'))
+
+# The rows of one DID in updated_dids must have the bucket computed on insert by rucio.db.sqla.models,
+# otherwise two judge-evaluators process the same DID while rows from before the upgrade remain
+EXACT_TABLES = ('updated_dids', )
+
+# For the names MySQL computes the same crc32 as rucio.db.sqla.models, the other hashes only give a stable bucket
+HASHES = {'oracle': 'ORA_HASH(%(column)s, %(buckets)s - 1)',
+          'mysql': 'mod(crc32(%(column)s), %(buckets)s)',
+          'postgresql': 'abs(mod((\'x\'||md5(%(column)s::text))::bit(32)::int, %(buckets)s))'}
+
+
+def backfill(table, column):
+    '''
+    Fill the buckets of the existing rows with rucio.db.sqla.models.partition_bucket.
+    '''
+    bind = get_bind()
+    tab = sa.sql.table(table, sa.sql.column(column), sa.sql.column('bucket'))
+    values = {}
+    for value, in bind.execute(sa.select([tab.c[column]]).distinct()):
+        values.setdefault(partition_bucket(value), []).append(value)
+    for bucket, bucket_values in values.iteritems():
+        for chunk in chunks(bucket_values, 1000):
+            bind.execute(tab.update().where(tab.c[column].in_(chunk)).values(bucket=bucket))
+
+
+def upgrade():
+    '''
+    upgrade method
+    '''
+    dialect = context.get_context().dialect.name
+    if dialect != 'sqlite':
+        for table, column, index in TABLES:
+            add_column(table, sa.Column('bucket', sa.SmallInteger))
+            # The rows of the other tables are processed one by one, a stable bucket is enough
+            if table in EXACT_TABLES and dialect != 'mysql':
+                backfill(table, column)
+            elif dialect in HASHES:
+                execute('UPDATE %s SET bucket = coalesce(%s, 0)' % (table, HASHES[dialect] % {'column': column, 'buckets': PARTITION_BUCKETS}))
+            create_index(index, table, ['bucket'])
+        add_column('requests_history', sa.Column('bucket', sa.SmallInteger))
+
+
+def downgrade():
+    '''
+    downgrade method
+    '''
+    if context.get_context().dialect.name != 'sqlite':
+        for table, column, index in TABLES:
+            drop_index(index, table)
+            drop_column(table, 'bucket')
+        drop_column('requests_history', 'bucket')
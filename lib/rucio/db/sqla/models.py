@@ -18,6 +18,7 @@ SQLAlchemy models for rucio data
 """
 import datetime
 import uuid
+import zlib
 
 from sqlalchemy import BigInteger, Boolean, Column, DateTime, Float, Integer, SmallInteger, String as _String, event, UniqueConstraint
 from sqlalchemy.engine import Engine
@@ -32,12 +33,38 @@ from rucio.common import utils
 from rucio.db.sqla.constants import (AccountStatus, AccountType, DIDAvailability, DIDType, DIDReEvaluation,
                                      KeyType, IdentityType, LockState, RuleGrouping, BadFilesStatus,
                                      RuleState, ReplicaState, RequestState, RequestType, RSEType,
-                                     ScopeStatus, SubscriptionState, RuleNotification, LifetimeExceptionsState)
+                                     ScopeStatus, SubscriptionState, RuleNotification, LifetimeExceptionsState,
+                                     PARTITION_BUCKETS)
 from rucio.db.sqla.history import Versioned
 from rucio.db.sqla.session import BASE
 from rucio.db.sqla.types import GUID, BooleanString
 
 
+def partition_bucket(value):
+    """
+    Return the work partition bucket of a value, between 0 and PARTITION_BUCKETS - 1.
+
+    :param value: The value to hash, e.g. a name or an id.
+    :returns: The bucket as an integer.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return (zlib.crc32(str(value)) & 0xffffffff) % PARTITION_BUCKETS
+
+
+def _partition_bucket_default(key):
+    """
+    Column default filling the partition bucket from another column of the inserted row.
+
+    :param key: The column the bucket is computed from.
+    """
+    def default(context):
+        return partition_bucket(context.current_parameters.get(key))
+    return default
+
+
 # Recipe to for str instead if unicode
 # https://groups.google.com/forum/#!msg/sqlalchemy/8Xn31vBfGKU/bAGLNKapvSMJ
 def String(*arg, **kw):
@@ -351,6 +378,7 @@ class DataIdentifier(BASE, ModelBase):
     eol_at = Column(DateTime)
     is_archive = Column(Boolean(name='DIDS_ARCHIVE_CHK'))
     constituent = Column(Boolean(name='DIDS_CONSTITUENT_CHK'))
+    bucket = Column(SmallInteger, default=_partition_bucket_default('name'))
     _table_args = (PrimaryKeyConstraint('scope', 'name', name='DIDS_PK'),
                    ForeignKeyConstraint(['account'], ['accounts.account'], ondelete='CASCADE', name='DIDS_ACCOUNT_FK'),
                    ForeignKeyConstraint(['scope'], ['scopes.scope'], name='DIDS_SCOPE_FK'),
@@ -361,7 +389,8 @@ class DataIdentifier(BASE, ModelBase):
                    CheckConstraint('PURGE_REPLICAS IS NOT NULL', name='DIDS_PURGE_REPLICAS_NN'),
                    # UniqueConstraint('guid', name='DIDS_GUID_UQ'),
                    Index('DIDS_IS_NEW_IDX', 'is_new'),
-                   Index('DIDS_EXPIRED_AT_IDX', 'expired_at'))
+                   Index('DIDS_EXPIRED_AT_IDX', 'expired_at'),
+                   Index('DIDS_BUCKET_IDX', 'bucket'))
 
 
 class DeletedDataIdentifier(BASE, ModelBase):
@@ -418,10 +447,12 @@ class UpdatedDID(BASE, ModelBase):
     scope = Column(String(25))
     name = Column(String(255))
     rule_evaluation_action = Column(DIDReEvaluation.db_type(name='UPDATED_DIDS_RULE_EVAL_ACT_CHK'))
+    bucket = Column(SmallInteger, default=_partition_bucket_default('name'))
     _table_args = (PrimaryKeyConstraint('id', name='UPDATED_DIDS_PK'),
                    CheckConstraint('SCOPE IS NOT NULL', name='UPDATED_DIDS_SCOPE_NN'),
                    CheckConstraint('NAME IS NOT NULL', name='UPDATED_DIDS_NAME_NN'),
-                   Index('UPDATED_DIDS_SCOPERULENAME_IDX', 'scope', 'rule_evaluation_action', 'name'))
+                   Index('UPDATED_DIDS_SCOPERULENAME_IDX', 'scope', 'rule_evaluation_action', 'name'),
+                   Index('UPDATED_DIDS_BUCKET_IDX', 'bucket'))
 
 
 class BadReplicas(BASE, ModelBase):
@@ -709,6 +740,7 @@ class RSEFileAssociation(BASE, ModelBase):
     lock_cnt = Column(Integer, server_default='0')
     accessed_at = Column(DateTime)
     tombstone = Column(DateTime)
+    bucket = Column(SmallInteger, default=_partition_bucket_default('name'))
     rse = relationship("RSE", backref=backref('replicas', order_by="RSE.id"))
     _table_args = (PrimaryKeyConstraint('rse_id', 'scope', 'name', name='REPLICAS_PK'),
                    ForeignKeyConstraint(['scope', 'name'], ['dids.scope', 'dids.name'], name='REPLICAS_LFN_FK'),
@@ -717,7 +749,8 @@ class RSEFileAssociation(BASE, ModelBase):
                    CheckConstraint('bytes IS NOT NULL', name='REPLICAS_SIZE_NN'),
                    CheckConstraint('lock_cnt IS NOT NULL', name='REPLICAS_LOCK_CNT_NN'),
                    Index('REPLICAS_TOMBSTONE_IDX', 'tombstone'),
-                   Index('REPLICAS_PATH_IDX', 'path', mysql_length=255))
+                   Index('REPLICAS_PATH_IDX', 'path', mysql_length=255),
+                   Index('REPLICAS_BUCKET_IDX', 'bucket'))
 
 
 class CollectionReplica(BASE, ModelBase):
@@ -986,6 +1019,7 @@ class Request(BASE, ModelBase, Versioned):
     account = Column(String(25))
     requested_at = Column(DateTime)
     priority = Column(Integer)
+    bucket = Column(SmallInteger, default=_partition_bucket_default('rule_id'))
     _table_args = (PrimaryKeyConstraint('id', name='REQUESTS_PK'),
                    ForeignKeyConstraint(['scope', 'name'], ['dids.scope', 'dids.name'], name='REQUESTS_DID_FK'),
                    ForeignKeyConstraint(['dest_rse_id'], ['rses.id'], name='REQUESTS_RSES_FK'),
@@ -995,7 +1029,8 @@ class Request(BASE, ModelBase, Versioned):
                    Index('REQUESTS_TYP_STA_UPD_IDX_OLD', 'request_type', 'state', 'updated_at'),
                    Index('REQUESTS_TYP_STA_UPD_IDX', 'request_type', 'state', 'activity'),
                    Index('REQUESTS_RULEID_IDX', 'rule_id'),
-                   Index('REQUESTS_EXTERNALID_UQ', 'external_id'))
+                   Index('REQUESTS_EXTERNALID_UQ', 'external_id'),
+                   Index('REQUESTS_BUCKET_IDX', 'bucket'))
 
 
 class Source(BASE, ModelBase, Versioned):
@@ -1080,9 +1115,11 @@ class Message(BASE, ModelBase):
     id = Column(GUID(), default=utils.generate_uuid)
     event_type = Column(String(1024))
     payload = Column(String(4000))
+    bucket = Column(SmallInteger, default=_partition_bucket_default('id'))
     _table_args = (PrimaryKeyConstraint('id', name='MESSAGES_ID_PK'),
                    CheckConstraint('EVENT_TYPE IS NOT NULL', name='MESSAGES_EVENT_TYPE_NN'),
-                   CheckConstraint('PAYLOAD IS NOT NULL', name='MESSAGES_PAYLOAD_NN'),)
+                   CheckConstraint('PAYLOAD IS NOT NULL', name='MESSAGES_PAYLOAD_NN'),
+                   Index('MESSAGES_BUCKET_IDX', 'bucket'))
 
 
 class MessageHistory(BASE, ModelBase):
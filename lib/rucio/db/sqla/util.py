@@ -15,7 +15,7 @@ from traceback import format_exc
 from alembic import command
 from alembic.config import Config
 
-from sqlalchemy import func
+from sqlalchemy import and_, or_, func
 from sqlalchemy.engine import reflection
 from sqlalchemy.schema import MetaData, Table, DropTable, ForeignKeyConstraint, DropConstraint
 from sqlalchemy.sql.expression import select, text
@@ -23,7 +23,7 @@ from sqlalchemy.sql.expression import select, text
 from rucio.common.config import config_get
 from rucio.core.account_counter import create_counters_for_new_account
 from rucio.db.sqla import session, models
-from rucio.db.sqla.constants import AccountStatus, AccountType, IdentityType
+from rucio.db.sqla.constants import AccountStatus, AccountType, IdentityType, PARTITION_BUCKETS
 
 
 def build_database(echo=True, tests=False):
@@ -167,3 +167,36 @@ def get_db_time():
 
     finally:
         s.remove()
+
+
+def get_partition_filter(column, worker_number, total_workers):
+    """
+    Translate a worker of a hash-sharded work queue into a range predicate on a partition bucket column.
+
+    :param column: The partition bucket column, e.g. models.RSEFileAssociation.bucket.
+    :param worker_number: The worker number, between 0 and total_workers - 1.
+    :param total_workers: The total number of workers.
+    :returns: The filter expression.
+    """
+    lower = worker_number * PARTITION_BUCKETS // total_workers
+    upper = (worker_number + 1) * PARTITION_BUCKETS // total_workers
+    return and_(column >= lower, column < upper)
+
+
+def get_buckets_filter(column, buckets):
+    """
+    Translate a set of partition buckets, e.g. from rucio.core.membership, into range predicates on a partition bucket column.
+
+    :param column: The partition bucket column, e.g. models.UpdatedDID.bucket.
+    :param buckets: The list of buckets.
+    :returns: The filter expression.
+    """
+    ranges = []
+    for bucket in sorted(buckets):
+        if ranges and ranges[-1][1] == bucket:
+            ranges[-1][1] = bucket + 1
+        else:
+            ranges.append([bucket, bucket + 1])
+    if not ranges:
+        return column < 0
+    return or_(*[and_(column >= lower, column < upper) for lower, upper in ranges])
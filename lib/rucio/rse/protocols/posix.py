@@ -80,6 +80,32 @@ class Default(protocol.RSEProtocol):
             else:
                 raise exception.ServiceUnavailable(e)
 
+    def stream(self, pfn, offset=0, chunksize=1048576):
+        """ Provides the content of a file stored inside the connected RSE.
+
+            :param pfn: Physical file name of requested file
+            :param offset: Number of bytes to skip at the beginning of the file
+            :param chunksize: Size of the chunks
+
+            :returns: an iterator over the chunks of the file, starting at offset
+
+            :raises ServiceUnavailable: if some generic error occured in the library.
+            :raises SourceNotFound: if the source file was not found on the referred storage.
+         """
+        try:
+            source = open(self.pfn2path(pfn), 'rb')
+            source.seek(offset)
+        except IOError as e:
+            if e.errno == 2:
+                raise exception.SourceNotFound(e)
+            raise exception.ServiceUnavailable(e)
+
+        def chunks():
+            with source:
+                for chunk in iter(lambda: source.read(chunksize), ''):
+                    yield chunk
+        return chunks()
+
     def put(self, source, target, source_dir=None):
         """
             Allows to store files inside the referred RSE.
@@ -25,6 +25,11 @@ if rsemanager.CLIENT_MODE:
 if rsemanager.SERVER_MODE:
     from rucio.core import replica
 
+# Process-wide cache of the deterministic paths, {(scope, name): path}. It is a plain dictionary
+# emptied when full: the bookkeeping of a least-recently-used cache costs more than the md5.
+PATH_CACHE = {}
+PATH_CACHE_SIZE = 100000
+
 
 class RSEProtocol(object):
     """ This class is virtual and acts as a base to inherit new protocols from. It further provides some common functionality which applies for the amjority of the protocols."""
@@ -55,36 +60,43 @@ class RSEProtocol(object):
             :returns: Fully qualified PFN.
         """
         pfns = {}
-        prefix = self.attributes['prefix']
-
-        if not prefix.startswith('/'):
-            prefix = ''.join(['/', prefix])
-        if not prefix.endswith('/'):
-            prefix = ''.join([prefix, '/'])
+        base = self._pfn_base()
 
         lfns = [lfns] if type(lfns) == dict else lfns
         for lfn in lfns:
             scope, name = lfn['scope'], lfn['name']
             if 'path' in lfn and lfn['path'] is not None:
-                pfns['%s:%s' % (scope, name)] = ''.join([self.attributes['scheme'],
-                                                         '://',
-                                                         self.attributes['hostname'],
-                                                         ':',
-                                                         str(self.attributes['port']),
-                                                         prefix,
-                                                         lfn['path'] if not lfn['path'].startswith('/') else lfn['path'][1:]
-                                                         ])
+                pfns['%s:%s' % (scope, name)] = ''.join([base, lfn['path'] if not lfn['path'].startswith('/') else lfn['path'][1:]])
             else:
-                pfns['%s:%s' % (scope, name)] = ''.join([self.attributes['scheme'],
-                                                         '://',
-                                                         self.attributes['hostname'],
-                                                         ':',
-                                                         str(self.attributes['port']),
-                                                         prefix,
-                                                         self._get_path(scope=scope, name=name)
-                                                         ])
+                pfns['%s:%s' % (scope, name)] = ''.join([base, self._get_path(scope=scope, name=name)])
         return pfns
 
+    def lfns2pfns_bulk(self, lfns):
+        """
+            Returns the fully qualified PFNs of several files in one pass.
+
+            :param lfns: list of (scope, name, path) tuples, the path is None if it must be computed.
+
+            :returns: list of PFNs in the order of lfns.
+        """
+        if 'lfns2pfns' in self.__dict__ or type(self).lfns2pfns.im_func is not RSEProtocol.lfns2pfns.im_func:
+            # The protocol builds its own PFNs
+            return [self.lfns2pfns(lfns={'scope': scope, 'name': name, 'path': path if path is not None else self._get_path(scope, name)}).values()[0]
+                    for scope, name, path in lfns]
+
+        base, get_path = self._pfn_base(), self._get_path
+        return [base + (get_path(scope, name) if path is None else path[1:] if path.startswith('/') else path)
+                for scope, name, path in lfns]
+
+    def _pfn_base(self):
+        """ :returns: the beginning of the PFNs, scheme://hostname:port/prefix/ """
+        prefix = self.attributes['prefix']
+        if not prefix.startswith('/'):
+            prefix = ''.join(['/', prefix])
+        if not prefix.endswith('/'):
+            prefix = ''.join([prefix, '/'])
+        return ''.join([self.attributes['scheme'], '://', self.attributes['hostname'], ':', str(self.attributes['port']), prefix])
+
     def __lfns2pfns_client(self, lfns):
         """ Provides the path of a replica for non-deterministic sites. Will be assigned to get path by the __init__ method if neccessary.
 
@@ -116,10 +128,15 @@ class RSEProtocol(object):
 
             :returns: RSE specific URI of the physical file
         """
-        hstr = hashlib.md5('%s:%s' % (scope, name)).hexdigest()
-        if scope.startswith('user') or scope.startswith('group'):
-            scope = scope.replace('.', '/')
-        return '%s/%s/%s/%s' % (scope, hstr[0:2], hstr[2:4], name)
+        path = PATH_CACHE.get((scope, name))
+        if path is None:
+            hstr = hashlib.md5('%s:%s' % (scope, name)).hexdigest()
+            directory = scope.replace('.', '/') if scope.startswith('user') or scope.startswith('group') else scope
+            path = '%s/%s/%s/%s' % (directory, hstr[0:2], hstr[2:4], name)
+            if len(PATH_CACHE) >= PATH_CACHE_SIZE:
+                PATH_CACHE.clear()
+            PATH_CACHE[(scope, name)] = path
+        return path
 
     def _get_path_nondeterministic_server(self, scope, name):
         """ Provides the path of a replica for non-deterministic sites. Will be assigned to get path by the __init__ method if neccessary. """
@@ -223,6 +240,21 @@ class RSEProtocol(object):
          """
         raise NotImplementedError
 
+    def stream(self, path, offset=0):
+        """
+            Provides the content of a file stored inside the connected RSE, without storing it locally.
+            Protocols which do not implement it are only used through get.
+
+            :param path: Physical file name of requested file
+            :param offset: Number of bytes to skip at the beginning of the file
+
+            :returns: an iterator over the chunks of the file, starting at offset
+
+            :raises ServiceUnavailable: if some generic error occured in the library.
+            :raises SourceNotFound: if the source file was not found on the referred storage.
+        """
+        raise NotImplementedError
+
     def put(self, source, target, source_dir):
         """
             Allows to store files inside the referred RSE.
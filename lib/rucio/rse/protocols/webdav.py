@@ -280,6 +280,39 @@ class Default(protocol.RSEProtocol):
         except requests.exceptions.ConnectionError as error:
             raise exception.ServiceUnavailable(error)
 
+    def stream(self, pfn, offset=0, chunksize=1048576):
+        """ Provides the content of a file stored inside the connected RSE.
+
+            :param pfn Physical file name of requested file
+            :param offset Number of bytes to skip at the beginning of the file, requested with a range
+            :param chunksize Size of the chunks
+
+            :returns: an iterator over the chunks of the file, starting at offset
+
+            :raises ServiceUnavailable, SourceNotFound, RSEAccessDenied
+        """
+        path = self.path2pfn(pfn)
+        headers = {'Range': 'bytes=%d-' % offset} if offset else None
+        try:
+            result = self.session.get(path, verify=False, stream=True, timeout=self.timeout, cert=self.cert, headers=headers)
+        except requests.exceptions.ConnectionError as error:
+            raise exception.ServiceUnavailable(error)
+        if result.status_code in [404, ]:
+            raise exception.SourceNotFound()
+        elif result.status_code in [401, 403]:
+            raise exception.RSEAccessDenied()
+        elif result.status_code not in ([206, ] if offset else [200, ]):
+            # catchall exception, including a server ignoring the range
+            raise exception.RucioException(result.status_code, result.text)
+
+        def chunks():
+            try:
+                for chunk in result.iter_content(chunksize):
+                    yield chunk
+            except requests.exceptions.RequestException as error:
+                raise exception.ServiceUnavailable(error)
+        return chunks()
+
     def put(self, source, target, source_dir=None, progressbar=False):
         """ Allows to store files inside the referred RSE.
 
@@ -14,12 +14,16 @@
  - Wen Guan, <wen.guan@cern.ch>, 2014-2015
 '''
 
+import Queue
 import copy
+import errno
 import os
+import threading
 
 from urlparse import urlparse
 
 from rucio.common import exception, utils
+from rucio.common.checksum import Checksummer, checksum_file, checksum_files
 
 DEFAULT_PROTOCOL = 1
 
@@ -175,13 +179,102 @@ def parse_pfns(rse_settings, pfns, operation='read'):
     return create_protocol(rse_settings, operation, urlparse(pfns[0]).scheme).parse_pfns(pfns)
 
 
-def download(rse_settings, files, dest_dir=None, force_scheme=None, ignore_checksum=False, printstatements=False):
+def _download_file(rse_list, protocols, f, dest_dir=None, force_scheme=None, ignore_checksum=False, printstatements=False):
+    """
+        Downloads one file from the first RSE of rse_list which succeeds. If the protocol can stream the file,
+        the checksums are computed while the file is written and a transfer failing midway is continued
+        on the next RSE from the bytes already written.
+
+        :param rse_list:   list of RSE settings holding a replica of the file
+        :param protocols:  dict of the connected protocols by RSE, reused for the next files
+
+        :returns: True
+    """
+    target_dir = "./%s" % f['scope'] if dest_dir is None else dest_dir
+    try:
+        os.makedirs(target_dir)
+    except OSError as error:
+        # Another thread may have created it
+        if error.errno != errno.EEXIST:
+            raise
+    # Each scope is stored into a separate folder
+    finalfile = '%s/%s' % (target_dir, f['name'])
+    # Check if the file already exists, if not download and validate it
+    if os.path.isfile(finalfile):
+        return True
+
+    expected = {} if ignore_checksum else dict((name, f[name]) for name in ('adler32', 'md5') if f.get(name))
+    validate = 'adler32' in f or 'md5' in f
+    tempfile = '%s/%s.part' % (target_dir, f['name']) if validate else finalfile
+    if validate and os.path.isfile(tempfile):
+        if printstatements:
+            print '%s already exists, probably from a failed attempt. Will remove it' % (tempfile)
+        os.unlink(tempfile)
+
+    # The PFN is only valid on its own RSE
+    rse_list = rse_list[:1] if 'pfn' in f else rse_list
+    offset, checksummer = 0, Checksummer(expected)
+    for index, rse_settings in enumerate(rse_list):
+        last = index == len(rse_list) - 1
+        try:
+            if rse_settings['rse'] not in protocols:
+                protocol = create_protocol(rse_settings, 'read', scheme=force_scheme)
+                protocol.connect()
+                protocols[rse_settings['rse']] = protocol
+            protocol = protocols[rse_settings['rse']]
+            pfn = f['pfn'] if 'pfn' in f else protocol.lfns2pfns(f).values()[0]
+
+            try:
+                chunks = protocol.stream(pfn, offset)
+            except NotImplementedError:
+                chunks = None
+
+            if chunks is None:
+                offset = None
+                protocol.get(pfn, tempfile)
+                computed = checksum_file(tempfile, expected) if expected else {}
+            else:
+                with open(tempfile, 'r+b' if offset else 'wb') as out:
+                    out.seek(offset)
+                    out.truncate()
+                    for chunk in chunks:
+                        out.write(chunk)
+                        offset += len(chunk)
+                        checksummer.update(chunk)
+                computed = checksummer.hexdigests()
+
+            if printstatements:
+                print 'File downloaded. Will be validated'
+            for name in ('adler32', 'md5'):
+                if name in expected and computed[name] != expected[name]:
+                    os.unlink(tempfile)
+                    # Another replica may be intact
+                    offset, checksummer = 0, Checksummer(expected)
+                    raise exception.FileConsistencyMismatch('Checksum mismatch : local %s vs recorded %s' % (str(computed[name]), str(expected[name])))
+        except exception.DestinationNotAccessible:
+            raise
+        except Exception:
+            if last:
+                raise
+            if offset is None:
+                # The file was not streamed, the next replica is downloaded from the beginning
+                offset, checksummer = 0, Checksummer(expected)
+            continue
+
+        if printstatements and expected:
+            print 'File validated'
+        if tempfile != finalfile:
+            os.rename(tempfile, finalfile)
+        return True
+
+
+def download(rse_settings, files, dest_dir=None, force_scheme=None, ignore_checksum=False, printstatements=False, threads=1):
     """
         Copy a file from the connected storage to the local file system.
         Providing a list indicates the bulk mode.
 
 
-        :param rse_settings:    RSE to use
+        :param rse_settings:    RSE to use, or a list of RSEs holding replicas of the files, tried in order if a transfer fails.
         :param files:           a single dict or a list with dicts containing 'scope' and 'name'
                                 if LFNs are provided and additional 'pfn' if PFNs are provided.
                                 E.g.  [{'name': '2_rse_remote_get.raw', 'scope': 'user.jdoe'},
@@ -189,6 +282,7 @@ def download(rse_settings, files, dest_dir=None, force_scheme=None, ignore_check
         :param dest_dir:        path to the directory where the downloaded files will be stored. If not given, each scope is represented by its own directory.
         :param force_scheme:    normally the scheme is dictated by the RSE object, when specifying the PFN it must be forced to the one specified in the PFN, overruling the RSE description.
         :param ignore_checksum: do not verify the checksum - caution: should only be used for rucio download --pfn
+        :param threads:         number of files downloaded concurrently, each thread keeps one connection per RSE.
 
         :returns: True/False for a single file or a dict object with 'scope:name' for LFNs or 'name' for PFNs as keys and True or the exception as value for each file in bulk mode
 
@@ -199,50 +293,37 @@ def download(rse_settings, files, dest_dir=None, force_scheme=None, ignore_check
 
     """
     ret = {}
-    gs = True  # gs represents the global status which inidcates if every operation workd in bulk mode
-
-    protocol = create_protocol(rse_settings, 'read', scheme=force_scheme)
-    protocol.connect()
-
+    rse_list = rse_settings if type(rse_settings) is list else [rse_settings]
     files = [files] if not type(files) is list else files
+    queue = Queue.Queue()
     for f in files:
-        pfn = f['pfn'] if 'pfn' in f else protocol.lfns2pfns(f).values()[0]
-        target_dir = "./%s" % f['scope'] if dest_dir is None else dest_dir
-        try:
-            if not os.path.exists(target_dir):
-                os.makedirs(target_dir)
-            # Each scope is stored into a separate folder
-            finalfile = '%s/%s' % (target_dir, f['name'])
-            # Check if the file already exists, if not download and validate it
-            if not os.path.isfile(finalfile):
-                if 'adler32' in f:
-                    tempfile = '%s/%s.part' % (target_dir, f['name'])
-                    if os.path.isfile(tempfile):
-                        if printstatements:
-                            print '%s already exists, probably from a failed attempt. Will remove it' % (tempfile)
-                        os.unlink(tempfile)
-                    protocol.get(pfn, tempfile)
-                    if printstatements:
-                        print 'File downloaded. Will be validated'
-
-                    localchecksum = f['adler32'] if ignore_checksum else utils.adler32(tempfile)
-                    if localchecksum == f['adler32']:
-                        if printstatements:
-                            print 'File validated'
-                        os.rename(tempfile, finalfile)
-                    else:
-                        os.unlink(tempfile)
-                        raise exception.FileConsistencyMismatch('Checksum mismatch : local %s vs recorded %s' % (str(localchecksum), str(f['adler32'])))
-                else:
-                    protocol.get(pfn, '%s/%s' % (target_dir, f['name']))
-                ret['%s:%s' % (f['scope'], f['name'])] = True
-            else:
-                ret['%s:%s' % (f['scope'], f['name'])] = True
-        except Exception as e:
-            gs = False
-            ret['%s:%s' % (f['scope'], f['name'])] = e
+        queue.put(f)
 
-    protocol.close()
+    def worker():
+        protocols = {}
+        try:
+            while True:
+                try:
+                    f = queue.get_nowait()
+                except Queue.Empty:
+                    break
+                try:
+                    ret['%s:%s' % (f['scope'], f['name'])] = _download_file(rse_list, protocols, f, dest_dir=dest_dir, force_scheme=force_scheme,
+                                                                            ignore_checksum=ignore_checksum, printstatements=printstatements)
+                except Exception as e:
+                    ret['%s:%s' % (f['scope'], f['name'])] = e
+        finally:
+            for protocol in protocols.values():
+                protocol.close()
+
+    workers = [threading.Thread(target=worker) for _ in xrange(min(threads, len(files)) - 1)]
+    for thread in workers:
+        thread.start()
+    worker()
+    for thread in workers:
+        thread.join()
+
+    gs = not any(isinstance(value, Exception) for value in ret.values())  # gs represents the global status which inidcates if every operation workd in bulk mode
     if len(ret) == 1:
         for x in ret:
             if isinstance(ret[x], Exception):
@@ -319,6 +400,13 @@ def upload(rse_settings, lfns, source_dir=None, force_pfn=None):
     protocol_delete.connect()
 
     lfns = [lfns] if not type(lfns) is list else lfns
+
+    # The missing checksums and sizes are computed from the local files, in parallel
+    sources = dict(('%s/%s' % (source_dir, lfn['name']) if source_dir else lfn['name'], lfn) for lfn in lfns if 'adler32' not in lfn or 'filesize' not in lfn)
+    for path, checksums in checksum_files([path for path in sources if os.path.isfile(path)]).iteritems():
+        sources[path].setdefault('adler32', checksums['adler32'])
+        sources[path].setdefault('filesize', os.path.getsize(path))
+
     for lfn in lfns:
         name = lfn['name']
         scope = lfn['scope']
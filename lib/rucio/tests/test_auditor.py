@@ -13,13 +13,18 @@ from datetime import datetime
 from datetime import timedelta
 from nose.tools import eq_
 from nose.tools import ok_
+from rucio.common import dumper
 from rucio.common.dumper import consistency
 from rucio.daemons import auditor
 from rucio.daemons.auditor import srmdumps
 from rucio.daemons.auditor import hdfs
 from rucio.tests.common import stubbed
+import Queue
 import collections
 import multiprocessing
+import os
+import requests
+import shutil
 import tempfile
 
 
@@ -93,3 +98,65 @@ def test_auditor_check_survives_failures_and_queues_failed_rses():
     eq_(retry.get(), ('RSE_WITH_EXCEPTION', 0))
     eq_(retry.get(), ('RSE_WITH_ERROR', 0))
     ok_(retry.empty())
+
+
+def test_auditor_check_resumes_http_dump_download():
+    content = '0123456789' * 10
+    ranges = []
+    failures = [60]
+
+    class FakeSession(object):
+        def head(self, url):
+            response = requests.Response()
+            response.status_code = 200
+            response.headers['content-length'] = str(len(content))
+            response.headers['accept-ranges'] = 'bytes'
+            response.headers['etag'] = '"v1"'
+            return response
+
+        def get(self, url, headers):
+            start, end = (int(bound) for bound in headers['Range'].split('=')[1].split('-'))
+            ranges.append((start, end))
+            response = requests.Response()
+            response.status_code = 206 if headers.get('If-Range') == '"v1"' else 200
+            data = content[start:end + 1]
+            if failures and start <= failures[0] <= end:
+                # The connection breaks in the middle of the range
+                data = data[:failures.pop() - start]
+            response.iter_content = lambda _: [data]
+            return response
+
+    cache_dir = tempfile.mkdtemp()
+    path = os.path.join(cache_dir, 'ddmendpoint_MOCK_01-01-2015_dump')
+
+    def fake_consistency(rse, delta, configuration, cache_dir, results_dir):
+        dumper.http_download_resumable('http://example.com', path, session=FakeSession(), parts=4, min_part_size=10)
+        with open(path) as f:
+            eq_(f.read(), content)
+
+    queue = Queue.Queue()
+    retry = Queue.Queue()
+    wr_pipe = collections.namedtuple('FakePipe', ('send', 'close'))(
+        lambda _: None,
+        lambda: None,
+    )
+    terminate = multiprocessing.Event()
+    terminate.is_set = queue.empty
+    # stubbed() would run the fake with the globals of the auditor module
+    consistency_, parse_configuration = auditor.consistency, srmdumps.parse_configuration
+    auditor.consistency, srmdumps.parse_configuration = fake_consistency, lambda: None
+    try:
+        queue.put(('MOCK', 1))
+        auditor.check(queue, retry, terminate, wr_pipe, cache_dir, None, False, 3)
+        eq_(retry.get_nowait(), ('MOCK', 0))
+
+        # Only the missing bytes are downloaded again
+        del ranges[:]
+        queue.put(('MOCK', 0))
+        auditor.check(queue, retry, terminate, wr_pipe, cache_dir, None, False, 3)
+        eq_(ranges, [(60, 74)])
+        ok_(retry.empty())
+        eq_(os.listdir(cache_dir), [])
+    finally:
+        auditor.consistency, srmdumps.parse_configuration = consistency_, parse_configuration
+        shutil.rmtree(cache_dir)
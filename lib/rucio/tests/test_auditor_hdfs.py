@@ -15,7 +15,7 @@ import tempfile
 
 
 from datetime import datetime
-from nose.tools import eq_
+from nose.tools import assert_raises, eq_
 
 from rucio.daemons.auditor import hdfs
 from rucio.tests.common import stubbed
@@ -29,16 +29,37 @@ class FakeHDFSGet(object):
         '''
         __init__
         '''
-        self.files = files
+        self.files = dict((name, content) for content, name in files)
+        self.requested = []
+        self.failing = ()
 
     def __call__(self, src_path, dst_dir):
         '''
         __call__
         '''
-        # src_path is ignored, it is assumed a directory is requested
-        for content, name in self.files:
-            with open(os.path.join(dst_dir, name), 'w') as fichier:
-                fichier.write(str(content) + '\n')
+        name = os.path.basename(src_path)
+        if name in self.failing:
+            raise IOError('Transfer of {0} failed'.format(name))
+        self.requested.append(name)
+        with open(os.path.join(dst_dir, name), 'w') as fichier:
+            fichier.write(str(self.files[name]) + '\n')
+
+
+class FakeHDFSLs(object):
+    '''
+    FakeHDFSLs
+    '''
+    def __init__(self, hdfs_get):
+        '''
+        __init__
+        '''
+        self.names = list(hdfs_get.files)
+
+    def __call__(self, src_url):
+        '''
+        __call__
+        '''
+        return sorted('/'.join((os.path.dirname(src_url), name)) for name in self.names)
 
 
 class TestReplicaFromHDFS(object):
@@ -60,7 +81,8 @@ class TestReplicaFromHDFS(object):
     def test_replica_from_hdfs_download_merges_the_file_parts_in_order(self):
         '''test_replica_from_hdfs_download_merges_the_file_parts_in_order'''
         files = reversed(list(enumerate(string.lowercase[:5])))
-        with stubbed(hdfs._hdfs_get, FakeHDFSGet(files)):
+        hdfs_get = FakeHDFSGet(files)
+        with stubbed(hdfs._hdfs_get, hdfs_get), stubbed(hdfs._hdfs_ls, FakeHDFSLs(hdfs_get)):
             merged_file_path = hdfs.ReplicaFromHDFS.download(
                 'FAKE_RSE',
                 datetime.now(),
@@ -76,7 +98,8 @@ class TestReplicaFromHDFS(object):
             (string.digits[:5], 'a'),
             (string.digits[5:10], 'b'),
         ]
-        with stubbed(hdfs._hdfs_get, FakeHDFSGet(files)):
+        hdfs_get = FakeHDFSGet(files)
+        with stubbed(hdfs._hdfs_get, hdfs_get), stubbed(hdfs._hdfs_ls, FakeHDFSLs(hdfs_get)):
             merged_file_path = hdfs.ReplicaFromHDFS.download(
                 'FAKE_RSE',
                 datetime.now(),
@@ -86,3 +109,22 @@ class TestReplicaFromHDFS(object):
 
         with open(merged_file_path) as fichier:
             eq_('0123456789', fichier.read().replace('\n', ''))
+
+    def test_replica_from_hdfs_download_resumes_from_the_downloaded_parts(self):
+        '''test_replica_from_hdfs_download_resumes_from_the_downloaded_parts'''
+        files = list(enumerate(string.lowercase[:5]))
+        hdfs_get = FakeHDFSGet(files)
+        hdfs_get.failing = ('d', )
+        with stubbed(hdfs._hdfs_get, hdfs_get), stubbed(hdfs._hdfs_ls, FakeHDFSLs(hdfs_get)):
+            with assert_raises(IOError):
+                hdfs.ReplicaFromHDFS.download('FAKE_RSE', datetime(2017, 6, 1), cache_dir=self.work_dir)
+        eq_(sorted(hdfs_get.requested), ['a', 'b', 'c', 'e'])
+
+        hdfs_get.failing, hdfs_get.requested = (), []
+        with stubbed(hdfs._hdfs_get, hdfs_get), stubbed(hdfs._hdfs_ls, FakeHDFSLs(hdfs_get)):
+            merged_file_path = hdfs.ReplicaFromHDFS.download('FAKE_RSE', datetime(2017, 6, 1), cache_dir=self.work_dir)
+        eq_(hdfs_get.requested, ['d'])
+
+        with open(merged_file_path) as fichier:
+            eq_('01234', fichier.read().replace('\n', ''))
+        eq_(os.listdir(self.work_dir), [os.path.basename(merged_file_path)])
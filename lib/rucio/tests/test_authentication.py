@@ -10,10 +10,16 @@
  - Vincent Garonne,  <vincent.garonne@cern.ch> , 2011-2017
 '''
 
-from nose.tools import assert_equal, assert_is_not_none, assert_greater
+import datetime
+
+from nose.tools import assert_equal, assert_is_none, assert_is_not_none, assert_greater
 from paste.fixture import TestApp
 
 from rucio.api.authentication import get_auth_token_user_pass
+from rucio.common.utils import generate_uuid
+from rucio.core.authentication import TOKEN_CACHE, TOKENREGION, validate_auth_token
+from rucio.db.sqla import models
+from rucio.db.sqla.session import get_session
 from rucio.web.rest.authentication import APP
 
 
@@ -26,6 +32,31 @@ class TestAuthCoreApi(object):
         result = get_auth_token_user_pass(account='root', username='ddmlab', password='secret', appid='test', ip='127.0.0.1')
         assert_is_not_none(result)
 
+    def test_validate_auth_token_local_cache(self):
+        """AUTHENTICATION (CORE): Valid tokens are served from the process-local cache."""
+        token = get_auth_token_user_pass(account='root', username='ddmlab', password='secret', appid='test', ip='127.0.0.1')
+        value = validate_auth_token(token)
+        assert_equal(value['account'], 'root')
+
+        # Neither the cache region nor the database are read again
+        TOKENREGION.delete(token)
+        session = get_session()
+        session.query(models.Token).filter_by(token=token).delete()
+        session.commit()
+        assert_equal(validate_auth_token(' %s ' % token), value)
+
+        # Expired entries are dropped
+        TOKEN_CACHE.set(token, (value, datetime.datetime.utcnow() - datetime.timedelta(seconds=1)))
+        assert_is_none(validate_auth_token(token))
+
+    def test_validate_auth_token_invalid(self):
+        """AUTHENTICATION (CORE): Invalid tokens are cached negatively."""
+        token = 'root-ddmlab-test-%s' % generate_uuid()
+        assert_is_none(validate_auth_token(token))
+        value, expires_at = TOKEN_CACHE.get(token)
+        assert_is_none(value)
+        assert_greater(expires_at, datetime.datetime.utcnow())
+
 
 class TestAuthRestApi(object):
     '''
@@ -0,0 +1,97 @@
+'''
+  Copyright European Organization for Nuclear Research (CERN)
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  You may not use this file except in compliance with the License.
+  You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+'''
+
+import hashlib
+import os
+import shutil
+import tempfile
+import zlib
+
+from nose.tools import assert_equal, raises
+
+from rucio.common import checksum
+from rucio.common.checksum import Checksummer, checksum_file, checksum_files
+from rucio.common.utils import adler32, md5
+
+
+def _expected(data):
+    return {'adler32': '%08x' % (zlib.adler32(data) & 0xffffffff),
+            'md5': hashlib.md5(data).hexdigest(),
+            'sha1': hashlib.sha1(data).hexdigest(),
+            'sha256': hashlib.sha256(data).hexdigest()}
+
+
+class TestChecksum(object):
+
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.contents = {'empty': '',
+                         'random': os.urandom(3 * 4096 + 17),
+                         'newlines': '\n' * 10000,
+                         'no_newline': 'a' * 10000}
+        self.paths = {}
+        for name, data in self.contents.iteritems():
+            self.paths[name] = os.path.join(self.tmp_dir, name)
+            with open(self.paths[name], 'wb') as f:
+                f.write(data)
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_checksum_file(self):
+        """ CHECKSUM: Buffered checksums of a file """
+        for name, path in self.paths.iteritems():
+            assert_equal(checksum_file(path, ('adler32', 'md5', 'sha1', 'sha256'), buffer_size=4096), _expected(self.contents[name]))
+
+    def test_checksum_file_mmap(self):
+        """ CHECKSUM: Checksums of a file read through mmap """
+        for name, path in self.paths.iteritems():
+            assert_equal(checksum_file(path, ('adler32', 'md5'), buffer_size=4096, mmap_threshold=1),
+                         dict((key, value) for key, value in _expected(self.contents[name]).iteritems() if key in ('adler32', 'md5')))
+
+    def test_utils(self):
+        """ CHECKSUM: adler32 and md5 of rucio.common.utils """
+        for name, path in self.paths.iteritems():
+            assert_equal(adler32(path), _expected(self.contents[name])['adler32'])
+            assert_equal(md5(path), _expected(self.contents[name])['md5'])
+
+    def test_checksum_files(self):
+        """ CHECKSUM: Checksums of several files in parallel """
+        checksums = checksum_files(self.paths.values(), ('adler32', 'sha1'), processes=2)
+        assert_equal(sorted(checksums), sorted(self.paths.values()))
+        for name, path in self.paths.iteritems():
+            assert_equal(checksums[path]['adler32'], _expected(self.contents[name])['adler32'])
+            assert_equal(checksums[path]['sha1'], _expected(self.contents[name])['sha1'])
+
+    def test_checksum_files_pool_size(self):
+        """ CHECKSUM: Checksums of more files than CPUs """
+        sizes = []
+        pool, cpu_count = checksum.Pool, checksum.cpu_count
+
+        def sized_pool(processes):
+            sizes.append(processes)
+            return pool(processes)
+        checksum.Pool, checksum.cpu_count = sized_pool, lambda: 2
+        try:
+            checksums = checksum_files(self.paths.values(), ('adler32', ))
+        finally:
+            checksum.Pool, checksum.cpu_count = pool, cpu_count
+        assert_equal(sizes, [2])
+        assert_equal(len(checksums), len(self.paths))
+
+    def test_checksummer(self):
+        """ CHECKSUM: Incremental checksums """
+        checksummer = Checksummer(('adler32', 'md5'))
+        for data in ('abc', buffer('defgh', 1, 3), ''):
+            checksummer.update(data)
+        assert_equal(checksummer.hexdigests(), {'adler32': _expected('abcefg')['adler32'], 'md5': _expected('abcefg')['md5']})
+
+    @raises(ValueError)
+    def test_unknown_algorithm(self):
+        """ CHECKSUM: Unknown checksum algorithm """
+        Checksummer(('adler32', 'crc32'))
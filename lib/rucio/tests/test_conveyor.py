@@ -10,10 +10,16 @@
   - Wen Guan, <wen.guan@cern.ch>, 2015
 '''
 
+import json
+import threading
 import time
 
+from nose.tools import assert_equal
+
+from rucio.common.utils import generate_uuid
+from rucio.core import request as request_core
 from rucio.daemons.mock.conveyorinjector import request_transfer
-from rucio.daemons.conveyor import submitter, poller, finisher, throttler
+from rucio.daemons.conveyor import common, submitter, poller, finisher, throttler
 
 
 class TestConveyorSubmitter:
@@ -31,3 +37,149 @@ class TestConveyorSubmitter:
         time.sleep(5)
         poller.run(once=True)
         finisher.run(once=True)
+
+
+class TestConveyorSubmitJobs:
+    """ TestConveyorSubmitJobs Class."""
+
+    def test_submit_jobs_bounded_inflight(self):
+        """ CONVEYOR (DAEMON): Jobs are submitted concurrently with a bounded number in flight per host."""
+        lock = threading.Lock()
+        inflight = {}
+        max_seen = {}
+        submitted = []
+
+        def fake_submit_transfer(external_host, job, **kwargs):
+            with lock:
+                inflight[external_host] = inflight.get(external_host, 0) + 1
+                max_seen[external_host] = max(max_seen.get(external_host, 0), inflight[external_host])
+            time.sleep(0.05)
+            with lock:
+                inflight[external_host] -= 1
+                submitted.append((external_host, job))
+
+        grouped_jobs = {'https://fts1:8446': range(10), 'https://fts2:8446': range(3)}
+        original = submitter.submit_transfer
+        submitter.submit_transfer = fake_submit_transfer
+        try:
+            submitter.submit_jobs(grouped_jobs, 2, submitter='test')
+        finally:
+            submitter.submit_transfer = original
+
+        assert_equal(len(submitted), 13)
+        assert_equal(sorted(job for host, job in submitted if host == 'https://fts1:8446'), range(10))
+        assert_equal(max_seen['https://fts1:8446'], 2)
+        assert_equal(max_seen['https://fts2:8446'], 2)
+
+
+class TestConveyorPollerPipeline:
+    """ TestConveyorPollerPipeline Class."""
+
+    def test_poller_pipeline(self):
+        """ CONVEYOR (DAEMON): Query workers feed the state writer which updates in batches."""
+        import Queue
+
+        batches = []
+
+        def fake_query_transfers(external_host, xfers, **kwargs):
+            return dict((xfer, {}) for xfer in xfers)
+
+        def fake_update_transfers_states(transfers, **kwargs):
+            batches.append(transfers)
+
+        original = common.query_transfers, common.update_transfers_states
+        common.query_transfers, common.update_transfers_states = fake_query_transfers, fake_update_transfers_states
+        try:
+            queries, responses = Queue.Queue(), Queue.Queue()
+            workers = [threading.Thread(target=poller.query_worker, args=(queries, responses)) for i in xrange(3)]
+            writer = threading.Thread(target=poller.state_writer, args=(responses, ), kwargs={'update_bulk': 4})
+            [t.start() for t in workers + [writer]]
+            for i in xrange(10):
+                queries.put(('https://fts%s:8446' % (i % 2), ['%s-a' % i, '%s-b' % i]))
+            queries.join()
+            responses.join()
+            [queries.put(None) for t in workers]
+            [t.join() for t in workers]
+            responses.put(None)
+            writer.join()
+        finally:
+            common.query_transfers, common.update_transfers_states = original
+
+        transfer_ids = [transfer_id for batch in batches for external_host, resps in batch for transfer_id in resps]
+        assert_equal(len(transfer_ids), 20)
+        assert_equal(len(set(transfer_ids)), 20)
+        for batch in batches:
+            assert_equal(sum([len(resps) for external_host, resps in batch]) <= 4, True)
+
+
+class TestConveyorReceiver:
+    """ TestConveyorReceiver Class."""
+
+    def test_receiver_bulk_ack(self):
+        """ CONVEYOR (DAEMON): The receiver applies messages in bulk and acknowledges them once applied."""
+        from rucio.daemons.conveyor.receiver import Receiver
+
+        class FakeConnection(object):
+            def __init__(self):
+                self.acked = []
+
+            def ack(self, id, subscription):
+                self.acked.append(id)
+
+        def message(i):
+            msg = {'job_metadata': {'issuer': 'rucio'},
+                   'file_metadata': {'request_id': 'request_%s' % i, 'scope': 'mock', 'name': 'file_%s' % i},
+                   'job_m_replica': 'false', 'job_state': 'FINISHED', 't_final_transfer_state': 'Ok',
+                   'tr_id': '2016-01-01-0000__transfer_%s' % i, 'endpnt': 'https://fts:8446',
+                   'tr_timestamp_start': 0, 'tr_timestamp_complete': 0}
+            return json.dumps(msg) + '\x04'
+
+        conn = FakeConnection()
+        receiver = Receiver(broker='broker', id=0, total_threads=1, conn=conn, subscription_id='test', bulk=2, bulk_wait=60000)
+        receiver.on_message({'vo': 'other', 'message-id': 'ignored'}, '')
+        assert_equal(conn.acked, ['ignored'])
+        for i in xrange(3):
+            receiver.on_message({'vo': 'atlas', 'message-id': 'id_%s' % i}, message(i))
+        assert_equal(conn.acked, ['ignored', 'id_0', 'id_1'])
+        receiver.flush()
+        assert_equal(conn.acked, ['ignored', 'id_0', 'id_1'])
+        receiver.flush(force=True)
+        assert_equal(conn.acked, ['ignored', 'id_0', 'id_1', 'id_2'])
+
+    def test_receiver_no_ack_on_failure(self):
+        """ CONVEYOR (DAEMON): The receiver does not acknowledge the messages whose update failed."""
+        from rucio.daemons.conveyor.receiver import Receiver
+
+        class FakeConnection(object):
+            def __init__(self):
+                self.acked = []
+
+            def ack(self, id, subscription):
+                self.acked.append(id)
+
+        request_ids = [generate_uuid() for i in xrange(3)]
+
+        def message(i):
+            msg = {'job_metadata': {'issuer': 'rucio'},
+                   'file_metadata': {'request_id': request_ids[i], 'scope': 'mock', 'name': 'file_%s' % i},
+                   'job_m_replica': 'false', 'job_state': 'FINISHED', 't_final_transfer_state': 'Ok',
+                   'tr_id': '2016-01-01-0000__transfer_%s' % i, 'endpnt': 'https://fts:8446',
+                   'tr_timestamp_start': 0, 'tr_timestamp_complete': 0}
+            return json.dumps(msg) + '\x04'
+
+        get_request = request_core.get_request
+
+        def failing_get_request(request_id, session=None):
+            if request_id == request_ids[1]:
+                raise Exception('Database error')
+            return get_request(request_id, session=session)
+
+        conn = FakeConnection()
+        receiver = Receiver(broker='broker', id=0, total_threads=1, full_mode=True, conn=conn, subscription_id='test', bulk=3, bulk_wait=60000)
+        request_core.get_request = failing_get_request
+        try:
+            for i in xrange(3):
+                receiver.on_message({'vo': 'atlas', 'message-id': 'id_%s' % i}, message(i))
+        finally:
+            request_core.get_request = get_request
+        assert_equal(sorted(conn.acked), ['id_0', 'id_2'])
@@ -12,7 +12,10 @@
 from nose.tools import assert_equal
 
 from rucio.core import account_counter, rse_counter
+from rucio.core.counter_accumulator import CounterAccumulator
 from rucio.core.rse import get_rse
+from rucio.db.sqla import models
+from rucio.db.sqla.session import get_session
 from rucio.daemons.abacus.rse import rse_update
 from rucio.daemons.abacus.account import account_update
 
@@ -66,6 +69,42 @@ class TestCoreRSECounter():
             del cnt['updated_at']
             assert_equal(cnt, {'files': count, 'bytes': sum})
 
+    def test_update_rse_counters(self):
+        """ RSE COUNTER (CORE): Aggregate the updates of several RSEs """
+        rse_ids = [get_rse(rse).id for rse in ('MOCK', 'MOCK2')]
+        rse_update(once=True)
+        before = [rse_counter.get_counter(rse_id=rse_id) for rse_id in rse_ids]
+        for i in xrange(3):
+            rse_counter.increase(rse_id=rse_ids[0], files=2, bytes=10)
+            rse_counter.decrease(rse_id=rse_ids[1], files=1, bytes=5)
+        rse_counter.update_rse_counters(rse_ids=rse_ids)
+        after = [rse_counter.get_counter(rse_id=rse_id) for rse_id in rse_ids]
+        assert_equal((after[0]['files'] - before[0]['files'], after[0]['bytes'] - before[0]['bytes']), (6, 30))
+        assert_equal((after[1]['files'] - before[1]['files'], after[1]['bytes'] - before[1]['bytes']), (-3, -15))
+        assert_equal(rse_counter.get_updated_rse_counters(total_workers=0, worker_number=0), [])
+
+    def test_accumulator(self):
+        """ RSE COUNTER (CORE): Accumulate the committed updates """
+        rse_id = get_rse('MOCK').id
+        rse_update(once=True)
+        accumulator = CounterAccumulator(model=models.UpdatedRSECounter, columns=('rse_id', ))
+
+        session = get_session()
+        for i in xrange(5):
+            accumulator.add(key=(rse_id, ), files=1, bytes=10, session=session)
+        session.commit()
+        accumulator.add(key=(rse_id, ), files=100, bytes=1000, session=session)
+        session.rollback()
+        session.remove()
+        assert_equal(accumulator.pending(), {(rse_id, ): (5, 50)})
+
+        assert_equal(accumulator.flush(), 1)
+        assert_equal(accumulator.pending(), {})
+        session = get_session()
+        assert_equal(session.query(models.UpdatedRSECounter.files, models.UpdatedRSECounter.bytes).filter_by(rse_id=rse_id).all(), [(5, 50)])
+        session.remove()
+        rse_update(once=True)
+
 
 class TestCoreAccountCounter():
 
@@ -116,3 +155,18 @@ class TestCoreAccountCounter():
             cnt = account_counter.get_counter(rse_id=rse_id, account=account)
             del cnt['updated_at']
             assert_equal(cnt, {'files': count, 'bytes': sum})
+
+    def test_update_account_counters(self):
+        """ACCOUNT COUNTER (CORE): Aggregate the updates of several accounts """
+        rse_id = get_rse('MOCK').id
+        account_update(once=True)
+        counters = [('jdoe', rse_id), ('root', rse_id)]
+        before = [account_counter.get_counter(rse_id=rse_id, account=account) for account, _ in counters]
+        for i in xrange(3):
+            account_counter.increase(rse_id=rse_id, account='jdoe', files=2, bytes=10)
+            account_counter.increase(rse_id=rse_id, account='root', files=1, bytes=5)
+        account_counter.update_account_counters(counters=counters)
+        after = [account_counter.get_counter(rse_id=rse_id, account=account) for account, _ in counters]
+        assert_equal((after[0]['files'] - before[0]['files'], after[0]['bytes'] - before[0]['bytes']), (6, 30))
+        assert_equal((after[1]['files'] - before[1]['files'], after[1]['bytes'] - before[1]['bytes']), (3, 15))
+        assert_equal(account_counter.get_updated_account_counters(total_workers=0, worker_number=0), [])
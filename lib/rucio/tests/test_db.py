@@ -9,7 +9,12 @@
   Authors:
   - Vincent Garonne, <vincent.garonne@cern.ch>, 2013-2017
 '''
+from nose.tools import assert_equal
+
+from rucio.db.sqla.constants import PARTITION_BUCKETS
+from rucio.db.sqla.models import Message, partition_bucket
 from rucio.db.sqla.session import get_session
+from rucio.db.sqla.util import get_partition_filter
 
 
 def test_db_connection():
@@ -20,3 +25,24 @@ def test_db_connection():
     else:
         session.execute('select 1')
     session.close()
+
+
+def test_partition_filter():
+    """ DB (CORE): Test the partition bucket column and ranges """
+    session = get_session()
+    message = Message(event_type='test', payload='{}')
+    message.save(session=session)
+    session.flush()
+    assert_equal(message.bucket, partition_bucket(message.id))
+    assert_equal(sum(session.query(Message).filter_by(id=message.id).filter(get_partition_filter(Message.bucket, worker_number, 7)).count() for worker_number in xrange(7)), 1)
+    session.rollback()
+    session.close()
+
+    # The bucket ranges of the workers are contiguous and cover all buckets
+    for total_workers in (1, 3, 7, PARTITION_BUCKETS):
+        upper = 0
+        for worker_number in xrange(total_workers):
+            predicate = get_partition_filter(Message.bucket, worker_number, total_workers)
+            assert_equal(predicate.clauses[0].right.value, upper)
+            upper = predicate.clauses[1].right.value
+        assert_equal(upper, PARTITION_BUCKETS)
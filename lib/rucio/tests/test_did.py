@@ -27,12 +27,12 @@ from rucio.client.rseclient import RSEClient
 from rucio.client.scopeclient import ScopeClient
 from rucio.common.exception import (DataIdentifierNotFound, DataIdentifierAlreadyExists,
                                     FileAlreadyExists, FileConsistencyMismatch,
-                                    InvalidPath, KeyNotFound, UnsupportedOperation,
+                                    InvalidObject, InvalidPath, KeyNotFound, UnsupportedOperation,
                                     UnsupportedStatus, ScopeNotFound)
 from rucio.common.utils import generate_uuid
 from rucio.core.account_limit import set_account_limit
-from rucio.core.did import (list_dids, add_did, delete_dids, get_did_atime, touch_dids, attach_dids,
-                            get_metadata, set_metadata, get_did)
+from rucio.core.did import (list_dids, list_dids_page, list_files, list_files_page, add_did, delete_dids,
+                            get_did_atime, touch_dids, attach_dids, get_metadata, set_metadata, get_did)
 from rucio.core.rse import get_rse_id
 from rucio.core.replica import add_replica
 from rucio.db.sqla.constants import DIDType
@@ -116,6 +116,55 @@ class TestDIDCore:
         assert_equal(get_did(scope=tmp_scope, name=tmp_dsn1, dynamic=True)['bytes'], 20)
         assert_equal(get_did(scope=tmp_scope, name=tmp_dsn4, dynamic=True)['bytes'], 20)
 
+    def test_list_dids_page(self):
+        """ DATA IDENTIFIERS (CORE): List dids by pages """
+        tmp_scope = 'mock'
+        tmp_dsn = 'dsn_%s' % generate_uuid()
+        names = ['%s-%i' % (tmp_dsn, i) for i in xrange(7)]
+        for name in names:
+            add_did(scope=tmp_scope, name=name, type=DIDType.DATASET, account='root')
+
+        listed, marker = [], None
+        while True:
+            dids, marker = list_dids_page(scope=tmp_scope, filters={'name': '%s*' % tmp_dsn}, limit=3, marker=marker)
+            assert_true(len(dids) <= 3)
+            listed.extend(dids)
+            if marker is None:
+                break
+            assert_equal(marker, dids[-1])
+        assert_equal(listed, sorted(names))
+
+        dids, marker = list_dids_page(scope=tmp_scope, filters={'name': '%s*' % tmp_dsn}, limit=7, long=True)
+        assert_equal([d['name'] for d in dids], sorted(names))
+        assert_equal(marker, None)
+
+        assert_equal(list(list_dids(scope=tmp_scope, filters={'name': '%s*' % tmp_dsn}, limit=2, offset=5)), sorted(names)[5:])
+
+    def test_list_files_page(self):
+        """ DATA IDENTIFIERS (CORE): List files by pages """
+        tmp_scope = 'mock'
+        tmp_cnt = 'cnt_%s' % generate_uuid()
+        add_did(scope=tmp_scope, name=tmp_cnt, type=DIDType.CONTAINER, account='root')
+        names = []
+        for i in xrange(2):
+            tmp_dsn = 'dsn_%s' % generate_uuid()
+            files = [{'scope': tmp_scope, 'name': 'lfn.%s' % generate_uuid(), 'bytes': 1L, 'adler32': '0cc737eb'} for j in xrange(5)]
+            add_did(scope=tmp_scope, name=tmp_dsn, type=DIDType.DATASET, account='root')
+            attach_dids(scope=tmp_scope, name=tmp_dsn, rse='MOCK', dids=files, account='root')
+            attach_dids(scope=tmp_scope, name=tmp_cnt, dids=[{'scope': tmp_scope, 'name': tmp_dsn}], account='root')
+            names.extend(f['name'] for f in files)
+
+        listed, marker = [], None
+        while True:
+            files, marker = list_files_page(scope=tmp_scope, name=tmp_cnt, limit=3, marker=marker)
+            assert_true(len(files) <= 3)
+            listed.extend(f['name'] for f in files)
+            if marker is None:
+                break
+        assert_equal(len(listed), 10)
+        assert_equal(sorted(listed), sorted(names))
+        assert_equal(listed, [f['name'] for f in list_files(scope=tmp_scope, name=tmp_cnt)])
+
 
 class TestDIDApi:
 
@@ -149,6 +198,26 @@ class TestDIDApi:
         with assert_raises(DataIdentifierNotFound):
             did.set_new_dids([{'scope': 'dummyscope', 'name': 'dummyname', 'did_type': DIDType.DATASET}], None)
 
+    def test_list_dids_page(self):
+        """ DATA IDENTIFIERS (API): List dids with continuation tokens """
+        tmp_scope = scope_name_generator()
+        tmp_dsn = 'dsn_%s' % generate_uuid()
+        scope.add_scope(tmp_scope, 'jdoe', 'jdoe')
+        names = ['%s-%i' % (tmp_dsn, i) for i in xrange(5)]
+        for name in names:
+            did.add_did(scope=tmp_scope, name=name, type='DATASET', issuer='root')
+
+        dids, token = did.list_dids_page(scope=tmp_scope, filters={}, limit=2)
+        assert_equal(dids, names[:2])
+        dids, token = did.list_dids_page(scope=tmp_scope, filters={}, limit=5, continuation_token=token)
+        assert_equal(dids, names[2:])
+        assert_equal(token, None)
+
+        with assert_raises(InvalidObject):
+            did.list_dids_page(scope=tmp_scope, filters={}, continuation_token='Nimportnawak')
+        with assert_raises(InvalidObject):
+            did.list_dids_page(scope=tmp_scope, filters={}, continuation_token=did.encode_continuation_token(['mock', tmp_dsn]))
+
 
 class TestDIDClients:
 
@@ -190,6 +259,10 @@ class TestDIDClients:
             results.append(result)
         assert_equal(len(results), 3)
         results = []
+        for result in self.did_client.list_dids(tmp_scope, {'name': 'file*'}, type='file', page_size=2):
+            results.append(result)
+        assert_equal(results, sorted(tmp_files))
+        results = []
 
         filters = {'name': 'file*', 'created_after': datetime.utcnow() - timedelta(hours=1)}
         for result in self.did_client.list_dids(tmp_scope, filters):
@@ -713,6 +786,15 @@ class TestDIDClients:
         with assert_raises(DataIdentifierNotFound):
             self.did_client.list_files(scope, 'Nimportnawak')
 
+        # List container content by pages
+        names = [f['name'] for f in self.did_client.list_files(scope, container, page_size=3)]
+        assert_equal(sorted(names), sorted(f['name'] for f in files1 + files2))
+        files, token = self.did_client.list_files_page(scope, container, limit=15)
+        assert_equal(len(files), 15)
+        files, token = self.did_client.list_files_page(scope, container, limit=15, continuation_token=token)
+        assert_equal(len(files), 5)
+        assert_equal(token, None)
+
     def test_list_replicas(self):
         """ DATA IDENTIFIERS (CLIENT): List replicas for a container"""
         rse = 'MOCK'
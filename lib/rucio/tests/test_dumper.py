@@ -12,6 +12,7 @@
 
 import __builtin__
 import os
+import shutil
 import tempfile
 
 from StringIO import StringIO
@@ -225,3 +226,123 @@ def test_srm_download_creates_file_with_content():
 
     local_file.seek(0)
     eq_(local_file.read(), 'content')
+
+
+class FakeRangeSession(object):
+    def __init__(self, content, fail_from=None, etag='"v1"'):
+        self.content = content
+        self.fail_from = fail_from
+        self.etag = etag
+        self.head_etag = etag
+        self.ranges = []
+
+    def head(self, url):
+        response = requests.Response()
+        response.status_code = 200
+        response.headers['content-length'] = str(len(self.content))
+        response.headers['accept-ranges'] = 'bytes'
+        if self.head_etag is not None:
+            response.headers['etag'] = self.head_etag
+        return response
+
+    def get(self, url, headers):
+        response = requests.Response()
+        if headers.get('If-Range', self.etag) != self.etag:
+            # The file changed, the whole file is sent
+            response.status_code = 200
+            response.iter_content = lambda _: [self.content]
+            return response
+        start, end = (int(bound) for bound in headers['Range'].split('=')[1].split('-'))
+        self.ranges.append((start, end))
+        response.status_code = 206
+        data = self.content[start:end + 1]
+        if self.fail_from is not None and start <= self.fail_from <= end:
+            # The connection breaks in the middle of the range
+            data = data[:self.fail_from - start]
+        response.iter_content = lambda _: [data]
+        return response
+
+
+class TestHTTPDownloadResumable(object):
+    def setUp(self):  # pylint: disable=invalid-name
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'dump')
+
+    def tearDown(self):  # pylint: disable=invalid-name
+        shutil.rmtree(self.tmp_dir)
+
+    def _fail_download(self, session):
+        try:
+            dumper.http_download_resumable('http://example.com', self.path, session=session, parts=4, min_part_size=10)
+        except dumper.HTTPDownloadFailed:
+            pass
+        else:
+            raise AssertionError('The download did not fail')
+        ok_(not os.path.exists(self.path))
+
+    def test_http_download_resumable_downloads_ranges_concurrently(self):
+        session = FakeRangeSession('0123456789' * 10)
+
+        dumper.http_download_resumable('http://example.com', self.path, session=session, parts=4, min_part_size=10)
+
+        eq_(sorted(session.ranges), [(0, 24), (25, 49), (50, 74), (75, 99)])
+        with open(self.path) as f:
+            eq_(f.read(), '0123456789' * 10)
+        eq_(os.listdir(self.tmp_dir), ['dump'])
+
+    def test_http_download_resumable_resumes_incomplete_ranges(self):
+        session = FakeRangeSession('0123456789' * 10, fail_from=60)
+        self._fail_download(session)
+
+        session.fail_from = None
+        session.ranges = []
+        dumper.http_download_resumable('http://example.com', self.path, session=session, parts=4, min_part_size=10)
+
+        eq_(session.ranges, [(60, 74)])
+        with open(self.path) as f:
+            eq_(f.read(), '0123456789' * 10)
+        eq_(os.listdir(self.tmp_dir), ['dump'])
+
+    def test_http_download_resumable_discards_ranges_of_another_file(self):
+        session = FakeRangeSession('0123456789' * 10, fail_from=60)
+        self._fail_download(session)
+
+        # Another dump of the same size
+        session.content = 'abcdefghij' * 10
+        session.etag = session.head_etag = '"v2"'
+        session.fail_from = None
+        session.ranges = []
+        dumper.http_download_resumable('http://example.com', self.path, session=session, parts=4, min_part_size=10)
+
+        eq_(sorted(session.ranges), [(0, 24), (25, 49), (50, 74), (75, 99)])
+        with open(self.path) as f:
+            eq_(f.read(), 'abcdefghij' * 10)
+
+    def test_http_download_resumable_discards_ranges_without_etag(self):
+        session = FakeRangeSession('0123456789' * 10, fail_from=60, etag=None)
+        self._fail_download(session)
+
+        session.fail_from = None
+        session.ranges = []
+        dumper.http_download_resumable('http://example.com', self.path, session=session, parts=4, min_part_size=10)
+
+        eq_(sorted(session.ranges), [(0, 24), (25, 49), (50, 74), (75, 99)])
+
+    def test_http_download_resumable_file_changed_during_download(self):
+        session = FakeRangeSession('0123456789' * 10)
+        session.etag = '"v2"'
+        self._fail_download(session)
+
+        eq_(os.listdir(self.tmp_dir), ['dump.etag'])
+
+    def test_http_download_resumable_without_range_support(self):
+        response = requests.Response()
+        response.status_code = 200
+        response.iter_content = lambda _: ['content']
+        session = requests.Session()
+        session.get = lambda _: response
+
+        dumper.http_download_resumable('http://example.com', self.path, session=session, head=response)
+
+        with open(self.path) as f:
+            eq_(f.read(), 'content')
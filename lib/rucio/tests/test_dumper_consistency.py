@@ -27,6 +27,7 @@ from rucio.common.dumper.consistency import compare3
 from rucio.common.dumper.consistency import gnu_sort
 from rucio.common.dumper.consistency import min3
 from rucio.common.dumper.consistency import parse_and_filter_file
+from rucio.common.dumper.consistency import partition_file
 from rucio.tests.common import make_temp_file
 from rucio.tests.common import stubbed
 
@@ -238,6 +239,105 @@ class TestConsistency(object):
         ok_('user.someuser.dark' in dark)
         ok_('user.someuser.lost' in lost)
 
+    def test_consistency_manual_partitioned(self):
+        ''' DUMPER '''
+        line = 'MOCK_SCRATCHDISK\tuser.someuser\t{0}\t19028d77\t189468\t2015-09-20 21:22:04\tuser/someuser/{1}/{0}\t2015-09-20 21:22:17\t{2}\n'
+        rucio_dump_1 = ''.join(line.format('file%d' % i, 'dir%d' % (i % 7), 'U' if i == 3 else 'A') for i in xrange(40))
+        rucio_dump_2 = ''.join(line.format('file%d' % i, 'dir%d' % (i % 7), 'A') for i in xrange(40) if i != 5)
+        storage_dump = ''.join('/pnfs/example.com/atlas/atlasdatadisk/rucio/user/someuser/dir{0}/file{1}\n'.format(i % 7, i)
+                               for i in xrange(45) if i not in (3, 10, 20))
+
+        rrdf1 = make_temp_file(self.tmp_dir, rucio_dump_1)
+        rrdf2 = make_temp_file(self.tmp_dir, rucio_dump_2)
+        sdf = make_temp_file(self.tmp_dir, storage_dump)
+
+        results = {}
+        for partitions in (None, 4):
+            with stubbed(dumper.agis_endpoints_data, self.fake_agis_data):
+                consistency = Consistency.dump(
+                    'consistency-manual',
+                    'MOCK_SCRATCHDISK',
+                    sdf,
+                    prev_date_fname=rrdf1,
+                    next_date_fname=rrdf2,
+                    sort_rucio_replica_dumps=True,
+                    cache_dir=tempfile.mkdtemp(dir=self.tmp_dir),
+                    partitions=partitions,
+                    processes=2,
+                )
+                results[partitions] = sorted((entry.apparent_status, entry.path) for entry in consistency)
+
+        eq_(results[4], results[None])
+        eq_(results[4], sorted([('DARK', 'user/someuser/dir{0}/file{1}'.format(i % 7, i)) for i in (40, 41, 42, 43, 44)] +
+                               [('LOST', 'user/someuser/dir3/file10'), ('LOST', 'user/someuser/dir6/file20')]))
+
+    def test_consistency_manual_binary_cache(self):
+        ''' DUMPER '''
+        line = 'MOCK_SCRATCHDISK\tuser.someuser\t{0}\t19028d77\t189468\t2015-09-20 21:22:04\tuser/someuser/{1}/{0}\t2015-09-20 21:22:17\t{2}\n'
+        rucio_dump_1 = ''.join(line.format('file%d' % i, 'dir%d' % (i % 7), 'U' if i == 3 else 'A') for i in xrange(40))
+        rucio_dump_2 = ''.join(line.format('file%d' % i, 'dir%d' % (i % 7), 'A') for i in xrange(40) if i != 5)
+        storage_dump = ''.join('/pnfs/example.com/atlas/atlasdatadisk/rucio/user/someuser/dir{0}/file{1}\n'.format(i % 7, i)
+                               for i in xrange(45) if i not in (3, 10, 20))
+
+        rrdf1 = make_temp_file(self.tmp_dir, rucio_dump_1)
+        rrdf2 = make_temp_file(self.tmp_dir, rucio_dump_2)
+        sdf = make_temp_file(self.tmp_dir, storage_dump)
+        cache_dir = tempfile.mkdtemp(dir=self.tmp_dir)
+
+        for _ in xrange(2):
+            with stubbed(dumper.agis_endpoints_data, self.fake_agis_data):
+                consistency = Consistency.dump(
+                    'consistency-manual',
+                    'MOCK_SCRATCHDISK',
+                    sdf,
+                    prev_date_fname=rrdf1,
+                    next_date_fname=rrdf2,
+                    cache_dir=cache_dir,
+                    binary_cache=True,
+                )
+                eq_(sorted((entry.apparent_status, entry.path) for entry in consistency),
+                    sorted([('DARK', 'user/someuser/dir{0}/file{1}'.format(i % 7, i)) for i in (40, 41, 42, 43, 44)] +
+                           [('LOST', 'user/someuser/dir3/file10'), ('LOST', 'user/someuser/dir6/file20')]))
+
+            # Only the caches are kept
+            eq_(sorted(name.rsplit('_', 1)[1] for name in os.listdir(cache_dir)), ['cache'] * 3)
+
+    def test_partition_file(self):
+        ''' DUMPER '''
+        data = ''.join('dir{0}/file{1},A\n'.format(i % 5, i) for i in xrange(50))
+        path = make_temp_file(self.tmp_dir, data)
+
+        partitions = partition_file(path, parser=str.strip, partitions=3, cache_dir=self.tmp_dir)
+        eq_(len(partitions), 3)
+        directories = []
+        lines = []
+        for partition in partitions:
+            with open(partition) as f:
+                content = f.read().splitlines()
+            lines.extend(content)
+            directories.append(set(line.split('/')[0] for line in content))
+        eq_(sorted(lines), sorted(data.splitlines()))
+        for i, partition in enumerate(directories):
+            for other in directories[i + 1:]:
+                eq_(partition & other, set())
+
+        # The partitions are reused
+        eq_(partition_file(path, parser=str.strip, partitions=3, cache_dir=self.tmp_dir), partitions)
+
+    def test_partition_file_commas(self):
+        ''' DUMPER '''
+        paths = ['dir{0},x/file,{1}'.format(i, i) for i in xrange(20)]
+        replicas = partition_file(make_temp_file(self.tmp_dir, ''.join('{0},A\n'.format(p) for p in paths)),
+                                  parser=str.strip, partitions=4, cache_dir=self.tmp_dir)
+        storage = partition_file(make_temp_file(self.tmp_dir, ''.join('{0}\n'.format(p) for p in paths)),
+                                 parser=str.strip, states=False, partitions=4, cache_dir=self.tmp_dir)
+        # A path is in the same partition of both dumps
+        for replica_partition, storage_partition in zip(replicas, storage):
+            with open(replica_partition) as f:
+                replica_paths = [line.rsplit(',', 1)[0] for line in f.read().splitlines()]
+            with open(storage_partition) as f:
+                eq_(f.read().splitlines(), replica_paths)
+
     def test__try_to_advance(self):
         ''' DUMPER '''
         i = iter(['   abc  '])
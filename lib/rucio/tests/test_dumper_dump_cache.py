@@ -0,0 +1,66 @@
+# Copyright European Organization for Nuclear Research (CERN)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+
+from nose.tools import eq_
+from nose.tools import raises
+from rucio.common.dumper.dump_cache import DumpCache
+from rucio.common.dumper.dump_cache import DumpCacheError
+from rucio.common.dumper.dump_cache import write_dump_cache
+import os
+import shutil
+import tempfile
+
+
+class TestDumpCache(object):
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'cache')
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, lines, states=True):
+        with open(self.path, 'wb') as output:
+            return write_dump_cache(lines, output, states=states, tmp_dir=self.tmp_dir)
+
+    def test_replica_dump(self):
+        lines = ['a/b/file1,A\n', 'a/b/file2,U\n', 'a/b/file2,U\n', 'a/c/file1,A\n', 'file0,D\n', 'z/b/file3,A\n']
+        eq_(self.write(sorted(lines)), 5)
+
+        with DumpCache(self.path) as cache:
+            eq_(len(cache), 5)
+            eq_(list(cache), [('a/b/file1', 'A'), ('a/b/file2', 'U'), ('a/c/file1', 'A'), ('file0', 'D'), ('z/b/file3', 'A')])
+            eq_(cache[-1], ('z/b/file3', 'A'))
+            eq_(cache.state('a/c/file1'), 'A')
+            eq_(cache.state('a/c/file2'), None)
+            eq_('file0' in cache, True)
+            eq_('a/b' in cache, False)
+            eq_(list(cache.lines()), [line.strip() for line in sorted(set(lines))])
+
+    def test_storage_dump(self):
+        lines = ['a/b,c/file1', 'a/b/file1', 'a/b/file2']
+        eq_(self.write(lines, states=False), 3)
+
+        with DumpCache(self.path) as cache:
+            eq_(list(cache), [(line, None) for line in lines])
+            eq_(list(cache.lines()), lines)
+            eq_(cache.find('a/b/file2'), 2)
+
+    def test_empty_dump(self):
+        self.write([])
+        with DumpCache(self.path) as cache:
+            eq_(len(cache), 0)
+            eq_(cache.find('a'), None)
+
+    @raises(DumpCacheError)
+    def test_unsorted_dump(self):
+        self.write(['a/b/file2,A', 'a/b/file1,A'])
+
+    @raises(DumpCacheError)
+    def test_not_a_cache(self):
+        with open(self.path, 'w') as f:
+            f.write('a/b/file1,A\n' * 10)
+        DumpCache(self.path)
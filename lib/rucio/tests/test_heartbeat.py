@@ -14,6 +14,9 @@ import threading
 from nose.tools import assert_equal
 
 from rucio.core.heartbeat import live, die, cardiac_arrest
+from rucio.core.membership import HashRing, Membership, get_assignment
+from rucio.core import membership
+from rucio.db.sqla.constants import PARTITION_BUCKETS
 
 
 class TestHeartbeat:
@@ -70,5 +73,69 @@ class TestHeartbeat:
         die('test0', 'host2', pids[2], threads[2])
         assert_equal(live('test0', 'host3', pids[3], threads[3]), {'assign_thread': 1, 'nr_threads': 2})
 
+    def test_hash_ring(self):
+        """ HEARTBEAT (CORE): Consistent hash ring over the partition buckets """
+
+        members = [('host%d' % i, 1000 + i, 1) for i in xrange(8)]
+        ring = HashRing(members)
+        assignments = [ring.buckets(member) for member in members]
+        assert_equal(sorted(sum(assignments, [])), range(PARTITION_BUCKETS))
+        for buckets in assignments:
+            assert len(buckets) > PARTITION_BUCKETS / len(members) / 3
+
+        # Only the buckets of the new member move
+        joined = HashRing(members + [('host8', 1008, 1)])
+        moved = [bucket for bucket in xrange(PARTITION_BUCKETS) if ring.owner(bucket) != joined.owner(bucket)]
+        assert_equal(set(joined.owner(bucket) for bucket in moved), set([('host8', 1008, 1)]))
+        assert len(moved) < 2 * PARTITION_BUCKETS / len(members)
+
+        # Only the buckets of the leaving member move
+        left = HashRing(members[1:])
+        moved = [bucket for bucket in xrange(PARTITION_BUCKETS) if ring.owner(bucket) != left.owner(bucket)]
+        assert_equal(moved, assignments[0])
+
+    def test_membership(self):
+        """ HEARTBEAT (CORE): Cached membership """
+
+        pids = [self.__pid() for _ in xrange(2)]
+        threads = [self.__thread() for _ in xrange(2)]
+        first = Membership('test0', 'host0', pids[0], threads[0], refresh_interval=3600)
+        second = Membership('test0', 'host1', pids[1], threads[1], refresh_interval=3600)
+        assert_equal(first.assignment(), None)
+        assert_equal(first.refresh(), {'assign_thread': 0, 'nr_threads': 1, 'buckets': range(PARTITION_BUCKETS)})
+        assignment = second.refresh()
+        assert_equal((assignment['assign_thread'], assignment['nr_threads']), (1, 2))
+
+        # The members are cached until the next refresh
+        assert_equal(first.refresh()['nr_threads'], 1)
+        assignment = first.refresh(force=True)
+        assert_equal(assignment['nr_threads'], 2)
+        assert_equal(sorted(assignment['buckets'] + second.assignment()['buckets']), range(PARTITION_BUCKETS))
+
+        assert_equal(get_assignment('test0', 'host2', pids[0], threads[0]), None)
+        assignment = membership.live('test0', 'host2', pids[0], threads[0])
+        assert_equal(get_assignment('test0', 'host2', pids[0], threads[0]), assignment)
+        membership.die('test0', 'host2', pids[0], threads[0])
+        assert_equal(get_assignment('test0', 'host2', pids[0], threads[0]), None)
+
+    def test_membership_join(self):
+        """ HEARTBEAT (CORE): Members starting together own disjoint buckets after joining """
+
+        pids = [self.__pid() for _ in xrange(2)]
+        assignments = {}
+
+        def run(i):
+            assignments[i] = membership.join('test0', 'host%d' % i, pids[i], threading.current_thread(), delay=1)
+            membership.die('test0', 'host%d' % i, pids[i], threading.current_thread())
+        threads = [threading.Thread(target=run, args=(i, )) for i in xrange(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert_equal([assignments[i]['nr_threads'] for i in xrange(2)], [2, 2])
+        assert_equal(set(assignments[0]['buckets']) & set(assignments[1]['buckets']), set())
+        assert_equal(sorted(assignments[0]['buckets'] + assignments[1]['buckets']), range(PARTITION_BUCKETS))
+
     def tearDown(self):
         cardiac_arrest()
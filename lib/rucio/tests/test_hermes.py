@@ -13,9 +13,35 @@
 Hermes Test
 """
 
+import smtplib
+
+from nose.tools import assert_equal
+
 from rucio.common.config import config_get
-from rucio.core.message import add_message
+from rucio.core.message import add_message, retrieve_messages, truncate_messages
 from rucio.daemons.hermes import hermes
+from rucio.db.sqla.models import MessageHistory
+from rucio.db.sqla.session import get_session
+
+
+class MockConnection(object):
+    ''' Acknowledges the sent messages with receipts, or fails every send. '''
+
+    def __init__(self, fail=False, receipts=True):
+        self.fail = fail
+        self.receipts = receipts
+        self.sent = []
+        self.listener = None
+
+    def set_listener(self, name, listener):
+        self.listener = listener
+
+    def send(self, body, destination, headers):
+        if self.fail:
+            raise Exception('broker down')
+        self.sent.append(headers['receipt'])
+        if self.receipts:
+            self.listener.on_receipt({'receipt-id': headers['receipt']}, '')
 
 
 class TestHermes(object):
@@ -39,3 +65,96 @@ class TestHermes(object):
                                   Thank you, and have a very safe, and productive day.'''})
 
         hermes.run(once=True, send_email=False)
+
+    def test_delivery_pipeline(self):
+        ''' HERMES (DAEMON): Deliver messages concurrently and delete them on receipt. '''
+        truncate_messages()
+        for i in xrange(20):
+            add_message('test-pipeline', {'test': i})
+
+        conns = [{'conn': MockConnection(), 'broker': 'broker1', 'use': False, 'retry': 0},
+                 {'conn': MockConnection(fail=True), 'broker': 'broker2', 'use': True, 'retry': 0},
+                 {'conn': MockConnection(receipts=False), 'broker': 'broker3', 'use': False, 'retry': 0}]
+        pipeline = hermes.DeliveryPipeline(conns=conns, destination='/topic/test', bulk=10, receipt_timeout=60)
+        pipeline.start()
+        assert_equal(pipeline.fill(thread=0, total_threads=1), 10)
+        # The failing broker is taken out of use, its message is left to the working one
+        while conns[1]['use']:
+            hermes.graceful_stop.wait(0.1)
+        conns[0]['use'] = True
+        # The next bulk is retrieved once the outbox drains, without the messages in flight
+        retrieved = pipeline.fill(thread=0, total_threads=1)
+        while retrieved is None:
+            hermes.graceful_stop.wait(0.1)
+            retrieved = pipeline.fill(thread=0, total_threads=1)
+        assert_equal(retrieved, 10)
+        pipeline.stop(timeout=10)
+
+        assert_equal(conns[1]['use'], False)
+        assert_equal(len(set(conns[0]['conn'].sent)), 20)
+        assert_equal(pipeline.deleted, 20)
+        assert_equal(retrieve_messages(event_type='test-pipeline'), [])
+        session = get_session()
+        assert_equal(session.query(MessageHistory).filter(MessageHistory.id.in_(conns[0]['conn'].sent)).count(), 20)
+        session.close()
+
+    def test_receipt_timeout(self):
+        ''' HERMES (DAEMON): Send messages again without receipt. '''
+        truncate_messages()
+        for i in xrange(5):
+            add_message('test-pipeline', {'test': i})
+
+        conns = [{'conn': MockConnection(receipts=False), 'broker': 'broker1', 'use': True, 'retry': 0}]
+        pipeline = hermes.DeliveryPipeline(conns=conns, destination='/topic/test', bulk=10, receipt_timeout=0)
+        pipeline.start()
+        assert_equal(pipeline.fill(thread=0, total_threads=1), 5)
+        while len(conns[0]['conn'].sent) < 5:
+            hermes.graceful_stop.wait(0.1)
+        assert_equal(pipeline.fill(thread=0, total_threads=1), 5)
+        pipeline.stop()
+        assert_equal(pipeline.deleted, 0)
+        truncate_messages()
+
+    def test_email_digests(self):
+        ''' HERMES (DAEMON): Aggregate the notifications per digest and recipients. '''
+        messages = [{'id': str(i), 'payload': {'to': to, 'subject': 'rule %i' % i, 'body': 'body %i' % i, 'digest': digest}}
+                    for i, (to, digest) in enumerate([(['a@cern.ch'], 'rules'), (['a@cern.ch'], 'rules'), (['b@cern.ch'], 'rules'),
+                                                      (['a@cern.ch'], None), (['a@cern.ch'], 'others')])]
+        emails = dict((tuple(ids), (to, msg)) for ids, to, msg in hermes.build_emails(messages, 'rucio@cern.ch'))
+        assert_equal(sorted(emails), [('0', '1'), ('2',), ('3',), ('4',)])
+        assert_equal(emails[('0', '1')][0], ['a@cern.ch'])
+        assert_equal(emails[('0', '1')][1]['Subject'], 'rules (2 notifications)')
+        assert_equal(emails[('2',)][1]['Subject'], 'rule 2')
+        assert_equal(emails[('3',)][1]['To'], 'a@cern.ch')
+
+    def test_email_connection_reuse(self):
+        ''' HERMES (DAEMON): Send a batch of emails on pooled SMTP connections. '''
+        connections = []
+
+        class MockSMTP(object):
+            def __init__(self):
+                self.sent = []
+                connections.append(self)
+
+            def connect(self):
+                pass
+
+            def sendmail(self, sender, to, body):
+                if to == ['down@cern.ch']:
+                    raise smtplib.SMTPServerDisconnected('down')
+                self.sent.append(to)
+
+            def quit(self):
+                pass
+
+        messages = [{'id': str(i), 'payload': {'to': ['user%i@cern.ch' % i], 'subject': 'test', 'body': 'test'}} for i in xrange(20)]
+        messages.append({'id': 'down', 'payload': {'to': ['down@cern.ch'], 'subject': 'test', 'body': 'test'}})
+        smtp, hermes.smtplib.SMTP = hermes.smtplib.SMTP, MockSMTP
+        try:
+            done = hermes.send_emails(hermes.build_emails(messages, 'rucio@cern.ch'), workers=3)
+        finally:
+            hermes.smtplib.SMTP = smtp
+        assert_equal(sorted(done), sorted(str(i) for i in xrange(20)))
+        # At most one connection per worker, and one more after the failure
+        assert len(connections) <= 4
+        assert_equal(sum(len(connection.sent) for connection in connections), 20)
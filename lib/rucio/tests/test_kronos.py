@@ -0,0 +1,86 @@
+#  Copyright European Organization for Nuclear Research (CERN)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  You may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+
+"""
+Kronos Test
+"""
+
+from datetime import datetime
+from json import dumps
+from Queue import Queue
+from time import mktime
+
+from nose.tools import assert_equal
+
+from rucio.common.utils import generate_uuid, LRUCache
+from rucio.core.did import add_did, attach_dids, get_did_atime
+from rucio.core.replica import add_replicas, get_replica_atime
+from rucio.daemons.tracer.kronos import AMQConsumer
+from rucio.db.sqla.constants import DIDType
+
+
+class MockConnection(object):
+    ''' Records the acknowledged and sent messages. '''
+
+    def __init__(self):
+        self.acks = []
+        self.sent = []
+
+    def ack(self, id, subscription_id):
+        self.acks.append(id)
+
+    def send(self, body, destination, headers):
+        self.sent.append(body)
+
+
+class TestKronos(object):
+    ''' Test the tracer consumer. '''
+
+    def test_coalesce_accesses(self):
+        ''' KRONOS (DAEMON): Coalesce the accesses to a replica and its dataset. '''
+        scope, dataset = 'mock', 'dataset_%s' % generate_uuid()
+        files = [{'scope': scope, 'name': 'file_%s' % generate_uuid(), 'bytes': 1L, 'adler32': '0cc737eb'} for i in xrange(2)]
+        add_replicas(rse='MOCK', files=files, account='root')
+        add_did(scope=scope, name=dataset, type=DIDType.DATASET, account='root')
+        attach_dids(scope=scope, name=dataset, dids=files, account='root')
+
+        conn, dataset_queue = MockConnection(), Queue()
+        consumer = AMQConsumer(broker='localhost', conn=conn, queue='/queue/test', chunksize=2, subscription_id='test',
+                               excluded_usrdns=set(), dataset_queue=dataset_queue, parent_cache=LRUCache(10), atime_window=3600)
+
+        times = [datetime(2017, 1, 1, hour) for hour in (3, 5, 1)]
+        reports = [(files[0], times[0]), (files[0], times[1]), (files[0], times[2]), (files[1], times[2])]
+        for i, (f, accessed_at) in enumerate(reports):
+            consumer.on_message({'message-id': str(i), 'appversion': 'rucio'},
+                                dumps({'eventType': 'get', 'eventVersion': 'test', 'clientState': 'DONE', 'usrdn': 'someuser',
+                                       'scope': f['scope'], 'filename': f['name'], 'remoteSite': 'MOCK',
+                                       'traceTimeentryUnix': mktime(accessed_at.timetuple())}))
+
+        # The accesses stay buffered until the window expires
+        assert_equal(conn.acks, [])
+        assert_equal(get_replica_atime({'scope': scope, 'name': files[0]['name'], 'rse': 'MOCK'}), None)
+
+        consumer.flush(force=True)
+        assert_equal(sorted(conn.acks), ['0', '1', '2', '3'])
+        assert_equal(conn.sent, [])
+        assert_equal(get_replica_atime({'scope': scope, 'name': files[0]['name'], 'rse': 'MOCK'}), datetime.utcfromtimestamp(mktime(times[1].timetuple())))
+        assert_equal(get_did_atime(scope=scope, name=files[1]['name']), datetime.utcfromtimestamp(mktime(times[2].timetuple())))
+
+        datasets = [dataset_queue.get() for i in xrange(dataset_queue.qsize())]
+        assert_equal([(d['name'], d['rse'], d['accessed_at']) for d in datasets], [(dataset, 'MOCK', datetime.utcfromtimestamp(mktime(times[1].timetuple())))])
+
+    def test_lru_cache(self):
+        ''' KRONOS (DAEMON): Evict the least recently used parents. '''
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert_equal(cache.get('a'), 1)
+        cache.set('c', 3)
+        assert_equal(cache.get('b'), None)
+        assert_equal((cache.get('a'), cache.get('c'), len(cache)), (1, 3, 2))
+        cache.delete('a')
+        assert_equal('a' in cache, False)
@@ -13,12 +13,18 @@
 Test the Permission Core and API
 """
 
-from nose.tools import assert_true, assert_false
+from nose.tools import assert_equal, assert_true, assert_false
 
 from rucio.api.permission import has_permission
 from rucio.common.config import config_get
+from rucio.common.utils import generate_uuid
+from rucio.core import permission_cache
+from rucio.core.account import add_account, add_account_attribute, del_account_attribute
 from rucio.core.scope import add_scope
-from rucio.tests.common import scope_name_generator
+from rucio.db.sqla import models
+from rucio.db.sqla.constants import AccountType
+from rucio.db.sqla.session import get_session
+from rucio.tests.common import account_name_generator, scope_name_generator
 
 
 class TestPermissionCoreApi(object):
@@ -68,3 +74,73 @@ class TestPermissionCoreApi(object):
         gsscred = 'ddmlab@CERN.CH'
         assert_true(has_permission(issuer='root', action='get_auth_token_gss', kwargs={'account': 'root', 'gsscred': gsscred}))
         assert_false(has_permission(issuer='root', action='get_auth_token_gss', kwargs={'account': self.usr, 'gsscred': gsscred}))
+
+
+class CountingPermission(object):
+    """ Permission function counting its calls """
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, issuer, action, kwargs):
+        self.calls += 1
+        return True
+
+
+class TestPermissionCache(object):
+    """
+    Test the cache of the permission checks
+    """
+
+    def setup(self):
+        """ Setup Test Case """
+        self.account = account_name_generator()
+        add_account(self.account, AccountType.USER, 'rucio@email.com')
+
+    def test_account_attribute_invalidation(self):
+        """ PERMISSION(CORE): Account attributes are cached and invalidated on change """
+        assert_false(has_permission(issuer=self.account, action='add_rse', kwargs={}))
+        add_account_attribute(account=self.account, key='admin', value=True)
+        assert_true(has_permission(issuer=self.account, action='add_rse', kwargs={}))
+        del_account_attribute(account=self.account, key='admin')
+        assert_false(has_permission(issuer=self.account, action='add_rse', kwargs={}))
+
+    def test_account_attribute_cached(self):
+        """ PERMISSION(CORE): Account attributes are served from the cache until invalidated """
+        assert_false(permission_cache.has_account_attribute(account=self.account, key='admin'))
+        session = get_session()
+        models.AccountAttrAssociation(account=self.account, key='admin', value=True).save(session=session)
+        session.commit()
+        if permission_cache.CACHE_TTL > 0:
+            assert_false(permission_cache.has_account_attribute(account=self.account, key='admin'))
+        permission_cache.invalidate(self.account)
+        assert_true(permission_cache.has_account_attribute(account=self.account, key='admin'))
+        assert_equal(permission_cache.list_account_attributes(account=self.account), [{'key': 'admin', 'value': True}])
+
+    def test_scope_owner_invalidation(self):
+        """ PERMISSION(CORE): Scope ownership is invalidated when a scope is added """
+        scope = scope_name_generator()
+        assert_false(permission_cache.is_scope_owner(scope=scope, account=self.account))
+        add_scope(scope=scope, account=self.account)
+        assert_true(permission_cache.is_scope_owner(scope=scope, account=self.account))
+        assert_true(has_permission(issuer=self.account, action='add_did', kwargs={'scope': scope}))
+
+    def test_request_memoization(self):
+        """ PERMISSION(CORE): Decisions are memoised within a request """
+        function = CountingPermission()
+        kwargs = {'scope': 'mock', 'name': generate_uuid(), 'dids': [{'scope': 'mock', 'name': 'file'}]}
+        permission_cache.memoize_decision(function, issuer=self.account, action='attach_dids', kwargs=kwargs)
+        assert_equal(function.calls, 1)
+
+        permission_cache.begin_request()
+        try:
+            for _ in xrange(3):
+                assert_true(permission_cache.memoize_decision(function, issuer=self.account, action='attach_dids', kwargs=dict(kwargs)))
+            permission_cache.memoize_decision(function, issuer=self.account, action='detach_dids', kwargs=kwargs)
+        finally:
+            permission_cache.end_request()
+        expected = 3 if permission_cache.CACHE_TTL > 0 else 5
+        assert_equal(function.calls, expected)
+
+        permission_cache.memoize_decision(function, issuer=self.account, action='attach_dids', kwargs=kwargs)
+        assert_equal(function.calls, expected + 1)
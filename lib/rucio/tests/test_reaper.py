@@ -9,10 +9,21 @@
   Authors:
   - Vincent Garonne, <vincent.garonne@cern.ch>, 2013-2017
 '''
+import time
+
+from datetime import datetime, timedelta
+
+from nose.tools import assert_equal, assert_true
+
 from rucio.common.utils import generate_uuid
 from rucio.core import rse as rse_core
 from rucio.core import replica as replica_core
-from rucio.daemons.reaper.reaper import reaper
+from rucio.core.deletion_candidates import DeletionCandidates
+from rucio.daemons.reaper.reaper import reaper, DeletionExecutor
+from rucio.db.sqla import models
+from rucio.db.sqla.constants import ReplicaState, OBSOLETE
+from rucio.db.sqla.session import get_session
+from rucio.rse import rsemanager as rsemgr
 
 
 def test_reaper():
@@ -29,3 +40,93 @@ def test_reaper():
     rses = [rse_core.get_rse('MOCK'), ]
     reaper(once=True, rses=rses)
     reaper(once=True, rses=rses)
+
+
+def test_deletion_candidates():
+    """ REAPER (CORE): Test the deletion candidate index."""
+    rse = 'MOCK_' + generate_uuid()[:8].upper()
+    rse_id = rse_core.add_rse(rse)
+    files = [{'scope': 'mock', 'name': 'lfn' + generate_uuid(), 'bytes': 1, 'adler32': '0cc737eb',
+              'tombstone': datetime.utcnow() - timedelta(days=10 - i)} for i in xrange(5)]
+    replica_core.add_replicas(rse=rse, files=files, account='root')
+
+    candidates = DeletionCandidates(rse_id=rse_id, delay_seconds=600, window=2)
+    replicas = candidates.get(limit=2)
+    assert_equal([replica['name'] for replica in replicas], [f['name'] for f in files[:2]])
+    replica_core.update_replicas_states([{'rse': rse, 'scope': 'mock', 'name': replica['name'], 'state': ReplicaState.BEING_DELETED} for replica in replicas])
+
+    # A replica locked after it was indexed is skipped, a new obsolete replica comes first
+    replica_core.update_replica_lock_counter(rse=rse, scope='mock', name=files[2]['name'], value=1)
+    obsolete = {'scope': 'mock', 'name': 'lfn' + generate_uuid(), 'bytes': 1, 'adler32': '0cc737eb', 'tombstone': OBSOLETE}
+    replica_core.add_replicas(rse=rse, files=[obsolete], account='root')
+    replicas = candidates.get(limit=10)
+    assert_equal([replica['name'] for replica in replicas], [obsolete['name'], files[3]['name'], files[4]['name']])
+    replica_core.update_replicas_states([{'rse': rse, 'scope': 'mock', 'name': replica['name'], 'state': ReplicaState.BEING_DELETED} for replica in replicas])
+
+    assert_equal(candidates.get(limit=10), [])
+    replica_core.update_replica_lock_counter(rse=rse, scope='mock', name=files[2]['name'], value=-1)
+    candidates.invalidate()
+    assert_equal([replica['name'] for replica in candidates.get(limit=10)], [files[2]['name']])
+
+
+def test_deletion_candidates_retry():
+    """ REAPER (CORE): Test the retry of the deletion candidates which were not deleted."""
+    rse = 'MOCK_' + generate_uuid()[:8].upper()
+    rse_id = rse_core.add_rse(rse)
+    files = [{'scope': 'mock', 'name': 'lfn' + generate_uuid(), 'bytes': 1, 'adler32': '0cc737eb',
+              'tombstone': datetime.utcnow() - timedelta(days=10 - i)} for i in xrange(4)]
+    replica_core.add_replicas(rse=rse, files=files, account='root')
+
+    # The replicas which could not be marked BEING_DELETED are given back
+    candidates = DeletionCandidates(rse_id=rse_id, delay_seconds=1)
+    replicas = candidates.get(limit=2)
+    assert_equal([replica['name'] for replica in candidates.get(limit=2)], [f['name'] for f in files[2:]])
+    candidates.requeue(replicas)
+    replicas = candidates.get(limit=10)
+    assert_equal([replica['name'] for replica in replicas], [f['name'] for f in files[:2]])
+
+    # The BEING_DELETED replicas are selected again after the delay
+    replica_core.update_replicas_states([{'rse': rse, 'scope': 'mock', 'name': replica['name'], 'state': ReplicaState.BEING_DELETED} for replica in replicas])
+    assert_equal(candidates.get(limit=10), [])
+    time.sleep(2)
+    assert_equal(sorted(replica['name'] for replica in candidates.get(limit=10)), sorted(f['name'] for f in files[:2]))
+
+
+def test_deletion_executor():
+    """ REAPER (DAEMON): Test the concurrent deletion of replicas with backoff and reused protocols."""
+    rse_info = rsemgr.get_rse_info('MOCK')
+    batches = []
+    for batch in xrange(2):
+        files = [{'scope': 'mock', 'name': 'lfn' + generate_uuid(), 'bytes': 1, 'adler32': '0cc737eb'} for i in xrange(20)]
+        replica_core.add_replicas(rse='MOCK', files=files, account='root')
+        for replica in files:
+            replica['state'] = ReplicaState.AVAILABLE
+            replica['pfn'] = rsemgr.lfns2pfns(rse_settings=rse_info, lfns=[{'scope': replica['scope'], 'name': replica['name']}], operation='delete', scheme='mock').values()[0]
+        batches.append(files)
+
+    protocols = []
+    create_protocol = rsemgr.create_protocol
+
+    def counting_create_protocol(*args, **kwargs):
+        protocols.append(create_protocol(*args, **kwargs))
+        return protocols[-1]
+
+    rsemgr.create_protocol = counting_create_protocol
+    try:
+        executor = DeletionExecutor(scheme='mock', max_inflight=4, chunk_size=7, slow_threshold=-1, max_backoff=0)
+        executor.submit(rse_info, batches[0])
+        assert_equal(executor.wait(), 20)
+        assert_equal(executor.state(rse_info).window, 1)
+        nb_protocols = len(protocols)
+        executor.submit(rse_info, batches[1])
+        assert_equal(executor.close(), 20)
+    finally:
+        rsemgr.create_protocol = create_protocol
+    # The protocols of the first batch are reused by the second one
+    assert_true(0 < nb_protocols <= 4)
+    assert_equal(len(protocols), nb_protocols)
+
+    session = get_session()
+    rse_id = rse_core.get_rse_id('MOCK')
+    for replica in batches[0] + batches[1]:
+        assert_equal(session.query(models.RSEFileAssociation).filter_by(rse_id=rse_id, scope=replica['scope'], name=replica['name']).count(), 0)
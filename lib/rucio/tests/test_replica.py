@@ -18,6 +18,7 @@ from json import dumps, loads
 from nose.tools import assert_equal, assert_in, assert_raises
 from paste.fixture import TestApp
 
+import rucio.core.replica
 
 from rucio.db.sqla.constants import DIDType, ReplicaState
 from rucio.client.baseclient import BaseClient
@@ -31,7 +32,7 @@ from rucio.core.replica import (add_replica, add_replicas, delete_replicas,
                                 update_replica_lock_counter, get_replica, list_replicas,
                                 declare_bad_file_replicas, list_bad_replicas,
                                 update_replicas_paths, update_replica_state,
-                                get_replica_atime, touch_replica)
+                                get_replica_atime, touch_replica, touch_replicas)
 from rucio.daemons.necromancer import run
 from rucio.rse import rsemanager as rsemgr
 from rucio.web.rest.authentication import APP as auth_app
@@ -225,6 +226,26 @@ class TestReplicaCore:
         for i in range(0, nbfiles - 1):
             assert_equal(None, get_replica_atime({'scope': files2[i]['scope'], 'name': files2[i]['name'], 'rse': 'MOCK'}))
 
+    def test_touch_replicas_bulk(self):
+        """ REPLICA (CORE): Touch replicas accessed_at timestamp in bulk"""
+        tmp_scope = 'mock'
+        files = [{'scope': tmp_scope, 'name': 'file_%s' % generate_uuid(), 'bytes': 1L, 'adler32': '0cc737eb', 'tombstone': datetime.utcnow()} for i in xrange(3)]
+        add_replicas(rse='MOCK', files=files, account='root', ignore_availability=True)
+        add_replicas(rse='MOCK3', files=files[:1], account='root', ignore_availability=True)
+
+        now = datetime.utcnow()
+        now -= timedelta(microseconds=now.microsecond)
+        replicas = [{'scope': f['scope'], 'name': f['name'], 'rse': 'MOCK', 'accessed_at': now - timedelta(hours=i)} for i, f in enumerate(files)]
+        replicas.append({'scope': files[0]['scope'], 'name': files[0]['name'], 'rse': 'MOCK3', 'accessed_at': now + timedelta(hours=1)})
+        assert_equal(touch_replicas(replicas), True)
+
+        for i, f in enumerate(files):
+            assert_equal(now - timedelta(hours=i), get_replica_atime({'scope': f['scope'], 'name': f['name'], 'rse': 'MOCK'}))
+            assert_equal(now - timedelta(hours=i), get_replica(rse='MOCK', scope=f['scope'], name=f['name'])['tombstone'])
+        assert_equal(now + timedelta(hours=1), get_replica_atime({'scope': files[0]['scope'], 'name': files[0]['name'], 'rse': 'MOCK3'}))
+        assert_equal(now + timedelta(hours=1), get_did_atime(scope=tmp_scope, name=files[0]['name']))
+        assert_equal(now - timedelta(hours=2), get_did_atime(scope=tmp_scope, name=files[2]['name']))
+
     def test_list_replicas_all_states(self):
         """ REPLICA (CORE): list file replicas with all_states"""
         tmp_scope = 'mock'
@@ -246,6 +267,37 @@ class TestReplicaCore:
 
         assert_equal(nbfiles, replica_cpt)
 
+    def test_lfns2pfns_bulk(self):
+        """ REPLICA (CORE): Build PFNs in bulk """
+        rse_info = rsemgr.get_rse_info('MOCK')
+        names = ['file_%s' % generate_uuid() for i in xrange(3)]
+        for scheme in ('mock', 'srm'):
+            protocol = rsemgr.create_protocol(rse_info, 'read', scheme)
+            lfns = [('mock', names[0], None), ('user.jdoe', names[1], None), ('mock', names[2], '/some/path/%s' % names[2])]
+            expected = [protocol.lfns2pfns({'scope': scope, 'name': name, 'path': path}).values()[0] for scope, name, path in lfns]
+            assert_equal(protocol.lfns2pfns_bulk(lfns), expected)
+
+    def test_list_replicas_pfn_chunks(self):
+        """ REPLICA (CORE): List file replicas whose PFNs are built in several chunks """
+        tmp_scope = 'mock'
+        files = [{'scope': tmp_scope, 'name': 'file_%s' % generate_uuid(), 'bytes': 1L, 'adler32': '0cc737eb'} for i in xrange(5)]
+        rses = ['MOCK', 'MOCK3']
+        for rse in rses:
+            add_replicas(rse=rse, files=files, account='root', ignore_availability=True)
+
+        chunk_size, rucio.core.replica.PFN_CHUNK_SIZE = rucio.core.replica.PFN_CHUNK_SIZE, 3
+        try:
+            replicas = list(list_replicas(dids=[{'scope': f['scope'], 'name': f['name'], 'type': DIDType.FILE} for f in files], schemes=['srm']))
+        finally:
+            rucio.core.replica.PFN_CHUNK_SIZE = chunk_size
+
+        assert_equal(sorted(replica['name'] for replica in replicas), sorted(f['name'] for f in files))
+        for replica in replicas:
+            for rse in rses:
+                pfn = rsemgr.lfns2pfns(rsemgr.get_rse_info(rse), lfns=[{'scope': tmp_scope, 'name': replica['name']}], operation='read', scheme='srm').values()[0]
+                assert_equal(replica['rses'][rse], [pfn])
+                assert_equal(replica['pfns'][pfn]['rse'], rse)
+
 
 class TestReplicaClients:
 
@@ -0,0 +1,95 @@
+'''
+  Copyright European Organization for Nuclear Research (CERN)
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  You may not use this file except in compliance with the License.
+  You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+'''
+
+from json import dumps, loads
+from xml.etree import ElementTree
+
+from nose.tools import assert_equal, assert_greater, assert_in
+from paste.fixture import TestApp
+
+from rucio.common.replicas_serializer import ReplicaSerializer
+from rucio.common.utils import generate_uuid
+from rucio.core.replica import add_replicas
+from rucio.web.rest.authentication import APP as auth_app
+from rucio.web.rest.replica import APP as replica_app
+
+
+METALINK4 = '{urn:ietf:params:xml:ns:metalink}'
+
+
+def _file(nr_replicas=3):
+    return {'scope': 'mock', 'name': 'file_%s' % generate_uuid(), 'bytes': 1L, 'adler32': '0cc737eb', 'md5': None,
+            'rses': {'MOCK': ['https://mock.com:2880/rucio/file_%d' % i for i in xrange(nr_replicas)],
+                     'MOCK3': ['https://mock3.com:2880/rucio/file']}}
+
+
+class TestReplicaSerializer(object):
+
+    def test_json(self):
+        """ REPLICA (SERIALIZER): JSON lines """
+        files = [_file() for _ in xrange(5)]
+        chunks = list(ReplicaSerializer().stream(files))
+        assert_equal(len(chunks), 1)
+        assert_equal([loads(line) for line in chunks[0].splitlines()], files)
+
+    def test_metalink_3(self):
+        """ REPLICA (SERIALIZER): Metalink 3 with a limit """
+        files = [_file(), _file()]
+        root = ElementTree.fromstring(''.join(ReplicaSerializer(metalink=3, limit=2).stream(files)))
+        ns = '{http://www.metalinker.org/}'
+        elements = root.findall('%sfiles/%sfile' % (ns, ns))
+        assert_equal([element.get('name') for element in elements], [f['name'] for f in files])
+        for element in elements:
+            urls = element.findall('%sresources/%surl' % (ns, ns))
+            assert_equal([url.get('preference') for url in urls], ['0', '1'])
+            assert_equal(element.find('%sglfn' % ns).get('name'), '/atlas/rucio/mock:%s' % element.get('name'))
+
+    def test_metalink_4(self):
+        """ REPLICA (SERIALIZER): Metalink 4 """
+        rfile = _file()
+        root = ElementTree.fromstring(''.join(ReplicaSerializer(metalink=4, glfn=False).stream([rfile])))
+        element = root.find('%sfile' % METALINK4)
+        assert_equal(element.find('%sidentity' % METALINK4).text, 'mock:%s' % rfile['name'])
+        assert_equal([(h.get('type'), h.text) for h in element.findall('%shash' % METALINK4)], [('adler32', '0cc737eb')])
+        assert_equal(element.find('%sglfn' % METALINK4), None)
+        urls = element.findall('%surl' % METALINK4)
+        assert_equal([url.get('priority') for url in urls], ['1', '2', '3', '4'])
+        assert_equal(sorted((url.get('location'), url.text) for url in urls),
+                     sorted((rse, pfn) for rse, pfns in rfile['rses'].iteritems() for pfn in pfns))
+
+    def test_buffering(self):
+        """ REPLICA (SERIALIZER): Chunks of at least the buffer size """
+        files = [_file() for _ in xrange(100)]
+        serializer = ReplicaSerializer(metalink=4)
+        chunks = list(serializer.stream(files, buffer_size=4096))
+        assert_greater(len(chunks), 1)
+        for chunk in chunks[:-1]:
+            assert_greater(len(chunk), 4095)
+        assert_equal(len(ElementTree.fromstring(''.join(chunks)).findall('%sfile' % METALINK4)), 100)
+
+
+class TestReplicaSerializerRestApi(object):
+
+    def test_list_replicas(self):
+        """ REPLICA (REST): List replicas as JSON lines and metalink 4 """
+        headers = {'X-Rucio-Account': 'root', 'X-Rucio-Username': 'ddmlab', 'X-Rucio-Password': 'secret'}
+        token = str(TestApp(auth_app.wsgifunc()).get('/userpass', headers=headers, expect_errors=True).header('X-Rucio-Auth-Token'))
+        files = [{'scope': 'mock', 'name': 'file_%s' % generate_uuid(), 'bytes': 1L, 'adler32': '0cc737eb'} for _ in xrange(3)]
+        add_replicas(rse='MOCK', files=files, account='root', ignore_availability=True)
+
+        result = TestApp(replica_app.wsgifunc()).get('/mock/%s?schemes=file' % files[0]['name'], headers={'X-Rucio-Auth-Token': token}, expect_errors=True)
+        assert_equal(result.status, 200)
+        assert_equal(loads(result.body)['name'], files[0]['name'])
+
+        result = TestApp(replica_app.wsgifunc()).post('/list', headers={'X-Rucio-Auth-Token': token, 'Accept': 'application/metalink4+xml'},
+                                                      params=dumps({'dids': [{'scope': 'mock', 'name': f['name']} for f in files], 'schemes': ['file']}),
+                                                      expect_errors=True)
+        assert_equal(result.status, 200)
+        assert_in(('Content-Type', 'application/metalink4+xml'), result.headers)
+        names = [element.get('name') for element in ElementTree.fromstring(result.body).findall('%sfile' % METALINK4)]
+        assert_equal(sorted(names), sorted(f['name'] for f in files))
@@ -17,6 +17,7 @@ from rucio.core import rse
 from rucio.core import rse_expression_parser
 from rucio.client.rseclient import RSEClient
 from rucio.common.exception import InvalidRSEExpression, RSEBlacklisted
+from rucio.db.sqla.session import get_session
 
 
 def rse_name_generator(size=10):
@@ -164,6 +165,41 @@ class TestRSEExpressionParserCore(object):
         assert_raises(InvalidRSEExpression, rse_expression_parser.parse_expression, "%s>51" % self.attribute_numeric)
         assert_equal(sorted([t_rse['id'] for t_rse in rse_expression_parser.parse_expression("%s>30" % self.attribute_numeric)]), sorted([self.rse4_id, self.rse5_id]))
 
+    def test_index_incremental_update(self):
+        """ RSE_EXPRESSION_PARSER (CORE) Test attribute changes are reflected without reloading the index """
+        attribute = attribute_name_generator()
+        rse.add_rse_attribute(self.rse1, attribute, "it")
+        assert_equal([t_rse['id'] for t_rse in rse_expression_parser.parse_expression("%s=it" % attribute)], [self.rse1_id])
+
+        rse.add_rse_attribute(self.rse2, attribute, "it")
+        assert_equal(sorted([t_rse['id'] for t_rse in rse_expression_parser.parse_expression("%s=it" % attribute)]), sorted([self.rse1_id, self.rse2_id]))
+
+        rse.del_rse_attribute(self.rse1, attribute)
+        assert_equal([t_rse['id'] for t_rse in rse_expression_parser.parse_expression("%s=it" % attribute)], [self.rse2_id])
+
+    def test_index_rollback(self):
+        """ RSE_EXPRESSION_PARSER (CORE) Test attribute changes of a rolled back transaction are not indexed """
+        attribute = attribute_name_generator()
+        rse.add_rse_attribute(self.rse1, attribute, "it")
+        assert_equal([t_rse['id'] for t_rse in rse_expression_parser.parse_expression("%s=it" % attribute)], [self.rse1_id])
+
+        session = get_session()
+        try:
+            rse.add_rse_attribute(self.rse2, attribute, "it", session=session)
+            rse.del_rse_attribute(self.rse1, attribute, session=session)
+            session.rollback()
+        finally:
+            session.remove()
+        assert_equal([t_rse['id'] for t_rse in rse_expression_parser.parse_expression("%s=it" % attribute)], [self.rse1_id])
+
+        session = get_session()
+        try:
+            rse.add_rse_attribute(self.rse2, attribute, "it", session=session)
+            session.commit()
+        finally:
+            session.remove()
+        assert_equal(sorted([t_rse['id'] for t_rse in rse_expression_parser.parse_expression("%s=it" % attribute)]), sorted([self.rse1_id, self.rse2_id]))
+
 
 class TestRSEExpressionParserClient(object):
 
@@ -12,6 +12,7 @@
 Test the posix protocol
 """
 
+import copy
 import json
 import os
 import shutil
@@ -19,13 +20,30 @@ import tempfile
 
 from uuid import uuid4 as uuid
 
-from nose.tools import raises
+from nose.tools import assert_equal, raises
 
 from rucio.common import exception
+from rucio.common.utils import adler32
 from rucio.rse import rsemanager as mgr
+from rucio.rse.protocols import posix
 from rucio.tests.rsemgr_api_test import MgrTestCases
 
 
+class BrokenPOSIX(posix.Default):
+    """ Fails after the first chunk of each file. """
+
+    offsets = []
+
+    def stream(self, pfn, offset=0):
+        BrokenPOSIX.offsets.append(offset)
+        chunks = super(BrokenPOSIX, self).stream(pfn, offset, chunksize=1000)
+
+        def broken():
+            yield next(chunks)
+            raise exception.ServiceUnavailable('Connection lost')
+        return broken()
+
+
 class TestRsePOSIX(object):
     """
     Test the posix protocol
@@ -231,3 +249,42 @@ class TestRsePOSIX(object):
     def test_change_scope_mgr_ok_single_pfn(self):
         """POSIX (RSE/PROTOCOLS): Change the scope of a single file on storage using PFN (Success)"""
         self.mtc.test_change_scope_mgr_ok_single_pfn()
+
+    def test_get_mgr_ok_multi_threads(self):
+        """POSIX (RSE/PROTOCOLS): Get multiple files concurrently and validate them while they are written (Success)"""
+        tmp_dir = tempfile.mkdtemp()
+        # The threads create the destination directory concurrently
+        dest_dir = os.path.join(tmp_dir, 'dest')
+        checksum = adler32(TestRsePOSIX.static_file)
+        files = [{'name': '%d_rse_remote_get.raw' % i, 'scope': 'user.%s' % TestRsePOSIX.user, 'adler32': checksum} for i in xrange(1, 5)]
+        status, details = mgr.download(mgr.get_rse_info('MOCK-POSIX'), files, dest_dir, threads=3)
+        assert_equal((status, set(details.values())), (True, set([True])))
+        for f in files:
+            assert_equal(adler32('%s/%s' % (dest_dir, f['name'])), checksum)
+        assert_equal([name for name in os.listdir(dest_dir) if name.endswith('.part')], [])
+        shutil.rmtree(tmp_dir)
+
+    @raises(exception.FileConsistencyMismatch)
+    def test_get_mgr_FileConsistencyMismatch_single(self):
+        """POSIX (RSE/PROTOCOLS): Get a single file with a wrong checksum (FileConsistencyMismatch)"""
+        dest_dir = tempfile.mkdtemp()
+        try:
+            mgr.download(mgr.get_rse_info('MOCK-POSIX'), {'name': '1_rse_remote_get.raw', 'scope': 'user.%s' % TestRsePOSIX.user, 'adler32': '00000001'}, dest_dir)
+        finally:
+            assert_equal(os.listdir(dest_dir), [])
+            shutil.rmtree(dest_dir)
+
+    def test_get_mgr_ok_failover(self):
+        """POSIX (RSE/PROTOCOLS): Continue a failed transfer from another RSE (Success)"""
+        dest_dir = tempfile.mkdtemp()
+        broken = copy.deepcopy(mgr.get_rse_info('MOCK-POSIX'))
+        broken['rse'] = 'MOCK-POSIX-BROKEN'
+        for protocol in broken['protocols']:
+            protocol['impl'] = 'rucio.tests.test_rse_protocol_posix.BrokenPOSIX'
+        BrokenPOSIX.offsets = []
+
+        f = {'name': '2_rse_remote_get.raw', 'scope': 'user.%s' % TestRsePOSIX.user, 'adler32': adler32(TestRsePOSIX.static_file)}
+        assert_equal(mgr.download([broken, mgr.get_rse_info('MOCK-POSIX')], f, dest_dir), True)
+        assert_equal(BrokenPOSIX.offsets, [0])
+        assert_equal(adler32('%s/%s' % (dest_dir, f['name'])), f['adler32'])
+        shutil.rmtree(dest_dir)
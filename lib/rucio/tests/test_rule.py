@@ -31,7 +31,7 @@ from rucio.common.exception import (RuleNotFound, AccessDenied, InsufficientAcco
 from rucio.core.account_counter import get_counter as get_account_counter
 from rucio.daemons.judge.evaluator import re_evaluator
 from rucio.core.did import add_did, attach_dids, set_status
-from rucio.core.lock import get_replica_locks, get_dataset_locks, successful_transfer
+from rucio.core.lock import get_replica_locks, get_dataset_locks, successful_transfer, successful_transfers
 from rucio.core.account import add_account_attribute
 from rucio.core.account_limit import set_account_limit
 from rucio.core.request import get_request_by_did
@@ -43,7 +43,8 @@ from rucio.daemons.abacus.account import account_update
 from rucio.daemons.abacus.rse import rse_update
 from rucio.db.sqla import models
 from rucio.db.sqla.constants import DIDType, OBSOLETE, RuleState, LockState
-from rucio.db.sqla.session import transactional_session
+from rucio.db.sqla.models import partition_bucket
+from rucio.db.sqla.session import get_session, transactional_session
 from rucio.tests.common import rse_name_generator, account_name_generator
 
 
@@ -233,6 +234,26 @@ class TestReplicationRuleCore():
             assert_in(self.rse4_id, rse_locks)
             assert_not_in(self.rse5_id, rse_locks)
 
+    def test_add_rule_container_shared_files(self):
+        """ REPLICATION RULE (CORE): Add a replication rule on a container with files shared between datasets"""
+        scope = 'mock'
+        container = 'container_' + str(uuid())
+        add_did(scope, container, DIDType.from_sym('CONTAINER'), 'jdoe')
+        shared_files = create_files(2, scope, self.rse1)
+        all_files = list(shared_files)
+        for i in xrange(3):
+            files = create_files(2, scope, self.rse1)
+            all_files.extend(files)
+            dataset = 'dataset_' + str(uuid())
+            add_did(scope, dataset, DIDType.from_sym('DATASET'), 'jdoe')
+            attach_dids(scope, dataset, files + shared_files, 'jdoe')
+            attach_dids(scope, container, [{'scope': scope, 'name': dataset}], 'jdoe')
+
+        rule_id = add_rule(dids=[{'scope': scope, 'name': container}], account='jdoe', copies=1, rse_expression=self.rse4, grouping='NONE', weight=None, lifetime=None, locked=False, subscription_id=None)[0]
+        for file in all_files:
+            assert_equal([lock['rse_id'] for lock in get_replica_locks(scope=file['scope'], name=file['name'])], [self.rse4_id])
+        assert_equal(get_rule(rule_id)['locks_replicating_cnt'], len(all_files))
+
     def test_add_rule_dataset_all(self):
         """ REPLICATION RULE (CORE): Add a replication rule on a dataset, ALL Grouping"""
         scope = 'mock'
@@ -321,6 +342,22 @@ class TestReplicationRuleCore():
         for file in files:
             get_request_by_did(scope=file['scope'], name=file['name'], rse=self.rse5)
 
+    def test_add_rule_replicas_bucket(self):
+        """ REPLICATION RULE (CORE): Add a replication rule and check the partition bucket of the bulk inserted replicas"""
+        scope = 'mock'
+        files = create_files(3, scope, self.rse1)
+        dataset = 'dataset_' + str(uuid())
+        add_did(scope, dataset, DIDType.from_sym('DATASET'), 'jdoe')
+        attach_dids(scope, dataset, files, 'jdoe')
+
+        add_rule(dids=[{'scope': scope, 'name': dataset}], account='jdoe', copies=1, rse_expression=self.rse5, grouping='DATASET', weight=None, lifetime=None, locked=False, subscription_id=None)
+
+        session = get_session()
+        for file in files:
+            bucket, = session.query(models.RSEFileAssociation.bucket).filter_by(rse_id=self.rse5_id, scope=scope, name=file['name']).one()
+            assert_equal(bucket, partition_bucket(file['name']))
+        session.remove()
+
     def test_add_rule_container_dataset(self):
         """ REPLICATION RULE (CORE): Add a replication rule on a container, DATASET Grouping"""
         scope = 'mock'
@@ -557,6 +594,34 @@ class TestReplicationRuleCore():
 
         set_account_limit(account='jdoe', rse_id=self.rse1_id, bytes=-1)
 
+    def test_successful_transfers_bulk(self):
+        """ REPLICATION RULE (CORE): Finish the transfers of several rules in bulk"""
+
+        scope = 'mock'
+        files = create_files(3, scope, self.rse1, bytes=100)
+        dataset = 'dataset_' + str(uuid())
+        add_did(scope, dataset, DIDType.from_sym('DATASET'), 'jdoe')
+        attach_dids(scope, dataset, files, 'jdoe')
+        set_status(scope=scope, name=dataset, open=False)
+
+        rule_id_1 = add_rule(dids=[{'scope': scope, 'name': dataset}], account='jdoe', copies=1, rse_expression=self.rse3, grouping='DATASET', weight=None, lifetime=None, locked=False, subscription_id=None)[0]
+        rule_id_2 = add_rule(dids=[{'scope': scope, 'name': dataset}], account='jdoe', copies=1, rse_expression=self.rse4, grouping='NONE', weight=None, lifetime=None, locked=False, subscription_id=None)[0]
+
+        transfers = [{'scope': scope, 'name': file['name'], 'rse_id': self.rse3_id} for file in files]
+        transfers += [{'scope': scope, 'name': file['name'], 'rse_id': self.rse4_id} for file in files[:2]]
+        successful_transfers(files=transfers, nowait=False)
+
+        rule_1 = get_rule(rule_id_1)
+        assert(rule_1['state'] == RuleState.OK)
+        assert((rule_1['locks_ok_cnt'], rule_1['locks_replicating_cnt'], rule_1['locks_stuck_cnt']) == (3, 0, 0))
+        assert([lock['state'] for lock in get_dataset_locks(scope, dataset) if lock['rule_id'] == rule_id_1] == [LockState.OK])
+        rule_2 = get_rule(rule_id_2)
+        assert(rule_2['state'] == RuleState.REPLICATING)
+        assert((rule_2['locks_ok_cnt'], rule_2['locks_replicating_cnt'], rule_2['locks_stuck_cnt']) == (2, 1, 0))
+        for file in files:
+            for lock in get_replica_locks(scope=file['scope'], name=file['name']):
+                assert(lock.state == (LockState.REPLICATING if (lock.rse_id, file['name']) == (self.rse4_id, files[2]['name']) else LockState.OK))
+
     def test_dataset_callback(self):
         """ REPLICATION RULE (CORE): Test dataset callback"""
 
@@ -15,6 +15,7 @@ import json
 import logging
 import requests
 import sys
+import threading
 import time
 import urlparse
 import uuid
@@ -41,10 +42,41 @@ try:
 except NoOptionError:
     __USE_DETERMINISTIC_ID = False
 
+try:
+    __POOL_MAXSIZE = int(config_get('conveyor', 'fts_pool_maxsize'))
+except NoOptionError:
+    __POOL_MAXSIZE = 10
+
+__SESSIONS = {}
+__SESSIONS_LOCK = threading.Lock()
+
 REGION_SHORT = make_region().configure('dogpile.cache.memory',
                                        expiration_time=1800)
 
 
+def get_session(external_host):
+    """
+    Get the keep-alive HTTP session of an FTS server.
+
+    The session is created on first use and shared by all threads of the process,
+    so connections (and TLS handshakes) are reused between requests to the same server.
+
+    :param external_host: FTS server as a string.
+    :returns: requests.Session.
+    """
+    with __SESSIONS_LOCK:
+        session = __SESSIONS.get(external_host)
+        if session is None:
+            session = requests.Session()
+            session.mount(external_host, requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=__POOL_MAXSIZE))
+            session.headers.update({'Content-Type': 'application/json'})
+            if external_host.startswith('https://'):
+                session.verify = False
+                session.cert = (__USERCERT, __USERCERT)
+            __SESSIONS[external_host] = session
+        return session
+
+
 def get_transfer_baseid_voname(external_host):
     """
     Get transfer VO name from external host.
@@ -61,22 +93,10 @@ def get_transfer_baseid_voname(external_host):
             logging.debug("Refresh transfer baseid and voname for %s" % external_host)
 
             r = None
-            if external_host.startswith('https://'):
-                try:
-                    r = requests.get('%s/whoami' % external_host,
-                                     verify=False,
-                                     cert=(__USERCERT, __USERCERT),
-                                     headers={'Content-Type': 'application/json'},
-                                     timeout=5)
-                except:
-                    logging.warn('Could not get baseid and voname from %s - %s' % (external_host, str(traceback.format_exc())))
-            else:
-                try:
-                    r = requests.get('%s/whoami' % external_host,
-                                     headers={'Content-Type': 'application/json'},
-                                     timeout=5)
-                except:
-                    logging.warn('Could not get baseid and voname from %s - %s' % (external_host, str(traceback.format_exc())))
+            try:
+                r = get_session(external_host).get('%s/whoami' % external_host, timeout=5)
+            except:
+                logging.warn('Could not get baseid and voname from %s - %s' % (external_host, str(traceback.format_exc())))
 
             if r and r.status_code == 200:
                 baseid = str(r.json()['base_id'])
@@ -275,28 +295,14 @@ def submit_bulk_transfers(external_host, files, job_params, timeout=None):
     params_str = json.dumps(params_dict)
 
     r = None
-    if external_host.startswith('https://'):
-        try:
-            ts = time.time()
-            r = requests.post('%s/jobs' % external_host,
-                              verify=False,
-                              cert=(__USERCERT, __USERCERT),
-                              data=params_str,
-                              headers={'Content-Type': 'application/json'},
-                              timeout=timeout)
-            record_timer('transfertool.fts3.submit_transfer.%s' % __extract_host(external_host), (time.time() - ts) * 1000 / len(files))
-        except:
-            logging.warn('Could not submit transfer to %s - %s' % (external_host, str(traceback.format_exc())))
-    else:
-        try:
-            ts = time.time()
-            r = requests.post('%s/jobs' % external_host,
-                              data=params_str,
-                              headers={'Content-Type': 'application/json'},
-                              timeout=timeout)
-            record_timer('transfertool.fts3.submit_transfer.%s' % __extract_host(external_host), (time.time() - ts) * 1000 / len(files))
-        except:
-            logging.warn('Could not submit transfer to %s - %s' % (external_host, str(traceback.format_exc())))
+    try:
+        ts = time.time()
+        r = get_session(external_host).post('%s/jobs' % external_host, data=params_str, timeout=timeout)
+        duration = (time.time() - ts) * 1000
+        record_timer('transfertool.fts3.submit_transfer.%s' % __extract_host(external_host), duration / len(files))
+        record_timer('transfertool.fts3.%s.submission.latency' % __extract_host(external_host), duration)
+    except:
+        logging.warn('Could not submit transfer to %s - %s' % (external_host, str(traceback.format_exc())))
 
     if r and r.status_code == 200:
         record_counter('transfertool.fts3.%s.submission.success' % __extract_host(external_host), len(files))
@@ -323,16 +329,7 @@ def query(transfer_id, transfer_host):
 
     job = None
 
-    if transfer_host.startswith('https://'):
-        job = requests.get('%s/jobs/%s' % (transfer_host, transfer_id),
-                           verify=False,
-                           cert=(__USERCERT, __USERCERT),
-                           headers={'Content-Type': 'application/json'},
-                           timeout=5)
-    else:
-        job = requests.get('%s/jobs/%s' % (transfer_host, transfer_id),
-                           headers={'Content-Type': 'application/json'},
-                           timeout=5)
+    job = get_session(transfer_host).get('%s/jobs/%s' % (transfer_host, transfer_id), timeout=5)
     if job and job.status_code == 200:
         record_counter('transfertool.fts3.%s.query.success' % __extract_host(transfer_host))
         return job.json()
@@ -411,16 +408,7 @@ def query_details(transfer_id, transfer_host):
 
     files = None
 
-    if transfer_host.startswith('https://'):
-        files = requests.get('%s/jobs/%s/files' % (transfer_host, transfer_id),
-                             verify=False,
-                             cert=(__USERCERT, __USERCERT),
-                             headers={'Content-Type': 'application/json'},
-                             timeout=5)
-    else:
-        files = requests.get('%s/jobs/%s/files' % (transfer_host, transfer_id),
-                             headers={'Content-Type': 'application/json'},
-                             timeout=5)
+    files = get_session(transfer_host).get('%s/jobs/%s/files' % (transfer_host, transfer_id), timeout=5)
     if files and (files.status_code == 200 or files.status_code == 207):
         record_counter('transfertool.fts3.%s.query_details.success' % __extract_host(transfer_host))
         return files.json()
@@ -599,18 +587,9 @@ def bulk_query(transfer_ids, transfer_host, timeout=None):
         transfer_ids = [transfer_ids]
 
     responses = {}
-    fts_session = requests.Session()
     xfer_ids = ','.join(transfer_ids)
-    if transfer_host.startswith('https://'):
-        jobs = fts_session.get('%s/jobs/%s?files=file_state,dest_surl,finish_time,start_time,reason,source_surl,file_metadata' % (transfer_host, xfer_ids),
-                               verify=False,
-                               cert=(__USERCERT, __USERCERT),
-                               headers={'Content-Type': 'application/json'},
-                               timeout=timeout)
-    else:
-        jobs = fts_session.get('%s/jobs/%s?files=file_state,dest_surl,finish_time,start_time,reason,source_surl,file_metadata' % (transfer_host, xfer_ids),
-                               headers={'Content-Type': 'application/json'},
-                               timeout=timeout)
+    jobs = get_session(transfer_host).get('%s/jobs/%s?files=file_state,dest_surl,finish_time,start_time,reason,source_surl,file_metadata' % (transfer_host, xfer_ids),
+                                          timeout=timeout)
 
     if jobs is None:
         record_counter('transfertool.fts3.%s.bulk_query.failure' % __extract_host(transfer_host))
@@ -22,6 +22,7 @@ from rucio.api.authentication import validate_auth_token
 from rucio.common.exception import RucioException
 from rucio.common.utils import generate_http_error, generate_uuid
 from rucio.core.monitor import record_timer
+from rucio.core.permission_cache import begin_request, end_request
 
 
 def rucio_loadhook():
@@ -60,9 +61,13 @@ def rucio_loadhook():
     ctx.env['request_id'] = generate_uuid()
     ctx.env['start_time'] = time()
 
+    # Memoise the permission decisions until the end of the request
+    begin_request()
+
 
 def rucio_unloadhook():
     """ Rucio unload Hook."""
+    end_request()
     duration = time() - ctx.env['start_time']
     ip = ctx.env.get('HTTP_X_FORWARDED_FOR')
     if not ip:
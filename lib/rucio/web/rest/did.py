@@ -20,7 +20,7 @@ from urlparse import parse_qs
 from web import application, ctx, data, Created, header, InternalError, OK, loadhook
 
 from rucio.api.did import (add_did, add_dids, list_content, list_content_history,
-                           list_dids, list_files, scope_list, get_did, set_metadata,
+                           list_dids, list_dids_page, list_files, list_files_page, scope_list, get_did, set_metadata,
                            get_metadata, set_status, attach_dids, detach_dids,
                            attach_dids_to_dids, get_dataset_by_guid, list_parent_dids,
                            create_did_sample, list_new_dids, resurrect)
@@ -31,10 +31,26 @@ from rucio.common.exception import (ScopeNotFound, DataIdentifierNotFound,
                                     Duplicate, InvalidValueForKey,
                                     UnsupportedStatus, UnsupportedOperation,
                                     RSENotFound, RucioException, RuleNotFound,
-                                    InvalidMetadata)
+                                    InvalidMetadata, InvalidObject)
 from rucio.common.utils import generate_http_error, render_json, APIEncoder
 from rucio.web.rest.common import rucio_loadhook, RucioController
 
+CONTINUATION_TOKEN_HEADER = 'X-Rucio-Continuation-Token'
+
+
+def parse_limit(value):
+    """
+    :returns: The limit of a page, a positive integer.
+    """
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        raise generate_http_error(400, 'InvalidObject', 'Invalid limit %s' % value)
+    return limit
+
+
 URLS = (
     '/(.*)/$', 'Scope',
     '/(.*)/guid', 'GUIDLookup',
@@ -98,10 +114,14 @@ class Search(RucioController):
         """
         List all data identifiers in a scope which match a given metadata.
 
+        With a limit or a continuation token, only one page of data identifiers ordered by name
+        is returned, the token of the next page is in the X-Rucio-Continuation-Token header.
+
         HTTP Success:
             200 OK
 
         HTTP Error:
+            400 InvalidObject
             401 Unauthorized
             404 KeyNotFound
             409 UnsupportedOperation
@@ -112,6 +132,7 @@ class Search(RucioController):
         header('Content-Type', 'application/x-json-stream')
         filters = {}
         long = False
+        limit, continuation_token = None, None
         if ctx.query:
             params = parse_qs(ctx.query[1:])
             for k, v in params.items():
@@ -119,12 +140,25 @@ class Search(RucioController):
                     type = v[0]
                 elif k == 'long':
                     long = bool(v[0])
+                elif k == 'limit':
+                    limit = parse_limit(v[0])
+                elif k == 'continuation_token':
+                    continuation_token = v[0]
                 else:
                     filters[k] = v[0]
 
         try:
-            for did in list_dids(scope=scope, filters=filters, type=type, long=long):
-                yield dumps(did) + '\n'
+            if limit is None and continuation_token is None:
+                for did in list_dids(scope=scope, filters=filters, type=type, long=long):
+                    yield dumps(did) + '\n'
+            else:
+                dids, continuation_token = list_dids_page(scope=scope, filters=filters, type=type, long=long,
+                                                          limit=limit, continuation_token=continuation_token)
+                if continuation_token is not None:
+                    header(CONTINUATION_TOKEN_HEADER, continuation_token)
+                yield ''.join(dumps(did) + '\n' for did in dids)
+        except InvalidObject, error:
+            raise generate_http_error(400, 'InvalidObject', error.args[0][0])
         except UnsupportedOperation, error:
             raise generate_http_error(409, 'UnsupportedOperation', error.args[0][0])
         except KeyNotFound, error:
@@ -479,10 +513,14 @@ class Files(RucioController):
     def GET(self, scope, name):
         """ List all replicas of a data identifier.
 
+        With a limit or a continuation token, only one page of files is returned, the token of
+        the next page is in the X-Rucio-Continuation-Token header.
+
         HTTP Success:
             200 OK
 
         HTTP Error:
+            400 InvalidObject
             401 Unauthorized
             500 InternalError
 
@@ -490,13 +528,27 @@ class Files(RucioController):
         """
         header('Content-Type', 'application/x-json-stream')
         long = False
+        limit, continuation_token = None, None
         if ctx.query:
             params = parse_qs(ctx.query[1:])
             if 'long' in params:
                 long = True
+            if 'limit' in params:
+                limit = parse_limit(params['limit'][0])
+            if 'continuation_token' in params:
+                continuation_token = params['continuation_token'][0]
         try:
-            for file in list_files(scope=scope, name=name, long=long):
-                yield dumps(file) + "\n"
+            if limit is None and continuation_token is None:
+                for file in list_files(scope=scope, name=name, long=long):
+                    yield dumps(file) + "\n"
+            else:
+                files, continuation_token = list_files_page(scope=scope, name=name, long=long,
+                                                            limit=limit, continuation_token=continuation_token)
+                if continuation_token is not None:
+                    header(CONTINUATION_TOKEN_HEADER, continuation_token)
+                yield ''.join(dumps(file) + '\n' for file in files)
+        except InvalidObject, error:
+            raise generate_http_error(400, 'InvalidObject', error.args[0][0])
         except DataIdentifierNotFound, error:
             raise generate_http_error(404, 'DataIdentifierNotFound', error.args[0][0])
         except RucioException, error:
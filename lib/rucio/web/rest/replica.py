@@ -18,8 +18,6 @@ from urllib import unquote
 from urlparse import parse_qs
 from web import application, ctx, Created, data, header, InternalError, loadhook, OK, unloadhook
 
-from geoip2.errors import AddressNotFoundError
-
 from rucio.api.replica import (add_replicas, list_replicas, list_dataset_replicas,
                                delete_replicas,
                                get_did_from_pfns, update_replicas_states,
@@ -31,7 +29,7 @@ from rucio.common.exception import (AccessDenied, DataIdentifierAlreadyExists,
                                     DataIdentifierNotFound, Duplicate, InvalidPath,
                                     ResourceTemporaryUnavailable, RucioException,
                                     RSENotFound, UnsupportedOperation, ReplicaNotFound)
-from rucio.common.replicas_selector import random_order, geoIP_order
+from rucio.common.replicas_serializer import ReplicaSerializer
 
 from rucio.common.utils import generate_http_error, parse_response, APIEncoder
 from rucio.web.rest.common import rucio_loadhook, rucio_unloadhook, RucioController
@@ -86,82 +84,16 @@ class Replicas(RucioController):
             if 'limit' in params:
                 limit = int(params['limit'][0])
 
+        client_ip = ctx.env.get('HTTP_X_FORWARDED_FOR')
+        if client_ip is None:
+            client_ip = ctx.ip
+        serializer = ReplicaSerializer(metalink=metalink, select=select, limit=limit, client_ip=client_ip)
+
         try:
-            # first, set the APPropriate content type, and stream the header
-            if metalink is None:
-                header('Content-Type', 'application/x-json-stream')
-            elif metalink == 3:
-                header('Content-Type', 'application/metalink+xml')
-                yield '<?xml version="1.0" encoding="UTF-8"?>\n<metalink version="3.0" xmlns="http://www.metalinker.org/">\n<files>\n'
-            elif metalink == 4:
-                header('Content-Type', 'application/metalink4+xml')
-                yield '<?xml version="1.0" encoding="UTF-8"?>\n<metalink xmlns="urn:ietf:params:xml:ns:metalink">\n'
-
-            # then, stream the replica information
-            for rfile in list_replicas(dids=dids, schemes=schemes):
-                client_ip = ctx.env.get('HTTP_X_FORWARDED_FOR')
-                if client_ip is None:
-                    client_ip = ctx.ip
-
-                replicas = []
-                dictreplica = {}
-                for rse in rfile['rses']:
-                    for replica in rfile['rses'][rse]:
-                        replicas.append(replica)
-                        dictreplica[replica] = rse
-                if select == 'geoip':
-                    try:
-                        replicas = geoIP_order(dictreplica, client_ip)
-                    except AddressNotFoundError:
-                        pass
-                else:
-                    replicas = random_order(dictreplica, client_ip)
-                if metalink is None:
-                    yield dumps(rfile) + '\n'
-
-                elif metalink == 3:
-                    idx = 0
-                    yield ' <file name="' + rfile['name'] + '">\n'
-
-                    yield '  <glfn name="/atlas/rucio/%s:%s">' % (rfile['scope'], rfile['name'])
-                    yield '</glfn>\n'
-
-                    yield '  <resources>\n'
-                    for replica in replicas:
-                        yield '   <url type="http" preference="' + str(idx) + '">' + replica + '</url>\n'
-                        idx += 1
-                        if limit and limit == idx:
-                            break
-                    yield '  </resources>\n </file>\n'
-
-                elif metalink == 4:
-                    yield ' <file name="' + rfile['name'] + '">\n'
-                    yield '  <identity>' + rfile['scope'] + ':' + rfile['name'] + '</identity>\n'
-
-                    if rfile['adler32'] is not None:
-                        yield '  <hash type="adler32">' + rfile['adler32'] + '</hash>\n'
-                    if rfile['md5'] is not None:
-                        yield '  <hash type="md5">' + rfile['md5'] + '</hash>\n'
-
-                    yield '  <size>' + str(rfile['bytes']) + '</size>\n'
-
-                    yield '  <glfn name="/atlas/rucio/%s:%s">' % (rfile['scope'], rfile['name'])
-                    yield '</glfn>\n'
-
-                    idx = 0
-                    for replica in replicas:
-                        yield '   <url location="' + str(dictreplica[replica]) + '" priority="' + str(idx + 1) + '">' + replica + '</url>\n'
-                        idx += 1
-                        if limit and limit == idx:
-                            break
-                    yield ' </file>\n'
-
-            # don't forget to send the metalink footer
-            if metalink:
-                if metalink == 3:
-                    yield '</files>\n</metalink>\n'
-                elif metalink == 4:
-                    yield '</metalink>\n'
+            # first, set the APPropriate content type, then stream the header, the replica information and the footer
+            header('Content-Type', serializer.content_type)
+            for chunk in serializer.stream(list_replicas(dids=dids, schemes=schemes)):
+                yield chunk
 
         except DataIdentifierNotFound, e:
             raise generate_http_error(404, 'DataIdentifierNotFound', e.args[0][0])
@@ -329,72 +261,23 @@ class ListReplicas(RucioController):
             if 'select' in params:
                 select = params['select'][0]
             if 'limit' in params:
-                limit = params['limit'][0]
+                limit = int(params['limit'][0])
+
+        client_ip = ctx.env.get('HTTP_X_FORWARDED_FOR')
+        if client_ip is None:
+            client_ip = ctx.ip
+        serializer = ReplicaSerializer(metalink=metalink, select=select, limit=limit, client_ip=client_ip, glfn=False)
 
         try:
-            # first, set the APPropriate content type, and stream the header
-            if metalink is None:
-                header('Content-Type', 'application/x-json-stream')
-            elif metalink == 3:
-                header('Content-Type', 'application/metalink+xml')
-                yield '<?xml version="1.0" encoding="UTF-8"?>\n<metalink version="3.0" xmlns="http://www.metalinker.org/">\n<files>\n'
-            elif metalink == 4:
-                header('Content-Type', 'application/metalink4+xml')
-                yield '<?xml version="1.0" encoding="UTF-8"?>\n<metalink xmlns="urn:ietf:params:xml:ns:metalink">\n'
-
-            # then, stream the replica information
-            for rfile in list_replicas(dids=dids, schemes=schemes,
-                                       unavailable=unavailable,
-                                       request_id=ctx.env.get('request_id'),
-                                       ignore_availability=ignore_availability,
-                                       all_states=all_states,
-                                       rse_expression=rse_expression):
-                client_ip = ctx.env.get('HTTP_X_FORWARDED_FOR')
-                if client_ip is None:
-                    client_ip = ctx.ip
-                replicas = []
-                dictreplica = {}
-                for rse in rfile['rses']:
-                    for replica in rfile['rses'][rse]:
-                        replicas.append(replica)
-                        dictreplica[replica] = rse
-                if select == 'geoip':
-                    replicas = geoIP_order(dictreplica, client_ip)
-                else:
-                    replicas = random_order(dictreplica, client_ip)
-                if metalink is None:
-                    yield dumps(rfile, cls=APIEncoder) + '\n'
-                elif metalink == 3:
-                    idx = 0
-                    yield ' <file name="' + rfile['name'] + '">\n  <resources>\n'
-                    for replica in replicas:
-                        yield '   <url type="http" preference="' + str(idx) + '">' + replica + '</url>\n'
-                        idx += 1
-                        if limit and limit == idx:
-                            break
-                    yield '  </resources>\n </file>\n'
-                elif metalink == 4:
-                    yield ' <file name="' + rfile['name'] + '">\n'
-                    yield '  <identity>' + rfile['scope'] + ':' + rfile['name'] + '</identity>\n'
-                    if rfile['adler32'] is not None:
-                        yield '  <hash type="adler32">' + rfile['adler32'] + '</hash>\n'
-                    if rfile['md5'] is not None:
-                        yield '  <hash type="md5">' + rfile['md5'] + '</hash>\n'
-                    yield '  <size>' + str(rfile['bytes']) + '</size>\n'
-                    idx = 0
-                    for replica in replicas:
-                        yield '   <url location="' + str(dictreplica[replica]) + '" priority="' + str(idx + 1) + '">' + replica + '</url>\n'
-                        idx += 1
-                        if limit and limit == idx:
-                            break
-                    yield ' </file>\n'
-
-            # don't forget to send the metalink footer
-            if metalink:
-                if metalink == 3:
-                    yield '</files>\n</metalink>\n'
-                elif metalink == 4:
-                    yield '</metalink>\n'
+            # first, set the APPropriate content type, then stream the header, the replica information and the footer
+            header('Content-Type', serializer.content_type)
+            for chunk in serializer.stream(list_replicas(dids=dids, schemes=schemes,
+                                                         unavailable=unavailable,
+                                                         request_id=ctx.env.get('request_id'),
+                                                         ignore_availability=ignore_availability,
+                                                         all_states=all_states,
+                                                         rse_expression=rse_expression)):
+                yield chunk
 
         except DataIdentifierNotFound, e:
             raise generate_http_error(404, 'DataIdentifierNotFound', e.args[0][0])
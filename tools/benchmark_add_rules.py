@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# Copyright European Organization for Nuclear Research (CERN)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#                       http://www.apache.org/licenses/LICENSE-2.0
+
+"""
+Compare wall time and number of SQL statements of add_rules on a container
+between the per-dataset resolution and the bulk resolution of rucio.core.rule.
+
+Runs against the database configured in rucio.cfg (e.g. etc/rucio.sqlite.cfg)
+after tools/reset_database.py, tools/sync_rses.py and tools/bootstrap_tests.py.
+"""
+
+import time
+
+from argparse import ArgumentParser
+
+from sqlalchemy import event
+
+import rucio.core.rule
+
+from rucio.common.utils import generate_uuid
+from rucio.core.account_limit import set_account_limit
+from rucio.core.did import add_did, attach_dids
+from rucio.core.replica import add_replicas
+from rucio.core.rse import get_rse_id
+from rucio.db.sqla.constants import DIDType
+from rucio.db.sqla.session import get_engine
+
+
+class QueryCounter(object):
+    """
+    Counts the statements executed on the engine.
+    """
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self)
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def create_container(scope, rse, account, nr_datasets, nr_files):
+    """
+    Create a container with nr_datasets datasets of nr_files files, each with a replica on rse.
+    """
+    container = 'benchmark_container_%s' % generate_uuid()
+    add_did(scope=scope, name=container, type=DIDType.CONTAINER, account=account)
+    datasets = []
+    for i in xrange(nr_datasets):
+        dataset = 'benchmark_dataset_%s' % generate_uuid()
+        files = [{'scope': scope, 'name': 'benchmark_file_%s' % generate_uuid(), 'bytes': 1, 'adler32': '0cc737eb'} for j in xrange(nr_files)]
+        add_did(scope=scope, name=dataset, type=DIDType.DATASET, account=account)
+        add_replicas(rse=rse, files=files, account=account)
+        attach_dids(scope=scope, name=dataset, dids=files, account=account)
+        datasets.append({'scope': scope, 'name': dataset})
+    attach_dids(scope=scope, name=container, dids=datasets, account=account)
+    return container
+
+
+def run(scope, container, rse_expression, account, counter):
+    """
+    Create a rule on the container and return (seconds, statements).
+    """
+    before = counter.count
+    start = time.time()
+    rucio.core.rule.add_rules(dids=[{'scope': scope, 'name': container}],
+                              rules=[{'account': account, 'copies': 1, 'rse_expression': rse_expression,
+                                      'grouping': 'DATASET', 'weight': None, 'lifetime': None, 'locked': False,
+                                      'subscription_id': None}])
+    return time.time() - start, counter.count - before
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser()
+    parser.add_argument('--datasets', type=int, default=200, help='Number of datasets in the container')
+    parser.add_argument('--files', type=int, default=10, help='Number of files per dataset')
+    parser.add_argument('--scope', default='mock', help='Scope of the created dids')
+    parser.add_argument('--source-rse', default='MOCK', help='RSE holding the replicas')
+    parser.add_argument('--rse-expression', default='MOCK3', help='RSE expression of the rules')
+    parser.add_argument('--account', default='jdoe', help='Account of the dids and rules')
+    parser.add_argument('--chunk-size', type=int, default=rucio.core.rule.BULK_RESOLUTION_CHUNK_SIZE or 50, help='Datasets per query in bulk mode')
+    args = parser.parse_args()
+
+    set_account_limit(account=args.account, rse_id=get_rse_id(args.rse_expression), bytes=-1)
+    counter = QueryCounter(get_engine())
+
+    results = []
+    for mode, chunk_size in (('per-dataset', 0), ('bulk', args.chunk_size)):
+        container = create_container(args.scope, args.source_rse, args.account, args.datasets, args.files)
+        rucio.core.rule.BULK_RESOLUTION_CHUNK_SIZE = chunk_size
+        seconds, statements = run(args.scope, container, args.rse_expression, args.account, counter)
+        results.append((mode, seconds, statements))
+
+    print '%d datasets x %d files' % (args.datasets, args.files)
+    print '%-12s %10s %12s' % ('mode', 'seconds', 'statements')
+    for mode, seconds, statements in results:
+        print '%-12s %10.3f %12d' % (mode, seconds, statements)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# Copyright European Organization for Nuclear Research (CERN)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#                       http://www.apache.org/licenses/LICENSE-2.0
+
+"""
+Compare the throughput of the adler32 of a file iterated line by line (the former
+rucio.common.utils.adler32) with the buffered and mmap reads of rucio.common.checksum,
+for random data, data full of newlines and data without any newline.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import zlib
+
+from argparse import ArgumentParser
+
+from rucio.common.checksum import checksum_file
+
+
+CONTENTS = {'random': lambda size: os.urandom(size),
+            'newlines': lambda size: '\n' * size,
+            'no-newline': lambda size: 'a' * size}
+
+
+def line_adler32(path):
+    """
+    adler32 computed over the lines of the file.
+    """
+    adler = 1
+    with open(path, 'rb') as f:
+        for line in f:
+            adler = zlib.adler32(line, adler)
+    return '%08x' % (adler & 0xffffffff)
+
+
+def create_file(directory, content, size):
+    """
+    Write a file of size bytes of the given content.
+    """
+    path = os.path.join(directory, '%s_%d' % (content, size))
+    with open(path, 'wb') as f:
+        for offset in xrange(0, size, 1048576):
+            f.write(CONTENTS[content](min(1048576, size - offset)))
+    return path
+
+
+def run(function, path):
+    """
+    Return (seconds, checksum) of the function on path.
+    """
+    start = time.time()
+    checksum = function(path)
+    return time.time() - start, checksum
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 64], help='Sizes of the files in MiB')
+    parser.add_argument('--directory', default=None, help='Directory of the temporary files')
+    args = parser.parse_args()
+
+    modes = (('lines', line_adler32),
+             ('buffered', lambda path: checksum_file(path, mmap_threshold=float('inf'))['adler32']),
+             ('mmap', lambda path: checksum_file(path, mmap_threshold=0)['adler32']))
+
+    directory = tempfile.mkdtemp(dir=args.directory)
+    try:
+        print '%-12s %8s %-10s %10s %10s' % ('content', 'MiB', 'mode', 'seconds', 'MiB/s')
+        for content in sorted(CONTENTS):
+            for size in args.sizes:
+                path = create_file(directory, content, size * 1048576)
+                checksums = set()
+                for mode, function in modes:
+                    seconds, checksum = run(function, path)
+                    checksums.add(checksum)
+                    print '%-12s %8d %-10s %10.3f %10.1f' % (content, size, mode, seconds, size / max(seconds, 1e-6))
+                if len(checksums) != 1:
+                    print 'Checksums differ: %s' % ', '.join(sorted(checksums))
+                os.remove(path)
+    finally:
+        shutil.rmtree(directory)